@@ -0,0 +1,80 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Compare matching two sets of faces pair by pair and with blocked GEMM
+
+Usage:
+    python benchmarks/bench_compare_many.py [--queries N] [--gallery N] [--top-k N]
+
+Random encodings are used, so no face detection is involved. Calling
+`face_distance` for every pair is only timed on a sample of the queries
+and extrapolated, as it would take too long otherwise.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import face_recognition
+
+from pyfaces.core.matrix import compare_matrices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the many-to-many comparisons")
+    parser.add_argument("--queries", type=int, default=2000, help="faces to look for. Default: 2000.")
+    parser.add_argument("--gallery", type=int, default=50000, help="faces to compare them with. Default: 50000.")
+    parser.add_argument("--top-k", type=int, default=10, help="matches kept per face. Default: 10.")
+    parser.add_argument("--block-size", type=int, default=1024, help="rows and columns of each block. Default: 1024.")
+    parser.add_argument("--sample", type=int, default=5, help="queries timed pair by pair. Default: 5.")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    queries = rng.normal(0, 0.1, (args.queries, 128))
+    gallery = rng.normal(0, 0.1, (args.gallery, 128))
+    print(f"[*] Comparing {args.queries} faces with {args.gallery} faces, keeping the top {args.top_k}")
+
+    start_time = time.perf_counter()
+    for query in queries[:args.sample]:
+        for known in gallery:
+            face_recognition.face_distance([known], query)
+    per_pair = (time.perf_counter() - start_time) / args.sample * args.queries
+    print(f"[*] pair by pair : {per_pair:10.2f} s (extrapolated from {args.sample} faces)")
+
+    start_time = time.perf_counter()
+    for query in queries:
+        distances = face_recognition.face_distance(gallery, query)
+        np.argpartition(distances, args.top_k)[:args.top_k]
+    per_row = time.perf_counter() - start_time
+    print(f"[*] face by face : {per_row:10.2f} s")
+
+    start_time = time.perf_counter()
+    pairs = sum(len(columns) for _, columns, _ in compare_matrices(queries, gallery, top_k=args.top_k, block_size=args.block_size))
+    blocked = time.perf_counter() - start_time
+    print(f"[*] blocked GEMM : {blocked:10.2f} s ({pairs} pairs)")
+    print(f"[*] Speed-up: {per_pair / blocked:.1f}x over pair by pair, {per_row / blocked:.1f}x over face by face")
+
+
+if __name__ == '__main__':
+    main()
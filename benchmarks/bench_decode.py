@@ -0,0 +1,148 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Measure the decode time and the peak memory of each image decode path
+
+Usage:
+    python benchmarks/bench_decode.py [--width PIXELS] [--images N] [--detection-size PIXELS] [--detect]
+
+Large JPEG photos are generated by upscaling the test images. Each path is
+run in its own process so that its peak resident memory, minus that of the
+process before decoding, can be measured. The time covers decoding the
+image and hashing it, plus looking for faces with `--detect`.
+
+    legacy   face_recognition.load_image_file, Image.fromarray and the md5
+             of image.tobytes(), as extract_faces used to do.
+    md5      pyfaces.core.imaging.load_image and the md5 of the array buffer.
+    blake2b  The same path hashing with blake2b.
+    draft    The md5 path plus a JPEG draft decode of --detection-size.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RES_FOLDER = os.path.join(ROOT_FOLDER, "tests", "res")
+PATHS = ["legacy", "md5", "blake2b", "draft"]
+
+
+def generate_photos(folder, images, width):
+    """Write large JPEG photos
+
+    Args:
+        folder (str): The output folder.
+        images (int): The number of photos.
+        width (int): The width of the photos.
+
+    Returns:
+        list. The paths to the photos.
+    """
+    from PIL import Image
+
+    sources = sorted(os.listdir(RES_FOLDER))
+    paths = []
+    for i in range(images):
+        with Image.open(os.path.join(RES_FOLDER, sources[i % len(sources)])) as image:
+            image = image.convert("RGB")
+            image = image.resize((width, int(width * image.height / image.width)), Image.BICUBIC)
+        path = os.path.join(folder, f"photo-{i:03d}.jpg")
+        image.save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def run(path_name, paths, detection_size, detect):
+    """Decode the photos following one path
+
+    Args:
+        path_name (str): One of PATHS.
+        paths (list): The paths to the photos.
+        detection_size (int): The longest side of the draft decode.
+        detect (bool): If True, faces are looked for too.
+
+    Returns:
+        dict. The mean seconds per image, the extra peak memory in MB and the faces found.
+    """
+    import face_recognition
+    from PIL import Image
+
+    from pyfaces.core.imaging import hash_pixels
+    from pyfaces.core.imaging import load_image
+
+    # ru_maxrss is in KB in Linux
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    faces = 0
+    start_time = time.perf_counter()
+    for path in paths:
+        if path_name == "legacy":
+            detection_array = image_array = face_recognition.load_image_file(path)
+            hashlib.md5(Image.fromarray(image_array).tobytes()).hexdigest()
+        else:
+            image_array, detection_array, _ = load_image(path, detection_size if path_name == "draft" else 0)
+            hash_pixels(image_array, "blake2b" if path_name == "blake2b" else "md5")
+        if detect:
+            faces += len(face_recognition.face_locations(detection_array))
+        del image_array, detection_array
+    elapsed = time.perf_counter() - start_time
+    return {
+        "seconds": elapsed / len(paths),
+        "peak_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024,
+        "faces": faces
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the image decode paths")
+    parser.add_argument("--width", type=int, default=6000, help="width of the photos generated. Default: 6000.")
+    parser.add_argument("--images", type=int, default=4, help="photos to generate. Default: 4.")
+    parser.add_argument("--detection-size", type=int, default=1500, help="longest side of the draft decode. Default: 1500.")
+    parser.add_argument("--detect", action="store_true", help="look for faces too, in the draft image for the draft path.")
+    parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--photos", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child process measuring a single path
+        print(json.dumps(run(args.run, args.photos.split(os.pathsep), args.detection_size, args.detect)))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = generate_photos(folder, args.images, args.width)
+        print(f"[*] {len(paths)} photos {args.width} pixels wide")
+        for path_name in PATHS:
+            command = [sys.executable, __file__, "--run", path_name, "--photos", os.pathsep.join(paths), "--detection-size", str(args.detection_size)]
+            if args.detect:
+                command.append("--detect")
+            output = subprocess.check_output(command, env=dict(os.environ, PYTHONPATH=ROOT_FOLDER))
+            summary = json.loads(output.decode().strip().splitlines()[-1])
+            line = f"[*] {path_name:<8}: {summary['seconds'] * 1000:8.1f} ms/image | peak +{summary['peak_mb']:7.1f} MB"
+            if args.detect:
+                line += f" | {summary['faces']} faces"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Compare deleting images one by one with a single bulk deletion
+
+Usage:
+    python benchmarks/bench_delete.py [--images N] [--deleted N]
+
+A synthetic gallery with random encodings and comparisons is generated in a
+temporary data folder, so no face detection is involved and the user's
+gallery is untouched.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def generate_gallery(images, faces_per_image=2, partners=50):
+    """Fill the data folder with a synthetic gallery
+
+    Args:
+        images (int): The number of images.
+        faces_per_image (int): The faces found in each image.
+        partners (int): The faces each face has been compared with.
+
+    Returns:
+        list. The paths to the copies of the images.
+    """
+    from pyfaces.core.configuration import ConfigManager
+
+    config = ConfigManager()
+    rng = random.Random(0)
+    metadata = {}
+    encodings = {}
+    for i in range(images):
+        copied_path = os.path.join(config.sources_folder, f"{i:08x}.bmp")
+        open(copied_path, "w").close()
+        metadata[copied_path] = {"copied_path": copied_path, "faces": [], "original_path": f"/photos/{i}.jpg"}
+        for j in range(faces_per_image):
+            face_path = os.path.join(config.faces_folder, f"{i:08x}-{j}.bmp")
+            metadata[copied_path]["faces"].append(face_path)
+            encodings[face_path] = {
+                "copied_original_file": copied_path,
+                "encodings": [[rng.random() for _ in range(128)]],
+                "face_path": face_path,
+                "original_image_path": f"/photos/{i}.jpg"
+            }
+
+    faces = list(encodings)
+    comparisons = {face_path: {} for face_path in faces}
+    for face_path in faces:
+        for partner in rng.sample(faces, partners):
+            distance = rng.random()
+            comparisons[face_path][partner] = distance
+            comparisons[partner][face_path] = distance
+
+    for file_path, data in [
+        (config.metadata_file, metadata),
+        (config.encodings_file, encodings),
+        (config.comparisons_file, comparisons),
+    ]:
+        with open(file_path, "w") as output_file:
+            json.dump(data, output_file)
+    return list(metadata)
+
+
+def run(mode, images, deleted):
+    """Delete some images from a fresh synthetic gallery
+
+    Args:
+        mode (str): Either 'one-by-one' or 'bulk'.
+        images (int): The number of images in the gallery.
+        deleted (int): The number of images to delete.
+
+    Returns:
+        float. The elapsed seconds.
+    """
+    # Imported here so that HOME is already pointing to the temporary folder
+    from pyfaces.core.processor import FaceProcessor
+
+    sources = generate_gallery(images)[:deleted]
+    proc = FaceProcessor()
+    start_time = time.perf_counter()
+    if mode == "one-by-one":
+        for source in sources:
+            proc.delete_analysis(source)
+    else:
+        proc.delete_many(source_paths=sources)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of bulk deletions")
+    parser.add_argument("--images", type=int, default=2000, help="images in the synthetic gallery. Default: 2000.")
+    parser.add_argument("--deleted", type=int, default=50, help="images to delete. Default: 50.")
+    parser.add_argument("--mode", choices=["one-by-one", "bulk"], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process with HOME already set
+        print(f"{run(args.mode, args.images, args.deleted):.4f}")
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"[*] Deleting {args.deleted} of {args.images} images")
+        timings = {}
+        for mode in ["one-by-one", "bulk"]:
+            home = os.path.join(folder, f"home-{mode}")
+            os.makedirs(home)
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--mode", mode, "--images", str(args.images), "--deleted", str(args.deleted)],
+                env=dict(os.environ, HOME=home, PYTHONPATH=ROOT_FOLDER)
+            )
+            timings[mode] = float(output.decode().strip().splitlines()[-1])
+            print(f"[*] {mode:<10}: {timings[mode]:8.3f} s | {args.deleted / timings[mode]:8.2f} images/s")
+        print(f"[*] Speed-up: {timings['one-by-one'] / timings['bulk']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Compare sequential extract_faces calls with the extract_many pipeline
+
+Usage:
+    python benchmarks/bench_extract_many.py [--copies N]
+
+Mixed-size copies of the test images are generated in a temporary folder.
+Each run uses a brand new data folder so the user's gallery is untouched.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RES_FOLDER = os.path.join(ROOT_FOLDER, "tests", "res")
+
+
+def generate_images(folder, copies):
+    """Write resized copies of the test images
+
+    Args:
+        folder (str): The output folder.
+        copies (int): The number of scales per image.
+
+    Returns:
+        list. The paths to the images.
+    """
+    from PIL import Image
+
+    paths = []
+    for name in sorted(os.listdir(RES_FOLDER)):
+        with Image.open(os.path.join(RES_FOLDER, name)) as image:
+            image = image.convert("RGB")
+            for i in range(copies):
+                scale = 0.5 + 1.5 * i / max(copies - 1, 1)
+                size = (int(image.width * scale), int(image.height * scale))
+                path = os.path.join(folder, f"{i:03d}-{os.path.splitext(name)[0]}.jpg")
+                image.resize(size).save(path, quality=90)
+                paths.append(path)
+    return paths
+
+
+def run(mode, paths):
+    """Extract the faces in a fresh data folder
+
+    Args:
+        mode (str): Either 'sequential' or 'pipeline'.
+        paths (list): The paths to the images.
+
+    Returns:
+        float. The elapsed seconds.
+    """
+    # Imported here so that HOME is already pointing to the temporary folder
+    from pyfaces.core.processor import FaceProcessor
+
+    proc = FaceProcessor()
+    start_time = time.perf_counter()
+    if mode == "sequential":
+        for path in paths:
+            proc.extract_faces(path)
+    else:
+        for _ in proc.extract_many(paths):
+            pass
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the extraction pipeline")
+    parser.add_argument("--copies", type=int, default=8, help="resized copies of each test image. Default: 8.")
+    parser.add_argument("--mode", choices=["sequential", "pipeline"], default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--images", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process with HOME already set
+        paths = args.images.split(os.pathsep)
+        print(f"{run(args.mode, paths):.4f}")
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = generate_images(folder, args.copies)
+        print(f"[*] {len(paths)} images of mixed sizes")
+        timings = {}
+        for mode in ["sequential", "pipeline"]:
+            home = os.path.join(folder, f"home-{mode}")
+            os.makedirs(home)
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--mode", mode, "--images", os.pathsep.join(paths)],
+                env=dict(os.environ, HOME=home, PYTHONPATH=ROOT_FOLDER)
+            )
+            timings[mode] = float(output.decode().strip().splitlines()[-1])
+            print(f"[*] {mode:<10}: {timings[mode]:8.3f} s | {len(paths) / timings[mode]:6.2f} images/s")
+        print(f"[*] Speed-up: {timings['sequential'] / timings['pipeline']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Measure the time saved by the face filters on crowded photos
+
+Usage:
+    python benchmarks/bench_face_filters.py [--photos N] [--min-face-size PIXELS] [--max-faces NUM]
+
+Crowded photos are generated by pasting one large copy of a test image and
+many small ones on the same canvas. Each run uses a brand new data folder so
+the user's gallery is untouched.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RES_FOLDER = os.path.join(ROOT_FOLDER, "tests", "res")
+
+
+def generate_photos(folder, photos):
+    """Write crowded photos with a few large faces and many small ones
+
+    Args:
+        folder (str): The output folder.
+        photos (int): The number of photos.
+
+    Returns:
+        list. The paths to the photos.
+    """
+    from PIL import Image
+
+    sources = []
+    for name in sorted(os.listdir(RES_FOLDER)):
+        with Image.open(os.path.join(RES_FOLDER, name)) as image:
+            sources.append(image.convert("RGB"))
+
+    rng = random.Random(0)
+    paths = []
+    for i in range(photos):
+        canvas = Image.new("RGB", (1600, 1200), (128, 128, 128))
+        large = sources[i % len(sources)]
+        canvas.paste(large.resize((800, int(800 * large.height / large.width))), (0, 0))
+        for _ in range(24):
+            small = rng.choice(sources)
+            width = rng.randint(120, 200)
+            small = small.resize((width, int(width * small.height / small.width)))
+            canvas.paste(small, (rng.randint(800, 1600 - width), rng.randint(0, 1200 - small.height)))
+        path = os.path.join(folder, f"crowd-{i:03d}.jpg")
+        canvas.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def run(paths, min_face_size, max_faces):
+    """Extract the faces in a fresh data folder
+
+    Args:
+        paths (list): The paths to the photos.
+        min_face_size (int): The minimum width and height of a face.
+        max_faces (int): The maximum number of faces per photo.
+
+    Returns:
+        dict. The elapsed seconds and the faces kept and skipped.
+    """
+    # Imported here so that HOME is already pointing to the temporary folder
+    from pyfaces.core.processor import FaceProcessor
+
+    proc = FaceProcessor()
+    summary = {"faces": 0, "over_limit": 0, "too_small": 0}
+    start_time = time.perf_counter()
+    for path in paths:
+        metadata = proc.extract_faces(path, min_face_size=min_face_size, max_faces=max_faces)
+        summary["faces"] += len(metadata["faces"])
+        for reason, count in metadata["skipped_faces"].items():
+            summary[reason] += count
+    summary["seconds"] = time.perf_counter() - start_time
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the face filters")
+    parser.add_argument("--photos", type=int, default=4, help="crowded photos to generate. Default: 4.")
+    parser.add_argument("--min-face-size", type=int, default=60, help="the minimum face size of the filtered run. Default: 60.")
+    parser.add_argument("--max-faces", type=int, default=3, help="the maximum faces per photo of the filtered run. Default: 3.")
+    parser.add_argument("--run", nargs=2, type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--images", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child process with HOME already set
+        print(json.dumps(run(args.images.split(os.pathsep), *args.run)))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = generate_photos(folder, args.photos)
+        print(f"[*] {len(paths)} crowded photos")
+        timings = {}
+        for mode, filters in [("unfiltered", (0, 0)), ("filtered", (args.min_face_size, args.max_faces))]:
+            home = os.path.join(folder, f"home-{mode}")
+            os.makedirs(home)
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--run", *map(str, filters), "--images", os.pathsep.join(paths)],
+                env=dict(os.environ, HOME=home, PYTHONPATH=ROOT_FOLDER)
+            )
+            summary = json.loads(output.decode().strip().splitlines()[-1])
+            timings[mode] = summary["seconds"] / len(paths)
+            print(
+                f"[*] {mode:<10}: {timings[mode]:8.3f} s/photo | {summary['faces']} faces kept, "
+                f"{summary['too_small']} too small, {summary['over_limit']} over the limit"
+            )
+        print(f"[*] Time saved: {timings['unfiltered'] - timings['filtered']:.3f} s/photo")
+
+
+if __name__ == '__main__':
+    main()
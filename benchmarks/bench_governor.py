@@ -0,0 +1,126 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Compare concurrent requests with and without the resource governor
+
+Usage:
+    python benchmarks/bench_governor.py [--requests N] [--queries N] [--gallery N]
+
+Several requests compare sets of random encodings at once, as concurrent
+`compare_many` calls do in pyfacesd. Without the governor, every request
+starts a thread per CPU and NumPy's BLAS starts a thread per CPU inside
+each of them. With it, BLAS is limited to `native_threads` per worker and
+the blocks of all the requests share a pool of `cpus // native_threads` workers.
+Each mode runs in its own process since BLAS reads its limits when it is
+loaded. Use --cpus to size the ungoverned pools as in a bigger host, which
+shows the oversubscription even on a small machine.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_FOLDER)
+
+from pyfaces.core.governor import NATIVE_THREAD_VARIABLES
+from pyfaces.core.governor import available_cpus
+
+
+def run(mode, cpus, requests, queries, gallery):
+    """Run the concurrent requests in this process
+
+    Args:
+        mode (str): Either 'ungoverned' or 'governed'.
+        cpus (int): The CPUs the ungoverned pools are sized for.
+        requests (int): The requests run at once.
+        queries (int): The query encodings of each request.
+        gallery (int): The gallery encodings.
+
+    Returns:
+        float. The elapsed seconds.
+    """
+    import numpy as np
+    from pyfaces.core.governor import configure_governor
+    from pyfaces.core.matrix import compare_matrices
+
+    if mode == "ungoverned":
+        # As before the governor: every request sized for the whole machine
+        configure_governor(cpus=cpus * cpus * requests, native_threads=1)
+        workers = cpus
+    else:
+        configure_governor()
+        workers = None
+
+    rng = np.random.RandomState(0)
+    gallery_matrix = rng.rand(gallery, 128).astype(np.float32)
+    query_matrices = [rng.rand(queries, 128).astype(np.float32) for _ in range(requests)]
+
+    def request(query_matrix):
+        for _ in compare_matrices(query_matrix, gallery_matrix, top_k=10, block_size=256, workers=workers):
+            pass
+
+    threads = [threading.Thread(target=request, args=(query_matrix,)) for query_matrix in query_matrices]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the resource governor")
+    parser.add_argument("--cpus", type=int, default=available_cpus(), help="CPUs the ungoverned pools are sized for. Default: the available ones.")
+    parser.add_argument("--requests", type=int, default=8, help="requests run at once. Default: 8.")
+    parser.add_argument("--queries", type=int, default=1024, help="query encodings of each request. Default: 1024.")
+    parser.add_argument("--gallery", type=int, default=50000, help="gallery encodings. Default: 50000.")
+    parser.add_argument("--mode", choices=["ungoverned", "governed"], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process with the environment already set
+        print(f"{run(args.mode, args.cpus, args.requests, args.queries, args.gallery):.4f}")
+        return
+
+    print(f"[*] {args.requests} requests of {args.queries} x {args.gallery} encodings on {available_cpus()} CPUs")
+    timings = {}
+    with tempfile.TemporaryDirectory() as home:
+        for mode in ["ungoverned", "governed"]:
+            env = dict(os.environ, HOME=home, PYTHONPATH=ROOT_FOLDER)
+            for name in NATIVE_THREAD_VARIABLES:
+                env.pop(name, None)
+            if mode == "ungoverned":
+                env.update({name: str(args.cpus) for name in NATIVE_THREAD_VARIABLES})
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--mode", mode, "--cpus", str(args.cpus), "--requests", str(args.requests), "--queries", str(args.queries), "--gallery", str(args.gallery)],
+                env=env
+            )
+            timings[mode] = float(output.decode().strip().splitlines()[-1])
+            throughput = args.requests * args.queries / timings[mode]
+            print(f"[*] {mode:<10}: {timings[mode]:8.3f} s | {throughput:10.1f} queries/s")
+    print(f"[*] Speed-up: {timings['ungoverned'] / timings['governed']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Compare the memory used by the encodings as dicts and as a FaceStore
+
+Usage:
+    python benchmarks/bench_memory.py [--faces N]
+
+A synthetic encodings file is generated in memory, so no face detection is
+involved and the user's gallery is untouched. The memory is measured with
+tracemalloc once the structure is built and the JSON text released.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pyfaces.core.store import FaceStore
+
+
+def generate_encodings(faces, faces_per_image=2):
+    """Build the text of a synthetic encodings file
+
+    Args:
+        faces (int): The number of faces.
+        faces_per_image (int): The faces found in each image.
+
+    Returns:
+        str.
+    """
+    rng = random.Random(0)
+    encodings = {}
+    for i in range(faces):
+        copied_path = f"/home/user/.config/pyfaces/data/sources/{i // faces_per_image:032x}.jpg"
+        face_path = f"/home/user/.config/pyfaces/data/faces/{i:032x}.bmp"
+        encodings[face_path] = {
+            "copied_md5": f"{i // faces_per_image:032x}",
+            "copied_original_file": copied_path,
+            "face_path": face_path,
+            "original_image_path": f"/home/user/Pictures/{i // faces_per_image}.jpg",
+            "position": {"top": rng.randrange(500), "bottom": rng.randrange(500), "left": rng.randrange(500), "right": rng.randrange(500)},
+            "encodings": [[rng.uniform(-0.3, 0.3) for _ in range(128)]],
+            "quality": {"pose": round(rng.random(), 4), "sharpness": round(rng.random(), 4), "size": round(rng.random(), 4), "score": round(rng.random(), 4)},
+            "dhash": f"{rng.getrandbits(64):016x}"
+        }
+    return json.dumps(encodings)
+
+
+def measure(text, compact):
+    """Load the encodings and measure the memory they retain
+
+    Args:
+        text (str): The contents of the encodings file.
+        compact (bool): Whether to keep them as a FaceStore instead of dicts.
+
+    Returns:
+        tuple. The retained bytes and the peak bytes while loading.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    encodings = json.loads(text)
+    if compact:
+        encodings = FaceStore(encodings)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del encodings
+    return current - start, peak - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the memory used by the encodings")
+    parser.add_argument("--faces", type=int, default=20000, help="faces in the synthetic gallery. Default: 20000.")
+    args = parser.parse_args()
+
+    text = generate_encodings(args.faces)
+    print(f"[*] Loading {args.faces} faces ({len(text) / args.faces:.0f} bytes per face on disk)")
+    results = {}
+    for name, compact in [("dict", False), ("FaceStore", True)]:
+        retained, peak = measure(text, compact)
+        results[name] = retained
+        print(f"[*] {name:<9}: {retained / args.faces:8.0f} bytes/face | peak {peak / 2 ** 20:8.1f} MiB")
+    print(f"[*] Reduction: {results['dict'] / results['FaceStore']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Measure how fast read replicas bootstrap and follow their primary
+
+Usage:
+    python benchmarks/bench_replication.py [--faces N] [--replicas N] [--deletions N]
+
+A primary pyfacesd and several replicas are launched as local processes,
+each one with its own home folder, on a synthetic gallery. The time taken
+by the replicas to bootstrap from the snapshot of the primary is reported,
+and so is the size of that snapshot compared with the encodings file.
+Then images are deleted in the primary one at a time and the lag until
+every replica serves the new generation is measured.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_FOLDER)
+
+from bench_server_modes import percentile
+from bench_server_modes import wait_until_ready
+from load_generator import seed_data_folder
+from pyfaces.core.rpc import RPCClient
+
+
+def launch(home, port, *params):
+    """Start a pyfacesd in its own home folder"""
+    return subprocess.Popen(
+        [sys.executable, "-m", "pyfaces.server", "--host", "127.0.0.1", "-p", str(port), *params],
+        env=dict(os.environ, HOME=home, PYTHONPATH=ROOT_FOLDER),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def wait_for_generation(replicas, generation, timeout=600):
+    """Wait until every replica serves a generation of the primary"""
+    def behind(replica):
+        held = replica.call("info")["replica"]["generation"]
+        return held is None or held < generation
+
+    deadline = time.time() + timeout
+    pending = list(replicas)
+    while pending:
+        if time.time() > deadline:
+            raise RuntimeError("The replicas did not catch up in time")
+        pending = [replica for replica in pending if behind(replica)]
+        if pending:
+            time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the read replicas of pyfacesd")
+    parser.add_argument("--faces", type=int, default=20000, help="faces in the synthetic gallery. Default: 20000.")
+    parser.add_argument("--replicas", type=int, default=2, help="replicas following the primary. Default: 2.")
+    parser.add_argument("--deletions", type=int, default=20, help="images deleted one at a time in the primary. Default: 20.")
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between polls of the replicas. Default: 0.1.")
+    parser.add_argument("--port", type=int, default=12970, help="the first port to use. Default: 12970.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        homes = [os.path.join(folder, f"home-{i}") for i in range(args.replicas + 1)]
+        for home in homes:
+            os.makedirs(home)
+        os.environ["HOME"] = homes[0]
+        face_paths, _ = seed_data_folder(args.faces, 0, max(args.faces // 10, 1), 0)
+        from pyfaces.core.configuration import ConfigManager
+        encodings_file = ConfigManager().encodings_file
+        print(f"[*] Primary with {len(face_paths)} faces and {args.replicas} replicas")
+
+        daemons = [launch(homes[0], args.port)]
+        try:
+            wait_until_ready(args.port)
+            primary = RPCClient(f"http://127.0.0.1:{args.port}", timeout=600)
+
+            snapshot = json.dumps(primary.call("replication_snapshot", limit=len(face_paths)))
+            print(f"[*] Snapshot: {len(snapshot) / 2**20:8.2f} MiB | encodings file: {os.path.getsize(encodings_file) / 2**20:8.2f} MiB")
+
+            start_time = time.perf_counter()
+            replicas = []
+            for i, home in enumerate(homes[1:], start=1):
+                port = args.port + i
+                daemons.append(launch(home, port, "--replica-of", primary.url, "--replica-interval", str(args.interval)))
+                replicas.append(RPCClient(f"http://127.0.0.1:{port}", timeout=600))
+            for i in range(1, len(homes)):
+                wait_until_ready(args.port + i)
+            wait_for_generation(replicas, primary.call("info")["generation"])
+            print(f"[*] Bootstrap: {time.perf_counter() - start_time:8.3f} s (including the start of the daemons)")
+
+            lags = []
+            for i in range(args.deletions):
+                primary.call("delete_many", source_paths=[f"/photos/{i}.jpg"])
+                start_time = time.perf_counter()
+                wait_for_generation(replicas, primary.call("info")["generation"])
+                lags.append(time.perf_counter() - start_time)
+            print(f"[*] Replication lag: p50 {percentile(lags, 0.5) * 1000:8.1f} ms | max {max(lags) * 1000:8.1f} ms")
+
+            statuses = [replica.call("info")["replica"] for replica in replicas]
+            print(f"[*] Reported staleness: max {max(status['staleness'] for status in statuses):.3f} s")
+        finally:
+            for daemon in daemons:
+                daemon.terminate()
+                daemon.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Measure the latency of searches during a heavy ingestion
+
+Usage:
+    python benchmarks/bench_scheduler.py [--threads N] [--bulk-clients N] [--seconds N]
+
+The JSON-RPC methods are replaced by synthetic ones so that no face
+detection is involved: 'guess_encoding' searches a random gallery and
+'extract_faces' runs a large matrix product, as CPU-bound as detecting the
+faces of a photo. A pool of threads plays the part of the waitress threads.
+Interactive clients search while bulk clients send extractions as fast as
+they can, with and without the scheduler in front of the dispatcher.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_FOLDER)
+
+# Keep the configuration of the user untouched
+os.environ["HOME"] = tempfile.mkdtemp()
+
+import numpy as np
+from jsonrpc import Dispatcher
+from jsonrpc import JSONRPCResponseManager
+
+from pyfaces.core.governor import get_governor
+from pyfaces.core.scheduler import RequestScheduler
+from pyfaces.core.scheduler import default_limits
+from pyfaces.core.scheduler import percentile
+from pyfaces.server import schedule_methods
+
+
+def build_dispatcher(gallery_size):
+    """Build a dispatcher with the synthetic methods
+
+    Args:
+        gallery_size (int): The encodings of the random gallery.
+
+    Returns:
+        Dispatcher.
+    """
+    rng = np.random.RandomState(0)
+    gallery = rng.rand(gallery_size, 128).astype(np.float32)
+    photo = rng.rand(1500, 1500).astype(np.float32)
+
+    def guess_encoding(encoding):
+        distances = np.linalg.norm(gallery - np.asarray(encoding, dtype=np.float32), axis=1)
+        return np.argpartition(distances, 10)[:10].tolist()
+
+    def extract_faces(image_path):
+        photo @ photo
+        return {"image_path": image_path, "faces": []}
+
+    methods = Dispatcher()
+    methods.add_method(guess_encoding)
+    methods.add_method(extract_faces)
+    return methods
+
+
+def run(methods, threads, bulk_clients, interactive_clients, seconds):
+    """Run the clients against a pool of request threads
+
+    Args:
+        methods (Dispatcher): The dispatcher of the server.
+        threads (int): The request threads.
+        bulk_clients (int): The clients sending extractions.
+        interactive_clients (int): The clients sending searches.
+        seconds (float): The duration of the run.
+
+    Returns:
+        dict. The latencies of the searches, and the extractions done and refused.
+    """
+    pool = ThreadPoolExecutor(threads)
+    stop = threading.Event()
+    latencies = []
+    counts = {"extractions": 0, "refused": 0}
+    lock = threading.Lock()
+    encoding = json.dumps([0.5] * 128)
+
+    def call(method, params):
+        body = f'{{"jsonrpc": "2.0", "id": 1, "method": "{method}", "params": {params}}}'
+        return json.loads(pool.submit(JSONRPCResponseManager.handle, body, methods).result().json)
+
+    def bulk():
+        while not stop.is_set():
+            answer = call("extract_faces", '{"image_path": "photo.jpg"}')
+            with lock:
+                if "error" in answer:
+                    counts["refused"] += 1
+                else:
+                    counts["extractions"] += 1
+            if "error" in answer:
+                stop.wait(answer["error"]["data"]["retry_after"])
+
+    def interactive():
+        while not stop.is_set():
+            start_time = time.perf_counter()
+            call("guess_encoding", f'{{"encoding": {encoding}}}')
+            with lock:
+                latencies.append(time.perf_counter() - start_time)
+            stop.wait(0.05)
+
+    clients = [threading.Thread(target=bulk) for _ in range(bulk_clients)]
+    clients += [threading.Thread(target=interactive) for _ in range(interactive_clients)]
+    for client in clients:
+        client.start()
+    time.sleep(seconds)
+    stop.set()
+    for client in clients:
+        client.join()
+    pool.shutdown()
+    return {"latencies": sorted(latencies), **counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the request scheduler")
+    parser.add_argument("--threads", type=int, default=8, help="request threads. Default: 8.")
+    parser.add_argument("--bulk-clients", type=int, default=16, help="clients sending extractions. Default: 16.")
+    parser.add_argument("--interactive-clients", type=int, default=2, help="clients sending searches. Default: 2.")
+    parser.add_argument("--gallery", type=int, default=20000, help="encodings of the gallery. Default: 20000.")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each run. Default: 10.")
+    args = parser.parse_args()
+
+    limits, queue_sizes = default_limits(args.threads, get_governor().workers)
+    print(f"[*] {args.threads} request threads, {args.bulk_clients} bulk and {args.interactive_clients} interactive clients for {args.seconds} s")
+    print(f"[*] Limits: {limits} | Queue sizes: {queue_sizes}")
+
+    for mode, bulk_clients in [("searches only", 0), ("unscheduled", args.bulk_clients), ("scheduled", args.bulk_clients)]:
+        methods = build_dispatcher(args.gallery)
+        if mode == "scheduled":
+            schedule_methods(RequestScheduler(limits, queue_sizes, capacity=args.threads), methods)
+        result = run(methods, args.threads, bulk_clients, args.interactive_clients, args.seconds)
+        latencies = result["latencies"]
+        print(
+            f"[*] {mode:<13}: search p50 {percentile(latencies, 0.5) * 1000:8.1f} ms | "
+            f"p99 {percentile(latencies, 0.99) * 1000:8.1f} ms | "
+            f"{result['extractions']:5} extractions, {result['refused']:5} refused"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Load test comparing the waitress and asyncio front ends of pyfacesd
+
+Usage:
+    python benchmarks/bench_server_modes.py [--idle N] [--clients N] [--requests N]
+
+Each mode is started in a subprocess with a brand new data folder. Idle and
+slow clients are opened first and then active clients call 'info' over
+keep-alive connections.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def percentile(values, ratio):
+    """Get a percentile of a list of values"""
+    values = sorted(values)
+    return values[min(int(len(values) * ratio), len(values) - 1)] if values else float("nan")
+
+
+def wait_until_ready(port, timeout=60):
+    """Wait until the daemon answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("POST", "/", json.dumps({"jsonrpc": "2.0", "id": 0, "method": "info"}))
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("The daemon did not start in time")
+
+
+def active_client(port, requests, latencies, errors):
+    """Call 'info' several times reusing the connection"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    body = json.dumps({"jsonrpc": "2.0", "id": 1, "method": "info"})
+    for _ in range(requests):
+        start_time = time.perf_counter()
+        try:
+            connection.request("POST", "/", body, {"Content-Type": "application/json"})
+            json.loads(connection.getresponse().read())
+            latencies.append(time.perf_counter() - start_time)
+        except Exception:
+            errors.append(1)
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+
+def run(mode, port, args):
+    """Launch a daemon and load it"""
+    with tempfile.TemporaryDirectory() as home:
+        daemon = subprocess.Popen(
+            [sys.executable, "-m", "pyfaces.server", "--host", "127.0.0.1", "-p", str(port), "-m", mode, "-t", str(args.threads)],
+            env=dict(os.environ, HOME=home, PYTHONPATH=ROOT_FOLDER),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_ready(port)
+
+            # Idle clients and slow clients sending half a request
+            idle = []
+            for i in range(args.idle):
+                try:
+                    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+                    if i % 2:
+                        sock.sendall(b"POST / HTTP/1.1\r\nHost: localhost\r\n")
+                    idle.append(sock)
+                except OSError:
+                    break
+
+            latencies = []
+            errors = []
+            threads = [
+                threading.Thread(target=active_client, args=(port, args.requests, latencies, errors))
+                for _ in range(args.clients)
+            ]
+            start_time = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start_time
+
+            for sock in idle:
+                sock.close()
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    print(
+        f"[*] {mode:<8} | idle: {len(idle):5d} | ok: {len(latencies):6d} | errors: {len(errors):5d} | "
+        f"{len(latencies) / elapsed:8.1f} req/s | p50: {percentile(latencies, 0.5) * 1000:7.2f} ms | "
+        f"p99: {percentile(latencies, 0.99) * 1000:7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the pyfacesd front ends")
+    parser.add_argument("--idle", type=int, default=1000, help="idle and slow connections kept open. Default: 1000.")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent active clients. Default: 32.")
+    parser.add_argument("--requests", type=int, default=200, help="requests per active client. Default: 200.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="threads of the daemon.")
+    parser.add_argument("--port", type=int, default=12950, help="the first port to use. Default: 12950.")
+    args = parser.parse_args()
+
+    for i, mode in enumerate(["waitress", "asyncio"]):
+        run(mode, args.port + i, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Compare the RAM and the search latency of a flat and a tiered index
+
+Usage:
+    python benchmarks/bench_tiers.py [--gallery N] [--hot N] [--queries N]
+
+Random encodings are added oldest first, as when the index is built from
+the encodings file, so the newest `--hot` faces end up in RAM. Hot queries
+are slightly changed copies of those faces and cold queries of the oldest
+ones. The memory allocated by NumPy is measured with tracemalloc, which
+does not count the memory-mapped segments.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pyfaces.core.index import EncodingIndex
+from pyfaces.core.tiers import TieredIndex
+
+
+def build(index, encodings):
+    """Fill an index measuring the memory it keeps
+
+    Args:
+        index (EncodingIndex): An empty EncodingIndex or TieredIndex.
+        encodings (numpy.array): The gallery, oldest first.
+
+    Returns:
+        tuple. The index, the bytes kept and the seconds taken.
+    """
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    for row, encoding in enumerate(encodings):
+        index.add(f"/data/faces/{row:08x}.bmp", encoding)
+    elapsed = time.perf_counter() - start_time
+    kept = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return index, kept, elapsed
+
+
+def latency(index, queries, top_k):
+    """Get the mean seconds of a search
+
+    Args:
+        index (EncodingIndex): The index.
+        queries (numpy.array): The query encodings.
+        top_k (int): The results of each search.
+
+    Returns:
+        float.
+    """
+    start_time = time.perf_counter()
+    for query in queries:
+        index.search(query, top_k)
+    return (time.perf_counter() - start_time) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the tiered search index")
+    parser.add_argument("--gallery", type=int, default=200000, help="faces in the gallery. Default: 200000.")
+    parser.add_argument("--hot", type=int, default=20000, help="faces kept in RAM by the tiered index. Default: 20000.")
+    parser.add_argument("--queries", type=int, default=50, help="queries of each kind. Default: 50.")
+    parser.add_argument("--top-k", type=int, default=10, help="results of each search. Default: 10.")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    # Unrelated faces are ~0.9 apart and the copies ~0.1 from their face
+    encodings = rng.normal(0, 0.056, (args.gallery, 128)).astype(np.float32)
+    hot_rows = rng.randint(args.gallery - args.hot, args.gallery, args.queries)
+    cold_rows = rng.randint(0, args.gallery - args.hot, args.queries)
+    noise = rng.normal(0, 0.009, (args.queries, 128))
+
+    print(f"[*] {args.gallery} faces, {args.hot} of them hot, top {args.top_k}")
+    with tempfile.TemporaryDirectory() as folder:
+        indexes = {
+            "flat": EncodingIndex(),
+            "tiered": TieredIndex(folder, args.hot)
+        }
+        for name, index in indexes.items():
+            index, kept, elapsed = build(index, encodings)
+            hot = latency(index, encodings[hot_rows] + noise, args.top_k)
+            cold = latency(index, encodings[cold_rows] + noise, args.top_k)
+            print(
+                f"[*] {name:<6}: {kept / 2 ** 20:8.1f} MB in RAM | built in {elapsed:6.2f} s | "
+                f"hot query {hot * 1000:7.2f} ms | cold query {cold * 1000:7.2f} ms"
+            )
+        print(f"[*] Tiers: {indexes['tiered'].stats()}")
+
+
+if __name__ == '__main__':
+    main()
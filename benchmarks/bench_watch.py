@@ -0,0 +1,83 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Measure the cost of scanning a watched folder with many files
+
+Usage:
+    python benchmarks/bench_watch.py [--files N] [--folders N]
+
+Empty image files are created in a temporary folder and the extraction is
+replaced by a stand-in which only counts the images, so the numbers only
+reflect the scans.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pyfaces.core.watch import FolderWatcher
+
+
+class CountingProcessor:
+    """Stands for a FaceProcessor counting the images it gets"""
+    def __init__(self):
+        self.images = 0
+
+    def extract_many(self, image_paths, batch_size=16, **kwargs):
+        for image_path in image_paths:
+            self.images += 1
+            yield image_path, {"faces": []}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the scans of a watched folder")
+    parser.add_argument("--files", type=int, default=200000, help="files in the folder. Default: 200000.")
+    parser.add_argument("--folders", type=int, default=2000, help="subfolders holding them. Default: 2000.")
+    parser.add_argument("--dropped", type=int, default=20, help="files dropped before the last scan. Default: 20.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder, tempfile.TemporaryDirectory() as index_folder:
+        old = time.time() - 3600
+        for i in range(args.files):
+            subfolder = os.path.join(folder, f"{i % args.folders:05d}")
+            if i < args.folders:
+                os.makedirs(subfolder)
+            path = os.path.join(subfolder, f"{i:08d}.jpg")
+            open(path, "w").close()
+            os.utime(path, (old, old))
+
+        processor = CountingProcessor()
+        watcher = FolderWatcher(processor, folder, os.path.join(index_folder, "index.json"), settle=0, batch_size=4096)
+        print(f"[*] {args.files} files in {args.folders} folders")
+        for label, full in [("first scan", False), ("full scan", True), ("incremental", False)]:
+            report = watcher.poll(full)
+            print(f"[*] {label:<12}: {report['scan_seconds']:8.4f} s scanning | {report['listed_folders']:6d} folders listed | {report['images']:7d} images")
+
+        for i in range(args.dropped):
+            open(os.path.join(folder, f"{i % args.folders:05d}", f"new-{i}.jpg"), "w").close()
+        report = watcher.poll()
+        print(f"[*] {'new files':<12}: {report['scan_seconds']:8.4f} s scanning | {report['listed_folders']:6d} folders listed | {report['images']:7d} images | lag: {report['lag']:.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Measure the cost of checking new faces against a watchlist
+
+Usage:
+    python benchmarks/bench_watchlist.py [--persons N [N ...]] [--batches N [N ...]]
+
+Each person of the watchlist has three reference encodings. The batches of
+new faces are random encodings, so the time is that of the matrix product
+and not that of building the hits. The time of one check is reported per
+new face, as it is added to the ingestion of every face.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pyfaces.core.watchlist import Watchlist
+
+
+def seconds_per_face(watchlist, batch, repetitions):
+    """Get the mean seconds that checking a new face takes
+
+    Args:
+        watchlist (Watchlist): The watchlist.
+        batch (dict): The new encodings entries by face path.
+        repetitions (int): The checks timed.
+
+    Returns:
+        float.
+    """
+    start_time = time.perf_counter()
+    for _ in range(repetitions):
+        watchlist.check(batch)
+    return (time.perf_counter() - start_time) / repetitions / len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the watchlist checks")
+    parser.add_argument("--persons", type=int, nargs="+", default=[10, 100, 1000], help="sizes of the watchlist. Default: 10 100 1000.")
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 16, 256], help="new faces checked at once. Default: 1 16 256.")
+    parser.add_argument("--repetitions", type=int, default=200, help="checks timed for each case. Default: 200.")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    with tempfile.TemporaryDirectory() as folder:
+        for persons in args.persons:
+            watchlist = Watchlist(os.path.join(folder, "watchlist.json"), os.path.join(folder, "hits.ndjson"))
+            for person in range(persons):
+                watchlist.add(f"person-{person}", rng.normal(0, 0.056, (3, 128)))
+            for size in args.batches:
+                batch = {
+                    f"/data/faces/{row:08x}.bmp": {"encodings": [encoding]}
+                    for row, encoding in enumerate(rng.normal(0, 0.056, (size, 128)))
+                }
+                elapsed = seconds_per_face(watchlist, batch, args.repetitions)
+                print(f"[*] {persons:5d} persons | batches of {size:4d} faces | {elapsed * 1e6:9.2f} µs per face")
+
+
+if __name__ == '__main__':
+    main()
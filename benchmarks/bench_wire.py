@@ -0,0 +1,138 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Compare the size and speed of the JSON and compact response formats
+
+Usage:
+    python benchmarks/bench_wire.py [--faces N] [--queries N] [--top-k N]
+
+Synthetic results are serialized as a server would send them, with and
+without gzip, and parsed back as the client does. No server is started.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pyfaces.core import wire
+from pyfaces.core.rpc import compress
+from pyfaces.core.rpc import decompress
+
+
+def generate_results(faces, queries, top_k):
+    """Build a face entry, a guess and a many-to-many comparison
+
+    Args:
+        faces (int): The known faces in the gallery.
+        queries (int): The faces compared with the gallery.
+        top_k (int): The matches kept for each query.
+
+    Returns:
+        dict. The results by name with their pack and unpack functions.
+    """
+    rng = random.Random(0)
+    folder = "/home/user/.config/pyfaces/data/faces"
+    paths = [f"{folder}/{rng.getrandbits(128):032x}.bmp" for _ in range(faces)]
+
+    def comparisons(count):
+        return sorted(
+            ({"known_face": path, "similarity": rng.random()} for path in rng.sample(paths, count)),
+            key=lambda c: c["similarity"]
+        )
+
+    face = {
+        "copied_original_file": f"{folder}/../sources/{rng.getrandbits(128):032x}.jpg",
+        "encodings": [[rng.uniform(-0.3, 0.3) for _ in range(128)]],
+        "face_path": paths[0],
+        "original_image_path": "/photos/0.jpg"
+    }
+    guess = {"face_path": paths[0], "comparisons": comparisons(faces)}
+    matches = {
+        "queries": queries,
+        "faces": faces,
+        "pairs": queries * faces,
+        "matches": {rng.choice(paths): comparisons(top_k) for _ in range(queries)},
+        "seconds": 1.0
+    }
+    return {
+        "get_face": (face, wire.compact_face, wire.expand_face),
+        "guess_face": (guess, wire.compact_guess, wire.expand_guess),
+        "compare_many": (matches, wire.compact_matches, wire.expand_matches),
+    }
+
+
+def measure(result, pack, unpack, encoding, repeat):
+    """Serialize and parse a result the way the server and the client do
+
+    Args:
+        result (dict): The result in the JSON format.
+        pack (callable): The compact packer or None for plain JSON.
+        unpack (callable): The compact unpacker or None for plain JSON.
+        encoding (str): The Accept-Encoding of the client.
+        repeat (int): The times to repeat the round trip.
+
+    Returns:
+        tuple. The bytes sent, and the seconds to encode and to decode.
+    """
+    encode_seconds = decode_seconds = 0
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        body, coding = compress(json.dumps(pack(result) if pack else result).encode("utf-8"), encoding)
+        encode_seconds += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        parsed = json.loads(decompress(body, coding))
+        if unpack:
+            parsed = unpack(parsed)
+        decode_seconds += time.perf_counter() - start_time
+    return len(body), encode_seconds / repeat, decode_seconds / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the response formats")
+    parser.add_argument("--faces", type=int, default=20000, help="known faces in the gallery. Default: 20000.")
+    parser.add_argument("--queries", type=int, default=1000, help="queries of the many-to-many comparison. Default: 1000.")
+    parser.add_argument("--top-k", type=int, default=10, help="matches kept for each query. Default: 10.")
+    parser.add_argument("--repeat", type=int, default=5, help="round trips to average. Default: 5.")
+    args = parser.parse_args()
+
+    for name, (result, pack, unpack) in generate_results(args.faces, args.queries, args.top_k).items():
+        print(f"[*] {name}")
+        baseline = None
+        for label, packer, unpacker, encoding in [
+            ("json", None, None, ""),
+            ("json+gzip", None, None, "gzip"),
+            ("compact", pack, unpack, ""),
+            ("compact+gzip", pack, unpack, "gzip"),
+        ]:
+            size, encode_seconds, decode_seconds = measure(result, packer, unpacker, encoding, args.repeat)
+            baseline = baseline or size
+            print(
+                f"    {label:<13}: {size:>10} bytes ({size / baseline:6.1%}) | "
+                f"encode {encode_seconds * 1000:8.2f} ms | decode {decode_seconds * 1000:8.2f} ms"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+"""Deterministic synthetic load generator for pyfacesd
+
+Usage:
+    python benchmarks/load_generator.py [--faces N] [--qps N] [--requests N] [--mix MIX]
+
+A data folder is seeded with synthetic encodings, metadata and noise images
+and a local daemon is started on it, so everything runs offline without
+real photos. A mix of JSON-RPC calls is then replayed at a target rate by
+several concurrent clients and the latency percentiles and error rates of
+each method are reported.
+
+The same --seed always produces the same gallery and the same sequence of
+calls. Latencies are measured from the time each call was scheduled, so a
+daemon that cannot keep up with the target rate shows it in the results.
+
+To load a daemon which is already running, seed its home folder first and
+point the generator to it:
+
+    python benchmarks/load_generator.py --home /tmp/load --seed-only
+    HOME=/tmp/load pyfacesd -p 12012 &
+    python benchmarks/load_generator.py --home /tmp/load --url http://localhost:12012
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_FOLDER)
+
+from bench_server_modes import percentile
+from bench_server_modes import wait_until_ready
+from pyfaces.core.rpc import RPCClient
+from pyfaces.core.rpc import RPCError
+
+METHODS = ["extract_faces", "get_face", "guess_face", "info"]
+DEFAULT_MIX = "guess_face=5,get_face=3,info=1,extract_faces=1"
+
+
+def parse_mix(text):
+    """Parse the share of each method in the load
+
+    Args:
+        text (str): Comma separated 'method=weight' pairs.
+
+    Returns:
+        list. The (method, weight) tuples.
+
+    Raises:
+        ValueError.
+    """
+    mix = []
+    for item in text.split(","):
+        method, _, weight = item.partition("=")
+        method = method.strip()
+        if method not in METHODS:
+            raise ValueError(f"Unknown method '{method}'. Use one of: {', '.join(METHODS)}.")
+        weight = float(weight or 1)
+        if weight < 0:
+            raise ValueError(f"The weight of '{method}' cannot be negative.")
+        mix.append((method, weight))
+    if not any(weight for _, weight in mix):
+        raise ValueError("At least one method needs a positive weight.")
+    return mix
+
+
+def seed_data_folder(faces, images, identities, seed):
+    """Fill the data folder of the current HOME with a synthetic gallery
+
+    Faces are grouped in identities whose encodings are close to each other,
+    so guesses have meaningful matches. A folder already seeded is reused.
+
+    Args:
+        faces (int): The number of faces.
+        images (int): The number of noise images to extract faces from.
+        identities (int): The number of distinct people.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        tuple. The face paths and the image paths.
+    """
+    # Imported here so that HOME is already pointing to the right folder
+    from PIL import Image
+    from pyfaces.core.configuration import ConfigManager
+
+    config = ConfigManager()
+    images_folder = os.path.join(config.app_folder, "load-images")
+    if os.path.exists(config.encodings_file) and os.path.isdir(images_folder):
+        with open(config.encodings_file) as input_file:
+            face_paths = sorted(json.load(input_file))
+        image_paths = sorted(os.path.join(images_folder, name) for name in os.listdir(images_folder))
+        return face_paths, image_paths
+
+    rng = random.Random(seed)
+    centers = [[rng.gauss(0, 0.1) for _ in range(128)] for _ in range(identities)]
+    metadata = {}
+    encodings = {}
+    for i in range(faces):
+        source_md5 = f"{i // 2:032x}"
+        copied_path = os.path.join(config.sources_folder, f"{source_md5}.jpg")
+        face_path = os.path.join(config.faces_folder, f"{i:032x}.bmp")
+        if copied_path not in metadata:
+            metadata[copied_path] = {
+                "copied_md5": source_md5,
+                "copied_path": copied_path,
+                "extraction_date": "2022-01-01 00:00:00",
+                "faces": [],
+                "original_path": f"/photos/{i // 2}.jpg"
+            }
+        metadata[copied_path]["faces"].append(face_path)
+        center = centers[rng.randrange(identities)]
+        top, left = rng.randrange(400), rng.randrange(400)
+        encodings[face_path] = {
+            "copied_md5": f"{i:032x}",
+            "copied_original_file": copied_path,
+            "face_path": face_path,
+            "original_image_path": f"/photos/{i // 2}.jpg",
+            "position": {"top": top, "bottom": top + 80, "left": left, "right": left + 80},
+            "encodings": [[value + rng.gauss(0, 0.03) for value in center]],
+            "dhash": f"{rng.getrandbits(64):016x}"
+        }
+
+    for file_path, data in [(config.metadata_file, metadata), (config.encodings_file, encodings)]:
+        with open(file_path, "w") as output_file:
+            json.dump(data, output_file)
+
+    os.makedirs(images_folder)
+    image_paths = []
+    for i in range(images):
+        image_path = os.path.join(images_folder, f"{i:05d}.jpg")
+        Image.frombytes("RGB", (320, 240), rng.randbytes(320 * 240 * 3)).save(image_path)
+        image_paths.append(image_path)
+    return sorted(encodings), image_paths
+
+
+def build_schedule(mix, qps, requests, face_paths, image_paths, top_k, seed):
+    """Build the calls to replay and the time they must be sent at
+
+    Args:
+        mix (list): The (method, weight) tuples.
+        qps (float): The target rate of calls per second.
+        requests (int): The number of calls.
+        face_paths (list): The faces to ask for.
+        image_paths (list): The images to extract faces from, in turns.
+        top_k (int): The number of matches asked to 'guess_face'.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        list. The (offset in seconds, method, params) tuples.
+    """
+    rng = random.Random(seed)
+    methods, weights = zip(*mix)
+    schedule = []
+    extractions = 0
+    for i in range(requests):
+        method = rng.choices(methods, weights)[0]
+        if method == "guess_face":
+            params = {"face_path": rng.choice(face_paths), "top_k": top_k}
+        elif method == "get_face":
+            params = {"face_path": rng.choice(face_paths)}
+        elif method == "extract_faces":
+            params = {"image_path": image_paths[extractions % len(image_paths)]}
+            extractions += 1
+        else:
+            params = {}
+        schedule.append((i / qps, method, params))
+    return schedule
+
+
+def replay(url, schedule, concurrency, timeout):
+    """Send the calls of a schedule with several concurrent clients
+
+    Args:
+        url (str): The URL of the daemon.
+        schedule (list): The (offset in seconds, method, params) tuples.
+        concurrency (int): The number of clients sending calls at once.
+        timeout (float): The socket timeout of each call.
+
+    Returns:
+        tuple. The (method, latency, error) tuples and the elapsed seconds.
+    """
+    pending = queue.Queue()
+    for item in schedule:
+        pending.put(item)
+    results = []
+    start_time = time.perf_counter()
+
+    def client():
+        rpc = RPCClient(url, timeout=timeout)
+        while True:
+            try:
+                offset, method, params = pending.get_nowait()
+            except queue.Empty:
+                return
+            delay = start_time + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            error = None
+            try:
+                rpc.call(method, **params)
+            except RPCError as exc:
+                error = f"rpc: {exc}"
+            except OSError as exc:
+                error = f"transport: {exc.__class__.__name__}"
+            results.append((method, time.perf_counter() - start_time - offset, error))
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start_time
+
+
+def summarize(results, elapsed):
+    """Compute the latency percentiles and error rates of each method
+
+    Args:
+        results (list): The (method, latency, error) tuples.
+        elapsed (float): The seconds it took to replay the schedule.
+
+    Returns:
+        dict. The statistics by method, including 'all' for the whole load.
+    """
+    groups = {"all": results}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+
+    report = {}
+    for method, items in sorted(groups.items()):
+        latencies = [latency for _, latency, _ in items]
+        errors = [error for _, _, error in items if error]
+        report[method] = {
+            "calls": len(items),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(items),
+            "qps": len(items) / elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p90_ms": percentile(latencies, 0.9) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies) * 1000,
+            "sample_errors": sorted(set(errors))[:3]
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic synthetic load generator for pyfacesd")
+    group_seed = parser.add_argument_group("Seeding arguments", "Configuring the synthetic gallery.")
+    group_seed.add_argument("--home", default=None, help="the home folder holding the data folder. Default: a temporary folder.")
+    group_seed.add_argument("--faces", type=int, default=10000, help="faces in the synthetic gallery. Default: 10000.")
+    group_seed.add_argument("--identities", type=int, default=1000, help="distinct people among the faces. Default: 1000.")
+    group_seed.add_argument("--images", type=int, default=50, help="noise images used by 'extract_faces'. Default: 50.")
+    group_seed.add_argument("--seed", type=int, default=0, help="seed of the gallery and of the calls. Default: 0.")
+    group_seed.add_argument("--seed-only", action="store_true", default=False, help="seed the data folder and exit.")
+
+    group_load = parser.add_argument_group("Load arguments", "Configuring the calls to replay.")
+    group_load.add_argument("--mix", default=DEFAULT_MIX, help=f"weight of each method. Default: '{DEFAULT_MIX}'.")
+    group_load.add_argument("--qps", type=float, default=50, help="target calls per second. Default: 50.")
+    group_load.add_argument("--requests", type=int, default=1000, help="total calls. Default: 1000.")
+    group_load.add_argument("--concurrency", type=int, default=16, help="clients sending calls at once. Default: 16.")
+    group_load.add_argument("--top-k", type=int, default=10, help="matches asked to 'guess_face'. Default: 10.")
+    group_load.add_argument("--timeout", type=float, default=60, help="seconds before a call is given up. Default: 60.")
+    group_load.add_argument("--report", default=None, help="also save the statistics as JSON in this file.")
+
+    group_daemon = parser.add_argument_group("Daemon arguments", "Configuring the daemon under load.")
+    group_daemon.add_argument("--url", default=None, help="a running daemon using the same home folder. Default: start one.")
+    group_daemon.add_argument("--mode", choices=["waitress", "asyncio"], default="waitress", help="front end of the started daemon.")
+    group_daemon.add_argument("--threads", type=int, default=os.cpu_count(), help="threads of the started daemon.")
+    group_daemon.add_argument("--port", type=int, default=12960, help="port of the started daemon. Default: 12960.")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.url and not args.home:
+        parser.error("--home is needed with --url to find the faces of the seeded gallery.")
+
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        home = os.path.abspath(args.home or temporary_folder)
+        os.makedirs(home, exist_ok=True)
+        os.environ["HOME"] = home
+        face_paths, image_paths = seed_data_folder(args.faces, args.images, args.identities, args.seed)
+        print(f"[*] Gallery in '{home}': {len(face_paths)} faces, {len(image_paths)} images")
+        if args.seed_only:
+            return
+
+        daemon = None
+        url = args.url
+        if not url:
+            daemon = subprocess.Popen(
+                [sys.executable, "-m", "pyfaces.server", "--host", "127.0.0.1", "-p", str(args.port), "-m", args.mode, "-t", str(args.threads)],
+                env=dict(os.environ, HOME=home, PYTHONPATH=ROOT_FOLDER),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            url = f"http://127.0.0.1:{args.port}"
+        try:
+            if daemon:
+                wait_until_ready(args.port)
+            schedule = build_schedule(mix, args.qps, args.requests, face_paths, image_paths, args.top_k, args.seed)
+            print(f"[*] Replaying {len(schedule)} calls at {args.qps:g} calls/s with {args.concurrency} clients")
+            results, elapsed = replay(url, schedule, args.concurrency, args.timeout)
+        finally:
+            if daemon:
+                daemon.terminate()
+                daemon.wait()
+
+    report = summarize(results, elapsed)
+    for method, stats in report.items():
+        print(
+            f"[*] {method:<13} | calls: {stats['calls']:6d} | errors: {stats['error_rate'] * 100:6.2f} % | "
+            f"{stats['qps']:8.1f} calls/s | p50: {stats['p50_ms']:8.2f} ms | p90: {stats['p90_ms']:8.2f} ms | "
+            f"p99: {stats['p99_ms']:8.2f} ms | max: {stats['max_ms']:8.2f} ms"
+        )
+        for error in stats["sample_errors"]:
+            print(f"    - {error}")
+    if args.report:
+        with open(args.report, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
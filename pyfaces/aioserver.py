@@ -0,0 +1,351 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import time
+
+from jsonrpc import JSONRPCResponseManager
+
+from pyfaces.core.rpc import compress
+
+
+REASONS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+}
+
+
+class HTTPError(Exception):
+    """An error that closes the connection after answering with a status
+
+    Attributes:
+        status (int): The HTTP status code.
+    """
+    def __init__(self, status):
+        super().__init__(REASONS[status])
+        self.status = status
+
+
+class AsyncJSONRPCServer:
+    """An asyncio front end for the JSON-RPC dispatcher
+
+    Connections are handled by coroutines, so idle or slow clients do not
+    hold an OS thread. Only the dispatching of each request runs in a thread
+    pool. Connections are kept alive and pipelined requests are dispatched
+    concurrently while their responses are sent back in order.
+
+    Attributes:
+        dispatcher (jsonrpc.Dispatcher): The methods to serve.
+        executor (concurrent.futures.Executor): The pool running the methods.
+        keep_alive_timeout (float): Seconds an idle connection is kept open.
+        max_body_size (int): The largest request body accepted, in bytes.
+        max_pipelined (int): The requests of a connection dispatched at once.
+        idle_timeout (float): Seconds without requests before the server stops
+            by itself. None to serve forever.
+    """
+    def __init__(self, dispatcher, threads=4, keep_alive_timeout=75, max_body_size=64 * 1024 * 1024, max_pipelined=16, idle_timeout=None):
+        self.dispatcher = dispatcher
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(threads))
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_body_size = max_body_size
+        self.max_pipelined = max_pipelined
+        self.idle_timeout = idle_timeout
+        self._in_flight = 0
+        self._last_activity = time.monotonic()
+
+    def dispatch(self, body, accept_encoding=""):
+        """Run a JSON-RPC request. It is called from the thread pool.
+
+        Args:
+            body (bytes): The raw JSON-RPC request.
+            accept_encoding (str): The Accept-Encoding header of the request.
+
+        Returns:
+            tuple. The HTTP status, the extra headers and the response body.
+        """
+        response = JSONRPCResponseManager.handle(body, self.dispatcher)
+        if response is None:
+            # Notifications do not get an answer
+            return 204, {}, b""
+        body, encoding = compress(response.json.encode("utf-8"), accept_encoding)
+        headers = {"Content-Type": "application/json", "Vary": "Accept-Encoding"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return 200, headers, body
+
+    async def _read_request(self, reader):
+        """Read a request from the stream
+
+        The client has `keep_alive_timeout` seconds to start a request and
+        as many to send its headers and body.
+
+        Returns:
+            tuple. The method, the headers and the body, or None if the
+                client closed the connection.
+
+        Raises:
+            HTTPError.
+        """
+        try:
+            line = await asyncio.wait_for(self._read_request_line(reader), self.keep_alive_timeout)
+        except asyncio.TimeoutError:
+            return None
+        if not line:
+            return None
+
+        try:
+            method, _, version = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400)
+
+        try:
+            headers, body = await asyncio.wait_for(self._read_message(reader), self.keep_alive_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(408)
+        headers[":version"] = version
+        return method.upper(), headers, body
+
+    async def _read_request_line(self, reader):
+        """Read the first line of a request, or b"" if the client closed the connection"""
+        line = await reader.readline()
+        # Tolerate stray empty lines between pipelined requests
+        while line in (b"\r\n", b"\n"):
+            line = await reader.readline()
+        return line
+
+    async def _read_message(self, reader):
+        """Read the headers and the body following a request line
+
+        Returns:
+            tuple. The headers by lowercase name and the body.
+
+        Raises:
+            HTTPError.
+        """
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= 100:
+                raise HTTPError(431)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            body = await self._read_chunked(reader)
+        else:
+            try:
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                raise HTTPError(400)
+            if length > self.max_body_size:
+                raise HTTPError(413)
+            body = await reader.readexactly(length) if length else b""
+        return headers, body
+
+    async def _read_chunked(self, reader):
+        """Read a body sent with chunked transfer encoding"""
+        chunks = []
+        size = 0
+        while True:
+            line = await reader.readline()
+            try:
+                length = int(line.split(b";")[0].strip(), 16)
+            except ValueError:
+                raise HTTPError(400)
+            if not length:
+                # Skip the trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            size += length
+            if size > self.max_body_size:
+                raise HTTPError(413)
+            chunks.append(await reader.readexactly(length))
+            await reader.readline()
+
+    @staticmethod
+    def _keep_alive(headers):
+        """Check if the client wants the connection to be reused"""
+        connection = headers.get("connection", "").lower()
+        if headers[":version"] == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    async def _respond(self, method, headers, body):
+        """Get the answer to a request
+
+        Returns:
+            tuple. The HTTP status, the extra headers and the response body.
+        """
+        if method != "POST":
+            return 405, {"Allow": "POST"}, b""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.dispatch, body, headers.get("accept-encoding", ""))
+
+    @staticmethod
+    def _serialize(status, extra_headers, body, keep_alive):
+        """Build the raw HTTP response"""
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+        for name, value in extra_headers.items():
+            lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    async def handle_connection(self, reader, writer):
+        """Serve all the requests of a connection
+
+        A reader loop parses the requests and schedules them right away,
+        while the responses are written in the same order they arrived.
+        """
+        pending = asyncio.Queue(maxsize=self.max_pipelined)
+
+        async def write_responses():
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                task, keep_alive = item
+                status, extra_headers, body = await task
+                writer.write(self._serialize(status, extra_headers, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+
+        writer_task = asyncio.ensure_future(write_responses())
+        try:
+            while not writer_task.done():
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as exc:
+                    await pending.put((self._done(exc.status), False))
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+
+                method, headers, body = request
+                keep_alive = self._keep_alive(headers)
+                task = asyncio.ensure_future(self._tracked(self._respond(method, headers, body)))
+                await pending.put((task, keep_alive))
+                if not keep_alive:
+                    break
+            await pending.put(None)
+            await writer_task
+        except Exception as exc:
+            logging.debug(f"Connection closed: '{exc}'.")
+        finally:
+            writer_task.cancel()
+            writer.close()
+
+    async def _tracked(self, coroutine):
+        """Await a request keeping count of the work in flight"""
+        self._in_flight += 1
+        try:
+            return await coroutine
+        finally:
+            self._in_flight -= 1
+            self._last_activity = time.monotonic()
+
+    def idle_for(self):
+        """Get the seconds elapsed since the last request was answered
+
+        Returns:
+            float. It is 0 while there are requests being served.
+        """
+        if self._in_flight:
+            return 0
+        return time.monotonic() - self._last_activity
+
+    async def _watch_idle(self, server):
+        """Close the server once it has been idle for longer than idle_timeout"""
+        while True:
+            remaining = self.idle_timeout - self.idle_for()
+            if remaining <= 0:
+                logging.info(f"No requests in {self.idle_timeout} seconds. Stopping…")
+                server.close()
+                return
+            await asyncio.sleep(min(remaining, 1))
+
+    def _done(self, status):
+        """Get an already finished task with an empty answer"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result((status, {}, b""))
+        return future
+
+    async def start(self, host=None, port=None, path=None):
+        """Start listening
+
+        Args:
+            host (str): The host to bind when using TCP.
+            port (int): The port to bind when using TCP.
+            path (str): The path of a Unix domain socket to use instead of TCP.
+
+        Returns:
+            asyncio.AbstractServer.
+        """
+        if path:
+            return await asyncio.start_unix_server(self.handle_connection, path=path)
+        return await asyncio.start_server(self.handle_connection, host=host, port=int(port), backlog=4096)
+
+    def serve_forever(self, host=None, port=None, path=None):
+        """Start listening and block until the server is stopped
+
+        Args:
+            host (str): The host to bind when using TCP.
+            port (int): The port to bind when using TCP.
+            path (str): The path of a Unix domain socket to use instead of TCP.
+        """
+        # The socket is only removed while it is still the one bound here
+        bound = []
+
+        async def run():
+            server = await self.start(host, port, path)
+            if path:
+                bound.append(os.stat(path).st_ino)
+            async with server:
+                if self.idle_timeout:
+                    watchdog = asyncio.ensure_future(self._watch_idle(server))
+                try:
+                    await server.serve_forever()
+                except asyncio.CancelledError:
+                    if not self.idle_timeout or not watchdog.done():
+                        raise
+
+        try:
+            asyncio.run(run())
+        finally:
+            self.executor.shutdown(wait=False)
+            try:
+                if bound and os.stat(path).st_ino == bound[0]:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
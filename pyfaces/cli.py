@@ -20,6 +20,7 @@
 import argparse
 import concurrent.futures
 import json
+import os
 import pathlib
 import sys
 import time
@@ -31,8 +32,35 @@ from pyfaces.misc.colors import error
 from pyfaces.misc.colors import success
 from pyfaces.misc.colors import title
 from pyfaces.misc.colors import warning
-from pyfaces.core.processor import FaceProcessor
+from pyfaces.core.bulk import BulkImport
+from pyfaces.core.bulk import manifest_slices
 from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.governor import configure_governor
+from pyfaces.core.governor import limit_native_threads
+from pyfaces.core.watch import default_index_path
+from pyfaces.core.watch import FolderWatcher
+from pyfaces.misc.files import iter_image_paths
+
+
+def manifest_part(value):
+    """Parse the slice of a manifest given as I/N
+
+    Args:
+        value (str): The I-th of N slices, with 1 <= I <= N.
+
+    Returns:
+        tuple. The slice, starting at 1, and the number of slices.
+
+    Raises:
+        argparse.ArgumentTypeError.
+    """
+    try:
+        part, parts = (int(number) for number in value.split("/"))
+    except ValueError:
+        part, parts = 0, 0
+    if not 1 <= part <= parts:
+        raise argparse.ArgumentTypeError(f"The part must be I/N with 1 <= I <= N, not '{value}'.")
+    return part, parts
 
 
 def get_parser():
@@ -79,6 +107,62 @@ def get_parser():
         parents=[compare_parser]
     )
 
+    compare_many_parser = argparse.ArgumentParser(
+        description='A parser to compare every face of a set with every face of another one',
+        prog='compare-many',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    compare_many_parser.add_argument('--faces', metavar='<PATH>', nargs='+', default=None, action='store', help='the faces to look for. Default: every face of the collection.')
+    compare_many_parser.add_argument('--images', metavar='<PATH>', nargs='+', default=None, action='store', help='look for the faces of these images, given by their original path or by their copy.')
+    compare_many_parser.add_argument('--against-collection', metavar='<NAME>', default=None, action='store', help='the collection of the faces to compare with. Default: the one given by --collection.')
+    compare_many_parser.add_argument('--against-faces', metavar='<PATH>', nargs='+', default=None, action='store', help='the faces to compare with. Default: every face of the collection.')
+    compare_many_parser.add_argument('--against-images', metavar='<PATH>', nargs='+', default=None, action='store', help='compare with the faces of these images.')
+
+    compare_many_group_results = compare_many_parser.add_argument_group('Result arguments', 'Keeping the results sparse.')
+    compare_many_group_results.add_argument('--threshold', metavar='<DISTANCE>', type=float, default=None, action='store', help='only keep the pairs closer than this. Default: None.')
+    compare_many_group_results.add_argument('--top-k', metavar='<NUM>', type=int, default=None, action='store', help='only keep the NUM closest faces of each face. Default: 10 if no threshold is given.')
+    compare_many_group_results.add_argument('--output', metavar='<PATH>', default=None, action='store', help="stream the matches to this file: a sparse matrix if it ends in '.npz' and a JSON line per face otherwise. Default: print them.")
+    compare_many_group_results.add_argument('--block-size', metavar='<NUM>', type=int, default=1024, action='store', help='the faces of each side compared at once, which bounds the memory used. Default: 1024.')
+
+    compare_many_group_about = compare_many_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    compare_many_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    compare_many_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "compare-many",
+        help="Compare every face of a set with every face of another one",
+        parents=[compare_many_parser]
+    )
+
+    watch_parser = argparse.ArgumentParser(
+        description='A parser to ingest the images dropped in a folder',
+        prog='watch',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    watch_parser.add_argument('folder', metavar='<FOLDER>', action='store', help='the folder to watch, including its subfolders.')
+    watch_parser.add_argument('--interval', metavar='<SECONDS>', type=float, default=5, action='store', help='the seconds between scans. Default: 5.')
+    watch_parser.add_argument('--settle', metavar='<SECONDS>', type=float, default=2, action='store', help='the seconds a file must remain unmodified, with the same size in two scans, before it is ingested. Default: 2.')
+    watch_parser.add_argument('--full-scan-every', metavar='<NUM>', type=int, default=60, action='store', help='list every folder once in NUM scans to find files modified in place, 0 for never. Default: 60.')
+    watch_parser.add_argument('--batch-size', metavar='<NUM>', type=int, default=16, action='store', help='the number of images persisted at once. Default: 16.')
+    watch_parser.add_argument('--cycles', metavar='<NUM>', type=int, default=None, action='store', help='stop after NUM scans. Default: watch until interrupted.')
+    watch_parser.add_argument('--index', metavar='<PATH>', default=None, action='store', help='the file recording the files already ingested. Default: one per folder and collection in the application folder.')
+
+    watch_group_about = watch_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    watch_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    watch_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "watch",
+        help="Ingest the new or changed images of a folder as they arrive",
+        parents=[watch_parser]
+    )
+
     extract_parser = argparse.ArgumentParser(
         description='A parser to extract faces from images',
         prog='extract',
@@ -90,6 +174,12 @@ def get_parser():
     extract_parser.add_argument("image_file", metavar="<PATH>", action='store', default=False, help='the file from which extract the faces.')
     extract_parser.add_argument('--force-recalculation', default=False, action='store_true', help='Force recalculation of operations. Default: False.')
 
+    extract_group_filters = extract_parser.add_argument_group('Filter arguments', 'Skipping the faces which are not worth encoding.')
+    extract_group_filters.add_argument('--roi', metavar=('<TOP>', '<RIGHT>', '<BOTTOM>', '<LEFT>'), nargs=4, type=int, default=None, action='store', help='only look for faces inside this box, in pixels. Default: the whole image.')
+    extract_group_filters.add_argument('--min-face-size', metavar='<PIXELS>', type=int, default=None, action='store', help=f"skip faces narrower or shorter than this. Default: {config.get_attribute('min_face_size')}.")
+    extract_group_filters.add_argument('--max-faces', metavar='<NUM>', type=int, default=None, action='store', help=f"keep only the largest NUM faces of each image, 0 for all. Default: {config.get_attribute('max_faces')}.")
+    extract_group_filters.add_argument('--best-shots', metavar='<NUM>', type=int, default=None, action='store', help=f"keep only the NUM faces of best quality of each image, 0 for all. Default: {config.get_attribute('best_shots')}.")
+
     extract_group_about = extract_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
     extract_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
     extract_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
@@ -100,6 +190,181 @@ def get_parser():
         parents=[extract_parser]
     )
 
+    many_parser = argparse.ArgumentParser(
+        description='A parser to extract faces from many images at once',
+        prog='extract-many',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    many_parser.add_argument("image_files", metavar="<PATH>", nargs='+', action='store', help='the files or folders from which extract the faces.')
+    many_parser.add_argument('--force-recalculation', default=False, action='store_true', help='Force recalculation of operations. Default: False.')
+    many_parser.add_argument('--batch-size', metavar='<NUM>', type=int, default=16, action='store', help='the number of images persisted at once. Default: 16.')
+    many_parser.add_argument('--io-workers', metavar='<NUM>', type=int, default=4, action='store', help='the threads decoding and saving images. Default: 4.')
+    many_parser.add_argument('--cpu-workers', metavar='<NUM>', type=int, default=None, action='store', help=f"the threads detecting and encoding faces. Default: {config.get_attribute('num_threads')}.")
+
+    many_group_filters = many_parser.add_argument_group('Filter arguments', 'Skipping the faces which are not worth encoding.')
+    many_group_filters.add_argument('--roi', metavar=('<TOP>', '<RIGHT>', '<BOTTOM>', '<LEFT>'), nargs=4, type=int, default=None, action='store', help='only look for faces inside this box, in pixels. Default: the whole image.')
+    many_group_filters.add_argument('--min-face-size', metavar='<PIXELS>', type=int, default=None, action='store', help=f"skip faces narrower or shorter than this. Default: {config.get_attribute('min_face_size')}.")
+    many_group_filters.add_argument('--max-faces', metavar='<NUM>', type=int, default=None, action='store', help=f"keep only the largest NUM faces of each image, 0 for all. Default: {config.get_attribute('max_faces')}.")
+    many_group_filters.add_argument('--best-shots', metavar='<NUM>', type=int, default=None, action='store', help=f"keep only the NUM faces of best quality of each image, 0 for all. Default: {config.get_attribute('best_shots')}.")
+
+    many_group_about = many_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    many_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    many_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "extract-many",
+        help="Extract faces from many files or folders overlapping I/O and CPU work",
+        parents=[many_parser]
+    )
+
+    delete_parser = argparse.ArgumentParser(
+        description='A parser to delete images and faces from the data folder',
+        prog='delete',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    delete_parser.add_argument('--images', metavar='<PATH>', nargs='+', default=[], action='store', help='the images to delete, given by their original path or by their copy in the data folder.')
+    delete_parser.add_argument('--faces', metavar='<PATH>', nargs='+', default=[], action='store', help='the faces to delete.')
+    delete_parser.add_argument('--prefix', metavar='<PATH>', default=None, action='store', help='delete every image whose original path starts with this prefix.')
+
+    delete_group_about = delete_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    delete_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    delete_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "delete",
+        help="Delete many images and faces at once",
+        parents=[delete_parser]
+    )
+
+    import_parser = argparse.ArgumentParser(
+        description='A parser to import the images listed in a manifest',
+        prog='import',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    import_parser.add_argument("manifest", metavar="<PATH>", action='store', help='a text file with one image path per line.')
+    import_parser.add_argument('--chunk-size', metavar='<NUM>', type=int, default=256, action='store', help='the number of images persisted and checkpointed at once. Default: 256.')
+    import_parser.add_argument('--checkpoint', metavar='<PATH>', default=None, action='store', help='the checkpoint of the import. Default: next to the manifest.')
+    import_parser.add_argument('--part', metavar='<I/N>', type=manifest_part, default=None, action='store', help='only import the I-th of N disjoint slices of the manifest, starting at 1. Used to run several imports in parallel.')
+    import_parser.add_argument('--start', metavar='<LINE>', type=int, default=0, action='store', help='the first line of the manifest to import, starting at 0. Default: 0.')
+    import_parser.add_argument('--stop', metavar='<LINE>', type=int, default=None, action='store', help='the line of the manifest where the import stops. Default: the end.')
+
+    import_group_about = import_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    import_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    import_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "import",
+        help="Import the images listed in a manifest in resumable chunks",
+        parents=[import_parser]
+    )
+
+    video_parser = argparse.ArgumentParser(
+        description='A parser to extract faces from videos or folders of frames',
+        prog='extract-video',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    video_parser.add_argument("video_file", metavar="<PATH>", action='store', help='the video or the folder of frames from which extract the faces.')
+    video_parser.add_argument('--sample-rate', metavar='<NUM>', type=int, default=1, action='store', help='process only one out of every NUM frames. Default: 1.')
+    video_parser.add_argument('--queue-size', metavar='<NUM>', type=int, default=8, action='store', help='the maximum number of frames waiting between stages. Default: 8.')
+    video_parser.add_argument('--batch-size', metavar='<NUM>', type=int, default=16, action='store', help='the number of frames with new faces persisted at once. Default: 16.')
+
+    video_group_about = video_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    video_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    video_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "extract-video",
+        help="Extract faces from a video or a folder of frames tracking them between frames",
+        parents=[video_parser]
+    )
+
+    prune_parser = argparse.ArgumentParser(
+        description='A parser to keep only the best faces of the gallery',
+        prog='prune',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    prune_parser.add_argument('--best-shots', metavar='<NUM>', type=int, default=1, action='store', help='the number of faces kept per group. Default: 1.')
+    prune_parser.add_argument('--group-by', choices=['identity', 'source'], default='identity', action='store', help='keep the best faces of each person or of each source image. Default: identity.')
+    prune_parser.add_argument('--tolerance', metavar='<DISTANCE>', type=float, default=0.6, action='store', help='the maximum distance between faces of the same person. Default: 0.6.')
+
+    prune_group_about = prune_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    prune_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    prune_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "prune",
+        help="Keep only the best shots of each person or image in the gallery",
+        parents=[prune_parser]
+    )
+
+    search_parser = argparse.ArgumentParser(
+        description='A parser to search the faces of an image without storing them',
+        prog='search',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    search_parser.add_argument("image_file", metavar="<PATH>", action='store', help='the image whose faces will be searched.')
+    search_parser.add_argument('--top-k', metavar='<NUM>', type=int, default=10, action='store', help='the number of matches of each face. Default: 10.')
+
+    search_group_filters = search_parser.add_argument_group('Filter arguments', 'Skipping the faces which are not worth searching.')
+    search_group_filters.add_argument('--roi', metavar=('<TOP>', '<RIGHT>', '<BOTTOM>', '<LEFT>'), nargs=4, type=int, default=None, action='store', help='only look for faces inside this box, in pixels. Default: the whole image.')
+    search_group_filters.add_argument('--min-face-size', metavar='<PIXELS>', type=int, default=None, action='store', help=f"skip faces narrower or shorter than this. Default: {config.get_attribute('min_face_size')}.")
+    search_group_filters.add_argument('--max-faces', metavar='<NUM>', type=int, default=None, action='store', help=f"keep only the largest NUM faces, 0 for all. Default: {config.get_attribute('max_faces')}.")
+    search_group_filters.add_argument('--best-shots', metavar='<NUM>', type=int, default=None, action='store', help=f"keep only the NUM faces of best quality, 0 for all. Default: {config.get_attribute('best_shots')}.")
+
+    search_group_about = search_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    search_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    search_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "search",
+        help="Find who is in an image without adding it to the gallery",
+        parents=[search_parser]
+    )
+
+    watchlist_parser = argparse.ArgumentParser(
+        description='A parser to manage the persons of interest checked against every new face',
+        prog='watchlist',
+        epilog="",
+        add_help=False,
+        conflict_handler='resolve'
+    )
+
+    watchlist_parser.add_argument("action", choices=["add", "remove", "list", "hits"], action='store', help="'add' or 'remove' a person, 'list' the persons or show the 'hits' of the new faces.")
+    watchlist_parser.add_argument("name", metavar="<NAME>", nargs='?', default=None, action='store', help='the name of the person to add or remove.')
+    watchlist_parser.add_argument("face_paths", metavar="<FACE>", nargs='*', default=[], action='store', help='registered faces of the person to add.')
+    watchlist_parser.add_argument('--tolerance', metavar='<DISTANCE>', type=float, default=None, action='store', help=f"the distance under which a new face is a hit. Default: {config.get_attribute('watchlist_tolerance')}.")
+    watchlist_parser.add_argument('--note', metavar='<TEXT>', default=None, action='store', help='any information about the person.')
+    watchlist_parser.add_argument('--after', metavar='<ID>', type=int, default=0, action='store', help='only show the hits with a greater id. Default: 0.')
+    watchlist_parser.add_argument('--limit', metavar='<NUM>', type=int, default=100, action='store', help='the maximum number of hits shown. Default: 100.')
+
+    watchlist_group_about = watchlist_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
+    watchlist_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
+    watchlist_group_about.add_argument('--version', action='version', version=f'[%(prog)s] Pyfaces {pyfaces.__version__}', help='shows the version of the program and exits.')
+
+    subparser_alias_generator = subcommands.add_parser(
+        "watchlist",
+        help="Manage the persons of interest every new face is checked against",
+        parents=[watchlist_parser]
+    )
+
     guess_parser = argparse.ArgumentParser(
         description='A parser to manage comparisons between faces',
         prog='compare',
@@ -110,6 +375,7 @@ def get_parser():
 
     guess_parser.add_argument('face_path', metavar='<PATH>', action='store', help='The path to the face to be guessed.')
     guess_parser.add_argument('--force-recalculation', default=False, action='store_true', help='Force recalculation of operations. Default: False.')
+    guess_parser.add_argument('--across', metavar='<NAME>', nargs='+', default=None, action='store', help="search these collections in parallel instead of the one of the face. Use '*' for all of them. Default: None.")
 
     guess_group_about = guess_parser.add_argument_group('About arguments', 'Showing additional information about this program.')
     guess_group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
@@ -121,6 +387,15 @@ def get_parser():
         parents=[guess_parser]
     )
 
+    # Collection options
+    group_collection = parser.add_argument_group('Collection arguments', 'Keeping the faces of different cases apart.')
+    group_collection.add_argument('-c', '--collection', metavar='<NAME>', default=None, action='store', help="the collection of faces to use. It is created the first time it is used. Default: 'default'.")
+
+    # Worker options
+    group_worker = parser.add_argument_group('Worker arguments', 'Reusing a background pyfacesd between calls.')
+    group_worker.add_argument('-w', '--worker', default=False, action='store_true', help='run the command in a background worker which is spawned if needed and kept warm between calls. Default: False.')
+    group_worker.add_argument('--worker-idle-timeout', metavar='<SECONDS>', type=float, default=600, action='store', help='the seconds a spawned worker waits for new calls before exiting. Default: 600.')
+
     # About options
     group_about = parser.add_argument_group('About arguments', 'Showing additional information about this program.')
     group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
@@ -137,6 +412,10 @@ def main(params=None):
     Returns:
         dict: A Json representing the matching results.
     """
+    # NumPy reads the limits once, when it is loaded, so they are set before
+    # importing the modules that load it
+    limit_native_threads()
+
     print(text.welcome)
 
     if params is None:
@@ -145,11 +424,29 @@ def main(params=None):
     else:
         args = params
 
+    # Size the pool of the CPU-bound sections
+    configure_governor()
+
     # Launch the appropiate util
     if args.command_name:
         try:
-            proc = FaceProcessor()
             start_time = time.perf_counter()
+            proc = None
+            registry = None
+            if args.worker:
+                from pyfaces.core.worker import connect_worker
+                from pyfaces.core.worker import WorkerProxy
+                client = connect_worker(ConfigManager(), idle_timeout=args.worker_idle_timeout)
+                if client:
+                    if args.collection:
+                        client.call("create_collection", name=args.collection)
+                    proc = WorkerProxy(client, args.collection)
+                else:
+                    print(warning("[!] No worker could be reached. Running the command locally…\n"))
+            if proc is None:
+                from pyfaces.core.registry import CollectionRegistry
+                registry = CollectionRegistry()
+                proc = registry.get(args.collection, create=True)
             if args.command_name == "compare":
                 print(f"[*] Comparing '{emphasis(args.face_path_1)}' with '{emphasis(args.face_path_2)}'…\n")
                 result = proc.compare_faces(
@@ -157,11 +454,143 @@ def main(params=None):
                     args.face_path_2, 
                     args.force_recalculation
                 )
+            elif args.command_name == "compare-many":
+                top_k = args.top_k
+                if top_k is None and args.threshold is None:
+                    top_k = 10
+                print(f"[*] Comparing sets of faces…\n")
+                result = (registry or proc).compare_sets(
+                    {"collection": args.collection, "face_paths": args.faces, "source_paths": args.images},
+                    {"collection": args.against_collection or args.collection, "face_paths": args.against_faces, "source_paths": args.against_images},
+                    threshold=args.threshold,
+                    top_k=top_k,
+                    output_path=args.output,
+                    block_size=args.block_size
+                )
             elif args.command_name == "extract":
                 print(f"[*] Extracting faces from '{emphasis(args.image_file)}'…\n")
                 result = proc.extract_faces(
                     args.image_file,
-                    args.force_recalculation
+                    args.force_recalculation,
+                    roi=args.roi,
+                    min_face_size=args.min_face_size,
+                    max_faces=args.max_faces,
+                    best_shots=args.best_shots
+                )
+            elif args.command_name == "extract-many":
+                print(f"[*] Extracting faces from {emphasis(len(args.image_files))} paths…\n")
+                result = {}
+                for image_path, metadata in proc.extract_many(
+                    iter_image_paths(args.image_files),
+                    args.force_recalculation,
+                    io_workers=args.io_workers,
+                    cpu_workers=args.cpu_workers,
+                    batch_size=args.batch_size,
+                    roi=args.roi,
+                    min_face_size=args.min_face_size,
+                    max_faces=args.max_faces,
+                    best_shots=args.best_shots
+                ):
+                    if isinstance(metadata, Exception):
+                        print(warning(f"'{image_path}' generated an exception: {metadata}"))
+                    else:
+                        result[image_path] = metadata
+            elif args.command_name == "delete":
+                print(f"[*] Deleting {emphasis(len(args.images))} images and {emphasis(len(args.faces))} faces…\n")
+                result = proc.delete_many(
+                    [os.path.abspath(image_path) for image_path in args.images],
+                    [os.path.abspath(face_path) for face_path in args.faces],
+                    args.prefix and os.path.abspath(args.prefix)
+                )
+            elif args.command_name == "import":
+                start, stop = args.start, args.stop
+                if args.part:
+                    part, parts = args.part
+                    start, stop = manifest_slices(args.manifest, parts)[part - 1]
+                job = BulkImport(proc, args.manifest, args.checkpoint, args.chunk_size, start, stop)
+                print(f"[*] Importing the images listed in '{emphasis(args.manifest)}' from line {emphasis(job.load_checkpoint()['next_index'])}…\n")
+                for report in job.run():
+                    for image_path, message in report["errors"]:
+                        print(warning(f"'{image_path}' generated an exception: {message}"))
+                    print(
+                        f"[*] Chunk {report['chunk']} (lines {report['first_index']}-{report['last_index']}): "
+                        f"{report['images']} images, {report['faces']} faces in {report['seconds']:.2f} s "
+                        f"({(report['images_per_second'] or 0):.2f} images/s)"
+                    )
+                result = job.load_checkpoint()
+            elif args.command_name == "watch":
+                config = ConfigManager(args.collection)
+                watcher = FolderWatcher(
+                    proc,
+                    args.folder,
+                    args.index or default_index_path(config, args.folder),
+                    interval=args.interval,
+                    settle=args.settle,
+                    full_scan_every=args.full_scan_every,
+                    batch_size=args.batch_size
+                )
+                print(f"[*] Watching '{emphasis(args.folder)}'. Press Ctrl+C to stop…\n")
+                try:
+                    for report in watcher.run(args.cycles):
+                        for image_path, message in report["errors"]:
+                            print(warning(f"'{image_path}' generated an exception: {message}"))
+                        if report["images"]:
+                            print(
+                                f"[*] {report['images']} images, {report['faces']} faces | lag: {report['lag']:.2f} s | "
+                                f"scan: {report['scan_seconds']:.4f} s ({report['listed_folders']} of {report['folders']} folders listed)"
+                            )
+                except KeyboardInterrupt:
+                    pass
+                result = {key: watcher.index[key] for key in ["errors", "folder", "ingested", "started", "updated"]}
+            elif args.command_name == "extract-video":
+                print(f"[*] Extracting faces from the frames of '{emphasis(args.video_file)}'…\n")
+                result = proc.extract_video(
+                    args.video_file,
+                    args.sample_rate,
+                    args.queue_size,
+                    args.batch_size
+                )
+            elif args.command_name == "prune":
+                print(f"[*] Keeping the {emphasis(args.best_shots)} best shots by {emphasis(args.group_by)}…\n")
+                result = proc.keep_best_shots(
+                    args.best_shots,
+                    args.group_by,
+                    args.tolerance
+                )
+            elif args.command_name == "search":
+                print(f"[*] Searching the faces of '{emphasis(args.image_file)}'…\n")
+                result = proc.search_image(
+                    args.image_file,
+                    top_k=args.top_k,
+                    roi=args.roi,
+                    min_face_size=args.min_face_size,
+                    max_faces=args.max_faces,
+                    best_shots=args.best_shots
+                )
+            elif args.command_name == "watchlist":
+                if args.action in ("add", "remove") and not args.name:
+                    raise ValueError(f"A name is required to {args.action} a person.")
+                if args.action == "add":
+                    print(f"[*] Adding '{emphasis(args.name)}' to the watchlist…\n")
+                    result = proc.watchlist_add(
+                        args.name,
+                        args.face_paths,
+                        tolerance=args.tolerance,
+                        note=args.note
+                    )
+                elif args.action == "remove":
+                    print(f"[*] Removing '{emphasis(args.name)}' from the watchlist…\n")
+                    result = proc.watchlist_remove(args.name)
+                elif args.action == "list":
+                    result = proc.watchlist_entries()
+                else:
+                    result = proc.watchlist_hits(args.after, args.limit)
+            elif args.across:
+                print(f"[*] Finding closes face to '{emphasis(args.face_path)}' in {emphasis(', '.join(args.across))}…\n")
+                result = (registry or proc).guess_across(
+                    args.face_path,
+                    args.across,
+                    args.collection
                 )
             else:
                 print(f"[*] Finding closes face to '{emphasis(args.face_path)}'…\n")
@@ -0,0 +1,201 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import datetime as dt
+import hashlib
+import itertools
+import json
+import os
+import time
+
+from pyfaces.core.locking import atomic_write_json
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """Calculate the md5 of a file without loading it at once
+
+    Args:
+        file_path (str): The path to the file.
+        block_size (int): The bytes read at a time.
+
+    Returns:
+        str. The hex digest.
+    """
+    digest = hashlib.md5()
+    with open(file_path, "rb") as input_file:
+        for block in iter(lambda: input_file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_manifest(manifest_path):
+    """Read the image paths listed in a manifest
+
+    A manifest is a text file with one image path per line. Empty lines and
+    lines starting with '#' are ignored but still counted, so the indexes
+    are the line numbers starting at 0. Relative paths are resolved against
+    the folder of the manifest.
+
+    Args:
+        manifest_path (str): The path to the manifest.
+
+    Yields:
+        tuple. The index of the line and the path to the image, or None for
+            ignored lines.
+    """
+    folder = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as input_file:
+        for index, line in enumerate(input_file):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                yield index, None
+            else:
+                yield index, os.path.join(folder, os.path.expanduser(line))
+
+
+def manifest_slices(manifest_path, parts):
+    """Split a manifest into disjoint slices of consecutive lines
+
+    Args:
+        manifest_path (str): The path to the manifest.
+        parts (int): The number of slices.
+
+    Returns:
+        list. The (start, stop) line indexes of each slice.
+    """
+    with open(manifest_path) as input_file:
+        total = sum(1 for _ in input_file)
+    size = -(-total // parts) if total else 0
+    return [(min(i * size, total), min((i + 1) * size, total)) for i in range(parts)]
+
+
+class BulkImport:
+    """A resumable import of the images listed in a manifest
+
+    The images are extracted in chunks. Each chunk is persisted at once and
+    then recorded in a checkpoint, so an interrupted import goes on from the
+    first chunk not recorded. Several imports can run at the same time over
+    disjoint slices of the same manifest, each one with its own checkpoint.
+
+    Attributes:
+        checkpoint_path (str): The path to the checkpoint of this slice.
+        chunk_size (int): The number of images persisted at once.
+        manifest_path (str): The path to the manifest.
+        processor (FaceProcessor): The processor, or any object providing
+            `extract_many` such as a `WorkerProxy`.
+        start (int): The index of the first line of the slice.
+        stop (int): The index after the last line of the slice. None for the
+            end of the manifest.
+    """
+    def __init__(self, processor, manifest_path, checkpoint_path=None, chunk_size=256, start=0, stop=None):
+        self.processor = processor
+        self.manifest_path = manifest_path
+        self.chunk_size = int(chunk_size)
+        self.start = int(start)
+        self.stop = None if stop is None else int(stop)
+        self.checkpoint_path = checkpoint_path or f"{manifest_path}.{self.start}-{'end' if stop is None else self.stop}.checkpoint.json"
+
+    def load_checkpoint(self):
+        """Load the checkpoint of this slice or create a new one
+
+        Returns:
+            dict. The checkpoint.
+
+        Raises:
+            ValueError. If the manifest or the slice changed since the
+                checkpoint was recorded.
+        """
+        manifest_md5 = hash_file(self.manifest_path)
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as input_file:
+                checkpoint = json.load(input_file)
+            if checkpoint["manifest_md5"] != manifest_md5:
+                raise ValueError(
+                    f"The manifest '{self.manifest_path}' changed since '{self.checkpoint_path}' was recorded. Remove the checkpoint to start over."
+                )
+            if [checkpoint["start"], checkpoint["stop"]] != [self.start, self.stop]:
+                raise ValueError(f"The checkpoint '{self.checkpoint_path}' belongs to another slice of the manifest.")
+            return checkpoint
+
+        return {
+            "chunks": 0,
+            "errors": 0,
+            "faces": 0,
+            "images": 0,
+            "last_path": None,
+            "manifest": os.path.abspath(self.manifest_path),
+            "manifest_md5": manifest_md5,
+            "next_index": self.start,
+            "seconds": 0.0,
+            "start": self.start,
+            "started": str(dt.datetime.now()),
+            "stop": self.stop,
+            "updated": None
+        }
+
+    def run(self, **options):
+        """Import the images not recorded in the checkpoint yet
+
+        Args:
+            **options: Extra arguments for `extract_many`, such as the filters.
+
+        Yields:
+            dict. The report of each chunk once it has been persisted and
+                checkpointed, including its throughput.
+
+        Raises:
+            ValueError.
+        """
+        checkpoint = self.load_checkpoint()
+        lines = itertools.islice(iter_manifest(self.manifest_path), checkpoint["next_index"], self.stop)
+
+        while True:
+            chunk = list(itertools.islice(lines, self.chunk_size))
+            if not chunk:
+                return
+            paths = [image_path for _, image_path in chunk if image_path]
+
+            start_time = time.perf_counter()
+            report = {
+                "chunk": checkpoint["chunks"],
+                "errors": [],
+                "faces": 0,
+                "first_index": chunk[0][0],
+                "images": len(paths),
+                "last_index": chunk[-1][0]
+            }
+            # A single batch so that the chunk is persisted at once
+            for image_path, metadata in self.processor.extract_many(paths, batch_size=max(len(paths), 1), **options):
+                if isinstance(metadata, Exception):
+                    report["errors"].append([image_path, str(metadata)])
+                else:
+                    report["faces"] += len(metadata["faces"])
+            report["seconds"] = time.perf_counter() - start_time
+            report["images_per_second"] = report["images"] / report["seconds"] if report["seconds"] else None
+
+            checkpoint["chunks"] += 1
+            checkpoint["errors"] += len(report["errors"])
+            checkpoint["faces"] += report["faces"]
+            checkpoint["images"] += report["images"]
+            checkpoint["last_path"] = paths[-1] if paths else checkpoint["last_path"]
+            checkpoint["next_index"] = chunk[-1][0] + 1
+            checkpoint["seconds"] += report["seconds"]
+            checkpoint["updated"] = str(dt.datetime.now())
+            atomic_write_json(self.checkpoint_path, checkpoint)
+            yield report
@@ -18,37 +18,99 @@
 ################################################################################
 
 import os
+import re
 import sys
 
 import configparser
 from pathlib import Path
 
 
+# Options added after the first release, for configuration files lacking them
+DEFAULT_OPTIONS = {
+    "best_shots": 0,
+    "cold_threshold": 0.45,
+    "cpu_budget": 0,
+    "dedup_max_hamming": 6,
+    "dedup_tolerance": 0.3,
+    "detection_size": 0,
+    "guess_cache_size": 100,
+    "hot_faces": 0,
+    "image_hash": "md5",
+    "max_faces": 0,
+    "min_face_size": 0,
+    "native_threads": 1,
+    "promote_hits": 1,
+    "watchlist_tolerance": 0.5,
+}
+
+# The collection stored directly in the data folder, as in older versions
+DEFAULT_COLLECTION = "default"
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
 class ConfigManager:
     """Global configuration manager
     
     Attributes:
         {static} app_folder (str): The application folder where the information will be stored.
+        {static} collection (str): The name of the collection whose files are used.
+        {static} cold_folder (str): The folder where the memory-mapped encodings of a tiered gallery are kept.
+        {static} collections_folder (str): The folder holding the collections other than the default one.
         {static} comparisons_file (str): The path to the file where the comparisons will be stored.
         {static} config (configparser.ConfigParser): The ConfigParser object.
         {static} config_file (str): The path to the file where the configuration will be stored.
         {static} encodings_file (str): The path to the file where the encodings will be stored.
+        {static} exports_folder (str): The folder where the files asked for through JSON-RPC are written.
         {static} faces_folder (str): The path to the folder where the faces images will be stored.
+        {static} gallery_file (str): The path to the file where the generation of the gallery will be stored.
+        {static} guess_cache_file (str): The path to the file where the guesses will be cached.
+        {static} guess_log_file (str): The path to the file where the guesses cached since the last compaction are appended.
+        {static} lock_file (str): The path to the file used to lock the data folder between processes.
         {static} metadata_file (str): The path to the file where the metadata will be stored.
+        {static} shard (tuple): The (index, count) of the shard whose files are used. None if not sharded.
         {static} sources_folder (str): The path to the folder where the original images will be stored.
+        {static} watchlist_file (str): The path to the file where the persons of interest will be stored.
+        {static} watchlist_hits_file (str): The path to the file where the faces matching them will be logged.
     """
     app_folder = None
+    cold_folder = None
+    collection = None
+    collections_folder = None
     comparisons_file = None
     config = None
     config_file = None
     encodings_file = None
+    exports_folder = None
     faces_folder = None
+    gallery_file = None
+    guess_cache_file = None
+    guess_log_file = None
+    lock_file = None
     metadata_file = None
+    shard = None
     sources_folder = None
+    watchlist_file = None
+    watchlist_hits_file = None
     
-    def __init__(self):
+    def __init__(self, collection=None, shard=None):
         """Constructor
+
+        Args:
+            collection (str): The name of the collection whose files are used.
+                The default collection if None.
+            shard (tuple): The (index, count) of a shard of the collection.
+                Each shard has its own data folder inside the one of the
+                collection. None to use the files of the collection.
+
+        Raises:
+            ValueError.
         """
+        self.collection = collection or DEFAULT_COLLECTION
+        self.shard = tuple(shard) if shard else None
+        if not COLLECTION_NAME.match(self.collection):
+            raise ValueError(
+                f"The collection name '{self.collection}' is not valid. Use up to 64 letters, digits, '.', '_' or '-'."
+            )
         if sys.platform == 'win32':
             self.app_folder = os.path.expanduser(os.path.join('~\\', 'Pyfaces'))
         else:
@@ -69,22 +131,64 @@ class ConfigManager:
         self.config = configparser.ConfigParser()
         self.config['Main Options'] = {
             "num_threads": os.cpu_count(),
-            "data_folder": os.path.join(self.app_folder, "data")
+            "data_folder": os.path.join(self.app_folder, "data"),
+            **DEFAULT_OPTIONS
         }
         with open(self.config_file, 'w') as config_file:
             self.config.write(config_file)
 
     def _update_paths(self):
-        self.faces_folder = os.path.join(self.get_attribute("data_folder"), "faces")
-        self.sources_folder = os.path.join(self.get_attribute("data_folder"), "sources")
-        self.encodings_file = os.path.join(self.get_attribute("data_folder"), "encodings.json")
-        self.comparisons_file = os.path.join(self.get_attribute("data_folder"), "comparisons.json")
-        self.metadata_file = os.path.join(self.get_attribute("data_folder"), "metadata.json")
+        self.collections_folder = os.path.join(self.get_attribute("data_folder"), "collections")
+        self.exports_folder = os.path.join(self.get_attribute("data_folder"), "exports")
+        data_folder = self.collection_folder(self.collection)
+        if self.shard:
+            data_folder = os.path.join(data_folder, "shards", "{}-of-{}".format(*self.shard))
+        self.faces_folder = os.path.join(data_folder, "faces")
+        self.sources_folder = os.path.join(data_folder, "sources")
+        self.encodings_file = os.path.join(data_folder, "encodings.json")
+        self.comparisons_file = os.path.join(data_folder, "comparisons.json")
+        self.metadata_file = os.path.join(data_folder, "metadata.json")
+        self.gallery_file = os.path.join(data_folder, "gallery.json")
+        self.guess_cache_file = os.path.join(data_folder, "guess_cache.json")
+        self.guess_log_file = os.path.join(data_folder, "guess_cache.ndjson")
+        self.lock_file = os.path.join(data_folder, ".lock")
+        self.cold_folder = os.path.join(data_folder, "cold")
+        self.watchlist_file = os.path.join(data_folder, "watchlist.json")
+        self.watchlist_hits_file = os.path.join(data_folder, "watchlist_hits.ndjson")
 
         #Check that folders are created
         Path(self.faces_folder).mkdir(parents=True, exist_ok=True)
         Path(self.sources_folder).mkdir(parents=True, exist_ok=True)
 
+    def collection_folder(self, collection):
+        """Get the folder holding the files of a collection
+
+        Args:
+            collection (str): The name of the collection.
+
+        Returns:
+            str.
+        """
+        if collection == DEFAULT_COLLECTION:
+            return self.get_attribute("data_folder")
+        return os.path.join(self.collections_folder, collection)
+
+    def list_collections(self):
+        """Get the names of the collections in the data folder
+
+        Returns:
+            list. The default collection first and then the rest sorted by name.
+        """
+        try:
+            names = os.listdir(self.collections_folder)
+        except FileNotFoundError:
+            names = []
+        return [DEFAULT_COLLECTION] + sorted(
+            name
+            for name in names
+            if COLLECTION_NAME.match(name) and name != DEFAULT_COLLECTION and os.path.isdir(os.path.join(self.collections_folder, name))
+        )
+
     def get(self):
         """Recover all the configuration
 
@@ -104,6 +208,8 @@ class ConfigManager:
         Return:
             object.
         """
+        if name in DEFAULT_OPTIONS:
+            return self.config.get("Main Options", name, fallback=str(DEFAULT_OPTIONS[name]))
         return self.config.get("Main Options", name)
         
     def set_attribute(self, name, value):
@@ -116,7 +222,7 @@ class ConfigManager:
         Raises:
             ValueError.
         """
-        if name in ["num_threads", "data_folder"]:
+        if name in ["num_threads", "data_folder", "best_shots", "cold_threshold", "cpu_budget", "dedup_max_hamming", "dedup_tolerance", "detection_size", "guess_cache_size", "hot_faces", "image_hash", "max_faces", "min_face_size", "native_threads", "promote_hits", "watchlist_tolerance"]:
             self.config.set("Main Options", name, str(value))
             with open(self.config_file, 'w') as config_file:
                 self.config.write(config_file)
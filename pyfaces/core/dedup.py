@@ -0,0 +1,119 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+from PIL import Image
+
+
+def dhash(image, size=8):
+    """Calculate the difference hash of an image
+
+    The image is shrunk to (size + 1) x size grayscale pixels and each bit
+    tells whether a pixel is brighter than its right neighbour, so the hash
+    survives recompression, rescaling and small offsets.
+
+    Args:
+        image (PIL.Image): The image.
+        size (int): The side of the hash. The hash has size * size bits.
+
+    Returns:
+        int. The hash.
+    """
+    pixels = image.convert("L").resize((size + 1, size), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(size):
+        for column in range(size):
+            left = pixels[row * (size + 1) + column]
+            right = pixels[row * (size + 1) + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(hash_1, hash_2):
+    """Count the bits which differ between two hashes
+
+    Args:
+        hash_1 (int): The first hash.
+        hash_2 (int): The second hash.
+
+    Returns:
+        int.
+    """
+    return bin(hash_1 ^ hash_2).count("1")
+
+
+class BKTree:
+    """A Burkhard-Keller tree to find hashes within a Hamming distance
+
+    Each child is stored under its distance to the parent, so the triangle
+    inequality prunes every branch which cannot hold a match and lookups
+    only visit a small part of the tree.
+
+    Attributes:
+        size (int): The number of values stored.
+    """
+    def __init__(self):
+        # Nodes are [hash, values, {distance: child}]
+        self._root = None
+        self.size = 0
+
+    def add(self, key, value):
+        """Store a value under a hash
+
+        Args:
+            key (int): The hash.
+            value (object): The value. Several values can share a hash.
+        """
+        self.size += 1
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key, radius):
+        """Find the values whose hash is close to a given one
+
+        Args:
+            key (int): The hash to look for.
+            radius (int): The maximum Hamming distance.
+
+        Returns:
+            list. The (distance, value) tuples found, closest first.
+        """
+        found = []
+        pending = [self._root] if self._root else []
+        while pending:
+            node = pending.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                found.extend((distance, value) for value in node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    pending.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
@@ -0,0 +1,130 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+
+class GalleryVersion:
+    """Generation counter of the gallery with a bounded log of its changes
+
+    Every commit of new faces or deletion bumps the generation once, so any
+    result calculated against a generation can be checked for staleness and
+    refreshed by only looking at the faces changed since then.
+
+    Attributes:
+        changes (list): The [generation, operation, face_path] entries, where
+            operation is either 'insert' or 'delete', oldest first.
+        generation (int): The current generation of the gallery.
+        max_changes (int): The number of changes kept in the log.
+        start (int): The log holds every change made after this generation.
+    """
+    def __init__(self, data=None, max_changes=10000):
+        """Constructor
+
+        Args:
+            data (dict): The contents of the gallery file as returned by `to_dict`.
+            max_changes (int): The number of changes kept in the log.
+        """
+        data = data or {}
+        self.generation = data.get("generation", 0)
+        self.changes = data.get("changes", [])
+        self.start = data.get("start", 0)
+        self.max_changes = max_changes
+
+    def bump(self, inserted=(), deleted=()):
+        """Record a new generation
+
+        Args:
+            inserted (iterable): The face paths added or replaced.
+            deleted (iterable): The face paths removed.
+
+        Returns:
+            int. The new generation.
+        """
+        self.generation += 1
+        self.changes.extend([self.generation, "insert", face] for face in inserted)
+        self.changes.extend([self.generation, "delete", face] for face in deleted)
+        self._truncate()
+        return self.generation
+
+    def replay(self, changes, generation):
+        """Append the changes logged by another gallery
+
+        Replicas use it to keep the generations and the log of their primary,
+        so anything cached against a generation stays valid in both.
+
+        Args:
+            changes (list): The [generation, operation, face_path] entries as
+                returned by `log_since`.
+            generation (int): The generation reached once they are applied.
+        """
+        self.changes.extend(list(change) for change in changes)
+        self.generation = generation
+        self._truncate()
+
+    def _truncate(self):
+        """Keep only the last `max_changes` changes of the log"""
+        if len(self.changes) > self.max_changes:
+            # Whole generations are dropped so that the log is never partial
+            self.start = self.changes[-self.max_changes - 1][0]
+            self.changes = [change for change in self.changes[-self.max_changes:] if change[0] > self.start]
+
+    def log_since(self, generation):
+        """Get the changes logged after a given generation in order
+
+        Args:
+            generation (int): A generation previously returned by `bump`.
+
+        Returns:
+            list. The [generation, operation, face_path] entries or None if
+                the log does not go back that far.
+        """
+        if generation < self.start or generation > self.generation:
+            return None
+        return [change for change in self.changes if change[0] > generation]
+
+    def changes_since(self, generation):
+        """Get the faces changed after a given generation
+
+        Args:
+            generation (int): A generation previously returned by `bump`.
+
+        Returns:
+            tuple. The sets of inserted and deleted face paths or None if the
+                log does not go back that far.
+        """
+        log = self.log_since(generation)
+        if log is None:
+            return None
+
+        inserted = set()
+        deleted = set()
+        for _, operation, face in log:
+            (inserted if operation == "insert" else deleted).add(face)
+        return inserted, deleted
+
+    def to_dict(self):
+        """Serialize the object
+
+        Returns:
+            dict.
+        """
+        return {
+            "generation": self.generation,
+            "start": self.start,
+            "changes": self.changes
+        }
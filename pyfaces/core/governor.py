@@ -0,0 +1,283 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import concurrent.futures
+import os
+import sys
+import threading
+
+try:
+    import threadpoolctl
+except ImportError:
+    # Optional, native libraries already loaded cannot be limited without it
+    threadpoolctl = None
+
+from pyfaces.core.configuration import ConfigManager
+
+
+# Variables read by OpenBLAS, MKL, BLIS, Accelerate and OpenMP when they are loaded
+NATIVE_THREAD_VARIABLES = [
+    "BLIS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS"
+]
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def available_cpus():
+    """Get the number of CPUs this process may run on
+
+    Returns:
+        int.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def limit_native_threads(threads=None):
+    """Limit the threads started by the native libraries of this process
+
+    The limits are set as environment variables, so they are inherited by
+    the processes spawned too. Variables already set by the user are kept.
+    Libraries read them once, when they are loaded, so the ones already
+    loaded are only limited by `ResourceGovernor.apply`.
+
+    Args:
+        threads (int): The threads of each library. By default,
+            `native_threads` in the configuration.
+
+    Returns:
+        bool. True if NumPy was not loaded yet, so the limits apply to it.
+    """
+    if threads is None:
+        threads = ConfigManager().get_attribute("native_threads")
+    for name in NATIVE_THREAD_VARIABLES:
+        os.environ.setdefault(name, str(threads))
+    return "numpy" not in sys.modules
+
+
+def _build_governor(cpus=None, request_threads=None, native_threads=None):
+    """Build a governor taking the values not given from the configuration"""
+    config = ConfigManager()
+    return ResourceGovernor(
+        cpus=cpus if cpus is not None else int(config.get_attribute("cpu_budget")),
+        request_threads=request_threads if request_threads is not None else int(config.get_attribute("num_threads")),
+        native_threads=native_threads if native_threads is not None else int(config.get_attribute("native_threads"))
+    )
+
+
+def get_governor():
+    """Get the governor shared by the whole process
+
+    It is built from the configuration the first time it is used unless
+    `configure_governor` was called before.
+
+    Returns:
+        ResourceGovernor.
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = _build_governor()
+    return _governor
+
+
+def configure_governor(cpus=None, request_threads=None, native_threads=None):
+    """Replace the governor shared by the whole process and apply its limits
+
+    Args:
+        cpus (int): The CPU budget. By default, `cpu_budget` in the
+            configuration, where 0 means all the CPUs available.
+        request_threads (int): The threads serving requests. By default,
+            `num_threads` in the configuration.
+        native_threads (int): The threads of the native libraries in each
+            worker. By default, `native_threads` in the configuration.
+
+    Returns:
+        ResourceGovernor.
+    """
+    global _governor
+    governor = _build_governor(cpus, request_threads, native_threads)
+    governor.apply()
+    with _governor_lock:
+        previous, _governor = _governor, governor
+    if previous is not None:
+        # The sections already submitted still run
+        previous.shutdown()
+    return governor
+
+
+class ResourceGovernor:
+    """Divides a CPU budget between the threads of the process
+
+    Three kinds of threads compete for the CPUs: the threads serving
+    requests, the workers running CPU-bound sections such as searching the
+    encoding matrix or the blocks of a many-to-many comparison, and the
+    threads the native libraries (OpenBLAS, OpenMP) start inside each of
+    those sections. Sized independently, each of them would take every
+    CPU, so a few concurrent requests would run cpus x cpus threads.
+
+    The governor gives each worker `native_threads` and runs the CPU-bound
+    sections of the whole process in a single pool of
+    `cpus // native_threads` workers. Request threads mostly wait for I/O,
+    so there may be more of them, but their CPU-bound sections wait for a
+    free worker. Sections submitted from a worker run in it right away, so
+    they never wait for the worker their caller holds.
+
+    Attributes:
+        cpus (int): The CPU budget.
+        native_threads (int): The threads of the native libraries in each worker.
+        request_threads (int): The threads serving requests.
+        workers (int): The CPU-bound sections run at once.
+    """
+    def __init__(self, cpus=None, request_threads=None, native_threads=1):
+        """Constructor
+
+        Args:
+            cpus (int): The CPU budget. All the CPUs available if None or 0.
+            request_threads (int): The threads serving requests. As many as CPUs if None.
+            native_threads (int): The threads of the native libraries in each worker.
+        """
+        self.cpus = max(int(cpus or available_cpus()), 1)
+        self.native_threads = min(max(int(native_threads or 1), 1), self.cpus)
+        self.workers = max(self.cpus // self.native_threads, 1)
+        self.request_threads = int(request_threads or self.cpus)
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="pyfaces-worker",
+            initializer=self._start_worker
+        )
+        self._local = threading.local()
+        self._busy = 0
+        self._waiting = 0
+        self._counter_lock = threading.Lock()
+        self._native_limits = None
+
+    def apply(self):
+        """Limit the native libraries already loaded to `native_threads`
+
+        It needs threadpoolctl. Otherwise only the libraries loaded later and
+        the processes spawned are limited, through `limit_native_threads`.
+        """
+        limit_native_threads(self.native_threads)
+        if threadpoolctl is not None:
+            self._native_limits = threadpoolctl.threadpool_limits(limits=self.native_threads)
+
+    def _start_worker(self):
+        """Mark the threads of the pool as workers"""
+        self._local.worker = True
+
+    def _run_section(self, function, args, kwargs):
+        """Run a section in a worker keeping the counters up to date"""
+        with self._counter_lock:
+            self._waiting -= 1
+            self._busy += 1
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self._counter_lock:
+                self._busy -= 1
+
+    def submit(self, function, *args, **kwargs):
+        """Run a CPU-bound section in one of the workers
+
+        The section waits while `workers` sections are already running.
+        When submitted from a worker it runs right away in that worker.
+
+        Args:
+            function (callable): The section.
+            *args: Its positional arguments.
+            **kwargs: Its keyword arguments.
+
+        Returns:
+            concurrent.futures.Future.
+        """
+        if getattr(self._local, "worker", False):
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._counter_lock:
+            self._waiting += 1
+        try:
+            return self._executor.submit(self._run_section, function, args, kwargs)
+        except RuntimeError:
+            with self._counter_lock:
+                self._waiting -= 1
+            raise
+
+    def run(self, function, *args, **kwargs):
+        """Run a CPU-bound section in one of the workers and wait for it
+
+        Args:
+            function (callable): The section.
+            *args: Its positional arguments.
+            **kwargs: Its keyword arguments.
+
+        Returns:
+            The value returned by the section.
+        """
+        return self.submit(function, *args, **kwargs).result()
+
+    def shutdown(self):
+        """Stop the workers once the sections submitted have run"""
+        self._executor.shutdown(wait=False)
+
+    def native_limits(self):
+        """Get how the threads of the native libraries are limited
+
+        Returns:
+            dict. The threads used by each library found by threadpoolctl or
+                the environment variables when it is not installed.
+        """
+        if threadpoolctl is not None:
+            return {
+                info["internal_api"]: info["num_threads"]
+                for info in threadpoolctl.threadpool_info()
+            }
+        return {name: os.environ.get(name) for name in NATIVE_THREAD_VARIABLES}
+
+    def allocation(self):
+        """Get the current division of the CPU budget
+
+        Returns:
+            dict.
+        """
+        with self._counter_lock:
+            busy = self._busy
+            waiting = self._waiting
+        return {
+            "cpus": self.cpus,
+            "available_cpus": available_cpus(),
+            "request_threads": self.request_threads,
+            "workers": self.workers,
+            "native_threads": self.native_threads,
+            "native_limits": self.native_limits(),
+            "busy_workers": busy,
+            "waiting_sections": waiting
+        }
@@ -0,0 +1,135 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+
+import numpy as np
+from PIL import Image
+
+
+# The functions available to name the copies of the images and the faces
+HASH_FUNCTIONS = ["md5", "blake2b"]
+
+
+def hash_pixels(image_array, algorithm="md5"):
+    """Hash the pixels of an image reading them from the array buffer
+
+    The digest is the same as that of `Image.fromarray(image_array).tobytes()`
+    but no copy is made unless the array is a view which is not contiguous,
+    such as a crop.
+
+    Args:
+        image_array (numpy.array): The RGB image.
+        algorithm (str): Either 'md5' or 'blake2b', which is faster and whose
+            16-byte digest is as long as the md5 one.
+
+    Returns:
+        str. The hexadecimal digest.
+
+    Raises:
+        ValueError.
+    """
+    if algorithm == "md5":
+        digest = hashlib.md5()
+    elif algorithm == "blake2b":
+        digest = hashlib.blake2b(digest_size=16)
+    else:
+        raise ValueError(f"Unknown hash function '{algorithm}'. Use one of: {', '.join(HASH_FUNCTIONS)}.")
+    digest.update(memoryview(np.ascontiguousarray(image_array)).cast("B"))
+    return digest.hexdigest()
+
+
+def _rgb_array(image, strip_bytes=1 << 22):
+    """Copy the pixels of a PIL image to an RGB array
+
+    They are copied by strips of rows, as exporting the whole image at once
+    keeps its bytes twice in memory while PIL joins them, besides the copy
+    `numpy.array` makes of them.
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    width, height = image.size
+    image_array = np.empty((height, width, 3), dtype=np.uint8)
+    rows = max(strip_bytes // (width * 3), 1)
+    for top in range(0, height, rows):
+        bottom = min(top + rows, height)
+        image_array[top:bottom] = np.asarray(image.crop((0, top, width, bottom)))
+    return image_array
+
+
+def load_image(source, detection_size=0):
+    """Decode an image and a smaller version of it to look for faces
+
+    The full image is needed to encode the faces, but detecting them in
+    large photos is much faster at a lower resolution. JPEG files are
+    decoded again in draft mode, which scales them down while decoding,
+    and any other format is reduced from the full image.
+
+    Args:
+        source (str): The path to the image or a file object.
+        detection_size (int): The longest side of the image faces are
+            looked for in. 0 to look for them in the full image.
+
+    Returns:
+        tuple. The RGB image as a numpy array, the image to look
+            for faces in and the scale between both.
+    """
+    with Image.open(source) as image:
+        width, height = image.size
+        image_array = _rgb_array(image)
+
+    factor = max(width, height) / detection_size if detection_size else 1
+    if factor < 2:
+        return image_array, image_array, 1.0
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    with Image.open(source) as image:
+        if image.format == "JPEG":
+            # The decoder picks the smallest scale which is not below the size asked
+            image.draft("RGB", (int(width / factor), int(height / factor)))
+            detection_array = _rgb_array(image)
+        else:
+            detection_array = _rgb_array(Image.fromarray(image_array).reduce(int(factor)))
+    return image_array, detection_array, width / detection_array.shape[1]
+
+
+def scale_locations(locations, scale, shape):
+    """Map the boxes found in a scaled down image to the full image
+
+    Args:
+        locations (list): The (top, right, bottom, left) boxes.
+        scale (float): The size of the full image over that of the scaled one.
+        shape (tuple): The shape of the full image.
+
+    Returns:
+        list. The boxes in the coordinates of the full image.
+    """
+    if scale == 1:
+        return locations
+    max_height, max_width = shape[:2]
+    return [
+        (
+            max(int(top * scale), 0),
+            min(int(round(right * scale)), max_width),
+            min(int(round(bottom * scale)), max_height),
+            max(int(left * scale), 0)
+        )
+        for top, right, bottom, left in locations
+    ]
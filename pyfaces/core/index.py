@@ -0,0 +1,173 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import numpy as np
+
+
+class EncodingIndex:
+    """The encodings of the gallery as a matrix for vectorized searches
+
+    Rows are appended in place. Removed rows are only marked as tombstones
+    and the matrix is compacted once they exceed a share of the rows, so
+    deleting faces never moves the whole matrix on every call. Values are
+    kept in single precision like in the FaceStore. Snapshots share the
+    matrix, which is copied before replacing a row they may see.
+
+    Attributes:
+        dimensions (int): The number of values of each encoding.
+        faces (list): The face path of each row. None for tombstones.
+        max_tombstones (float): The share of tombstones triggering a compaction.
+        rows (dict): The row of each face path.
+    """
+    def __init__(self, dimensions=128, max_tombstones=0.25):
+        self.dimensions = dimensions
+        self.max_tombstones = max_tombstones
+        self.faces = []
+        self.rows = {}
+        self._matrix = np.empty((0, dimensions), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._shared = False
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, face_path):
+        return face_path in self.rows
+
+    def add(self, face_path, encoding):
+        """Insert or replace the encoding of a face
+
+        Args:
+            face_path (str): The path to the face.
+            encoding (list): The values of the encoding.
+        """
+        row = self.rows.get(face_path)
+        if row is None:
+            row = len(self.faces)
+            if row == len(self._matrix):
+                # Grow geometrically so that appends are amortized
+                capacity = max(2 * row, 64)
+                matrix = np.empty((capacity, self.dimensions), dtype=np.float32)
+                matrix[:row] = self._matrix
+                alive = np.zeros(capacity, dtype=bool)
+                alive[:row] = self._alive
+                self._matrix, self._alive = matrix, alive
+                self._shared = False
+            self.faces.append(face_path)
+            self.rows[face_path] = row
+        elif self._shared:
+            self._matrix = self._matrix.copy()
+            self._shared = False
+        self._matrix[row] = encoding
+        self._alive[row] = True
+
+    def remove(self, face_paths):
+        """Tombstone the rows of some faces
+
+        Args:
+            face_paths (iterable): The paths to the faces. Unknown ones are ignored.
+        """
+        for face_path in face_paths:
+            row = self.rows.pop(face_path, None)
+            if row is not None:
+                self.faces[row] = None
+                self._alive[row] = False
+        if len(self.faces) - len(self.rows) > self.max_tombstones * len(self.faces):
+            self.compact()
+
+    def compact(self):
+        """Drop the tombstones keeping the rows in the same order"""
+        alive = np.flatnonzero(self._alive[:len(self.faces)])
+        self._matrix = self._matrix[alive]
+        self._alive = np.ones(len(alive), dtype=bool)
+        self._shared = False
+        self.faces = [self.faces[row] for row in alive]
+        self.rows = {face_path: row for row, face_path in enumerate(self.faces)}
+
+    def snapshot(self):
+        """Get a read-only copy of the index
+
+        Only the face paths and the flags of the rows are copied. The matrix
+        is shared: new rows are appended past the ones the snapshot uses and
+        replacing a row copies it first, so the snapshot can be searched
+        without locks while the index keeps changing.
+
+        Returns:
+            EncodingIndex.
+        """
+        used = len(self.faces)
+        snapshot = EncodingIndex(self.dimensions, self.max_tombstones)
+        snapshot.faces = list(self.faces)
+        snapshot.rows = dict(self.rows)
+        snapshot._matrix = self._matrix[:used]
+        snapshot._alive = self._alive[:used].copy()
+        snapshot._shared = True
+        self._shared = True
+        return snapshot
+
+    def vectors(self, face_paths):
+        """Copy the encodings of some faces
+
+        Args:
+            face_paths (list): The paths to the faces.
+
+        Returns:
+            numpy.array. A row for each face.
+
+        Raises:
+            KeyError.
+        """
+        return self._matrix[[self.rows[face_path] for face_path in face_paths]]
+
+    @property
+    def nbytes(self):
+        """int. The bytes used by the matrix, including the rows not used yet."""
+        return self._matrix.nbytes + self._alive.nbytes
+
+    @property
+    def tombstones(self):
+        """int. The number of rows waiting for a compaction."""
+        return len(self.faces) - len(self.rows)
+
+    def search(self, encoding, top_k=None, exclude=None):
+        """Find the faces closest to an encoding
+
+        Args:
+            encoding (list): The values of the encoding.
+            top_k (int): The number of results to return. All if None.
+            exclude (str): A face path to leave out of the results.
+
+        Returns:
+            list. The (face_path, distance) tuples, closest first. Ties are
+                sorted by face path.
+        """
+        used = len(self.faces)
+        distances = np.linalg.norm(self._matrix[:used] - np.asarray(encoding), axis=1)
+        candidates = self._alive[:used].copy()
+        if exclude in self.rows:
+            candidates[self.rows[exclude]] = False
+        candidates = np.flatnonzero(candidates)
+
+        if top_k is not None and top_k < len(candidates):
+            # Partition first and keep every face tied with the last one
+            kth = np.partition(distances[candidates], top_k - 1)[top_k - 1]
+            candidates = candidates[distances[candidates] <= kth]
+
+        results = sorted((float(distances[row]), self.faces[row]) for row in candidates)
+        return [(face_path, distance) for distance, face_path in results[:top_k]]
@@ -0,0 +1,175 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class ReadWriteLock:
+    """An in-process lock allowing concurrent readers and exclusive writers
+
+    Writers are given priority over new readers so that a constant flow of
+    searches cannot starve an extraction. It is not reentrant.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        """Block until no writer holds or waits for the lock"""
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        """Release a read lock"""
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        """Block until the lock is free of readers and writers"""
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        """Release a write lock"""
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def read(self):
+        """Context manager to hold the lock as a reader"""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        """Context manager to hold the lock as a writer"""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class FileLock:
+    """An advisory exclusive lock on a file shared between processes
+
+    It relies on `flock` in POSIX systems and on `msvcrt.locking` in Windows.
+    As advisory locks are only honoured by cooperating processes, every
+    process writing the data folder is expected to use it. It is reentrant
+    for the thread holding it.
+
+    Attributes:
+        path (str): The path to the lock file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._depth = 0
+        # Several threads could share the object so they are serialized too
+        self._thread_lock = threading.RLock()
+
+    def acquire(self):
+        """Block until the lock is held by this process"""
+        self._thread_lock.acquire()
+        if self._depth:
+            self._depth += 1
+            return
+
+        try:
+            self._file = open(self.path, "a+")
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        except Exception:
+            if self._file:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            raise
+        self._depth = 1
+
+    def release(self):
+        """Release the lock"""
+        self._depth -= 1
+        try:
+            if not self._depth:
+                try:
+                    if fcntl:
+                        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                    else:
+                        self._file.seek(0)
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+                finally:
+                    self._file.close()
+                    self._file = None
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def atomic_write_json(path, data):
+    """Write a JSON file so that readers never find it half written
+
+    The content is dumped to a temporary file in the same folder and then
+    moved over the destination. It is serialized at once since `json.dump`
+    goes through the pure Python encoder, slower than the C one used by
+    `json.dumps`.
+
+    Args:
+        path (str): The destination file.
+        data (object): The object to serialize.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as output_file:
+        output_file.write(json.dumps(data))
+    os.replace(temp_path, path)
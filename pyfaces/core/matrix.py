@@ -0,0 +1,239 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import json
+
+import numpy as np
+
+from pyfaces.core.governor import get_governor
+
+
+def squared_norms(matrix):
+    """Get the squared euclidean norm of each row of a matrix
+
+    Args:
+        matrix (numpy.array): The encodings, one per row.
+
+    Returns:
+        numpy.array.
+    """
+    return np.einsum("ij,ij->i", matrix, matrix)
+
+
+def distance_block(queries, query_norms, gallery, gallery_norms):
+    """Get the euclidean distances between two blocks of encodings
+
+    They are calculated as ‖a‖² + ‖b‖² − 2a·b so that the bulk of the work
+    is a single matrix product.
+
+    Args:
+        queries (numpy.array): The query encodings, one per row.
+        query_norms (numpy.array): The squared norms of the queries.
+        gallery (numpy.array): The gallery encodings, one per row.
+        gallery_norms (numpy.array): The squared norms of the gallery.
+
+    Returns:
+        numpy.array. The distances with a row per query and a column per
+            face of the gallery.
+    """
+    block = queries @ gallery.T
+    block *= -2
+    block += query_norms[:, None]
+    block += gallery_norms[None, :]
+    # Rounding errors may leave tiny negative values for identical encodings
+    np.maximum(block, 0, out=block)
+    return np.sqrt(block, out=block)
+
+
+def _match_rows(queries, excluded, gallery, gallery_norms, threshold, top_k, block_size):
+    """Match a block of queries against the gallery, one block of columns at a time
+
+    Returns:
+        list. The (row, columns, distances) tuples of each query of the block.
+    """
+    query_norms = squared_norms(queries)
+    rows = np.arange(len(queries))
+    found = [[] for _ in rows]
+    best_columns = np.empty((len(queries), 0), dtype=np.int64)
+    best_distances = np.empty((len(queries), 0), dtype=np.float32)
+
+    for start in range(0, len(gallery), block_size):
+        block = distance_block(queries, query_norms, gallery[start:start + block_size], gallery_norms[start:start + block_size])
+        columns = np.arange(start, start + block.shape[1])
+
+        # A face is never matched with itself
+        inside = (excluded >= start) & (excluded < start + block.shape[1])
+        block[rows[inside], excluded[inside] - start] = np.inf
+        if threshold is not None:
+            block[block > threshold] = np.inf
+
+        if top_k is None:
+            for row, column in zip(*np.nonzero(np.isfinite(block))):
+                found[row].append((block[row, column], start + column))
+            continue
+
+        # Keep the best top_k of the previous blocks and of this one
+        distances = np.concatenate([best_distances, block], axis=1)
+        candidates = np.concatenate([best_columns, np.broadcast_to(columns, block.shape)], axis=1)
+        if distances.shape[1] > top_k:
+            kept = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+            distances = np.take_along_axis(distances, kept, axis=1)
+            candidates = np.take_along_axis(candidates, kept, axis=1)
+        best_distances, best_columns = distances, candidates
+
+    if top_k is not None:
+        for row in rows:
+            finite = np.isfinite(best_distances[row])
+            found[row] = list(zip(best_distances[row][finite], best_columns[row][finite]))
+
+    results = []
+    for row in range(len(queries)):
+        matches = sorted((float(distance), int(column)) for distance, column in found[row])
+        results.append((
+            row,
+            np.array([column for _, column in matches], dtype=np.int64),
+            np.array([distance for distance, _ in matches], dtype=np.float32)
+        ))
+    return results
+
+
+def compare_matrices(queries, gallery, threshold=None, top_k=None, excluded=None, block_size=1024, workers=None):
+    """Compare every query encoding with every gallery encoding
+
+    Distances are computed in blocks of block_size x block_size with a
+    matrix product each, so the memory used does not depend on the size of
+    the sets. Blocks of queries are run by the workers of the resource
+    governor and their results are yielded in order as soon as they are
+    ready.
+
+    Args:
+        queries (numpy.array): The query encodings, one per row.
+        gallery (numpy.array): The gallery encodings, one per row.
+        threshold (float): Only keep the pairs closer than this.
+        top_k (int): Only keep the closest top_k faces of each query.
+        excluded (numpy.array): For each query, the column of the gallery
+            holding the same face, or -1. Those pairs are skipped.
+        block_size (int): The rows and columns of each block of distances.
+        workers (int): The blocks in flight are twice this. The workers
+            of the resource governor if None.
+
+    Yields:
+        tuple. The row of the query, the columns of its matches and their
+            distances, closest first.
+
+    Raises:
+        ValueError.
+    """
+    if threshold is None and top_k is None:
+        raise ValueError("A threshold or a top_k is needed to keep the results sparse.")
+    if top_k is not None and int(top_k) < 1:
+        raise ValueError("top_k must be at least 1.")
+    top_k = None if top_k is None else int(top_k)
+    block_size = max(int(block_size), 1)
+
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    gallery = np.ascontiguousarray(gallery, dtype=np.float32)
+    if excluded is None:
+        excluded = np.full(len(queries), -1, dtype=np.int64)
+    gallery_norms = squared_norms(gallery)
+    governor = get_governor()
+    workers = workers or governor.workers
+
+    # Concurrent comparisons share the workers of the process. Only a few
+    # blocks are in flight so that results never pile up
+    pending = collections.deque()
+    starts = iter(range(0, len(queries), block_size))
+    while True:
+        while len(pending) < 2 * workers:
+            start = next(starts, None)
+            if start is None:
+                break
+            pending.append((start, governor.submit(
+                _match_rows,
+                queries[start:start + block_size],
+                excluded[start:start + block_size],
+                gallery,
+                gallery_norms,
+                threshold,
+                top_k,
+                block_size
+            )))
+        if not pending:
+            return
+        start, future = pending.popleft()
+        for row, columns, distances in future.result():
+            yield start + row, columns, distances
+
+
+def write_ndjson(matches, query_paths, gallery_paths, output_file):
+    """Stream the matches as one JSON object per query and line
+
+    Args:
+        matches (iterable): The tuples yielded by `compare_matrices`.
+        query_paths (list): The face path of each query row.
+        gallery_paths (list): The face path of each gallery column.
+        output_file (file): A text file open for writing.
+
+    Returns:
+        int. The number of pairs written.
+    """
+    pairs = 0
+    for row, columns, distances in matches:
+        output_file.write(json.dumps({
+            "face_path": query_paths[row],
+            "comparisons": [
+                {"known_face": gallery_paths[column], "similarity": float(distance)}
+                for column, distance in zip(columns, distances)
+            ]
+        }) + "\n")
+        pairs += len(columns)
+    return pairs
+
+
+def write_npz(matches, query_paths, gallery_paths, output_path):
+    """Save the matches as a sparse matrix in a compressed npz file
+
+    Only the rows, columns and distances of the pairs found are kept in
+    memory until they are saved.
+
+    Args:
+        matches (iterable): The tuples yielded by `compare_matrices`.
+        query_paths (list): The face path of each query row.
+        gallery_paths (list): The face path of each gallery column.
+        output_path (str): The path of the npz file.
+
+    Returns:
+        int. The number of pairs written.
+    """
+    rows, columns, distances = [], [], []
+    for row, row_columns, row_distances in matches:
+        rows.append(np.full(len(row_columns), row, dtype=np.int64))
+        columns.append(row_columns)
+        distances.append(row_distances)
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    np.savez_compressed(
+        output_path,
+        query_paths=np.array(query_paths, dtype=str),
+        gallery_paths=np.array(gallery_paths, dtype=str),
+        rows=rows,
+        columns=np.concatenate(columns) if columns else np.empty(0, dtype=np.int64),
+        distances=np.concatenate(distances) if distances else np.empty(0, dtype=np.float32)
+    )
+    return len(rows)
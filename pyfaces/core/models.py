@@ -0,0 +1,128 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import contextlib
+import queue
+
+import dlib
+import face_recognition_models
+import numpy as np
+
+
+# The dlib detector and models keep scratch buffers of their own, so the
+# ones loaded by face_recognition cannot be shared by threads without
+# aborting the process. Each call borrows a set which no other thread is
+# using, loading a new one only when all of them are busy.
+_idle_models = queue.LifoQueue()
+
+
+@contextlib.contextmanager
+def _borrow():
+    """Context manager to use a set of models no other thread is using"""
+    try:
+        models = _idle_models.get_nowait()
+    except queue.Empty:
+        models = {
+            "detector": dlib.get_frontal_face_detector(),
+            "predictor": dlib.shape_predictor(face_recognition_models.pose_predictor_five_point_model_location()),
+            "encoder": dlib.face_recognition_model_v1(face_recognition_models.face_recognition_model_location())
+        }
+    try:
+        yield models
+    finally:
+        _idle_models.put(models)
+
+
+def _to_box(rect, shape):
+    """Convert a dlib rectangle to a (top, right, bottom, left) box inside the image"""
+    return max(rect.top(), 0), min(rect.right(), shape[1]), min(rect.bottom(), shape[0]), max(rect.left(), 0)
+
+
+def _to_rect(box):
+    """Convert a (top, right, bottom, left) box to a dlib rectangle"""
+    top, right, bottom, left = box
+    return dlib.rectangle(left, top, right, bottom)
+
+
+def _shapes(models, image_array, face_locations):
+    """Find the 5-point landmarks of the faces of an image"""
+    if face_locations is None:
+        rects = models["detector"](image_array, 1)
+    else:
+        rects = [_to_rect(box) for box in face_locations]
+    return [models["predictor"](image_array, rect) for rect in rects]
+
+
+def _landmarks(shape):
+    """Name the points of a 5-point shape as `face_recognition.face_landmarks` does"""
+    points = [(point.x, point.y) for point in shape.parts()]
+    return {
+        "nose_tip": [points[4]],
+        "left_eye": points[2:4],
+        "right_eye": points[0:2]
+    }
+
+
+def face_locations(image_array):
+    """Thread-safe `face_recognition.face_locations`
+
+    Args:
+        image_array (numpy.array): The image.
+
+    Returns:
+        list. The (top, right, bottom, left) boxes of the faces found.
+    """
+    with _borrow() as models:
+        return [_to_box(rect, image_array.shape) for rect in models["detector"](image_array, 1)]
+
+
+def face_encodings_and_landmarks(image_array):
+    """Calculate the encodings of the faces of an image and their landmarks
+
+    The encodings are those of `face_recognition.face_encodings`, which
+    finds the 5-point landmarks of each face to align it. They are returned too so that
+    scoring the faces does not look for them again.
+
+    Args:
+        image_array (numpy.array): The image.
+
+    Returns:
+        tuple. The 128-dimension encodings as numpy arrays and the landmarks
+            of each face as returned by `face_landmarks`.
+    """
+    with _borrow() as models:
+        shapes = _shapes(models, image_array, None)
+        encodings = [np.array(models["encoder"].compute_face_descriptor(image_array, shape, 1)) for shape in shapes]
+    return encodings, [_landmarks(shape) for shape in shapes]
+
+
+def face_landmarks(image_array, face_locations=None):
+    """Thread-safe `face_recognition.face_landmarks` with the 'small' model
+
+    Args:
+        image_array (numpy.array): The image.
+        face_locations (list): The boxes of the faces. If None, they are
+            detected first.
+
+    Returns:
+        list. A dict with the 'nose_tip', 'left_eye' and 'right_eye' points per face.
+    """
+    with _borrow() as models:
+        shapes = _shapes(models, image_array, face_locations)
+    return [_landmarks(shape) for shape in shapes]
@@ -0,0 +1,172 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import queue
+import threading
+
+
+class _Stop(Exception):
+    """Raised inside a stage when the pipeline has been cancelled"""
+
+
+class _Failure:
+    """Wraps an exception raised by a stage so that it reaches the consumer"""
+    def __init__(self, exception):
+        self.exception = exception
+
+
+_END = object()
+
+
+class Pipeline:
+    """A chain of stages running in their own threads
+
+    Stages are connected by bounded queues so that a slow stage makes the
+    previous ones wait instead of piling up items in memory. Each stage can
+    have several workers, in which case the order of the items is not kept.
+
+    Attributes:
+        queue_size (int): The maximum number of items waiting between stages.
+        stages (list): The (function, workers) tuples of the stages.
+    """
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.stages = []
+        self._stop = threading.Event()
+
+    def add_stage(self, function, workers=1):
+        """Append a stage to the pipeline
+
+        Args:
+            function (callable): Receives an item and returns an iterable with
+                the items for the next stage.
+            workers (int): The number of threads running the stage.
+
+        Returns:
+            Pipeline. The pipeline itself so that calls can be chained.
+        """
+        self.stages.append((function, max(int(workers), 1)))
+        return self
+
+    def _put(self, target, item):
+        """Put an item in a bounded queue unless the pipeline is cancelled"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _Stop()
+
+    def _get(self, source):
+        """Get an item from a queue unless the pipeline is cancelled"""
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        raise _Stop()
+
+    def _feed(self, items, target):
+        """Put the input items in the first queue"""
+        try:
+            for item in items:
+                self._put(target, item)
+            self._put(target, _END)
+        except _Stop:
+            pass
+        except Exception as exc:
+            try:
+                self._put(target, _Failure(exc))
+            except _Stop:
+                pass
+
+    def _work(self, function, source, target, pending):
+        """Run a stage until the end of the stream
+
+        The last worker of a stage to finish forwards the end of the stream.
+        """
+        try:
+            while True:
+                item = self._get(source)
+                if item is _END:
+                    # Let the siblings find it too
+                    self._put(source, _END)
+                    break
+                if isinstance(item, _Failure):
+                    self._put(target, item)
+                    continue
+                try:
+                    for result in function(item):
+                        self._put(target, result)
+                except _Stop:
+                    raise
+                except Exception as exc:
+                    self._put(target, _Failure(exc))
+
+            with pending["lock"]:
+                pending["workers"] -= 1
+                last = not pending["workers"]
+            if last:
+                self._put(target, _END)
+        except _Stop:
+            pass
+
+    def run(self, items):
+        """Process a stream of items
+
+        Args:
+            items (iterable): The input of the first stage. It is consumed in
+                a thread of its own.
+
+        Yields:
+            object. The items produced by the last stage.
+
+        Raises:
+            Exception. The first exception raised by a stage.
+        """
+        self._stop.clear()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+        for i, (function, workers) in enumerate(self.stages):
+            pending = {"lock": threading.Lock(), "workers": workers}
+            for _ in range(workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(function, queues[i], queues[i + 1], pending),
+                        daemon=True
+                    )
+                )
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _END:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.exception
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
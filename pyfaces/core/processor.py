@@ -18,18 +18,49 @@
 ################################################################################
 
 import base64
+import bisect
 import concurrent.futures
+import contextlib
 import datetime as dt
-import hashlib
+import io
 import json
+import math
 import os
 import pathlib
+import threading
 from PIL import Image
 
 import face_recognition
 import numpy as np
 
 from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.dedup import BKTree
+from pyfaces.core.dedup import dhash
+from pyfaces.core.gallery import GalleryVersion
+from pyfaces.core.governor import get_governor
+from pyfaces.core.imaging import hash_pixels
+from pyfaces.core.imaging import load_image
+from pyfaces.core.imaging import scale_locations
+from pyfaces.core.index import EncodingIndex
+from pyfaces.core.locking import FileLock
+from pyfaces.core.locking import ReadWriteLock
+from pyfaces.core.locking import atomic_write_json
+from pyfaces.core import models
+from pyfaces.core.pipeline import Pipeline
+from pyfaces.core.quality import group_identities
+from pyfaces.core.quality import quality_score
+from pyfaces.core.regions import clip_region
+from pyfaces.core.regions import crop_region
+from pyfaces.core.regions import select_faces
+from pyfaces.core.regions import shift_locations
+from pyfaces.core.replication import pack_entry
+from pyfaces.core.replication import unpack_entry
+from pyfaces.core.sharding import iter_json_items
+from pyfaces.core.sharding import shard_for_path
+from pyfaces.core.store import FaceStore
+from pyfaces.core.tiers import TieredIndex
+from pyfaces.core.video import VideoPipeline
+from pyfaces.core.watchlist import Watchlist
 from pyfaces.misc.colors import warning
 
 
@@ -37,94 +68,364 @@ class FaceProcessor:
     """The class professor
 
     Attributes:
+        collection (str): The name of the collection of faces handled.
         config (ConfigManager): The configuration manager object.
         comparisons (dict): The comparisons file as a dict. The key is the file name.
-        encodings (dict): The encodings file as a dict. The key is the file name.
+        encodings (FaceStore): The encodings file in a compact read-only form. The
+            key is the file name. Mutations replace it with a dict while writing.
+        gallery (GalleryVersion): The generation of the gallery and its recent changes.
+        guess_cache (dict): The cached guesses as a dict. The key is the face path.
+        guess_cache_size (int): The maximum number of comparisons cached per guess.
+        hot_faces (int): The faces whose encodings the search index keeps in
+            RAM, the rest being memory-mapped. 0 if the gallery is not tiered.
         metadata (dict): The metadata file as a dict. The key is the file name.
+        replica_of (str): The primary followed if this processor is a read
+            replica. None otherwise.
+        shard_count (int): The total number of shards. None if not sharded.
+        shard_index (int): The shard owned by this processor. None if not sharded.
+        watchlist (Watchlist): The persons of interest every new face is checked against.
     """
-    def __init__(self):
-        self.config = ConfigManager()
+    def __init__(self, shard_index=None, shard_count=None, collection=None):
+        """Constructor
+
+        Args:
+            shard_index (int): If set, the processor uses the data folder of
+                this shard, split from the one of the collection the first time.
+            shard_count (int): The total number of shards.
+            collection (str): The collection of faces to use. The default one if None.
+
+        Raises:
+            ValueError.
+        """
+        self.config = ConfigManager(collection, shard=(shard_index, shard_count) if shard_count else None)
+        self.collection = self.config.collection
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.replica_of = None
+
+        # In-process lock for the attributes and cross-process lock for the files
+        self.lock = ReadWriteLock()
+        self.folder_lock = FileLock(self.config.lock_file)
+        if self.shard_count:
+            self._split_shared_gallery()
+
+        self.hot_faces = int(self.config.get_attribute("hot_faces"))
 
         # Load previous configurations
+        self._mtimes = {}
+        self._touched = set()
+        self.comparisons = self._load(self.config.comparisons_file)
+        self.encodings = self._load_encodings()
+        self.metadata = self._load(self.config.metadata_file)
+        self.gallery = GalleryVersion(self._load(self.config.gallery_file))
+        self.guess_cache = self._load_guess_cache()
+        self.guess_cache_size = int(self.config.get_attribute("guess_cache_size"))
+        self.watchlist = Watchlist(
+            self.config.watchlist_file,
+            self.config.watchlist_hits_file,
+            tolerance=float(self.config.get_attribute("watchlist_tolerance"))
+        )
+
+        # Perceptual hash index of the faces, rebuilt when the gallery changes
+        self._hash_index = None
+        self._hash_index_generation = None
+
+        # Encoding matrix, updated with the changes logged by the gallery
+        self._index_lock = threading.Lock()
+        self._encoding_index = None
+        self._encoding_index_generation = None
+        self._encoding_snapshot = None
+
+        # Sorted face paths of the encodings paged by the replicas, with the
+        # store and the generation they were sorted for
+        self._snapshot_order = (None, None, [])
+
+    def _load(self, file_path):
+        """Load a JSON file from the data folder creating it if needed
+
+        Args:
+            file_path (str): The path to the file.
+
+        Returns:
+            dict.
+        """
         try:
-            with open(str(self.config.comparisons_file), "r") as input_file:
-                self.comparisons = json.load(input_file)
+            with open(file_path, "r") as input_file:
+                self._mtimes[file_path] = os.fstat(input_file.fileno()).st_mtime_ns
+                return json.load(input_file)
         except FileNotFoundError:
-            with open(self.config.comparisons_file, "w") as output_file:
-                json.dump({}, output_file)
-                self.comparisons = {}
+            with self.folder_lock:
+                if not os.path.exists(file_path):
+                    atomic_write_json(file_path, {})
+            return {}
+
+    def _dump(self, file_path, data):
+        """Persist a JSON file of the data folder
+
+        It MUST be called while holding the locks given by `_writing`.
+
+        Args:
+            file_path (str): The path to the file.
+            data (dict): The contents.
+        """
+        atomic_write_json(file_path, data)
+        self._mtimes[file_path] = os.stat(file_path).st_mtime_ns
+
+    def _bump_gallery(self, inserted=(), deleted=()):
+        """Record a new generation of the gallery
+
+        It MUST be called while holding the locks given by `_writing`.
 
+        Args:
+            inserted (iterable): The face paths added or replaced.
+            deleted (iterable): The face paths removed.
+        """
+        self.gallery = GalleryVersion(self._load(self.config.gallery_file))
+        self.gallery.bump(inserted, deleted)
+        self._touched.update(inserted)
+        self._touched.update(deleted)
+        self._dump(self.config.gallery_file, self.gallery.to_dict())
+
+    def _split_shared_gallery(self):
+        """Copy the faces owned by this shard from the gallery of the collection
+
+        It is only done the first time the shard is used. Faces are owned
+        by the shard given by `shard_for_path` for their original image, the
+        rule used to route the writes, so all the faces of an image end up
+        in the same shard. The shared files are parsed one entry at a time
+        so the peak memory is the one of the faces owned, not the whole
+        gallery. The crops and sources are not copied: the entries keep
+        pointing to the ones of the collection.
+        """
+        shared = ConfigManager(self.collection)
+        if not os.path.exists(shared.encodings_file):
+            return
+        with self.folder_lock:
+            if os.path.exists(self.config.encodings_file):
+                return
+            encodings = {
+                key: value
+                for (key, value) in iter_json_items(shared.encodings_file)
+                if shard_for_path(value["original_image_path"], self.shard_count) == self.shard_index
+            }
+            metadata = {}
+            if os.path.exists(shared.metadata_file):
+                for (key, value) in iter_json_items(shared.metadata_file):
+                    faces = [face_path for face_path in value.get("faces", []) if face_path in encodings]
+                    if faces:
+                        metadata[key] = {**value, "faces": faces}
+            atomic_write_json(self.config.metadata_file, metadata)
+            # Written last as it marks the split as done
+            atomic_write_json(self.config.encodings_file, encodings)
+
+    def _load_encodings(self):
+        """Load the encodings of the data folder
+
+        Returns:
+            FaceStore.
+        """
+        return self._compact(self._load(self.config.encodings_file))
+
+    def _load_guess_cache(self):
+        """Load the cached guesses and the ones appended since the last compaction
+
+        Returns:
+            dict.
+        """
+        guess_cache = self._load(self.config.guess_cache_file)
+        self._guess_log_lines = 0
         try:
-            with open(self.config.encodings_file, "r") as input_file:
-                self.encodings = json.load(input_file)
+            with open(self.config.guess_log_file, "r") as input_file:
+                self._mtimes[self.config.guess_log_file] = os.fstat(input_file.fileno()).st_mtime_ns
+                for line in input_file:
+                    # Lines being written are skipped until complete
+                    if line.endswith("\n"):
+                        guess_cache.update(json.loads(line))
+                        self._guess_log_lines += 1
         except FileNotFoundError:
-            with open(self.config.encodings_file, "w") as output_file:
-                json.dump({}, output_file)
-                self.encodings = {}
+            self._mtimes.pop(self.config.guess_log_file, None)
+        return guess_cache
+
+    def _dump_guess_cache(self):
+        """Persist every cached guess in a single file
 
+        It MUST be called while holding the locks given by `_writing`. The
+        guesses appended so far are already part of it.
+        """
+        self._dump(self.config.guess_cache_file, self.guess_cache)
         try:
-            with open(self.config.metadata_file, "r") as input_file:
-                self.metadata = json.load(input_file)
+            os.remove(self.config.guess_log_file)
         except FileNotFoundError:
-            with open(self.config.metadata_file, "w") as output_file:
-                json.dump({}, output_file)
-                self.metadata = {}
+            pass
+        self._mtimes.pop(self.config.guess_log_file, None)
+        self._guess_log_lines = 0
 
-    def compare_faces(self, face_path_1, face_path_2, force_recalculation=False):
-        """Compare two existing faces
+    def _compact(self, encodings):
+        """Turn the encodings into a FaceStore
+
+        The encodings matrix of a tiered gallery is memory-mapped so that
+        only the pages of the faces used stay in memory.
 
         Args:
-            face_path_1 (str): The path to the first face.
-            face_path_2 (str): The path to the first face.
-            force_recalculation (bool): If True, it recalculates the process.
+            encodings (dict): The contents of the encodings file.
 
         Returns:
-            float. The similarity between both faces
+            FaceStore.
         """
-        if not force_recalculation:
-            if face_path_1 in self.comparisons.keys() and face_path_2 in self.comparisons[face_path_1].keys():
-                return self.comparisons[face_path_1][face_path_2]
+        return FaceStore(encodings, vectors_folder=self.config.cold_folder if self.hot_faces else None)
 
-        if face_path_1 not in self.encodings.keys():
-            raise ValueError(f"Image '{face_path_1}' is not a registered face. Try extracting faces first.")
-        elif face_path_2 not in self.encodings.keys():
-            raise ValueError(f"Image '{face_path_2}' is not a registered face. Try extracting faces first.")
+    def _changed(self, file_path):
+        """Check if a file of the data folder was modified since it was loaded
 
-        # Calculate distances
-        new_numpy = np.array(self.encodings[face_path_2]["encodings"])
+        Args:
+            file_path (str): The path to the file.
 
-        try:    
-            distance = float(
+        Returns:
+            bool.
+        """
+        try:
+            return os.stat(file_path).st_mtime_ns != self._mtimes.get(file_path)
+        except FileNotFoundError:
+            return False
+
+    def refresh(self):
+        """Reload the files modified by other processes since they were loaded
+
+        It only checks the modification times so it is cheap to call it
+        before serving each request from a long-lived processor.
+        """
+        files = [
+            self.config.comparisons_file,
+            self.config.encodings_file,
+            self.config.gallery_file,
+            self.config.guess_cache_file,
+            self.config.guess_log_file,
+            self.config.metadata_file
+        ]
+        if not any(self._changed(file_path) for file_path in files):
+            return
+
+        with self.lock.write():
+            if self._changed(self.config.comparisons_file):
+                self.comparisons = self._load(self.config.comparisons_file)
+            if self._changed(self.config.encodings_file):
+                self.encodings = self._load_encodings()
+            if self._changed(self.config.metadata_file):
+                self.metadata = self._load(self.config.metadata_file)
+            if self._changed(self.config.gallery_file):
+                self.gallery = GalleryVersion(self._load(self.config.gallery_file))
+            if self._changed(self.config.guess_cache_file) or self._changed(self.config.guess_log_file):
+                self.guess_cache = self._load_guess_cache()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Context manager to hold every lock needed to modify the data folder
+
+        Mutations MUST reload the files they modify from disk inside this
+        block as other processes may have changed them, and add the faces
+        whose entries they change to `_touched`. When the block ends, only
+        those are applied to the FaceStore, unless the encodings file had
+        been changed by another process: then they are compacted again.
+        """
+        with self.lock.write():
+            with self.folder_lock:
+                store = self.encodings
+                if not isinstance(store, FaceStore) or self._changed(self.config.encodings_file):
+                    store = None
+                self._touched = set()
+                completed = False
+                try:
+                    yield
+                    completed = True
+                finally:
+                    if isinstance(self.encodings, dict):
+                        encodings = self.encodings
+                        changes = {face_path: encodings[face_path] for face_path in self._touched if face_path in encodings}
+                        deleted = [face_path for face_path in self._touched if face_path not in encodings]
+                        if completed and store is not None and store.update(changes, deleted):
+                            self.encodings = store
+                        else:
+                            self.encodings = self._compact(encodings)
+
+    def _check_writable(self):
+        """Make sure that the data folder can be modified by this processor
+
+        A replica only applies the changes of its primary. Shards are
+        writable as each one has its own data folder.
+
+        Raises:
+            ValueError.
+        """
+        if self.replica_of:
+            raise ValueError(f"This replica is read-only. Extract or delete faces in its primary: '{self.replica_of}'.")
+
+    def _distance(self, face_path_1, face_path_2):
+        """Calculate the distance between two registered faces
+
+        Args:
+            face_path_1 (str): The path to the first face.
+            face_path_2 (str): The path to the second face.
+
+        Returns:
+            float. The distance or None if it could not be calculated.
+        """
+        new_numpy = np.array(self.encodings[face_path_2]["encodings"])
+        try:
+            # Recent NumPy versions refuse float() on arrays with dimensions
+            return float(
                 face_recognition.face_distance(
                     self.encodings[face_path_1]["encodings"],       # It SHOULD BE a list of lists
                     new_numpy                                       # It SHOULD BE a numpy.array
-                )
+                ).item()
             )
+        except (TypeError, ValueError):
+            return None
 
-            # Persisting distance
-            with open(self.config.comparisons_file, "r") as input_file:
-                self.comparisons = json.load(input_file)
+    def _persist_comparisons(self, distances):
+        """Persist new distances in the comparisons file
 
-            if face_path_1 not in self.comparisons.keys():
-                self.comparisons[face_path_1] = {}
-            self.comparisons[face_path_1].update(
-                {
-                    face_path_2: distance
-                }
-            )
-            if face_path_2 not in self.comparisons.keys():
-                self.comparisons[face_path_2] = {}
-            self.comparisons[face_path_2].update(
-                {
-                    face_path_1: distance
-                }
-            )
+        Args:
+            distances (list): A list of (face_path_1, face_path_2, distance) tuples.
+        """
+        if not distances:
+            return
+
+        with self._writing():
+            self.comparisons = self._load(self.config.comparisons_file)
+            for face_path_1, face_path_2, distance in distances:
+                self.comparisons.setdefault(face_path_1, {})[face_path_2] = distance
+                self.comparisons.setdefault(face_path_2, {})[face_path_1] = distance
+            self._dump(self.config.comparisons_file, self.comparisons)
+
+    def compare_faces(self, face_path_1, face_path_2, force_recalculation=False):
+        """Compare two existing faces
+
+        Args:
+            face_path_1 (str): The path to the first face.
+            face_path_2 (str): The path to the first face.
+            force_recalculation (bool): If True, it recalculates the process.
 
-            with open(self.config.comparisons_file, "w") as output_file:
-                json.dump(self.comparisons, output_file)
-        except TypeError:
-            return 1 
+        Returns:
+            float. The similarity between both faces
+        """
+        with self.lock.read():
+            if not force_recalculation:
+                if face_path_1 in self.comparisons.keys() and face_path_2 in self.comparisons[face_path_1].keys():
+                    return self.comparisons[face_path_1][face_path_2]
+
+            if face_path_1 not in self.encodings.keys():
+                raise ValueError(f"Image '{face_path_1}' is not a registered face. Try extracting faces first.")
+            elif face_path_2 not in self.encodings.keys():
+                raise ValueError(f"Image '{face_path_2}' is not a registered face. Try extracting faces first.")
+
+            # Calculate distances
+            distance = self._distance(face_path_1, face_path_2)
+
+        if distance is None:
+            return 1
 
+        # Persisting distance
+        self._persist_comparisons([(face_path_1, face_path_2, distance)])
         return distance
 
     def delete_analysis(self, image_path):
@@ -136,138 +437,793 @@ class FaceProcessor:
         Raises:
             OSError.
             FileNotFoundError.
+            ValueError.
         """
-        # TODO: Add unlink(missing_ok=True) in Python3.8+
-        pathlib.Path(image_path).unlink()
-
-        try:
-            with open(self.config.encodings_file, "r") as input_file:
-                self.encodings = json.load(input_file)
-
-            faces_in_image = []
-            copy_encodings = dict(self.encodings)
-            for (key, value) in copy_encodings.items() :
-                if value["original_file"] == image_path:
-                    faces_in_image.append(key)
-                    del self.encodings[key]
-
-            with open(self.config.encodings_file, "w") as output_file:
-                json.dump(self.encodings, output_file)
-        except FileNotFoundError:
-            with open(self.config.encodings_file, "w") as output_file:
-                json.dump({}, output_file)
+        self._check_writable()
 
-        try:
-            with open(self.config.comparisons_file, "r") as input_file:
-                self.comparisons = json.load(input_file)
-
-            copy_comparisons = dict(self.comparisons)
-            for (key, value) in copy_comparisons.items() :
-                for face in faces_in_image:
-                    if key == face:
-                        del self.comparisons[key]
-                    else:
-                        self.comparisons[key].pop(face, None)
-
-            with open(self.config.comparisons_file, "w") as output_file:
-                json.dump(self.comparisons, output_file)
-        except FileNotFoundError:
-            with open(self.config.comparisons_file, "w") as output_file:
-                json.dump({}, output_file)
+        with self._writing():
+            # TODO: Add unlink(missing_ok=True) in Python3.8+
+            pathlib.Path(image_path).unlink()
+            self._delete(source_paths=[image_path])
         return True
 
-    def extract_faces(self, image_path, force_recalculation=False):
+    def delete_many(self, source_paths=(), face_paths=(), prefix=None):
+        """Delete many images and faces with a single pass over the data folder
+
+        Images can be given by the path to their copy in the data folder or
+        by their original path. Faces still seen in images which are kept
+        are not deleted, one of those images becomes their source instead.
+
+        Args:
+            source_paths (iterable): The images to delete.
+            face_paths (iterable): The faces to delete. They are also removed
+                from the metadata of their images.
+            prefix (str): Delete every image whose original path or copy
+                starts with this prefix.
+
+        Returns:
+            dict. The number of 'images' deleted and the 'faces' deleted.
+
+        Raises:
+            ValueError.
+        """
+        self._check_writable()
+
+        with self._writing():
+            deleted_sources, deleted_faces = self._delete(source_paths, face_paths, prefix)
+
+            # Only the copies owned by the data folder are removed
+            for file_path in deleted_sources + deleted_faces:
+                if os.path.dirname(file_path) in (self.config.sources_folder, self.config.faces_folder):
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+        return {
+            "faces": deleted_faces,
+            "images": len(deleted_sources)
+        }
+
+    def _delete(self, source_paths=(), face_paths=(), prefix=None):
+        """Remove images and faces from the files of the data folder
+
+        Each file is loaded and dumped once whatever the number of images.
+        It MUST be called while holding the locks given by `_writing`.
+
+        Args:
+            source_paths (iterable): The copies or original paths of the images.
+            face_paths (iterable): The faces to delete.
+            prefix (str): Delete every image whose original path or copy
+                starts with this prefix.
+
+        Returns:
+            tuple. The copies of the images deleted and the faces deleted.
+        """
+        self.metadata = self._load(self.config.metadata_file)
+        self.encodings = self._load(self.config.encodings_file)
+
+        # Images are given either by their copy or by their original path,
+        # which may have been stored relative to the working directory
+        originals = {os.path.abspath(source_path) for source_path in source_paths}
+        copies = set(source_paths)
+        for copied_path, image_metadata in self.metadata.items():
+            original_path = image_metadata.get("original_path") or ""
+            if original_path and os.path.abspath(original_path) in originals:
+                copies.add(copied_path)
+            elif prefix and any(path.startswith(prefix) for path in (copied_path, original_path, original_path and os.path.abspath(original_path))):
+                copies.add(copied_path)
+
+        def deleted(place):
+            return place["copied_original_file"] in copies or os.path.abspath(place["original_image_path"]) in originals
+
+        faces = set(face_paths)
+        for face_path, entry in self.encodings.items():
+            if face_path in faces:
+                continue
+            if "sightings" in entry:
+                entry["sightings"] = [sighting for sighting in entry["sightings"] if not deleted(sighting)]
+                self._touched.add(face_path)
+            if deleted(entry):
+                if entry.get("sightings"):
+                    # The face is still seen in other images, so one of them becomes its source
+                    entry.update(entry["sightings"].pop(0))
+                else:
+                    faces.add(face_path)
+            if "sightings" in entry and not entry["sightings"]:
+                del entry["sightings"]
+
+        deleted_faces = []
+        for face_path in sorted(faces):
+            entry = self.encodings.pop(face_path, None)
+            if entry is None:
+                continue
+            deleted_faces.append(face_path)
+            for place in [entry] + entry.get("sightings", []):
+                image_metadata = self.metadata.get(place["copied_original_file"])
+                if image_metadata and face_path in image_metadata["faces"]:
+                    image_metadata["faces"].remove(face_path)
+        self._dump(self.config.encodings_file, self.encodings)
+
+        deleted_sources = sorted(copied_path for copied_path in copies if self.metadata.pop(copied_path, None) is not None)
+        self._dump(self.config.metadata_file, self.metadata)
+
+        self._forget_faces(deleted_faces)
+        return deleted_sources, deleted_faces
+
+    def _forget_faces(self, faces):
+        """Remove the comparisons and cached guesses of deleted faces
+
+        It MUST be called while holding the locks given by `_writing`, once
+        the faces have been removed from the encodings.
+
+        Args:
+            faces (list): The paths to the deleted faces.
+        """
+        self.comparisons = self._load(self.config.comparisons_file)
+        # Distances are stored both ways, so only the rows of the partners are visited
+        for face in faces:
+            for partner in self.comparisons.pop(face, {}):
+                self.comparisons.get(partner, {}).pop(face, None)
+        self._dump(self.config.comparisons_file, self.comparisons)
+
+        if faces:
+            self._bump_gallery(deleted=faces)
+
+            self.guess_cache = self._load_guess_cache()
+            for face in faces:
+                self.guess_cache.pop(face, None)
+            self._dump_guess_cache()
+
+    def _decode(self, image_path):
+        """Load an image and find where its copy will be stored
+
+        Images larger than `detection_size` in the configuration are also
+        decoded at a lower resolution to look for faces in. The copy is named
+        after the `image_hash` of its pixels.
+
+        Args:
+            image_path (str): The path to the image.
+
+        Returns:
+            tuple. The image as a numpy array, the (image, scale) to look for
+                faces in, its hash and the path to its copy.
+        """
+        image_array, detection_array, scale = load_image(image_path, int(self.config.get_attribute("detection_size")))
+        source_md5 = hash_pixels(image_array, self.config.get_attribute("image_hash"))
+        full_image_path = os.path.join(
+            self.config.sources_folder,
+            f"{source_md5}.bmp"
+        )
+        return image_array, (detection_array, scale), source_md5, full_image_path
+
+    def _encode_face(self, image_array, location, full_image_path, image_path):
+        """Cut out a face and calculate its encodings
+
+        Args:
+            image_array (numpy.array): The source image.
+            location (tuple): The (top, right, bottom, left) box of the face.
+            full_image_path (str): The path to the copy of the source image.
+            image_path (str): The path to the original image.
+
+        Returns:
+            tuple. The path to the face, its encodings entry and the cropped
+                PIL image still to be saved, or (None, None, None) if no
+                encodings could be calculated.
+        """
+        max_height, max_width = image_array.shape[:2]
+
+        # Cutting out the face
+        top, right, bottom, left = location
+        face_image_array = image_array[
+            max(top-20, 0):min(bottom+20, max_height),
+            max(left-20, 0):min(right+20, max_width)
+        ]
+        # A single contiguous copy of the crop is hashed and encoded
+        known_image = np.ascontiguousarray(face_image_array)
+        pil_image = Image.fromarray(known_image)
+
+        face_md5 = hash_pixels(known_image, self.config.get_attribute("image_hash"))
+        full_face_path = os.path.join(
+            self.config.faces_folder,
+            f"{face_md5}.bmp"
+        )
+
+        # Extract the encodings from memory instead of reloading the saved crop
+        known_encodings, landmarks = models.face_encodings_and_landmarks(known_image)
+
+        # Deal with Array object by converting to list. Rememeber to undo this!
+        l = []
+        for a in known_encodings:
+            l.append(a.tolist())
+
+        if l == []:
+            return None, None, None
+
+        # The landmarks aligning the crop are reused, as the pose only depends on their relative position
+        quality = quality_score(image_array[max(top, 0):bottom, max(left, 0):right], landmarks[0])
+
+        return full_face_path, {
+            "copied_md5": face_md5,
+            "dhash": f"{dhash(pil_image):016x}",
+            "copied_original_file": full_image_path,
+            "face_path": full_face_path,
+            "original_image_path": image_path,
+            "position": {
+                "top": max(top-20, 0),
+                "bottom": min(bottom+20, max_height),
+                "left": max(left-20, 0),
+                "right": min(right+20, max_width),
+            },
+            "encodings": l,
+            "quality": quality
+        }, pil_image
+
+    def _filters(self, roi=None, min_face_size=None, max_faces=None, best_shots=None):
+        """Gather the filters applied when detecting faces
+
+        Args:
+            roi (list): The (top, right, bottom, left) region where faces are
+                looked for. None for the whole image.
+            min_face_size (int): The minimum width and height of a face in
+                pixels. By default, `min_face_size` in the configuration.
+            max_faces (int): The maximum number of faces per image, largest
+                first. By default, `max_faces` in the configuration.
+            best_shots (int): The maximum number of faces per image, best
+                quality first. By default, `best_shots` in the configuration.
+
+        Returns:
+            dict. The filters to pass to `_analyze`.
+        """
+        if best_shots is None:
+            best_shots = self.config.get_attribute("best_shots")
+        if min_face_size is None:
+            min_face_size = self.config.get_attribute("min_face_size")
+        if max_faces is None:
+            max_faces = self.config.get_attribute("max_faces")
+        return {
+            "best_shots": int(best_shots),
+            "max_faces": int(max_faces),
+            "min_face_size": int(min_face_size),
+            "roi": [int(value) for value in roi] if roi else None
+        }
+
+    def _analyze(self, image_array, full_image_path, image_path, filters=None, detection=None):
+        """Detect and encode the faces of an image
+
+        Faces are only looked for in the region of interest and the ones
+        discarded by the filters are never encoded nor saved.
+
+        Args:
+            image_array (numpy.array): The source image.
+            full_image_path (str): The path to the copy of the source image.
+            image_path (str): The path to the original image.
+            filters (dict): The filters as returned by `_filters`.
+            detection (tuple): The (image, scale) to look for faces in, as
+                returned by `_decode`. The source image if None.
+
+        Returns:
+            tuple. The list of (face_path, entry, pil_image) tuples of the
+                faces found and a dict with the number of faces skipped.
+
+        Raises:
+            ValueError.
+        """
+        filters = filters or self._filters()
+        detection_array, scale = detection or (image_array, 1.0)
+        # The region is checked against the full image, as given by the caller
+        roi = filters["roi"] and clip_region(filters["roi"], image_array.shape)
+        if roi and scale != 1:
+            # Rounded outwards so that small regions are not emptied by the scale
+            top, right, bottom, left = roi
+            roi = (math.floor(top / scale), math.ceil(right / scale), math.ceil(bottom / scale), math.floor(left / scale))
+        region, offset = crop_region(detection_array, roi)
+        locations, skipped = select_faces(
+            scale_locations(shift_locations(models.face_locations(region), offset), scale, image_array.shape),
+            filters["min_face_size"],
+            filters["max_faces"]
+        )
+
+        faces = []
+        for location in locations:
+            full_face_path, entry, pil_image = self._encode_face(image_array, location, full_image_path, image_path)
+            if entry:
+                faces.append((full_face_path, entry, pil_image))
+
+        skipped["low_quality"] = 0
+        if filters["best_shots"] and len(faces) > filters["best_shots"]:
+            faces.sort(key=lambda face: face[1]["quality"]["score"], reverse=True)
+            skipped["low_quality"] = len(faces) - filters["best_shots"]
+            faces = faces[:filters["best_shots"]]
+        return faces, skipped
+
+    def _hashes(self):
+        """Get the perceptual hash index of the faces in the gallery
+
+        The index is only rebuilt when the gallery changed since it was last
+        used. Faces extracted before hashes were stored are hashed from their
+        crops and the hash is kept in their entry.
+
+        It MUST be called while holding the locks given by `_writing`, with
+        the encodings already reloaded.
+
+        Returns:
+            BKTree. The face paths by perceptual hash.
+        """
+        generation = GalleryVersion(self._load(self.config.gallery_file)).generation
+        if self._hash_index is None or self._hash_index_generation != generation:
+            self._hash_index = BKTree()
+            for face_path, entry in self.encodings.items():
+                if "dhash" not in entry:
+                    if not os.path.exists(face_path):
+                        continue
+                    with Image.open(face_path) as image:
+                        entry["dhash"] = f"{dhash(image):016x}"
+                self._hash_index.add(int(entry["dhash"], 16), face_path)
+            self._hash_index_generation = generation
+        return self._hash_index
+
+    def _link_duplicates(self, new_encodings, new_metadata):
+        """Link new faces to near-duplicates already in the gallery
+
+        A new face is a near-duplicate if its perceptual hash is within
+        `dedup_max_hamming` bits of a known face and their encodings are
+        closer than `dedup_tolerance`. Instead of being added to the gallery
+        it is recorded as a sighting of the known face.
+
+        It MUST be called while holding the locks given by `_writing`, with
+        the encodings already reloaded.
+
+        Args:
+            new_encodings (dict): The new encodings entries by face path.
+                Near-duplicates are removed from it.
+            new_metadata (dict): The new metadata entries by source path. Their
+                faces are replaced by the known faces they are linked to.
+
+        Returns:
+            dict. The known face of each near-duplicate.
+        """
+        tolerance = float(self.config.get_attribute("dedup_tolerance"))
+        if not tolerance:
+            return {}
+        radius = int(self.config.get_attribute("dedup_max_hamming"))
+        index = self._hashes()
+
+        linked = {}
+        for face_path, entry in list(new_encodings.items()):
+            # Faces extracted again are replaced, not linked
+            if face_path in self.encodings or "dhash" not in entry:
+                continue
+            encoding = np.array(entry["encodings"][0])
+            for _, known_face in index.search(int(entry["dhash"], 16), radius):
+                known = self.encodings.get(known_face) or new_encodings.get(known_face)
+                if known_face == face_path or not known:
+                    continue
+                if np.linalg.norm(np.array(known["encodings"][0]) - encoding) <= tolerance:
+                    linked[face_path] = known_face
+                    break
+            else:
+                index.add(int(entry["dhash"], 16), face_path)
+                continue
+
+            # Linked faces never enter the index, so there are no chains of links
+            del new_encodings[face_path]
+            self._touched.add(known_face)
+            known.setdefault("sightings", []).append({
+                "copied_original_file": entry["copied_original_file"],
+                "original_image_path": entry["original_image_path"],
+                "position": entry["position"]
+            })
+
+        for image_metadata in new_metadata.values():
+            image_metadata["faces"] = list(dict.fromkeys(
+                linked.get(face_path, face_path) for face_path in image_metadata["faces"]
+            ))
+            linked_faces = [face_path for face_path in image_metadata["faces"] if face_path in linked.values()]
+            if linked_faces:
+                image_metadata["linked_faces"] = linked_faces
+        return linked
+
+    def _commit(self, new_encodings, new_metadata):
+        """Merge new faces and sources into the data folder
+
+        Near-duplicates of known faces are linked to them instead of being
+        added and their crops are removed. Every new face, linked or not, is
+        checked against the watchlist.
+
+        Args:
+            new_encodings (dict): The new encodings entries by face path.
+            new_metadata (dict): The new metadata entries by source path.
+
+        Returns:
+            list. The watchlist hits of the new faces.
+        """
+        with self._writing():
+            self.watchlist.reload()
+            hits = self.watchlist.check(new_encodings)
+
+            self.encodings = self._load(self.config.encodings_file)
+            linked = self._link_duplicates(new_encodings, new_metadata)
+            self.encodings.update(new_encodings)
+            self._dump(self.config.encodings_file, self.encodings)
+
+            self.metadata = self._load(self.config.metadata_file)
+            self.metadata.update(new_metadata)
+            self._dump(self.config.metadata_file, self.metadata)
+
+            if new_encodings:
+                self._bump_gallery(inserted=new_encodings.keys())
+                if self._hash_index_generation is not None:
+                    self._hash_index_generation = self.gallery.generation
+
+            for face_path in linked:
+                if face_path not in self.encodings:
+                    try:
+                        os.remove(face_path)
+                    except FileNotFoundError:
+                        pass
+
+            for hit in hits:
+                if hit["face_path"] in linked:
+                    hit["linked_to"] = linked[hit["face_path"]]
+                hit["collection"] = self.collection
+            self.watchlist.record(hits)
+
+        # Callbacks run without the locks as they may take a while
+        for exc in self.watchlist.notify(hits):
+            print(warning(f"A watchlist callback generated an exception: {exc}"))
+        return hits
+
+    def extract_faces(self, image_path, force_recalculation=False, roi=None, min_face_size=None, max_faces=None, best_shots=None):
         """Extract faces
 
         Args:
             image_path (str): The path to the image.
             force_recalculation (bool): If True, it recalculates the process.
+            roi (list): The (top, right, bottom, left) region where faces are
+                looked for. None for the whole image.
+            min_face_size (int): The minimum width and height of a face in
+                pixels. By default, `min_face_size` in the configuration.
+            max_faces (int): The maximum number of faces, largest first. By
+                default, `max_faces` in the configuration.
+            best_shots (int): The maximum number of faces, best quality first.
+                By default, `best_shots` in the configuration.
 
         Return:
             list. List of face_paths.
 
         Raises:
             OSError.
+            ValueError.
         """
-        image_array = face_recognition.load_image_file(image_path)
-        image = Image.fromarray(image_array)
-        source_md5 = hashlib.md5(image.tobytes()).hexdigest()
-        full_image_path = os.path.join(
-            self.config.sources_folder,
-            f"{source_md5}.bmp"
-        )
+        self._check_writable()
+        filters = self._filters(roi, min_face_size, max_faces, best_shots)
+
+        image_array, detection, source_md5, full_image_path = self._decode(image_path)
 
         # If the original image is found, it's assumed that the analysis has been performed
-        if full_image_path in self.metadata.keys() and not force_recalculation:
-            return self.metadata[full_image_path]
+        with self.lock.read():
+            if full_image_path in self.metadata.keys() and not force_recalculation:
+                return self.metadata[full_image_path]
 
-        self.metadata[full_image_path] = {
+        # Faces are collected apart and only merged when holding the locks
+        new_encodings = {}
+        image_metadata = {
             "copied_md5": source_md5,
             "copied_path": full_image_path,
             "extraction_date": str(dt.datetime.now()),
             "faces": [],
+            "filters": filters,
             "original_path": image_path
         }
 
         # Extract faces
-        max_width, max_height = image.size
-        face_locations = face_recognition.face_locations(image_array)
-
-        for i, f in enumerate(face_locations):
-            # Cutting out the face
-            top, right, bottom, left = f
-            face_image_array = image_array[
-                max(top-20, 0):min(bottom+20, max_height),
-                max(left-20, 0):min(right+20, max_width)
-            ]
-            pil_image = Image.fromarray(face_image_array)
+        faces, image_metadata["skipped_faces"] = self._analyze(image_array, full_image_path, image_path, filters, detection)
+        for full_face_path, entry, pil_image in faces:
+            pil_image.save(full_face_path)
+            new_encodings[full_face_path] = entry
+            image_metadata["faces"].append(full_face_path)
 
-            face_md5 = hashlib.md5(pil_image.tobytes()).hexdigest()
-            full_face_path = os.path.join(
-                self.config.faces_folder,
-                f"{face_md5}.bmp"
-            )
+        # Save the source image
+        Image.fromarray(image_array).save(full_image_path)
 
-            pil_image.save(full_face_path)
+        self._commit(new_encodings, {full_image_path: image_metadata})
+        return image_metadata
 
-            # Extract the encodings and saving them
-            known_image = face_recognition.load_image_file(full_face_path)
-            known_encodings = face_recognition.face_encodings(known_image)
-
-            # Deal with Array object by converting to list. Rememeber to undo this!
-            l = []
-            for a in known_encodings:
-                l.append(a.tolist())
-
-            if l != []:
-                self.encodings[full_face_path] = {
-                    "copied_md5": face_md5,
-                    "copied_original_file": full_image_path,
-                    "face_path": full_face_path,
-                    "original_image_path": image_path,
-                    "position": {
-                        "top": max(top-20, 0),
-                        "bottom": min(bottom+20, max_height),
-                        "left": max(left-20, 0),
-                        "right": min(right+20, max_width),
-                    },
-                    "encodings": l
-                }
+    def extract_many(self, image_paths, force_recalculation=False, io_workers=4, cpu_workers=None, batch_size=16, queue_size=8, roi=None, min_face_size=None, max_faces=None, best_shots=None):
+        """Extract faces from many images overlapping I/O and CPU work
+
+        Images are decoded, analyzed and written in separate stages with
+        their own workers, connected by bounded queues. The encodings and the
+        metadata are persisted once every `batch_size` images instead of
+        once per image.
+
+        Args:
+            image_paths (iterable): The paths to the images. It is consumed lazily.
+            force_recalculation (bool): If True, it recalculates the process.
+            io_workers (int): The threads decoding and saving images.
+            cpu_workers (int): The threads detecting and encoding faces. By
+                default, as many as `num_threads` in the configuration.
+            batch_size (int): The number of images persisted at once.
+            queue_size (int): The maximum number of images waiting between stages.
+            roi (list): The (top, right, bottom, left) region where faces are
+                looked for in every image. None for the whole image.
+            min_face_size (int): The minimum width and height of a face in
+                pixels. By default, `min_face_size` in the configuration.
+            max_faces (int): The maximum number of faces per image, largest
+                first. By default, `max_faces` in the configuration.
+            best_shots (int): The maximum number of faces per image, best
+                quality first. By default, `best_shots` in the configuration.
+
+        Yields:
+            tuple. The image path and its metadata, or the exception raised
+                while processing it. Images are yielded once persisted, not
+                necessarily in the order given.
 
-                self.metadata[full_image_path]["faces"].append(full_face_path)
+        Raises:
+            ValueError.
+        """
+        self._check_writable()
+        filters = self._filters(roi, min_face_size, max_faces, best_shots)
+        if cpu_workers is None:
+            cpu_workers = int(self.config.get_attribute("num_threads"))
+
+        def decode(image_path):
+            try:
+                image_array, detection, source_md5, full_image_path = self._decode(image_path)
+            except Exception as exc:
+                return [(image_path, exc)]
+
+            with self.lock.read():
+                if full_image_path in self.metadata.keys() and not force_recalculation:
+                    return [(image_path, self.metadata[full_image_path])]
+
+            image_metadata = {
+                "copied_md5": source_md5,
+                "copied_path": full_image_path,
+                "extraction_date": str(dt.datetime.now()),
+                "faces": [],
+                "filters": filters,
+                "original_path": image_path
+            }
+            return [(image_path, image_metadata, image_array, detection)]
+
+        def analyze(job):
+            if len(job) == 2:
+                return [job]
+            image_path, image_metadata, image_array, detection = job
+            try:
+                faces, image_metadata["skipped_faces"] = self._analyze(image_array, image_metadata["copied_path"], image_path, filters, detection)
+            except Exception as exc:
+                return [(image_path, exc)]
+            return [(image_path, image_metadata, image_array, faces)]
+
+        def write(job):
+            if len(job) == 2:
+                return [job]
+            image_path, image_metadata, image_array, faces = job
+            new_encodings = {}
+            try:
+                for full_face_path, entry, pil_image in faces:
+                    pil_image.save(full_face_path)
+                    new_encodings[full_face_path] = entry
+                    image_metadata["faces"].append(full_face_path)
+                Image.fromarray(image_array).save(image_metadata["copied_path"])
+            except Exception as exc:
+                return [(image_path, exc)]
+            return [(image_path, image_metadata, new_encodings)]
+
+        pipeline = Pipeline(queue_size=queue_size)
+        pipeline.add_stage(decode, workers=io_workers)
+        pipeline.add_stage(analyze, workers=cpu_workers)
+        pipeline.add_stage(write, workers=io_workers)
+
+        batch = []
+        new_encodings = {}
+        new_metadata = {}
+        for job in pipeline.run(image_paths):
+            if len(job) == 2:
+                batch.append(job)
             else:
-                pathlib.Path(full_face_path).unlink()
+                image_path, image_metadata, image_encodings = job
+                new_encodings.update(image_encodings)
+                new_metadata[image_metadata["copied_path"]] = image_metadata
+                batch.append((image_path, image_metadata))
+
+            if len(batch) >= batch_size:
+                if new_metadata:
+                    self._commit(new_encodings, new_metadata)
+                yield from batch
+                batch, new_encodings, new_metadata = [], {}, {}
+
+        if new_metadata:
+            self._commit(new_encodings, new_metadata)
+        yield from batch
+
+    def extract_video(self, video_path, sample_rate=1, queue_size=8, batch_size=16):
+        """Extract faces from a video or from a folder of frames
+
+        Faces are tracked between consecutive sampled frames and each track
+        is only encoded once, in the frame where it first appears. That frame
+        is kept as a source image so the faces can be located afterwards.
+        The faces are persisted once every `batch_size` frames with new faces
+        so memory stays flat and they can be searched during long videos.
 
-        # Save the source image
-        image.save(full_image_path)
+        Args:
+            video_path (str): The path to the video or to the folder of frames.
+            sample_rate (int): Only one out of every `sample_rate` frames is processed.
+            queue_size (int): The maximum number of frames waiting between stages.
+            batch_size (int): The number of frames with new faces persisted at once.
+
+        Return:
+            dict. A summary of the extraction including the face paths.
+
+        Raises:
+            ImportError.
+            OSError.
+            ValueError.
+        """
+        self._check_writable()
+
+        summary = {
+            "extraction_date": str(dt.datetime.now()),
+            "faces": [],
+            "frames": 0,
+            "original_path": video_path,
+            "sample_rate": sample_rate,
+            "tracks": 0
+        }
+
+        new_encodings = {}
+        new_metadata = {}
+        pipeline = VideoPipeline(sample_rate=sample_rate, queue_size=queue_size)
+        for frame_index, frame, new_faces, _ in pipeline.run(video_path):
+            summary["frames"] += 1
+            summary["tracks"] += len(new_faces)
+            if not new_faces:
+                continue
+
+            source_md5 = hash_pixels(frame, self.config.get_attribute("image_hash"))
+            full_image_path = os.path.join(
+                self.config.sources_folder,
+                f"{source_md5}.bmp"
+            )
+            frame_metadata = {
+                "copied_md5": source_md5,
+                "copied_path": full_image_path,
+                "extraction_date": str(dt.datetime.now()),
+                "faces": [],
+                "frame": frame_index,
+                "original_path": video_path
+            }
+
+            for _, box in new_faces:
+                full_face_path, entry, pil_image = self._encode_face(frame, box, full_image_path, video_path)
+                if entry:
+                    pil_image.save(full_face_path)
+                    new_encodings[full_face_path] = entry
+                    frame_metadata["faces"].append(full_face_path)
+
+            if frame_metadata["faces"]:
+                Image.fromarray(frame).save(full_image_path)
+                new_metadata[full_image_path] = frame_metadata
+                summary["faces"].extend(frame_metadata["faces"])
+
+            if len(new_metadata) >= batch_size:
+                self._commit(new_encodings, new_metadata)
+                new_encodings, new_metadata = {}, {}
+
+        if new_metadata:
+            self._commit(new_encodings, new_metadata)
+        return summary
+
+    def _quality_from_crop(self, face_path):
+        """Calculate the quality of a face extracted before it was scored
+
+        Args:
+            face_path (str): The path to the face.
+
+        Returns:
+            dict. The quality as returned by `quality_score`.
+        """
+        face_array = face_recognition.load_image_file(face_path)
+        landmarks = models.face_landmarks(face_array)
+        return quality_score(face_array, landmarks[0] if landmarks else None)
 
-        with open(self.config.encodings_file, "w") as output_file:
-            json.dump(self.encodings, output_file)
+    def keep_best_shots(self, best_shots=1, group_by="identity", tolerance=0.6):
+        """Keep only the best faces of each person or of each source image
 
-        with open(self.config.metadata_file, "w") as output_file:
-            json.dump(self.metadata, output_file)
+        The faces pruned are removed from the gallery together with their
+        crops, so they are no longer compared when guessing. The metadata of
+        their source images lists them in 'pruned_faces'.
 
-        return self.metadata[full_image_path]
+        Args:
+            best_shots (int): The number of faces kept per group.
+            group_by (str): Either 'identity', to group faces of the same
+                person, or 'source', to group faces of the same image.
+            tolerance (float): The maximum distance between faces of the same
+                person.
+
+        Returns:
+            dict. The number of groups and faces kept and the pruned faces.
+
+        Raises:
+            ValueError.
+        """
+        self._check_writable()
+        if int(best_shots) < 1:
+            raise ValueError("At least one face per group must be kept.")
+        if group_by not in ("identity", "source"):
+            raise ValueError(f"Faces cannot be grouped by '{group_by}'. Use 'identity' or 'source'.")
+
+        with self.lock.read():
+            entries = {
+                face_path: entry
+                for face_path, entry in self.encodings.items()
+                if len(entry["encodings"])
+            }
+
+        # Faces extracted by older versions are scored once and persisted
+        legacy = {
+            face_path: self._quality_from_crop(face_path)
+            for face_path, entry in entries.items()
+            if "quality" not in entry and os.path.exists(face_path)
+        }
+        scores = {
+            face_path: (entry.get("quality") or legacy.get(face_path) or {"score": 0})["score"]
+            for face_path, entry in entries.items()
+        }
+
+        if group_by == "identity":
+            groups = group_identities(
+                [(face_path, entry["encodings"][0], scores[face_path]) for face_path, entry in entries.items()],
+                tolerance
+            )
+        else:
+            by_source = {}
+            for face_path, entry in entries.items():
+                by_source.setdefault(entry["copied_original_file"], []).append(face_path)
+            groups = [
+                sorted(faces, key=lambda face_path: (-scores[face_path], face_path))
+                for faces in by_source.values()
+            ]
+        pruned = [face_path for group in groups for face_path in group[int(best_shots):]]
+
+        with self._writing():
+            self.encodings = self._load(self.config.encodings_file)
+            for face_path, quality in legacy.items():
+                if face_path in self.encodings:
+                    self.encodings[face_path]["quality"] = quality
+                    self._touched.add(face_path)
+            pruned = [face_path for face_path in pruned if face_path in self.encodings]
+            sources = {}
+            for face_path in pruned:
+                entry = self.encodings.pop(face_path)
+                sources[face_path] = [entry["copied_original_file"]] + [
+                    sighting["copied_original_file"] for sighting in entry.get("sightings", [])
+                ]
+            self._dump(self.config.encodings_file, self.encodings)
+
+            self.metadata = self._load(self.config.metadata_file)
+            for face_path, face_sources in sources.items():
+                for source in face_sources:
+                    if source in self.metadata and face_path in self.metadata[source]["faces"]:
+                        self.metadata[source]["faces"].remove(face_path)
+                        self.metadata[source].setdefault("pruned_faces", []).append(face_path)
+            self._dump(self.config.metadata_file, self.metadata)
+
+            self._forget_faces(pruned)
+
+            for face_path in pruned:
+                try:
+                    os.remove(face_path)
+                except FileNotFoundError:
+                    pass
+
+        return {
+            "groups": len(groups),
+            "kept": len(entries) - len(pruned),
+            "pruned": pruned
+        }
 
     def get_face(self, face_path):
         """Get the details of a face
@@ -282,10 +1238,11 @@ class FaceProcessor:
             Exception.
             FileNotFoundException.
         """
-        try:
-            return self.encodings[face_path]
-        except KeyError:
-            raise Exception(f"No encodings found for: '{face_path}'")
+        with self.lock.read():
+            try:
+                return self.encodings[face_path].to_dict()
+            except KeyError:
+                raise Exception(f"No encodings found for: '{face_path}'")
 
     def get_image(self, image_path):
         """Get the base64 encoded image
@@ -299,7 +1256,12 @@ class FaceProcessor:
         Raises:
             Exception.
             FileNotFoundException.
+            ValueError.
         """
+        if self.replica_of:
+            raise ValueError(
+                f"This replica only holds the encodings. Get the images from its primary: '{self.replica_of}'."
+            )
         with open(image_path, "rb") as image_file:
             data = image_file.read()
             return base64.b64encode(data)
@@ -309,6 +1271,45 @@ class FaceProcessor:
         except KeyError:
             raise Exception(f"No encodings found for: '{face_path}'")
 
+    def encoding_matrix(self, face_paths=None, source_paths=None):
+        """Get the encodings of some faces as a matrix
+
+        Args:
+            face_paths (list): The faces to include.
+            source_paths (list): Include the faces of these images, given by
+                their copy or by their original path. If neither faces nor
+                images are given, every face of the gallery is included.
+
+        Returns:
+            tuple. The list of face paths and a float32 matrix with the
+                encoding of each of them in the same order.
+
+        Raises:
+            ValueError.
+        """
+        with self.lock.read():
+            if face_paths is None and source_paths is None:
+                selected = list(self.encodings)
+            else:
+                unknown = [face_path for face_path in face_paths or [] if face_path not in self.encodings]
+                if unknown:
+                    raise ValueError(f"No encodings found for: '{unknown[0]}'")
+                selected = list(face_paths or [])
+                sources = set(source_paths or [])
+                for copied_path, image_metadata in self.metadata.items():
+                    if copied_path in sources or image_metadata.get("original_path") in sources:
+                        selected.extend(image_metadata["faces"])
+            selected = [
+                face_path
+                for face_path in dict.fromkeys(selected)
+                if face_path in self.encodings and len(self.encodings[face_path]["encodings"])
+            ]
+            matrix = np.array(
+                [self.encodings[face_path]["encodings"][0] for face_path in selected],
+                dtype=np.float32
+            ).reshape(len(selected), -1)
+        return selected, matrix
+
     def get_metadata(self, image_path):
         """Get the metadata of a source image
 
@@ -322,25 +1323,64 @@ class FaceProcessor:
             Exception.
             FileNotFoundException.
         """
-        try:
-            return self.metadata["image_path"]
-        except KeyError:
-            raise Exception(f"No metadata found for: '{image_path}'")
+        with self.lock.read():
+            try:
+                return self.metadata["image_path"]
+            except KeyError:
+                raise Exception(f"No metadata found for: '{image_path}'")
 
-    def guess_face(self, new_face_path, force_recalculation=False):
+    def _score(self, new_face_path, known_faces, force_recalculation=False):
+        """Compare a face with a list of known faces
+
+        Args:
+            new_face_path (str): The path to the face to compare.
+            known_faces (list): The paths to the registered faces to compare with.
+            force_recalculation (bool): If True, the comparisons file is ignored.
+
+        Returns:
+            tuple. The list of comparisons and the list of new distances which
+                have not been persisted yet.
+        """
+        comparisons = []
+        new_distances = []
+        cached = self.comparisons.get(new_face_path, {})
+        for known_face in known_faces:
+            if not force_recalculation and known_face in cached:
+                similarity = cached[known_face]
+            else:
+                similarity = self._distance(new_face_path, known_face)
+                if similarity is None:
+                    similarity = 1
+                else:
+                    new_distances.append((new_face_path, known_face, similarity))
+            try:
+                comparisons.append(
+                    {
+                        "known_face": known_face,
+                        "similarity": similarity
+                    }
+                )
+            except Exception as exc:
+                print(warning(f'{known_face} generated an exception: {exc}'))
+        return comparisons, new_distances
+
+    def guess_face(self, new_face_path, force_recalculation=False, top_k=None):
         """Find the most appropiate match.
 
-        This function starts a Task
+        Results are cached against the generation of the gallery. If faces
+        have been added or deleted since then, only those are scored and
+        merged into the cached results.
 
         Args:
             new_face_path (str): The file path of the task to edal with.
             force_recalculation (bool): If True, it recalculates the process.
+            top_k (int): The number of results to return. All if None.
 
         Returns:
             dict. Containing the task details:
             {
-                "total_comparisons": …,
-                "results": [
+                "counter": …,
+                "comparisons": [
                     …
                 ]
             }
@@ -349,32 +1389,541 @@ class FaceProcessor:
             Exception.
             ValueError.
         """
-        # Check if the path provided already has an encoding
-        if new_face_path not in self.encodings.keys():
-            raise ValueError(f"Image '{new_face_path}' is not a registered face. Try extracting faces first.")
+        with self.lock.read():
+            # Check if the path provided already has an encoding
+            if new_face_path not in self.encodings.keys():
+                raise ValueError(f"Image '{new_face_path}' is not a registered face. Try extracting faces first.")
+
+            task = {
+                "counter": len(self.encodings)-1,
+                "comparisons": []
+            }
+            generation = self.gallery.generation
+
+            # Find out what changed since the results were cached
+            delta = None
+            entry = None if force_recalculation else self.guess_cache.get(new_face_path)
+            if entry and (entry["top_k"] is None or (top_k is not None and top_k <= entry["top_k"])):
+                delta = self.gallery.changes_since(entry["generation"])
+            if delta is not None:
+                touched = delta[0] | delta[1]
+                kept = [c for c in entry["comparisons"] if c["known_face"] not in touched]
+                # A truncated list cannot fill the gaps left by the changed faces
+                if entry["top_k"] is not None and len(kept) < len(entry["comparisons"]) == entry["top_k"]:
+                    delta = None
+
+            if delta is not None:
+                known_faces = sorted(f for f in touched if f in self.encodings and f != new_face_path)
+                comparisons, new_distances = self._score(new_face_path, known_faces)
+                comparisons.extend(kept)
+            else:
+                known_faces = [f for f in sorted(self.encodings) if f != new_face_path]
+                comparisons, new_distances = self._score(new_face_path, known_faces, force_recalculation)
+
+        # Persisting all the new distances at once
+        self._persist_comparisons(new_distances)
+
+        comparisons = sorted(comparisons, key=lambda k: (k["similarity"], k["known_face"]))
+
+        # A refreshed entry keeps as many results as it had, never more than
+        # guess_cache_size. The whole results are kept while they fit, so
+        # that they also serve the guesses without top_k
+        whole = top_k is None or (delta is not None and entry["top_k"] is None)
+        if whole and len(comparisons) <= self.guess_cache_size:
+            cached_top_k = None
+        elif delta is not None and entry["top_k"] is not None:
+            cached_top_k = entry["top_k"]
+        elif top_k is not None and top_k <= self.guess_cache_size:
+            cached_top_k = top_k
+        else:
+            cached_top_k = self.guess_cache_size
+        if not entry or entry["generation"] != generation or entry["top_k"] != cached_top_k:
+            self._persist_guess(new_face_path, {
+                "generation": generation,
+                "top_k": cached_top_k,
+                "comparisons": comparisons[:cached_top_k]
+            })
+
+        task["comparisons"] = comparisons[:top_k]
+        return task
+
+    def _persist_guess(self, new_face_path, entry):
+        """Cache the results of a guess
 
+        The entry is appended to the guess log instead of rewriting the
+        whole cache. The log is merged into the cache file once it has as
+        many lines as the cache has entries, so each guess costs O(1)
+        amortized writes.
 
-        task = {
-            "counter": len(self.encodings)-1,
-            "comparisons": []
+        Args:
+            new_face_path (str): The path to the face guessed.
+            entry (dict): The generation, top_k and comparisons of the guess.
+        """
+        with self.folder_lock:
+            with open(self.config.guess_log_file, "a") as output_file:
+                output_file.write(json.dumps({new_face_path: entry}) + "\n")
+            self.guess_cache[new_face_path] = entry
+            self._guess_log_lines += 1
+            self._mtimes[self.config.guess_log_file] = os.stat(self.config.guess_log_file).st_mtime_ns
+
+        if self._guess_log_lines >= max(len(self.guess_cache), 64):
+            with self._writing():
+                self.guess_cache = self._load_guess_cache()
+                self._dump_guess_cache()
+
+    def search_image(self, image_path=None, image_data=None, top_k=10, roi=None, min_face_size=None, max_faces=None, best_shots=None):
+        """Find the closest known faces to the faces of an image
+
+        The image is decoded, analyzed and searched in memory. Nothing is
+        written to the data folder, so the query is not enrolled in the
+        gallery and searching does not make the store grow.
+
+        Args:
+            image_path (str): The path to the image.
+            image_data (bytes): The contents of the image, instead of a path.
+            top_k (int): The number of matches of each face. All if None.
+            roi (list): The (top, right, bottom, left) region where faces are
+                looked for. None for the whole image.
+            min_face_size (int): The minimum width and height of a face in
+                pixels. By default, `min_face_size` in the configuration.
+            max_faces (int): The maximum number of faces, largest first. By
+                default, `max_faces` in the configuration.
+            best_shots (int): The maximum number of faces, best quality first.
+                By default, `best_shots` in the configuration.
+
+        Returns:
+            dict. The box, quality and matches of each face found:
+            {
+                "faces": [
+                    {
+                        "position": …,
+                        "quality": …,
+                        "counter": …,
+                        "comparisons": […]
+                    }
+                ],
+                "filters": …,
+                "skipped_faces": …
+            }
+
+        Raises:
+            OSError.
+            ValueError.
+        """
+        if (image_path is None) == (image_data is None):
+            raise ValueError("Either the path to an image or its contents must be given.")
+        filters = self._filters(roi, min_face_size, max_faces, best_shots)
+        image_array, detection_array, scale = load_image(
+            image_path if image_data is None else io.BytesIO(image_data),
+            int(self.config.get_attribute("detection_size"))
+        )
+
+        faces, skipped = self._analyze(image_array, None, image_path, filters, (detection_array, scale))
+        results = []
+        for _, entry, _ in faces:
+            matches = self.guess_encoding(entry["encodings"][0], top_k)
+            results.append({
+                "position": entry["position"],
+                "quality": entry["quality"],
+                "counter": matches["counter"],
+                "comparisons": matches["comparisons"]
+            })
+        return {
+            "faces": results,
+            "filters": filters,
+            "skipped_faces": skipped
         }
 
-        for known_face in sorted(self.encodings):
-            if known_face != new_face_path:
-                similarity = self.compare_faces (
-                    new_face_path,
-                    known_face,
-                    force_recalculation
-                )
-                try:
-                    task["comparisons"].append(
-                        {
-                            "known_face": known_face,
-                            "similarity": similarity
-                        }
-                    )
-                except Exception as exc:
-                    print(warning(f'{known_face} generated an exception: {exc}'))
-
-        task["comparisons"] = sorted(task["comparisons"], key=lambda k: k["similarity"])
-        return task
+    def guess_encoding(self, encoding, top_k=None, exclude=None):
+        """Find the closest faces to a raw encoding
+
+        Unlike `guess_face`, nothing is persisted and the query face does not
+        need to be registered so it can be used by a coordinator to query the
+        shards.
+
+        Args:
+            encoding (list): The 128 values of the face encoding.
+            top_k (int): The number of results to return. All if None.
+            exclude (str): A face path to leave out of the results.
+
+        Returns:
+            dict. Containing the task details:
+            {
+                "counter": …,
+                "comparisons": [
+                    …
+                ]
+            }
+        """
+        # The locks are taken in the worker so that writers are not kept waiting for one
+        counter, results = get_governor().run(self._search_encoding, encoding, top_k, exclude)
+
+        return {
+            "counter": counter,
+            "comparisons": [
+                {
+                    "known_face": known_face,
+                    "similarity": similarity
+                }
+                for known_face, similarity in results
+            ]
+        }
+
+    def _search_encoding(self, encoding, top_k, exclude):
+        """Search the encoding matrix
+
+        It is the CPU-bound section of `guess_encoding`, run by a worker of
+        the resource governor.
+
+        Args:
+            encoding (list): The 128 values of the face encoding.
+            top_k (int): The number of results to return. All if None.
+            exclude (str): A face path to leave out of the results.
+
+        Returns:
+            tuple. The number of faces searched and the (known_face,
+                similarity) results.
+        """
+        with self.lock.read(), self._index_lock:
+            index = self._sync_encoding_index()
+            if self.hot_faces:
+                # Searching a tiered index promotes the cold faces matched
+                results = index.search(encoding, top_k, exclude)
+            else:
+                # The snapshot of each generation is searched without locks
+                if self._encoding_snapshot is None or self._encoding_snapshot[0] != self._encoding_index_generation:
+                    self._encoding_snapshot = (self._encoding_index_generation, index.snapshot())
+                index = self._encoding_snapshot[1]
+        if not self.hot_faces:
+            results = index.search(encoding, top_k, exclude)
+        return len(index) - (exclude in index), results
+
+    def _new_encoding_index(self):
+        """Build an empty search index as configured
+
+        Returns:
+            EncodingIndex. Or a TieredIndex if the gallery is tiered.
+        """
+        if not self.hot_faces:
+            return EncodingIndex()
+        return TieredIndex(
+            self.config.cold_folder,
+            self.hot_faces,
+            threshold=float(self.config.get_attribute("cold_threshold")),
+            promote_hits=int(self.config.get_attribute("promote_hits"))
+        )
+
+    def tier_stats(self):
+        """Get the size of the hot and cold tiers of the search index
+
+        Returns:
+            dict. None if the gallery is not tiered.
+        """
+        if not self.hot_faces:
+            return None
+        with self.lock.read(), self._index_lock:
+            return self._sync_encoding_index().stats()
+
+    def _sync_encoding_index(self):
+        """Bring the encoding matrix up to date with the gallery
+
+        Only the faces changed since the last call are applied, unless the
+        gallery log does not reach back that far. It MUST be called while
+        holding the read lock and `_index_lock`.
+
+        Returns:
+            EncodingIndex. Or a TieredIndex if the gallery is tiered.
+        """
+        generation = self.gallery.generation
+        if self._encoding_index_generation == generation:
+            return self._encoding_index
+
+        changes = None
+        if self._encoding_index is not None:
+            changes = self.gallery.changes_since(self._encoding_index_generation)
+
+        if changes is None:
+            self._encoding_index = self._new_encoding_index()
+            # Oldest first, so that the newest faces are the hot ones
+            changed = self.encodings
+        else:
+            inserted, deleted = changes
+            self._encoding_index.remove(deleted)
+            changed = inserted
+
+        for face_path in changed:
+            entry = self.encodings.get(face_path)
+            if entry and len(entry["encodings"]):
+                self._encoding_index.add(face_path, entry["encodings"][0])
+        self._encoding_index_generation = generation
+        return self._encoding_index
+
+    def watchlist_add(self, name, face_paths=(), encodings=(), tolerance=None, note=None):
+        """Put a person on the watchlist checked against every new face
+
+        Args:
+            name (str): The name of the person. An existing entry is replaced.
+            face_paths (list): Registered faces of the person used as references.
+            encodings (list): Raw reference encodings of the person.
+            tolerance (float): The distance under which a new face is a hit.
+                By default, `watchlist_tolerance` in the configuration.
+            note (str): Any information about the person.
+
+        Returns:
+            dict. The entry of the person without its encodings.
+
+        Raises:
+            ValueError.
+        """
+        self._check_writable()
+        references = []
+        with self.lock.read():
+            for face_path in face_paths:
+                entry = self.encodings.get(face_path)
+                if entry is None or not len(entry["encodings"]):
+                    raise ValueError(f"Image '{face_path}' is not a registered face. Try extracting faces first.")
+                references.append(entry["encodings"][0])
+        references.extend(encodings)
+
+        with self._writing():
+            self.watchlist.reload()
+            self.watchlist.add(name, references, tolerance, note)
+            self.watchlist.save()
+        return next(entry for entry in self.watchlist.summary() if entry["name"] == name)
+
+    def watchlist_remove(self, name):
+        """Take a person off the watchlist
+
+        Args:
+            name (str): The name of the person.
+
+        Returns:
+            bool. False if the person was not on the watchlist.
+        """
+        self._check_writable()
+        with self._writing():
+            self.watchlist.reload()
+            if name not in self.watchlist.entries:
+                return False
+            self.watchlist.remove(name)
+            self.watchlist.save()
+        return True
+
+    def watchlist_entries(self):
+        """Get the persons on the watchlist
+
+        Returns:
+            list. Their names, number of references, tolerance and notes.
+        """
+        self.watchlist.reload()
+        return self.watchlist.summary()
+
+    def watchlist_hits(self, after=0, limit=100):
+        """Get the new faces that matched a person of the watchlist
+
+        Args:
+            after (int): Only return the hits with a greater id, to poll for new ones.
+            limit (int): The maximum number of hits returned.
+
+        Returns:
+            list. The hits, oldest first.
+        """
+        return self.watchlist.hits(after, limit)
+
+    def replication_snapshot(self, after=None, limit=1000):
+        """Get a page of the gallery to bootstrap a replica
+
+        Faces are paged in the order of their paths, along with the metadata
+        of the images they come from. Images without faces are not shipped.
+
+        Args:
+            after (str): The last face path of the previous page. None for the first one.
+            limit (int): The number of faces of the page.
+
+        Returns:
+            dict. The page:
+            {
+                "generation": …,
+                "faces": {…},
+                "metadata": {…},
+                "next": …
+            }
+        """
+        with self.lock.read():
+            store, generation, face_paths = self._snapshot_order
+            if store is not self.encodings or generation != self.gallery.generation:
+                face_paths = sorted(self.encodings)
+                self._snapshot_order = (self.encodings, self.gallery.generation, face_paths)
+            start = 0 if after is None else bisect.bisect_right(face_paths, after)
+            page = face_paths[start:start + limit]
+
+            faces = {face_path: pack_entry(self.encodings[face_path]) for face_path in page}
+            return {
+                "generation": self.gallery.generation,
+                "faces": faces,
+                "metadata": self._replicated_metadata(faces.values()),
+                "next": page[-1] if start + limit < len(face_paths) else None
+            }
+
+    def replication_changes(self, since, limit=1000):
+        """Get the changes of the gallery made after a generation
+
+        Changes are returned in the order they were logged, cut at the end
+        of a generation once there are `limit` of them. The entries shipped
+        are the current ones of the faces inserted, so a face inserted and
+        deleted later has no entry until its deletion is shipped.
+
+        Args:
+            since (int): The generation held by the replica.
+            limit (int): The approximate number of changes returned.
+
+        Returns:
+            dict. The changes or a 'reset' flag if the log does not reach
+                back that far and a new snapshot is needed:
+            {
+                "generation": …,
+                "primary_generation": …,
+                "changes": [[generation, operation, face_path], …],
+                "faces": {…},
+                "metadata": {…},
+                "more": …
+            }
+        """
+        with self.lock.read():
+            log = self.gallery.log_since(since)
+            if log is None:
+                return {"reset": True, "primary_generation": self.gallery.generation}
+
+            changes = []
+            for change in log:
+                if changes and len(changes) >= limit and change[0] != changes[-1][0]:
+                    break
+                changes.append(change)
+            more = len(changes) < len(log)
+
+            faces = {
+                face_path: pack_entry(self.encodings[face_path])
+                for _, operation, face_path in changes
+                if operation == "insert" and face_path in self.encodings
+            }
+            return {
+                "generation": changes[-1][0] if more else self.gallery.generation,
+                "primary_generation": self.gallery.generation,
+                "changes": changes,
+                "faces": faces,
+                "metadata": self._replicated_metadata(faces.values()),
+                "more": more
+            }
+
+    def _replicated_metadata(self, entries):
+        """Get the metadata of the images some faces come from
+
+        It MUST be called while holding the read lock.
+
+        Args:
+            entries (iterable): The entries of the faces.
+
+        Returns:
+            dict. The metadata by source path.
+        """
+        metadata = {}
+        for entry in entries:
+            for place in [entry] + entry.get("sightings", []):
+                source = place["copied_original_file"]
+                if source in self.metadata:
+                    metadata[source] = self.metadata[source]
+        return metadata
+
+    def apply_snapshot(self, generation, pages):
+        """Replace the gallery of a replica with a snapshot of its primary
+
+        Each page is unpacked as soon as it is read, so only one of them is
+        kept in the form shipped. The gallery is replaced once the last page
+        has been read: the previous one is served meanwhile.
+
+        Args:
+            generation (int): The generation of the primary of the first page.
+            pages (iterable): The (faces, metadata) pages of the snapshot,
+                with the packed entries by face path and the metadata of
+                their images by source path.
+
+        Returns:
+            int. The faces in the snapshot.
+        """
+        encodings = {}
+        metadata = {}
+        for page_faces, page_metadata in pages:
+            for face_path, packed in page_faces.items():
+                encodings[face_path] = unpack_entry(packed)
+            metadata.update(page_metadata)
+
+        with self._writing():
+            self.metadata = metadata
+            self._dump(self.config.encodings_file, encodings)
+            self.encodings = self._compact(encodings)
+            self._dump(self.config.metadata_file, self.metadata)
+
+            self.comparisons = {}
+            self.guess_cache = {}
+            self._dump(self.config.comparisons_file, self.comparisons)
+            self._dump_guess_cache()
+
+            self.gallery = GalleryVersion({"generation": generation, "start": generation})
+            # The generation may be the one the index was built for with other faces
+            self._encoding_index = None
+            self._encoding_index_generation = None
+            self._encoding_snapshot = None
+            self._dump(self.config.gallery_file, self.gallery.to_dict())
+        return len(encodings)
+
+    def apply_replication(self, generation, faces, metadata, changes=()):
+        """Apply the faces shipped by a primary to a replica
+
+        It bypasses `_check_writable` as it is the only way a replica is
+        modified. The comparisons and guesses cached for the faces changed
+        are forgotten since their entries may be different now.
+
+        Args:
+            generation (int): The generation of the primary reached.
+            faces (dict): The packed entries by face path.
+            metadata (dict): The metadata of their images by source path.
+            changes (list): The [generation, operation, face_path] entries
+                logged by the primary, oldest first.
+        """
+        with self._writing():
+            self.encodings = self._load(self.config.encodings_file)
+            self.metadata = self._load(self.config.metadata_file)
+
+            for _, operation, face_path in changes:
+                if operation == "insert":
+                    if face_path in faces:
+                        self.encodings[face_path] = unpack_entry(faces[face_path])
+                    continue
+                entry = self.encodings.pop(face_path, None)
+                if entry is None:
+                    continue
+                for place in [entry] + entry.get("sightings", []):
+                    image_metadata = self.metadata.get(place["copied_original_file"])
+                    if image_metadata and face_path in image_metadata["faces"]:
+                        image_metadata["faces"].remove(face_path)
+                        if not image_metadata["faces"]:
+                            del self.metadata[place["copied_original_file"]]
+            self.metadata.update(metadata)
+            self._dump(self.config.encodings_file, self.encodings)
+            self._dump(self.config.metadata_file, self.metadata)
+
+            touched = {face_path for _, _, face_path in changes}
+            self._touched.update(touched)
+            self.comparisons = self._load(self.config.comparisons_file)
+            for face_path in touched & self.comparisons.keys():
+                for partner in self.comparisons.pop(face_path):
+                    self.comparisons.get(partner, {}).pop(face_path, None)
+            self.guess_cache = self._load_guess_cache()
+            for face_path in touched:
+                self.guess_cache.pop(face_path, None)
+            self._dump(self.config.comparisons_file, self.comparisons)
+            self._dump_guess_cache()
+
+            self.gallery = GalleryVersion(self._load(self.config.gallery_file))
+            self.gallery.replay(changes, generation)
+            self._dump(self.config.gallery_file, self.gallery.to_dict())
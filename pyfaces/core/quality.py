@@ -0,0 +1,134 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import numpy as np
+
+
+# Faces this size or larger get the full size score, in pixels
+REFERENCE_FACE_SIZE = 160
+
+# Laplacian variance giving a sharpness score of 0.5
+REFERENCE_SHARPNESS = 100.0
+
+WEIGHTS = {
+    "pose": 0.2,
+    "sharpness": 0.4,
+    "size": 0.4,
+}
+
+
+def laplacian_variance(image_array):
+    """Measure how sharp an image is
+
+    The 4-neighbour Laplacian highlights edges, so blurred images have a low
+    variance.
+
+    Args:
+        image_array (numpy.array): An RGB or grayscale image.
+
+    Returns:
+        float. The variance of the Laplacian of the grayscale image.
+    """
+    gray = np.asarray(image_array, dtype=np.float32)
+    if gray.ndim == 3:
+        gray = gray[:, :, :3].mean(axis=2)
+    if min(gray.shape) < 3:
+        return 0.0
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def pose_score(landmarks):
+    """Estimate how frontal a face is
+
+    Turning the head moves the nose towards one of the eyes, so the ratio
+    between both eye-to-nose distances is 1 for frontal faces and decreases
+    with the yaw.
+
+    Args:
+        landmarks (dict): The face landmarks as returned by
+            `face_recognition.face_landmarks`. They must include 'left_eye',
+            'right_eye' and 'nose_tip'.
+
+    Returns:
+        float. A score in [0, 1]. 0.5 if the landmarks are missing.
+    """
+    try:
+        nose = np.mean(landmarks["nose_tip"], axis=0)
+        left = np.linalg.norm(np.mean(landmarks["left_eye"], axis=0) - nose)
+        right = np.linalg.norm(np.mean(landmarks["right_eye"], axis=0) - nose)
+    except (KeyError, TypeError, ValueError):
+        return 0.5
+    if max(left, right) == 0:
+        return 0.5
+    return float(min(left, right) / max(left, right))
+
+
+def quality_score(face_array, landmarks=None):
+    """Calculate a cheap quality score of a face
+
+    Args:
+        face_array (numpy.array): The face, cropped to its bounding box.
+        landmarks (dict): The landmarks of the face, if known.
+
+    Returns:
+        dict. The 'size', 'sharpness' and 'pose' scores in [0, 1] and their
+            weighted 'score'.
+    """
+    height, width = face_array.shape[:2]
+    sharpness = laplacian_variance(face_array)
+    quality = {
+        "pose": round(pose_score(landmarks or {}), 4),
+        "sharpness": round(sharpness / (sharpness + REFERENCE_SHARPNESS), 4),
+        "size": round(min(min(height, width) / REFERENCE_FACE_SIZE, 1.0), 4),
+    }
+    quality["score"] = round(sum(quality[name] * weight for name, weight in WEIGHTS.items()), 4)
+    return quality
+
+
+def group_identities(faces, tolerance=0.6):
+    """Cluster faces of the same person
+
+    Faces are visited from the best to the worst and joined to the first
+    group whose best face is closer than the tolerance.
+
+    Args:
+        faces (list): The (face_path, encoding, score) tuples.
+        tolerance (float): The maximum distance between faces of the same person.
+
+    Returns:
+        list. The groups as lists of face paths, best first.
+    """
+    faces = sorted(faces, key=lambda face: (-face[2], face[0]))
+    groups = []
+    leaders = []
+    for face_path, encoding, _ in faces:
+        encoding = np.asarray(encoding)
+        if leaders:
+            distances = np.linalg.norm(np.asarray(leaders) - encoding, axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] <= tolerance:
+                groups[best].append(face_path)
+                continue
+        leaders.append(encoding)
+        groups.append([face_path])
+    return groups
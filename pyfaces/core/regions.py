@@ -0,0 +1,116 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import numpy as np
+
+
+def clip_region(roi, shape):
+    """Clip a region of interest to the boundaries of an image
+
+    Args:
+        roi (tuple): The (top, right, bottom, left) box.
+        shape (tuple): The shape of the image.
+
+    Returns:
+        tuple. The (top, right, bottom, left) box inside the image.
+
+    Raises:
+        ValueError. If the region is empty once clipped.
+    """
+    max_height, max_width = shape[:2]
+    top, right, bottom, left = (int(value) for value in roi)
+    top, left = max(top, 0), max(left, 0)
+    bottom, right = min(bottom, max_height), min(right, max_width)
+    if top >= bottom or left >= right:
+        raise ValueError(f"The region of interest {list(roi)} is outside the image ({max_width}x{max_height}).")
+    return top, right, bottom, left
+
+
+def crop_region(image_array, roi):
+    """Cut out the region of interest of an image
+
+    The region is clipped to the image boundaries and copied, as dlib
+    finds no faces in views of an array which are not contiguous.
+
+    Args:
+        image_array (numpy.array): The image.
+        roi (tuple): The (top, right, bottom, left) box to keep. None to keep
+            the whole image.
+
+    Returns:
+        tuple. The cropped image and the (top, left) offset of the region.
+
+    Raises:
+        ValueError. If the region is empty once clipped.
+    """
+    if roi is None:
+        return image_array, (0, 0)
+
+    top, right, bottom, left = clip_region(roi, image_array.shape)
+    return np.ascontiguousarray(image_array[top:bottom, left:right]), (top, left)
+
+
+def shift_locations(locations, offset):
+    """Translate locations found in a region to the coordinates of the image
+
+    Args:
+        locations (list): The (top, right, bottom, left) boxes in the region.
+        offset (tuple): The (top, left) offset of the region.
+
+    Returns:
+        list. The boxes in image coordinates.
+    """
+    offset_top, offset_left = offset
+    return [
+        (top + offset_top, right + offset_left, bottom + offset_top, left + offset_left)
+        for top, right, bottom, left in locations
+    ]
+
+
+def select_faces(locations, min_face_size=0, max_faces=0):
+    """Drop the faces too small to match and keep only the largest ones
+
+    Args:
+        locations (list): The (top, right, bottom, left) boxes found.
+        min_face_size (int): Faces whose width or height is below this
+            number of pixels are skipped. 0 to keep all of them.
+        max_faces (int): The maximum number of faces kept, largest first.
+            0 for no limit.
+
+    Returns:
+        tuple. The boxes kept, largest first if `max_faces` is set and in
+            the order found otherwise, and a dict with the number of faces
+            skipped for being 'too_small' or 'over_limit'.
+    """
+    kept = [
+        (top, right, bottom, left)
+        for top, right, bottom, left in locations
+        if min(bottom - top, right - left) >= min_face_size
+    ]
+    skipped = {
+        "over_limit": 0,
+        "too_small": len(locations) - len(kept)
+    }
+
+    if max_faces:
+        kept.sort(key=lambda box: (box[2] - box[0]) * (box[1] - box[3]), reverse=True)
+        if len(kept) > max_faces:
+            skipped["over_limit"] = len(kept) - max_faces
+            kept = kept[:max_faces]
+    return kept, skipped
@@ -0,0 +1,208 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import threading
+import time
+
+import numpy as np
+
+from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.configuration import DEFAULT_COLLECTION
+from pyfaces.core.governor import get_governor
+from pyfaces.core.matrix import compare_matrices
+from pyfaces.core.matrix import write_ndjson
+from pyfaces.core.matrix import write_npz
+from pyfaces.core.processor import FaceProcessor
+from pyfaces.core.sharding import merge_results
+
+
+class CollectionRegistry:
+    """The processors of the collections in the data folder
+
+    Each collection has its own files, locks and encoding index, so searching
+    or modifying one of them never touches the others. Processors are created
+    the first time a collection is used and reused afterwards. Collections
+    are only created when asked for explicitly.
+
+    Attributes:
+        shard_count (int): The total number of shards. None if not sharded.
+        shard_index (int): The shard owned by the processors. None if not sharded.
+    """
+    def __init__(self, shard_index=None, shard_count=None):
+        """Constructor
+
+        Args:
+            shard_index (int): If set, the processors use the data folders of this shard.
+            shard_count (int): The total number of shards.
+        """
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self._processors = {}
+        self._lock = threading.Lock()
+
+    def get(self, collection=None, create=False):
+        """Get the processor of a collection
+
+        Args:
+            collection (str): The name of the collection. The default one if None.
+            create (bool): If True, the collection is created if it does not
+                exist yet. Otherwise unknown collections are refused.
+
+        Returns:
+            FaceProcessor.
+
+        Raises:
+            ValueError.
+        """
+        collection = collection or DEFAULT_COLLECTION
+        with self._lock:
+            if collection not in self._processors:
+                if not create and collection not in self.names():
+                    raise ValueError(f"The collection '{collection}' does not exist. Create it first.")
+                self._processors[collection] = FaceProcessor(self.shard_index, self.shard_count, collection)
+            return self._processors[collection]
+
+    def names(self):
+        """Get the names of the collections in the data folder
+
+        Returns:
+            list.
+        """
+        return ConfigManager().list_collections()
+
+    def clear(self):
+        """Forget the processors, for instance after changing the data folder"""
+        with self._lock:
+            self._processors = {}
+
+    def guess_across(self, face_path, collections, collection=None, top_k=None):
+        """Find the closest faces to a known face in several collections at once
+
+        Each collection is searched in parallel with its own index and the
+        partial results are merged.
+
+        Args:
+            face_path (str): The face to look for.
+            collections (list): The names of the collections to search. '*'
+                searches all of them.
+            collection (str): The collection holding the face. The default one if None.
+            top_k (int): The number of results to return. All if None.
+
+        Returns:
+            dict. The same structure returned by `FaceProcessor.guess_face`
+                with the collection of each known face and a 'collections'
+                entry with the number of faces searched in each of them.
+
+        Raises:
+            Exception.
+            ValueError.
+        """
+        available = self.names()
+        if "*" in collections:
+            collections = available
+        unknown = sorted(set(collections) - set(available))
+        if unknown:
+            raise ValueError(f"Unknown collections: {', '.join(unknown)}.")
+
+        source = self.get(collection)
+        source.refresh()
+        encoding = source.get_face(face_path)["encodings"][0]
+
+        # Each collection is searched by a worker of the resource governor
+        futures = {}
+        for name in dict.fromkeys(collections):
+            processor = self.get(name)
+            processor.refresh()
+            futures[name] = get_governor().submit(processor.guess_encoding, encoding, top_k, face_path)
+
+        partial_results = []
+        counters = {}
+        for name, future in futures.items():
+            result = future.result()
+            for comparison in result["comparisons"]:
+                comparison["collection"] = name
+            partial_results.append(result["comparisons"])
+            counters[name] = result["counter"]
+
+        return {
+            "counter": sum(counters.values()),
+            "comparisons": merge_results(partial_results, top_k),
+            "collections": counters
+        }
+
+    def compare_sets(self, queries, gallery, threshold=None, top_k=None, output_path=None, block_size=1024, workers=None):
+        """Compare every face of a set with every face of another one
+
+        Each set is a dict with the 'collection' holding the faces and the
+        'face_paths' and 'source_paths' to pick from it, as accepted by
+        `FaceProcessor.encoding_matrix`. A set with neither of them takes
+        the whole collection. Only the pairs under the threshold or the
+        top_k of each query are kept and pairs of a face with itself are
+        skipped.
+
+        Args:
+            queries (dict): The faces to look for.
+            gallery (dict): The faces to compare them with.
+            threshold (float): Only keep the pairs closer than this.
+            top_k (int): Only keep the closest top_k faces of each query.
+            output_path (str): Stream the matches to this file instead of
+                returning them. Files ending in '.npz' get a sparse matrix
+                and any other an NDJSON line per query.
+            block_size (int): The rows and columns of each block of distances.
+            workers (int): The threads computing blocks at once.
+
+        Returns:
+            dict. The number of queries, faces and pairs, and either the
+                'output' file or the 'matches' of each query.
+
+        Raises:
+            Exception.
+            ValueError.
+        """
+        start_time = time.perf_counter()
+        sets = []
+        for selection in (queries, gallery):
+            processor = self.get(selection.get("collection"))
+            processor.refresh()
+            sets.append(processor.encoding_matrix(selection.get("face_paths"), selection.get("source_paths")))
+        (query_paths, query_matrix), (gallery_paths, gallery_matrix) = sets
+
+        columns = {face_path: column for column, face_path in enumerate(gallery_paths)}
+        excluded = np.array([columns.get(face_path, -1) for face_path in query_paths], dtype=np.int64)
+        matches = compare_matrices(query_matrix, gallery_matrix, threshold, top_k, excluded, block_size, workers)
+
+        result = {"queries": len(query_paths), "faces": len(gallery_paths)}
+        if output_path is None:
+            result["matches"] = {}
+            result["pairs"] = 0
+            for row, found, distances in matches:
+                result["matches"][query_paths[row]] = [
+                    {"known_face": gallery_paths[column], "similarity": float(distance)}
+                    for column, distance in zip(found, distances)
+                ]
+                result["pairs"] += len(found)
+        elif output_path.endswith(".npz"):
+            result["pairs"] = write_npz(matches, query_paths, gallery_paths, output_path)
+            result["output"] = output_path
+        else:
+            with open(output_path, "w") as output_file:
+                result["pairs"] = write_ndjson(matches, query_paths, gallery_paths, output_file)
+            result["output"] = output_path
+        result["seconds"] = time.perf_counter() - start_time
+        return result
@@ -0,0 +1,269 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import time
+
+from pyfaces.core.rpc import RPCError
+from pyfaces.core.wire import decode_array
+from pyfaces.core.wire import encode_array
+
+
+def pack_entry(entry):
+    """Get the entry of a face in the form shipped to the replicas
+
+    The encodings are sent as the base64 of their float32 values, which
+    takes about a quarter of the space of the same numbers in JSON.
+
+    Args:
+        entry (dict): The entry of the face in the encodings file or a FaceRecord.
+
+    Returns:
+        dict.
+    """
+    packed = dict(entry)
+    packed["encodings"] = encode_array(packed["encodings"])
+    return packed
+
+
+def unpack_entry(packed, dimensions=128):
+    """Rebuild the entry of a face shipped by `pack_entry`
+
+    Args:
+        packed (dict): The entry as shipped.
+        dimensions (int): The number of values of each encoding.
+
+    Returns:
+        dict. The entry as stored in the encodings file.
+    """
+    entry = dict(packed)
+    entry["encodings"] = decode_array(entry["encodings"], dimensions=dimensions).tolist()
+    return entry
+
+
+class PrimaryClient:
+    """The replication methods of a primary pyfacesd
+
+    Attributes:
+        client (RPCClient): The client connected to the primary.
+        collection (str): The collection replicated. The default one if None.
+    """
+    def __init__(self, client, collection=None):
+        self.client = client
+        self.collection = collection
+
+    def replication_snapshot(self, after=None, limit=1000):
+        """See `FaceProcessor.replication_snapshot`"""
+        return self.client.call("replication_snapshot", after=after, limit=limit, collection=self.collection)
+
+    def replication_changes(self, since, limit=1000):
+        """See `FaceProcessor.replication_changes`"""
+        return self.client.call("replication_changes", since=since, limit=limit, collection=self.collection)
+
+
+class ReplicaFollower:
+    """Keeps a read-only copy of the gallery of a primary
+
+    Only the encodings and the metadata are copied: the paths of the faces
+    and of their images are the ones of the primary and the replica refuses
+    to read those files.
+
+    The replica is bootstrapped from a snapshot of the primary and then
+    tails its change log, applying the faces inserted and deleted since the
+    last generation it holds. Generations and log are the same as in the
+    primary, so a replica can be followed by other replicas too. If the log
+    of the primary no longer reaches the generation of the replica, a new
+    snapshot is taken.
+
+    The staleness of the replica is the time since the last poll that
+    found it up to date: what it serves is at most that old.
+
+    Attributes:
+        generation (int): The generation of the primary held. None before the bootstrap.
+        interval (float): The seconds between polls.
+        last_error (str): The error of the last poll. None if it succeeded.
+        max_staleness (float): The seconds after which reads are refused. Never if None.
+        page_size (int): The faces requested at once.
+        primary (PrimaryClient): The primary. A FaceProcessor can be used too.
+        primary_generation (int): The generation of the primary in the last poll.
+        primary_url (str): The name of the primary in the errors and reports.
+        processor (FaceProcessor): The processor of the replica.
+        synced_at (float): The time of the last poll that left the replica up
+            to date. None if it never was.
+    """
+    def __init__(self, processor, primary, primary_url, interval=1, max_staleness=None, page_size=1000):
+        """Constructor
+
+        Args:
+            processor (FaceProcessor): The processor of the replica. It becomes read-only.
+            primary (PrimaryClient): The primary.
+            primary_url (str): The name of the primary in the errors and reports.
+            interval (float): The seconds between polls.
+            max_staleness (float): The seconds after which reads are refused. Never if None.
+            page_size (int): The faces requested at once.
+        """
+        self.processor = processor
+        self.processor.replica_of = primary_url
+        self.primary = primary
+        self.primary_url = primary_url
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.page_size = page_size
+        self.generation = None
+        self.primary_generation = None
+        self.synced_at = None
+        self.last_error = None
+
+    def bootstrap(self):
+        """Replace the gallery of the replica with a snapshot of the primary
+
+        The snapshot is read in pages and each of them is unpacked as soon
+        as it arrives. The gallery is replaced after the last one, so the
+        replica never serves a partial gallery, and reads are refused until
+        then. Pages are not read at a single generation but the changes made
+        meanwhile are applied by the next poll, as they are logged after the
+        generation of the first page.
+
+        Returns:
+            int. The faces in the snapshot.
+        """
+        self.synced_at = None
+        first_page = self.primary.replication_snapshot(None, self.page_size)
+
+        def pages():
+            page = first_page
+            while True:
+                yield page["faces"], page["metadata"]
+                if page["next"] is None:
+                    return
+                page = self.primary.replication_snapshot(page["next"], self.page_size)
+
+        faces = self.processor.apply_snapshot(first_page["generation"], pages())
+        self.generation = first_page["generation"]
+        return faces
+
+    def poll(self):
+        """Apply the changes of the primary until the replica is up to date
+
+        Returns:
+            dict. The report of the poll.
+
+        Raises:
+            OSError.
+            RPCError.
+        """
+        started = time.time()
+        report = {
+            "bootstrapped": None,
+            "deleted": 0,
+            "inserted": 0
+        }
+        if self.generation is None:
+            report["bootstrapped"] = self.bootstrap()
+
+        while True:
+            batch = self.primary.replication_changes(self.generation, self.page_size)
+            if batch.get("reset"):
+                # The log of the primary does not reach back to this generation
+                report["bootstrapped"] = self.bootstrap()
+                continue
+
+            if batch["changes"] or batch["generation"] != self.generation:
+                self.processor.apply_replication(batch["generation"], batch["faces"], batch["metadata"], batch["changes"])
+            for _, operation, _ in batch["changes"]:
+                report["inserted" if operation == "insert" else "deleted"] += 1
+            self.generation = batch["generation"]
+            self.primary_generation = batch["primary_generation"]
+            if not batch["more"]:
+                break
+
+        self.synced_at = started
+        report["generation"] = self.generation
+        report["seconds"] = time.time() - started
+        return report
+
+    def staleness(self):
+        """Get how old the gallery served by the replica may be
+
+        Returns:
+            float. The seconds since the last poll that left the replica up
+                to date. None if it never was.
+        """
+        if self.synced_at is None:
+            return None
+        return time.time() - self.synced_at
+
+    def check_fresh(self):
+        """Make sure that the replica can serve reads
+
+        Raises:
+            ValueError.
+        """
+        staleness = self.staleness()
+        if staleness is None:
+            raise ValueError(f"The replica has not synchronized with '{self.primary_url}' yet.")
+        if self.max_staleness is not None and staleness > self.max_staleness:
+            raise ValueError(
+                f"The replica is {staleness:.1f} s behind '{self.primary_url}', more than the {self.max_staleness} s allowed."
+            )
+
+    def status(self):
+        """Get the replication details reported by the replica
+
+        Returns:
+            dict.
+        """
+        return {
+            "generation": self.generation,
+            "last_error": self.last_error,
+            "max_staleness": self.max_staleness,
+            "primary": self.primary_url,
+            "primary_generation": self.primary_generation,
+            "staleness": self.staleness()
+        }
+
+    def run(self, cycles=None, stop_event=None):
+        """Follow the primary
+
+        Errors reaching the primary are reported and retried in the next
+        cycle, while the staleness of the replica grows.
+
+        Args:
+            cycles (int): The number of polls. Forever if None.
+            stop_event (threading.Event): Stop following once it is set.
+
+        Yields:
+            dict. The report of each poll, with an 'error' if it failed.
+        """
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            try:
+                report = self.poll()
+                self.last_error = None
+            except (OSError, RPCError) as exc:
+                self.last_error = str(exc)
+                report = {"error": self.last_error}
+            yield report
+            cycle += 1
+            if stop_event is not None and stop_event.is_set():
+                return
+            if cycles is None or cycle < cycles:
+                if stop_event is not None:
+                    stop_event.wait(self.interval)
+                else:
+                    time.sleep(self.interval)
@@ -0,0 +1,201 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import gzip
+import http.client
+import itertools
+import json
+import socket
+import urllib.parse
+import zlib
+
+
+# Smaller bodies are not worth compressing
+COMPRESSION_MIN_SIZE = 1024
+
+
+def compress(body, accept_encoding, min_size=COMPRESSION_MIN_SIZE):
+    """Compress a response body with a coding accepted by the client
+
+    Args:
+        body (bytes): The response body.
+        accept_encoding (str): The Accept-Encoding header of the request.
+        min_size (int): Smaller bodies are sent as they are.
+
+    Returns:
+        tuple. The body and its Content-Encoding, or None if it was not compressed.
+    """
+    if len(body) < min_size or not accept_encoding:
+        return body, None
+
+    accepted = set()
+    for token in accept_encoding.lower().split(","):
+        coding, _, parameters = token.partition(";")
+        name, _, value = parameters.partition("=")
+        try:
+            quality = float(value) if name.strip() == "q" else 1
+        except ValueError:
+            quality = 0
+        # A quality of 0 means that the coding is refused
+        if quality > 0:
+            accepted.add(coding.strip())
+    if "gzip" in accepted or "*" in accepted:
+        return gzip.compress(body, compresslevel=6, mtime=0), "gzip"
+    if "deflate" in accepted:
+        return zlib.compress(body, 6), "deflate"
+    return body, None
+
+
+def decompress(body, content_encoding):
+    """Decompress a body compressed by `compress`
+
+    Args:
+        body (bytes): The body received.
+        content_encoding (str): The Content-Encoding header of the response.
+
+    Returns:
+        bytes.
+
+    Raises:
+        ValueError.
+    """
+    content_encoding = (content_encoding or "identity").strip().lower()
+    if content_encoding == "gzip":
+        return gzip.decompress(body)
+    if content_encoding == "deflate":
+        return zlib.decompress(body)
+    if content_encoding == "identity":
+        return body
+    raise ValueError(f"Unsupported Content-Encoding '{content_encoding}'.")
+
+
+class RPCError(Exception):
+    """Error returned by a remote Pyfaces JSON-RPC server
+
+    Attributes:
+        code (int): The JSON-RPC error code.
+        data (object): Any additional data sent by the server.
+        retry_after (int): The seconds to wait before retrying when the
+            server is overloaded. None otherwise.
+    """
+    def __init__(self, message, code=None, data=None):
+        super().__init__(message)
+        self.code = code
+        self.data = data
+        self.retry_after = data.get("retry_after") if isinstance(data, dict) else None
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix domain socket"""
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class RPCClient:
+    """A minimal JSON-RPC 2.0 client over HTTP
+
+    It only relies on the standard library so that it can be used from the
+    CLI and from other pyfacesd instances without additional dependencies.
+    URLs like 'unix:///path/to/socket' connect to a Unix domain socket.
+
+    Attributes:
+        url (str): The URL of the JSON-RPC endpoint.
+        timeout (float): The socket timeout in seconds.
+        compression (bool): If True, compressed responses are accepted.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, url, timeout=30, compression=True):
+        if "://" not in url:
+            url = f"http://{url}"
+        self.url = url
+        self.timeout = timeout
+        self.compression = compression
+
+    def _connect(self):
+        """Open a connection to the server
+
+        Returns:
+            http.client.HTTPConnection.
+        """
+        parsed = urllib.parse.urlsplit(self.url)
+        if parsed.scheme == "unix":
+            return UnixHTTPConnection(parsed.path, timeout=self.timeout)
+        if parsed.scheme == "https":
+            return http.client.HTTPSConnection(parsed.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(parsed.netloc, timeout=self.timeout)
+
+    def call(self, method, **params):
+        """Call a remote method
+
+        Args:
+            method (str): The name of the remote method.
+            **params: The named parameters of the method.
+
+        Returns:
+            object. The result sent back by the server.
+
+        Raises:
+            RPCError.
+            OSError.
+            ValueError.
+        """
+        payload = json.dumps({
+            "jsonrpc": "2.0",
+            "id": next(self._ids),
+            "method": method,
+            "params": params
+        }).encode("utf-8")
+
+        headers = {"Content-Type": "application/json"}
+        if self.compression:
+            headers["Accept-Encoding"] = "gzip, deflate"
+
+        parsed = urllib.parse.urlsplit(self.url)
+        connection = self._connect()
+        try:
+            connection.request(
+                "POST",
+                parsed.path if parsed.scheme != "unix" and parsed.path else "/",
+                body=payload,
+                headers=headers
+            )
+            response = connection.getresponse()
+            body = decompress(response.read(), response.getheader("Content-Encoding"))
+            answer = json.loads(body.decode("utf-8"))
+        finally:
+            connection.close()
+
+        if "error" in answer:
+            error = answer["error"]
+            data = error.get("data")
+            # The dispatcher hides the message of the exceptions raised by the methods
+            message = data.get("message") if isinstance(data, dict) else None
+            raise RPCError(
+                message or error.get("message", "Unknown error"),
+                error.get("code"),
+                data
+            )
+        return answer.get("result")
@@ -0,0 +1,311 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import contextlib
+import math
+import threading
+import time
+
+
+# From the highest priority to the lowest
+PRIORITY_CLASSES = ["interactive", "bulk", "maintenance"]
+
+# The class of the JSON-RPC methods. Those not listed, such as 'info' or
+# 'shutdown', are never queued.
+METHOD_CLASSES = {
+    "compare_faces": "interactive",
+    "get_face": "interactive",
+    "get_image": "interactive",
+    "get_metadata": "interactive",
+    "guess_encoding": "interactive",
+    "guess_face": "interactive",
+    # Replicas poll often and page snapshots, which are cheap reads
+    "replication_changes": "interactive",
+    "replication_snapshot": "interactive",
+    "search_image": "interactive",
+    "watchlist": "interactive",
+    "watchlist_hits": "interactive",
+    "compare_many": "bulk",
+    "delete_analysis": "bulk",
+    "delete_many": "bulk",
+    "extract_faces": "bulk",
+    "extract_many": "bulk",
+    "extract_video": "bulk",
+    "create_collection": "maintenance",
+    "keep_best_shots": "maintenance",
+    "set_config": "maintenance",
+    "watchlist_add": "maintenance",
+    "watchlist_remove": "maintenance"
+}
+
+
+def parse_class_values(values):
+    """Parse a list of 'class=number' pairs given in the command line
+
+    Args:
+        values (list): The pairs, like ['bulk=2', 'maintenance=1'].
+
+    Returns:
+        dict. The numbers by priority class.
+
+    Raises:
+        ValueError.
+    """
+    parsed = {}
+    for value in values or []:
+        name, _, number = value.partition("=")
+        if name not in PRIORITY_CLASSES or not number.isdigit():
+            raise ValueError(f"Invalid value '{value}'. Use <CLASS>=<NUM> with one of: {', '.join(PRIORITY_CLASSES)}.")
+        parsed[name] = int(number)
+    return parsed
+
+
+def default_limits(request_threads, workers):
+    """Get the default limits and queue sizes of the priority classes
+
+    Bulk requests take at most half of the CPU workers, so searches keep
+    the rest. As a waiting request holds a thread of the server, the bulk
+    and maintenance queues are short.
+
+    Args:
+        request_threads (int): The threads serving requests.
+        workers (int): The CPU-bound sections the resource governor runs at once.
+
+    Returns:
+        tuple. The limits and the queue sizes by priority class.
+    """
+    bulk = max(workers // 2, 1)
+    limits = {"interactive": request_threads, "bulk": bulk, "maintenance": 1}
+    queue_sizes = {"interactive": request_threads, "bulk": bulk, "maintenance": 2}
+    return limits, queue_sizes
+
+
+def percentile(values, fraction):
+    """Get a percentile of some values with the nearest-rank method
+
+    Args:
+        values (list): The values, already sorted.
+        fraction (float): The percentile between 0 and 1.
+
+    Returns:
+        float. None if there are no values.
+    """
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+class Overloaded(Exception):
+    """Raised when a request is refused because its class is saturated
+
+    Attributes:
+        priority_class (str): The class of the request.
+        retry_after (int): The seconds the client should wait before retrying.
+    """
+    def __init__(self, message, priority_class, retry_after):
+        super().__init__(message)
+        self.priority_class = priority_class
+        self.retry_after = retry_after
+
+
+class PriorityClass:
+    """The limits, the queue and the metrics of a priority class
+
+    Attributes:
+        name (str): The name of the class.
+        limit (int): The requests of the class run at once.
+        queue_size (int): The requests of the class that may wait for a slot.
+        running (int): The requests running.
+        queue (collections.deque): The tickets of the requests waiting, in arrival order.
+        admitted (int): The requests run since the start.
+        rejected (int): The requests refused because the queue was full.
+        expired (int): The requests refused after waiting for too long.
+        waits (collections.deque): The seconds the last requests waited.
+        latencies (collections.deque): The seconds the last requests took, waiting included.
+    """
+    def __init__(self, name, limit, queue_size, window=1024):
+        self.name = name
+        self.limit = max(int(limit), 1)
+        self.queue_size = max(int(queue_size), 0)
+        self.running = 0
+        self.queue = collections.deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.waits = collections.deque(maxlen=window)
+        self.latencies = collections.deque(maxlen=window)
+
+    def retry_after(self):
+        """Estimate when a slot of the class will be free
+
+        Returns:
+            int. The seconds, at least one.
+        """
+        latencies = list(self.latencies)
+        mean = sum(latencies) / len(latencies) if latencies else 1
+        return max(math.ceil(mean * (len(self.queue) + 1) / self.limit), 1)
+
+    def stats(self):
+        """Get the state and the latency percentiles of the class
+
+        Returns:
+            dict. Seconds for the waits and the latencies.
+        """
+        waits = sorted(self.waits)
+        latencies = sorted(self.latencies)
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "running": self.running,
+            "waiting": len(self.queue),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "wait_p99": percentile(waits, 0.99),
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "latency_p99": percentile(latencies, 0.99)
+        }
+
+
+class RequestScheduler:
+    """Admits the requests of a server by priority class
+
+    Each class runs at most `limit` requests at once, so a bulk ingest can
+    never take the threads and CPUs that interactive searches need. The
+    requests over the limit wait in a bounded FIFO queue and are refused
+    with `Overloaded` when the queue is full or after waiting for
+    `queue_timeout` seconds, so an overloaded server fails fast instead of
+    piling up requests. When `capacity` requests of any class are running,
+    the freed slots go to the waiting requests of the highest class first.
+
+    Attributes:
+        classes (dict): The PriorityClass objects by name.
+        capacity (int): The requests of all the classes run at once.
+        queue_timeout (float): The seconds a request may wait for a slot.
+    """
+    def __init__(self, limits, queue_sizes, capacity=None, queue_timeout=30, window=1024):
+        """Constructor
+
+        Args:
+            limits (dict): The requests run at once by priority class.
+            queue_sizes (dict): The requests that may wait by priority class.
+            capacity (int): The requests of all the classes run at once. The
+                sum of the limits if None.
+            queue_timeout (float): The seconds a request may wait for a slot.
+            window (int): The last requests of each class used for the metrics.
+        """
+        self.classes = {
+            name: PriorityClass(name, limits[name], queue_sizes[name], window)
+            for name in PRIORITY_CLASSES
+        }
+        self.capacity = int(capacity or sum(state.limit for state in self.classes.values()))
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def classify(self, method):
+        """Get the priority class of a JSON-RPC method
+
+        Args:
+            method (str): The name of the method.
+
+        Returns:
+            str. None if the method is never queued.
+        """
+        return METHOD_CLASSES.get(method)
+
+    def _can_start(self, state, ticket):
+        """Check if a waiting request may take a slot. It needs the condition held."""
+        if state.queue[0] is not ticket or state.running >= state.limit or self._running >= self.capacity:
+            return False
+        # The classes before this one take the free slots first
+        for name in PRIORITY_CLASSES:
+            if name == state.name:
+                return True
+            higher = self.classes[name]
+            if higher.queue and higher.running < higher.limit:
+                return False
+        return True
+
+    @contextlib.contextmanager
+    def admit(self, priority_class):
+        """Context manager to run a request of a class once it gets a slot
+
+        Args:
+            priority_class (str): The class of the request.
+
+        Raises:
+            Overloaded.
+        """
+        state = self.classes[priority_class]
+        arrival = time.perf_counter()
+        ticket = object()
+        with self._condition:
+            if len(state.queue) >= state.queue_size and (state.running >= state.limit or self._running >= self.capacity):
+                state.rejected += 1
+                raise Overloaded(
+                    f"Too many '{priority_class}' requests. Retry later.",
+                    priority_class,
+                    state.retry_after()
+                )
+            state.queue.append(ticket)
+            deadline = arrival + self.queue_timeout
+            while not self._can_start(state, ticket):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    state.queue.remove(ticket)
+                    state.expired += 1
+                    self._condition.notify_all()
+                    raise Overloaded(
+                        f"The '{priority_class}' request waited for more than {self.queue_timeout} seconds. Retry later.",
+                        priority_class,
+                        state.retry_after()
+                    )
+                self._condition.wait(remaining)
+            state.queue.popleft()
+            state.running += 1
+            self._running += 1
+            state.admitted += 1
+            state.waits.append(time.perf_counter() - arrival)
+            # The next ticket of the queue may start too
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                state.running -= 1
+                self._running -= 1
+                state.latencies.append(time.perf_counter() - arrival)
+                self._condition.notify_all()
+
+    def stats(self):
+        """Get the state and the latency metrics of every class
+
+        Returns:
+            dict.
+        """
+        with self._condition:
+            return {
+                "capacity": self.capacity,
+                "running": self._running,
+                "queue_timeout": self.queue_timeout,
+                "classes": {name: state.stats() for name, state in self.classes.items()}
+            }
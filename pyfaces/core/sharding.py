@@ -0,0 +1,435 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import concurrent.futures
+import hashlib
+import json
+import os
+
+from pyfaces.core.rpc import RPCClient
+from pyfaces.core.wire import expand_face
+from pyfaces.core.wire import expand_guess
+
+
+def shard_for(face_md5, shard_count):
+    """Get the shard owning a face
+
+    Args:
+        face_md5 (str): The hexadecimal md5 of the face crop.
+        shard_count (int): The total number of shards.
+
+    Returns:
+        int. The index of the shard in the domain [0, shard_count).
+    """
+    return int(face_md5, 16) % shard_count
+
+
+def shard_for_path(file_path, shard_count):
+    """Get the shard where the faces of an image or a video are stored
+
+    The faces are not known before extracting them so new files are
+    assigned by the md5 of their path.
+
+    Args:
+        file_path (str): The path to the image or the video.
+        shard_count (int): The total number of shards.
+
+    Returns:
+        int. The index of the shard in the domain [0, shard_count).
+    """
+    return shard_for(hashlib.md5(file_path.encode("utf-8")).hexdigest(), shard_count)
+
+
+def face_md5_from_path(face_path):
+    """Get the md5 of a face from its path
+
+    Faces are stored as '<md5>.bmp' so the name of the file is enough.
+
+    Args:
+        face_path (str): The path to the face.
+
+    Returns:
+        str.
+    """
+    return os.path.splitext(os.path.basename(face_path))[0]
+
+
+def iter_json_items(file_path, chunk_size=1 << 20):
+    """Iterate over the items of a JSON object stored in a file
+
+    The file is read in chunks and every value is decoded on its own so that
+    only one of them is in memory at a time, not the whole object.
+
+    Args:
+        file_path (str): The path to a file holding a JSON object.
+        chunk_size (int): The number of characters read at once.
+
+    Returns:
+        generator. The (key, value) pairs of the object in file order.
+
+    Raises:
+        ValueError.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, "r") as input_file:
+        buffer = ""
+        position = 0
+        eof = False
+        expected = "{"
+
+        def fill():
+            nonlocal buffer, position, eof
+            chunk = input_file.read(chunk_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+
+        def skip_spaces():
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position].isspace():
+                    position += 1
+                if position < len(buffer) or eof:
+                    return
+                fill()
+
+        def decode():
+            nonlocal position
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                    # A number may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        position = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        while True:
+            skip_spaces()
+            if position >= len(buffer):
+                raise ValueError(f"Unexpected end of the JSON object in '{file_path}'.")
+            token = buffer[position]
+            if expected == "{":
+                if token != "{":
+                    raise ValueError(f"'{file_path}' does not hold a JSON object.")
+                position += 1
+                expected = "key"
+            elif token == "}" and expected in ("key", ","):
+                return
+            elif expected == ",":
+                if token != ",":
+                    raise ValueError(f"Expected ',' in '{file_path}'.")
+                position += 1
+                expected = "next"
+            else:
+                key = decode()
+                if not isinstance(key, str):
+                    raise ValueError(f"Expected a key in '{file_path}'.")
+                skip_spaces()
+                if position >= len(buffer) or buffer[position] != ":":
+                    raise ValueError(f"Expected ':' in '{file_path}'.")
+                position += 1
+                skip_spaces()
+                yield key, decode()
+                expected = ","
+
+
+def merge_results(partial_results, top_k=None):
+    """Merge the partial comparisons returned by several shards
+
+    Args:
+        partial_results (list): A list of lists of comparisons as returned by
+            `FaceProcessor.guess_encoding`.
+        top_k (int): The number of results to keep. All if None.
+
+    Returns:
+        list. The comparisons sorted by similarity.
+    """
+    merged = sorted(
+        (comparison for partial in partial_results for comparison in partial),
+        key=lambda k: k["similarity"]
+    )
+    if top_k is not None:
+        merged = merged[:top_k]
+    return merged
+
+
+class ShardCoordinator:
+    """Fans out searches over several pyfacesd shards
+
+    Each shard is a pyfacesd instance launched with `--shard-index` and
+    `--shard-count` so that it only loads the faces it owns. Writes are
+    routed to the shard given by `shard_for_path`.
+
+    Attributes:
+        shards (list): The RPCClient objects, ordered by shard index.
+        timeout (float): The seconds to wait for the shards before giving up.
+        writers (list): The RPCClient objects used for the writes, which
+            wait for the shards as long as needed.
+    """
+    def __init__(self, shard_urls, timeout=10, request_threads=4):
+        """Constructor
+
+        Searches and writes run in pools of their own, each with a thread
+        per shard for every request served at once. Otherwise searches
+        would wait for long writes or for each other and their timeout
+        would run out before they were even sent.
+
+        Args:
+            shard_urls (list): The URLs of the shards, in shard index order.
+            timeout (float): The seconds to wait for the shards before giving up.
+            request_threads (int): The requests served at once.
+        """
+        self.shards = [RPCClient(url, timeout=timeout) for url in shard_urls]
+        self.writers = [RPCClient(url, timeout=None) for url in shard_urls]
+        self.timeout = timeout
+        workers = max(len(self.shards) * int(request_threads), 1)
+        self._search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._write_executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def _fan_out(self, method, clients=None, **params):
+        """Call the same method in every shard
+
+        Args:
+            method (str): The name of the remote method.
+            clients (list): The clients to use. The searching ones if None,
+                which give up after `timeout` seconds.
+            **params: The named parameters of the method.
+
+        Returns:
+            tuple. A list of results and a dict with the failed shards.
+        """
+        executor = self._write_executor if clients else self._search_executor
+        futures = {
+            executor.submit(shard.call, method, **params): shard.url
+            for shard in clients or self.shards
+        }
+        done, not_done = concurrent.futures.wait(futures, timeout=None if clients else self.timeout)
+
+        results = []
+        failed = {}
+        for future in done:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                failed[futures[future]] = str(exc)
+        for future in not_done:
+            future.cancel()
+            failed[futures[future]] = "Timed out"
+        return results, failed
+
+    def get_face(self, face_path, collection=None):
+        """Get the details of a face from the shard owning it
+
+        The shard given by the md5 of the face is asked first. Faces added
+        through the coordinator are stored by the path of their image so
+        the rest of the shards are asked if it does not have it.
+
+        Args:
+            face_path (str): The face path which will be used as a key.
+            collection (str): The collection of the face. The default one if None.
+
+        Returns:
+            dict. A dictionary containing the encoding information.
+
+        Raises:
+            KeyError.
+        """
+        index = shard_for(face_md5_from_path(face_path), len(self.shards))
+        for shard in [self.shards[index]] + self.shards[:index] + self.shards[index + 1:]:
+            try:
+                return expand_face(shard.call("get_face", face_path=face_path, collection=collection, response_format="compact"))
+            except Exception:
+                continue
+        raise KeyError(f"No shard has the face '{face_path}'.")
+
+    def extract_faces(self, image_path, **params):
+        """Extract the faces of an image in the shard assigned to it
+
+        Args:
+            image_path (str): The path to the image.
+            **params: The rest of the named parameters of `extract_faces`.
+
+        Returns:
+            dict. The metadata of the image.
+        """
+        index = shard_for_path(image_path, len(self.shards))
+        return self.writers[index].call("extract_faces", image_path=image_path, **params)
+
+    def extract_many(self, image_paths, **params):
+        """Extract the faces of several images in the shards assigned to them
+
+        Each shard gets its images in a single call and they all work in
+        parallel.
+
+        Args:
+            image_paths (list): The paths to the images.
+            **params: The rest of the named parameters of `extract_many`.
+
+        Returns:
+            dict. The metadata of each image or the error it generated.
+        """
+        batches = {}
+        for image_path in image_paths:
+            batches.setdefault(shard_for_path(image_path, len(self.shards)), []).append(image_path)
+        futures = {
+            self._write_executor.submit(self.writers[index].call, "extract_many", image_paths=paths, **params): paths
+            for (index, paths) in batches.items()
+        }
+        results = {}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results.update(future.result())
+            except Exception as exc:
+                results.update({image_path: {"error": str(exc)} for image_path in futures[future]})
+        return results
+
+    def extract_video(self, video_path, **params):
+        """Extract the faces of a video in the shard assigned to it
+
+        Args:
+            video_path (str): The path to the video or to the folder of frames.
+            **params: The rest of the named parameters of `extract_video`.
+
+        Returns:
+            dict. The metadata of the video.
+        """
+        index = shard_for_path(video_path, len(self.shards))
+        return self.writers[index].call("extract_video", video_path=video_path, **params)
+
+    def delete_analysis(self, image_path, **params):
+        """Delete an image from the shard assigned to it and its faces from every shard
+
+        The shard assigned to the image deletes the file. The rest of them
+        may still hold faces of the image, e.g. extracted through another
+        form of its path, so they are asked to delete them too.
+
+        Args:
+            image_path (str): The path to the image.
+            **params: The rest of the named parameters of `delete_analysis`.
+
+        Returns:
+            bool.
+
+        Raises:
+            RuntimeError.
+        """
+        index = shard_for_path(image_path, len(self.shards))
+        result = self.writers[index].call("delete_analysis", image_path=image_path, **params)
+        others = self.writers[:index] + self.writers[index + 1:]
+        if others:
+            _, failed = self._fan_out("delete_many", clients=others, source_paths=[image_path], **params)
+            if failed:
+                raise RuntimeError(f"The faces of the image could not be deleted from every shard: {failed}.")
+        return result
+
+    def create_collection(self, name):
+        """Create a collection in every shard
+
+        Args:
+            name (str): The name of the collection.
+
+        Returns:
+            list. The names of the collections of the first shard.
+
+        Raises:
+            RuntimeError.
+        """
+        results, failed = self._fan_out("create_collection", clients=self.writers, name=name)
+        if failed:
+            raise RuntimeError(f"The collection could not be created in every shard: {failed}.")
+        return results[0]
+
+    def delete_many(self, **params):
+        """Delete many images and faces from every shard
+
+        Args:
+            **params: The named parameters of `delete_many`.
+
+        Returns:
+            dict. The number of 'images' deleted, the 'faces' deleted and
+                the shards that failed.
+
+        Raises:
+            RuntimeError.
+        """
+        results, failed = self._fan_out("delete_many", clients=self.writers, **params)
+        if failed and not results:
+            raise RuntimeError(f"No shard could delete the images: {failed}.")
+        return {
+            "faces": [face_path for result in results for face_path in result["faces"]],
+            "images": sum(result["images"] for result in results),
+            "failed": failed
+        }
+
+    def guess_face(self, face_path, top_k=None, collection=None):
+        """Find the most appropiate match in all the shards
+
+        Args:
+            face_path (str): The file path of the face to look for.
+            top_k (int): The number of results to keep. All if None.
+            collection (str): The collection searched. The default one if None.
+
+        Returns:
+            dict. The same structure returned by `FaceProcessor.guess_face`
+                plus a 'shards' entry with the shards that did not answer.
+        """
+        face = self.get_face(face_path, collection)
+        partial_results, failed = self._fan_out(
+            "guess_encoding",
+            encoding=face["encodings"][0],
+            top_k=top_k,
+            exclude=face_path,
+            collection=collection,
+            response_format="compact"
+        )
+        partial_results = [expand_guess(partial) for partial in partial_results]
+        comparisons = merge_results(
+            [partial["comparisons"] for partial in partial_results],
+            top_k
+        )
+        return {
+            "counter": sum(partial["counter"] for partial in partial_results),
+            "comparisons": comparisons,
+            "shards": {
+                "total": len(self.shards),
+                "answered": len(partial_results),
+                "failed": failed
+            }
+        }
+
+    def info(self, collection=None):
+        """Get the aggregated information of the shards
+
+        Args:
+            collection (str): The collection whose faces are counted. The default one if None.
+
+        Returns:
+            dict.
+        """
+        results, failed = self._fan_out("info", collection=collection)
+        return {
+            "shards": len(self.shards),
+            "answered": len(results),
+            "failed": failed,
+            "faces": sum(result["faces"] for result in results)
+        }
@@ -0,0 +1,360 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections.abc
+import os
+
+import numpy as np
+
+from pyfaces.core.tiers import disk_matrix
+
+
+# Fields of the encodings entries with a column of their own
+POSITION_KEYS = ("top", "bottom", "left", "right")
+QUALITY_KEYS = ("pose", "sharpness", "size", "score")
+STRING_KEYS = ("copied_md5", "copied_original_file", "original_image_path")
+
+
+class StringColumn:
+    """A column of strings stored as an interned folder plus a packed name
+
+    Face and image paths share a handful of folders, so each string only
+    costs the index of its folder, an offset and the bytes of its name
+    instead of a whole Python string.
+
+    Attributes:
+        folders (list): The distinct folders, including their trailing separator.
+    """
+    __slots__ = ("folders", "_folder_ids", "_offsets", "_names")
+
+    MISSING = np.iinfo(np.uint32).max
+
+    def __init__(self, values):
+        """Constructor
+
+        Args:
+            values (list): The strings. None values are kept as None.
+        """
+        folder_ids = {}
+        ids = np.empty(len(values), dtype=np.uint32)
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        names = []
+        position = 0
+        for i, value in enumerate(values):
+            if value is None:
+                ids[i] = self.MISSING
+            else:
+                # Split by hand as os.path.split does not always join back to the same string
+                folder, separator, name = value.rpartition(os.sep)
+                ids[i] = folder_ids.setdefault(folder + separator, len(folder_ids))
+                name = name.encode("utf-8", "surrogatepass")
+                names.append(name)
+                position += len(name)
+            offsets[i + 1] = position
+        self.folders = list(folder_ids)
+        self._folder_ids = ids
+        self._offsets = offsets
+        self._names = b"".join(names)
+
+    def __len__(self):
+        return len(self._folder_ids)
+
+    def __getitem__(self, row):
+        folder_id = self._folder_ids[row]
+        if folder_id == self.MISSING:
+            return None
+        name = self._names[self._offsets[row]:self._offsets[row + 1]]
+        return self.folders[folder_id] + name.decode("utf-8", "surrogatepass")
+
+    @property
+    def nbytes(self):
+        """int. The bytes used by the arrays of the column."""
+        return self._folder_ids.nbytes + self._offsets.nbytes + len(self._names)
+
+
+class FaceRecord(collections.abc.Mapping):
+    """A read-only view of one face of a FaceStore
+
+    It behaves like the dict stored in the encodings file, but its values are
+    only built when they are accessed.
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._store._value(self._row, key)
+
+    def __iter__(self):
+        return iter(self._store._keys(self._row))
+
+    def __len__(self):
+        return len(self._store._keys(self._row))
+
+    def __repr__(self):
+        return f"FaceRecord({self.to_dict()!r})"
+
+    def to_dict(self):
+        """Build the entry as stored in the encodings file
+
+        Returns:
+            dict. Using lists instead of arrays so that it can be serialized.
+        """
+        entry = dict(self.items())
+        entry["encodings"] = entry["encodings"].tolist()
+        return entry
+
+
+class ChangedRecord(collections.abc.Mapping):
+    """A face changed since its FaceStore was built
+
+    It behaves like a FaceRecord but reads from the entry it was given.
+    """
+    __slots__ = ("_entry",)
+
+    def __init__(self, entry):
+        self._entry = entry
+
+    def __getitem__(self, key):
+        return self._entry[key]
+
+    def __iter__(self):
+        return iter(self._entry)
+
+    def __len__(self):
+        return len(self._entry)
+
+    def __repr__(self):
+        return f"ChangedRecord({self.to_dict()!r})"
+
+    def to_dict(self):
+        """Build the entry as stored in the encodings file
+
+        Returns:
+            dict. Using lists instead of arrays so that it can be serialized.
+        """
+        entry = dict(self._entry)
+        entry["encodings"] = entry["encodings"].tolist()
+        return entry
+
+
+class FaceStore(collections.abc.Mapping):
+    """A compact version of the encodings file
+
+    Entries are stored as a struct of arrays: the encodings of every face in
+    a single float32 matrix, the boxes and the quality scores in numeric
+    arrays and the paths in string columns. Uncommon fields such as the
+    sightings are kept apart for the few faces having them. Looking a face up
+    returns a FaceRecord which reads from those arrays.
+
+    The arrays are not rebuilt when faces change: `update` keeps the changed
+    entries apart, in RAM, until they exceed `max_changes` of the rows. Note
+    that the encodings are rounded to float32, which moves the distances
+    between faces by less than 1e-6. The encodings file keeps every digit.
+
+    Attributes:
+        dimensions (int): The number of values of each encoding.
+        max_changes (float): The share of the rows that can be changed before
+            `update` asks for a new store.
+    """
+    def __init__(self, entries=None, dimensions=128, vectors_folder=None, max_changes=0.25):
+        """Constructor
+
+        Args:
+            entries (dict): The contents of the encodings file.
+            dimensions (int): The number of values of each encoding.
+            vectors_folder (str): If set, the encodings matrix is memory-mapped
+                from a file in this folder instead of being kept in RAM.
+            max_changes (float): The share of the rows that can be changed
+                before `update` asks for a new store.
+        """
+        entries = entries or {}
+        count = len(entries)
+        self.dimensions = dimensions
+        self.max_changes = max_changes
+
+        # Entries changed since the arrays were built. None for the deleted ones
+        self._changes = {}
+        self._length = count
+
+        paths = list(entries)
+        self._paths = StringColumn(paths)
+        self._strings = {key: StringColumn([entries[path].get(key) for path in paths]) for key in STRING_KEYS}
+
+        # Faces are looked up by the hash of their path and confirmed against the column
+        hashes = np.fromiter((hash(path) for path in paths), dtype=np.int64, count=count)
+        self._order = np.argsort(hashes, kind="stable")
+        self._hashes = hashes[self._order]
+
+        vector_counts = np.fromiter((len(entries[path]["encodings"]) for path in paths), dtype=np.int64, count=count)
+        self._vector_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(vector_counts, out=self._vector_offsets[1:])
+        if vectors_folder:
+            # Only the pages of the faces used are kept in memory
+            self._vectors = disk_matrix(vectors_folder, int(self._vector_offsets[-1]), dimensions)
+        else:
+            self._vectors = np.empty((int(self._vector_offsets[-1]), dimensions), dtype=np.float32)
+
+        self._positions = np.zeros((count, len(POSITION_KEYS)), dtype=np.int32)
+        self._has_position = np.zeros(count, dtype=bool)
+        self._quality = np.full((count, len(QUALITY_KEYS)), np.nan, dtype=np.float32)
+        self._dhashes = np.zeros(count, dtype=np.uint64)
+        self._has_dhash = np.zeros(count, dtype=bool)
+        self._extras = {}
+
+        known = set(STRING_KEYS) | {"dhash", "encodings", "face_path", "position", "quality"}
+        for row, path in enumerate(paths):
+            entry = entries[path]
+            if vector_counts[row]:
+                self._vectors[self._vector_offsets[row]:self._vector_offsets[row + 1]] = entry["encodings"]
+            if "position" in entry:
+                self._positions[row] = [entry["position"][key] for key in POSITION_KEYS]
+                self._has_position[row] = True
+            if "quality" in entry:
+                self._quality[row] = [entry["quality"][key] for key in QUALITY_KEYS]
+            if "dhash" in entry:
+                self._dhashes[row] = int(entry["dhash"], 16)
+                self._has_dhash[row] = True
+
+            extras = {key: value for key, value in entry.items() if key not in known}
+            if entry.get("face_path", path) != path:
+                extras["face_path"] = entry["face_path"]
+            if extras:
+                self._extras[row] = extras
+
+    def _find(self, face_path):
+        """Get the row of a face or None"""
+        if not isinstance(face_path, str):
+            return None
+        key = hash(face_path)
+        start = np.searchsorted(self._hashes, key, side="left")
+        stop = np.searchsorted(self._hashes, key, side="right")
+        for row in self._order[start:stop]:
+            if self._paths[row] == face_path:
+                return int(row)
+        return None
+
+    def _keys(self, row):
+        """Get the fields present in a row"""
+        keys = ["copied_md5", "copied_original_file", "face_path", "original_image_path"]
+        if self._has_position[row]:
+            keys.append("position")
+        keys.append("encodings")
+        if not np.isnan(self._quality[row, 0]):
+            keys.append("quality")
+        if self._has_dhash[row]:
+            keys.append("dhash")
+        keys.extend(key for key in self._extras.get(row, {}) if key not in keys)
+        return keys
+
+    def _value(self, row, key):
+        """Build the value of a field of a row
+
+        Raises:
+            KeyError.
+        """
+        extras = self._extras.get(row, {})
+        if key in extras:
+            return extras[key]
+        if key in self._strings:
+            return self._strings[key][row]
+        if key == "face_path":
+            return self._paths[row]
+        if key == "encodings":
+            return self._vectors[self._vector_offsets[row]:self._vector_offsets[row + 1]]
+        if key == "position" and self._has_position[row]:
+            return dict(zip(POSITION_KEYS, self._positions[row].tolist()))
+        if key == "quality" and not np.isnan(self._quality[row, 0]):
+            return {name: round(float(value), 4) for name, value in zip(QUALITY_KEYS, self._quality[row])}
+        if key == "dhash" and self._has_dhash[row]:
+            return f"{int(self._dhashes[row]):016x}"
+        raise KeyError(key)
+
+    def __getitem__(self, face_path):
+        if self._changes and face_path in self._changes:
+            if self._changes[face_path] is None:
+                raise KeyError(face_path)
+            return ChangedRecord(self._changes[face_path])
+        row = self._find(face_path)
+        if row is None:
+            raise KeyError(face_path)
+        return FaceRecord(self, row)
+
+    def __contains__(self, face_path):
+        if self._changes and isinstance(face_path, str) and face_path in self._changes:
+            return self._changes[face_path] is not None
+        return self._find(face_path) is not None
+
+    def __iter__(self):
+        changes = self._changes
+        for row in range(len(self._paths)):
+            face_path = self._paths[row]
+            if face_path not in changes:
+                yield face_path
+        for face_path, entry in list(changes.items()):
+            if entry is not None:
+                yield face_path
+
+    def __len__(self):
+        return self._length
+
+    def update(self, entries, deleted=()):
+        """Apply the changes of some faces without rebuilding the arrays
+
+        Args:
+            entries (dict): The new or replaced entries by face path.
+            deleted (iterable): The paths to the faces removed.
+
+        Returns:
+            bool. False if there are too many changes, leaving the store as
+                it was. A new store should be built instead.
+        """
+        deleted = [face_path for face_path in deleted if face_path not in entries]
+        changed = set(self._changes) | set(entries) | set(deleted)
+        if len(changed) > max(self.max_changes * len(self._paths), 1024):
+            return False
+
+        for face_path in deleted:
+            if face_path in self:
+                self._length -= 1
+            if self._find(face_path) is None:
+                self._changes.pop(face_path, None)
+            else:
+                self._changes[face_path] = None
+        for face_path, entry in entries.items():
+            if face_path not in self:
+                self._length += 1
+            entry = dict(entry)
+            entry["encodings"] = np.asarray(entry["encodings"], dtype=np.float32).reshape(-1, self.dimensions)
+            self._changes[face_path] = entry
+        return True
+
+    @property
+    def nbytes(self):
+        """int. The bytes used by the arrays of the store, without the extras."""
+        return (
+            self._paths.nbytes
+            + sum(column.nbytes for column in self._strings.values())
+            + self._order.nbytes + self._hashes.nbytes
+            + self._vector_offsets.nbytes + self._vectors.nbytes
+            + self._positions.nbytes + self._has_position.nbytes
+            + self._quality.nbytes + self._dhashes.nbytes + self._has_dhash.nbytes
+        )
@@ -0,0 +1,334 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import heapq
+import os
+import tempfile
+
+import numpy as np
+
+from pyfaces.core.index import EncodingIndex
+
+
+def disk_matrix(folder, rows, dimensions):
+    """Create a float32 matrix backed by a file instead of RAM
+
+    The file is removed as soon as it is mapped, so nothing is left behind
+    when the process ends. The pages of the matrix are then read from disk
+    when they are used and dropped by the OS under memory pressure.
+
+    Args:
+        folder (str): The folder for the file.
+        rows (int): The number of rows.
+        dimensions (int): The number of values of each row.
+
+    Returns:
+        numpy.memmap. A plain array if there are no rows, as empty files cannot be mapped.
+    """
+    if not rows:
+        return np.empty((0, dimensions), dtype=np.float32)
+    os.makedirs(folder, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(prefix="vectors-", suffix=".f4", dir=folder)
+    try:
+        return np.memmap(path, dtype=np.float32, mode="w+", shape=(rows, dimensions))
+    finally:
+        os.close(descriptor)
+        try:
+            os.remove(path)
+        except OSError:
+            # Windows does not remove files while they are mapped
+            pass
+
+
+class ColdSegment:
+    """A batch of demoted faces with their encodings in a memory-mapped matrix
+
+    Attributes:
+        faces (list): The face path of each row. None for tombstones.
+        matrix (numpy.memmap): The encodings.
+        rows (dict): The row of each face path.
+    """
+    def __init__(self, folder, faces, dimensions=128):
+        """Constructor
+
+        Args:
+            folder (str): The folder for the file of the matrix.
+            faces (list): The face paths. The rows of the matrix are filled by the caller.
+            dimensions (int): The number of values of each encoding.
+        """
+        self.faces = list(faces)
+        self.rows = {face_path: row for row, face_path in enumerate(self.faces)}
+        self.matrix = disk_matrix(folder, len(self.faces), dimensions)
+        self._alive = np.ones(len(self.faces), dtype=bool)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def remove(self, face_path):
+        """Tombstone the row of a face
+
+        Args:
+            face_path (str): The path to the face.
+        """
+        row = self.rows.pop(face_path)
+        self.faces[row] = None
+        self._alive[row] = False
+
+    def encoding(self, face_path):
+        """Read the encoding of a face into memory
+
+        Args:
+            face_path (str): The path to the face.
+
+        Returns:
+            numpy.array.
+        """
+        return np.array(self.matrix[self.rows[face_path]])
+
+    def alive_rows(self):
+        """Get the rows which are not tombstones
+
+        Returns:
+            numpy.array.
+        """
+        return np.flatnonzero(self._alive)
+
+    def search(self, encoding, top_k=None, exclude=None, chunk_size=65536):
+        """Find the faces of the segment closest to an encoding
+
+        The matrix is scanned in chunks so that only a chunk of distances
+        is in memory at once.
+
+        Args:
+            encoding (numpy.array): The values of the encoding.
+            top_k (int): The number of results to return. All if None.
+            exclude (str): A face path to leave out of the results.
+            chunk_size (int): The rows compared at once.
+
+        Returns:
+            list. The (distance, face_path) tuples, closest first.
+        """
+        results = []
+        for start in range(0, len(self.faces), chunk_size):
+            distances = np.linalg.norm(self.matrix[start:start + chunk_size] - encoding, axis=1)
+            candidates = np.flatnonzero(self._alive[start:start + chunk_size])
+            if top_k is not None and top_k < len(candidates):
+                kth = np.partition(distances[candidates], top_k - 1)[top_k - 1]
+                candidates = candidates[distances[candidates] <= kth]
+            results.extend(
+                (float(distances[row]), self.faces[start + row])
+                for row in candidates
+                if self.faces[start + row] != exclude
+            )
+            results = sorted(results)[:top_k]
+        return results
+
+
+class TieredIndex:
+    """A search index keeping only the hot faces in RAM
+
+    The faces added and the faces matched recently are hot: their encodings
+    are kept in an EncodingIndex. When there are more than `capacity` of
+    them, the least recently used are demoted in a batch to a cold segment,
+    a memory-mapped matrix the OS reads from disk when it is scanned.
+
+    A search scans the hot faces first and only scans the cold segments
+    when no hot face is closer than `threshold`, or when every match is
+    asked for. Otherwise the results only come from the hot faces. A cold
+    face matched closer than the threshold `promote_hits` times is promoted
+    back to the hot tier.
+
+    Attributes:
+        capacity (int): The hot faces kept in RAM.
+        counters (dict): The searches, the cold scans, the promotions and the demotions so far.
+        folder (str): The folder for the files of the cold segments.
+        hot (EncodingIndex): The hot faces.
+        max_segments (int): The cold segments merged into one when there are more.
+        promote_hits (int): The matches promoting a cold face.
+        segments (list): The ColdSegment objects.
+        threshold (float): The distance under which a match is confident.
+    """
+    def __init__(self, folder, capacity, threshold=0.45, promote_hits=1, dimensions=128, max_segments=8, slack=0.25):
+        """Constructor
+
+        Args:
+            folder (str): The folder for the files of the cold segments.
+            capacity (int): The hot faces kept in RAM.
+            threshold (float): The distance under which a match is confident.
+            promote_hits (int): The matches promoting a cold face.
+            dimensions (int): The number of values of each encoding.
+            max_segments (int): The cold segments merged into one when there are more.
+            slack (float): The share over the capacity tolerated before
+                demoting, so that faces are demoted in batches.
+        """
+        self.folder = folder
+        self.capacity = max(int(capacity), 1)
+        self.threshold = threshold
+        self.promote_hits = max(int(promote_hits), 1)
+        self.dimensions = dimensions
+        self.max_segments = max_segments
+        self.slack = slack
+        self.hot = EncodingIndex(dimensions)
+        self.segments = []
+        self.counters = {"searches": 0, "cold_scans": 0, "promotions": 0, "demotions": 0}
+        self._segment_of = {}
+        self._last_used = {}
+        self._cold_hits = {}
+        self._clock = 0
+
+    def __len__(self):
+        return len(self.hot) + len(self._segment_of)
+
+    def __contains__(self, face_path):
+        return face_path in self.hot or face_path in self._segment_of
+
+    def _touch(self, face_path):
+        """Mark a hot face as just used"""
+        self._clock += 1
+        self._last_used[face_path] = self._clock
+
+    def _forget_cold(self, face_path):
+        """Drop a face from the cold segments, if it is there"""
+        segment = self._segment_of.pop(face_path, None)
+        if segment is None:
+            return
+        segment.remove(face_path)
+        self._cold_hits.pop(face_path, None)
+        if not len(segment):
+            self.segments.remove(segment)
+
+    def add(self, face_path, encoding):
+        """Insert or replace the encoding of a face as a hot face
+
+        Args:
+            face_path (str): The path to the face.
+            encoding (list): The values of the encoding.
+        """
+        self._forget_cold(face_path)
+        self.hot.add(face_path, encoding)
+        self._touch(face_path)
+        if len(self.hot) > self.capacity * (1 + self.slack):
+            self._demote(len(self.hot) - self.capacity)
+
+    def remove(self, face_paths):
+        """Remove some faces from both tiers
+
+        Args:
+            face_paths (iterable): The paths to the faces. Unknown ones are ignored.
+        """
+        face_paths = list(face_paths)
+        for face_path in face_paths:
+            self._last_used.pop(face_path, None)
+            self._forget_cold(face_path)
+        self.hot.remove(face_paths)
+
+    def _demote(self, count):
+        """Move the least recently used hot faces to a new cold segment
+
+        Args:
+            count (int): The number of faces to demote.
+        """
+        coldest = heapq.nsmallest(count, self._last_used, key=self._last_used.get)
+        segment = ColdSegment(self.folder, coldest, self.dimensions)
+        segment.matrix[:] = self.hot.vectors(coldest)
+        self.segments.append(segment)
+        for face_path in coldest:
+            del self._last_used[face_path]
+            self._segment_of[face_path] = segment
+        self.hot.remove(coldest)
+        self.counters["demotions"] += len(coldest)
+        if len(self.segments) > self.max_segments:
+            self._merge()
+
+    def _merge(self, chunk_size=65536):
+        """Merge the cold segments into one without their tombstones
+
+        The rows are copied in chunks so that the cold faces are never all
+        in memory at once.
+        """
+        faces = [face_path for segment in self.segments for face_path in segment.faces if face_path is not None]
+        merged = ColdSegment(self.folder, faces, self.dimensions)
+        position = 0
+        for segment in self.segments:
+            alive = segment.alive_rows()
+            for start in range(0, len(alive), chunk_size):
+                rows = alive[start:start + chunk_size]
+                merged.matrix[position:position + len(rows)] = segment.matrix[rows]
+                position += len(rows)
+        self.segments = [merged] if len(merged) else []
+        for face_path in merged.rows:
+            self._segment_of[face_path] = merged
+
+    def _promote(self, face_path):
+        """Move a cold face back to the hot tier"""
+        encoding = self._segment_of[face_path].encoding(face_path)
+        self.counters["promotions"] += 1
+        self.add(face_path, encoding)
+
+    def search(self, encoding, top_k=None, exclude=None):
+        """Find the faces closest to an encoding
+
+        Args:
+            encoding (list): The values of the encoding.
+            top_k (int): The number of results to return. All if None.
+            exclude (str): A face path to leave out of the results.
+
+        Returns:
+            list. The (face_path, distance) tuples, closest first. Ties are
+                sorted by face path.
+        """
+        encoding = np.asarray(encoding)
+        self.counters["searches"] += 1
+        results = [(distance, face_path) for face_path, distance in self.hot.search(encoding, top_k, exclude)]
+        confident = top_k is not None and (not top_k or (len(results) > 0 and results[0][0] <= self.threshold))
+        if not confident and self.segments:
+            self.counters["cold_scans"] += 1
+            for segment in self.segments:
+                results.extend(segment.search(encoding, top_k, exclude))
+            results = sorted(results)[:top_k]
+
+        # Only the faces actually matched count as used
+        for distance, face_path in results:
+            if distance > self.threshold:
+                break
+            if face_path in self._last_used:
+                self._touch(face_path)
+            elif face_path in self._segment_of:
+                self._cold_hits[face_path] = self._cold_hits.get(face_path, 0) + 1
+                if self._cold_hits[face_path] >= self.promote_hits:
+                    self._promote(face_path)
+        return [(face_path, distance) for distance, face_path in results]
+
+    def stats(self):
+        """Get the size of the tiers and the counters
+
+        Returns:
+            dict.
+        """
+        return {
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "promote_hits": self.promote_hits,
+            "hot_faces": len(self.hot),
+            "cold_faces": len(self._segment_of),
+            "segments": len(self.segments),
+            "hot_bytes": self.hot.nbytes,
+            "cold_bytes": sum(segment.matrix.nbytes for segment in self.segments),
+            **self.counters
+        }
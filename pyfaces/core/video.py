@@ -0,0 +1,210 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+
+import face_recognition
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    # Optional decoder only needed for video files
+    cv2 = None
+
+from pyfaces.core import models
+from pyfaces.core.pipeline import Pipeline
+
+
+FRAME_EXTENSIONS = (".bmp", ".jpeg", ".jpg", ".png")
+
+
+def iter_frames(source, sample_rate=1):
+    """Decode the frames of a video or of a folder of frames
+
+    Args:
+        source (str): The path to a video file or to a folder with one image
+            per frame. Frames in a folder are processed in alphabetical order.
+        sample_rate (int): Only one out of every `sample_rate` frames is
+            decoded.
+
+    Yields:
+        tuple. The index of the frame and the frame as an RGB numpy array.
+
+    Raises:
+        ImportError. If a video is provided and OpenCV is not installed.
+        OSError.
+    """
+    if os.path.isdir(source):
+        frames = sorted(
+            name for name in os.listdir(source)
+            if name.lower().endswith(FRAME_EXTENSIONS)
+        )
+        for index in range(0, len(frames), sample_rate):
+            yield index, face_recognition.load_image_file(os.path.join(source, frames[index]))
+        return
+
+    if cv2 is None:
+        raise ImportError("Decoding videos requires OpenCV. Install it with 'pip3 install pyfaces[video]'.")
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise OSError(f"Video '{source}' could not be opened.")
+    try:
+        index = 0
+        while True:
+            # Skipped frames are grabbed but never decoded
+            if index % sample_rate:
+                if not capture.grab():
+                    break
+            else:
+                found, frame = capture.read()
+                if not found:
+                    break
+                yield index, np.ascontiguousarray(frame[:, :, ::-1])
+            index += 1
+    finally:
+        capture.release()
+
+
+def iou(box_1, box_2):
+    """Intersection over union of two boxes
+
+    Args:
+        box_1 (tuple): A (top, right, bottom, left) box.
+        box_2 (tuple): A (top, right, bottom, left) box.
+
+    Returns:
+        float.
+    """
+    top = max(box_1[0], box_2[0])
+    right = min(box_1[1], box_2[1])
+    bottom = min(box_1[2], box_2[2])
+    left = max(box_1[3], box_2[3])
+    intersection = max(0, bottom - top) * max(0, right - left)
+    if not intersection:
+        return 0.0
+
+    area_1 = (box_1[2] - box_1[0]) * (box_1[1] - box_1[3])
+    area_2 = (box_2[2] - box_2[0]) * (box_2[1] - box_2[3])
+    return intersection / float(area_1 + area_2 - intersection)
+
+
+class IoUTracker:
+    """A greedy tracker linking the boxes of consecutive frames by overlap
+
+    Attributes:
+        max_age (int): Sampled frames a track survives without being seen.
+        min_iou (float): Minimum overlap to consider that two boxes are the same face.
+        tracks (dict): The active tracks as {track_id: (box, last_seen)}.
+    """
+    def __init__(self, min_iou=0.3, max_age=2):
+        self.max_age = max_age
+        self.min_iou = min_iou
+        self.tracks = {}
+        self._next_id = 0
+
+    def update(self, boxes, step):
+        """Assign the boxes of a frame to the active tracks
+
+        Args:
+            boxes (list): The (top, right, bottom, left) boxes found in the frame.
+            step (int): The position of the frame among the sampled frames.
+
+        Returns:
+            list. A (track_id, box, is_new) tuple per box.
+        """
+        # Forget the faces that left the scene
+        self.tracks = {
+            track_id: (box, last_seen)
+            for track_id, (box, last_seen) in self.tracks.items()
+            if step - last_seen - 1 <= self.max_age
+        }
+
+        candidates = sorted(
+            (
+                (iou(box, track_box), track_id, i)
+                for i, box in enumerate(boxes)
+                for track_id, (track_box, _) in self.tracks.items()
+            ),
+            reverse=True
+        )
+
+        assigned = {}
+        used_tracks = set()
+        for overlap, track_id, i in candidates:
+            if overlap < self.min_iou:
+                break
+            if i in assigned or track_id in used_tracks:
+                continue
+            assigned[i] = track_id
+            used_tracks.add(track_id)
+
+        results = []
+        for i, box in enumerate(boxes):
+            is_new = i not in assigned
+            if is_new:
+                assigned[i] = self._next_id
+                self._next_id += 1
+            self.tracks[assigned[i]] = (box, step)
+            results.append((assigned[i], box, is_new))
+        return results
+
+
+class VideoPipeline:
+    """A detector → tracker → encoder pipeline over a stream of frames
+
+    Decoding and detection run in their own threads connected by bounded
+    queues, so memory stays flat no matter how long the input is. Only the
+    faces starting a new track are handed to the encoder.
+
+    Attributes:
+        queue_size (int): The maximum number of frames waiting in each queue.
+        sample_rate (int): Only one out of every `sample_rate` frames is processed.
+        tracker (IoUTracker): The tracker linking the faces between frames.
+    """
+    def __init__(self, sample_rate=1, queue_size=8, tracker=None):
+        self.sample_rate = max(int(sample_rate), 1)
+        self.queue_size = queue_size
+        self.tracker = tracker or IoUTracker()
+
+    def run(self, source):
+        """Process a stream of frames
+
+        Args:
+            source (str): The path to a video file or to a folder of frames.
+
+        Yields:
+            tuple. (frame_index, frame, new_faces, total_faces) per sampled
+                frame where `new_faces` is a list of (track_id, box) tuples
+                of the faces that have to be encoded.
+        """
+        def detect(item):
+            frame_index, frame = item
+            return [(frame_index, frame, models.face_locations(frame))]
+
+        # A single detection worker keeps the frames in order for the tracker
+        pipeline = Pipeline(queue_size=self.queue_size).add_stage(detect)
+
+        step = 0
+        for frame_index, frame, boxes in pipeline.run(iter_frames(source, self.sample_rate)):
+            tracked = self.tracker.update(boxes, step)
+            step += 1
+            new_faces = [(track_id, box) for (track_id, box, is_new) in tracked if is_new]
+            yield frame_index, frame, new_faces, len(boxes)
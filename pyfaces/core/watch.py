@@ -0,0 +1,287 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import datetime as dt
+import hashlib
+import json
+import os
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    # Optional, folders are only polled without it
+    inotify_simple = None
+
+from pyfaces.core.locking import atomic_write_json
+from pyfaces.misc.files import IMAGE_EXTENSIONS
+
+
+def default_index_path(config, folder):
+    """Get where the index of a watched folder is stored
+
+    Args:
+        config (ConfigManager): The configuration of the collection fed by the folder.
+        folder (str): The watched folder.
+
+    Returns:
+        str.
+    """
+    key = hashlib.md5(f"{config.collection}:{os.path.abspath(folder)}".encode("utf-8")).hexdigest()
+    return os.path.join(config.app_folder, "watch", f"{key}.json")
+
+
+class FolderWatcher:
+    """Feeds the new or changed images of a folder to a processor
+
+    Every image ingested is recorded in a persistent index by its size and
+    modification time, and so is the modification time of every folder.
+    A folder whose modification time did not change cannot have new files,
+    so it is not listed again: the cost of a scan depends on the folders
+    that changed, not on the total number of files. Files modified in place
+    do not change their folder, so a full scan is still run once in a while.
+
+    Files may still be being written, so they are only ingested once two
+    scans found the same size and modification time and that time is at
+    least `settle` seconds old. Until then they wait in 'pending'.
+
+    Attributes:
+        batch_size (int): The number of images persisted at once.
+        folder (str): The watched folder.
+        full_scan_every (int): Cycles between full scans. 0 to never run them.
+        index_path (str): The path to the persistent index.
+        interval (float): The seconds between scans.
+        processor (FaceProcessor): The processor, or any object providing
+            `extract_many` such as a `WorkerProxy`.
+        settle (float): The seconds a file must remain unmodified before it
+            is ingested.
+    """
+    def __init__(self, processor, folder, index_path, interval=5, settle=2, full_scan_every=60, batch_size=16):
+        self.processor = processor
+        self.folder = os.path.abspath(folder)
+        self.index_path = index_path
+        self.interval = float(interval)
+        self.settle = float(settle)
+        self.full_scan_every = int(full_scan_every)
+        self.batch_size = max(int(batch_size), 1)
+        self.index = self.load_index()
+        self._inotify = None
+        self._watched = set()
+
+    def load_index(self):
+        """Load the index of the folder or create a new one
+
+        Returns:
+            dict. The index.
+        """
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as input_file:
+                return json.load(input_file)
+        return {
+            "errors": 0,
+            "files": {},
+            "folder": self.folder,
+            "folders": {},
+            "ingested": 0,
+            "pending": {},
+            "started": str(dt.datetime.now()),
+            "updated": None
+        }
+
+    def _save(self):
+        """Persist the index"""
+        self.index["updated"] = str(dt.datetime.now())
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        atomic_write_json(self.index_path, self.index)
+
+    def _scan(self, full=False):
+        """Find the images which are new or changed since they were ingested
+
+        Args:
+            full (bool): If True, every folder is listed even if it did not change.
+
+        Returns:
+            tuple. The candidates as a dict of [size, mtime] by relative path
+                and the number of folders listed.
+        """
+        files = self.index["files"]
+        known_folders = self.index["folders"]
+        folders = {}
+        present = set()
+        candidates = {}
+        listed = 0
+
+        stack = [""]
+        while stack:
+            relative = stack.pop()
+            path = os.path.join(self.folder, relative)
+            try:
+                # Taken before listing, so files added meanwhile are found next time
+                mtime = os.stat(path).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+            known = known_folders.get(relative)
+            if not full and known and known[0] == mtime:
+                folders[relative] = known
+                stack.extend(os.path.join(relative, name) for name in known[1])
+                continue
+
+            listed += 1
+            children = []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append(entry.name)
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                            file_relative = os.path.join(relative, entry.name)
+                            stat = entry.stat()
+                            key = [stat.st_size, stat.st_mtime_ns]
+                            present.add(file_relative)
+                            if files.get(file_relative) != key:
+                                candidates[file_relative] = key
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+            folders[relative] = [mtime, sorted(children)]
+            stack.extend(os.path.join(relative, name) for name in children)
+
+        self.index["folders"] = folders
+        if full:
+            # Forget the files removed from the folder
+            self.index["files"] = {key: value for key, value in files.items() if key in present}
+        return candidates, listed
+
+    def poll(self, full=False):
+        """Scan the folder once and ingest the images ready
+
+        Args:
+            full (bool): If True, every folder is listed even if it did not change.
+
+        Returns:
+            dict. The report of the cycle, including the scan time and the
+                lag between the last modification of the images and their
+                ingestion.
+        """
+        start_time = time.perf_counter()
+        candidates, listed = self._scan(full)
+
+        # Files waiting to settle are checked directly as their folder may not change again
+        pending = self.index["pending"]
+        for relative in list(pending):
+            if relative in candidates:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, relative))
+            except (FileNotFoundError, NotADirectoryError):
+                del pending[relative]
+                continue
+            key = [stat.st_size, stat.st_mtime_ns]
+            if self.index["files"].get(relative) != key:
+                candidates[relative] = key
+
+        now = time.time_ns()
+        settle = int(self.settle * 1e9)
+        ready = []
+        for relative, key in sorted(candidates.items()):
+            # Writers may keep the modification time, so the size must not change either
+            if pending.get(relative) == key and now - key[1] >= settle:
+                del pending[relative]
+                ready.append((relative, key))
+            else:
+                pending[relative] = key
+
+        report = {
+            "errors": [],
+            "faces": 0,
+            "full": full,
+            "images": len(ready),
+            "lag": max(((now - key[1]) / 1e9 for _, key in ready), default=0.0),
+            "listed_folders": listed,
+            "folders": len(self.index["folders"]),
+            "pending": len(pending),
+            "scan_seconds": time.perf_counter() - start_time
+        }
+
+        for start in range(0, len(ready), self.batch_size):
+            batch = dict(
+                (os.path.join(self.folder, relative), (relative, key))
+                for relative, key in ready[start:start + self.batch_size]
+            )
+            # A single batch so that it is persisted at once
+            for image_path, metadata in self.processor.extract_many(list(batch), batch_size=len(batch)):
+                relative, key = batch[image_path]
+                self.index["files"][relative] = key
+                if isinstance(metadata, Exception):
+                    report["errors"].append([image_path, str(metadata)])
+                    self.index["errors"] += 1
+                else:
+                    report["faces"] += len(metadata["faces"])
+                    self.index["ingested"] += 1
+            self._save()
+
+        if not ready and (listed or candidates):
+            self._save()
+        report["seconds"] = time.perf_counter() - start_time
+        return report
+
+    def _wait(self, timeout, stop_event=None):
+        """Wait for the next cycle, waking up early on file system events if possible"""
+        if self._inotify is None and inotify_simple is not None:
+            try:
+                self._inotify = inotify_simple.INotify()
+            except OSError:
+                self._inotify = False
+        if self._inotify:
+            flags = inotify_simple.flags.CREATE | inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO
+            for relative in self.index["folders"]:
+                if relative not in self._watched:
+                    try:
+                        self._inotify.add_watch(os.path.join(self.folder, relative), flags)
+                    except OSError:
+                        # Out of watches or the folder is gone, polling still finds the files
+                        pass
+                    self._watched.add(relative)
+            self._inotify.read(timeout=int(timeout * 1000), read_delay=100)
+        elif stop_event is not None:
+            stop_event.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def run(self, cycles=None, stop_event=None):
+        """Watch the folder ingesting the new images
+
+        Args:
+            cycles (int): The number of scans to run. Forever if None.
+            stop_event (threading.Event): Stop watching once it is set.
+
+        Yields:
+            dict. The report of each cycle.
+        """
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            full = bool(cycle and self.full_scan_every and cycle % self.full_scan_every == 0)
+            yield self.poll(full)
+            cycle += 1
+            if stop_event is not None and stop_event.is_set():
+                return
+            if cycles is None or cycle < cycles:
+                # Files waiting to settle are checked again sooner
+                timeout = min(self.interval, self.settle) if self.index["pending"] else self.interval
+                self._wait(timeout, stop_event)
@@ -0,0 +1,265 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import datetime as dt
+import json
+import os
+
+import numpy as np
+
+from pyfaces.core.locking import atomic_write_json
+from pyfaces.core.matrix import distance_block
+from pyfaces.core.matrix import squared_norms
+
+
+class Watchlist:
+    """A short list of persons of interest checked against every new face
+
+    The reference encodings of all the persons are kept in a single matrix,
+    so checking a batch of new faces is one matrix product, whatever the
+    size of the gallery. The persons are stored in a JSON file and the hits
+    appended to an NDJSON file, so they are shared by every process using
+    the data folder.
+
+    Attributes:
+        entries (dict): The 'encodings', 'tolerance', 'note' and 'added' date of each person by name.
+        file_path (str): The path to the file of the persons.
+        hits_file (str): The path to the file of the hits.
+        tolerance (float): The distance under which a face is a hit, unless
+            a person has a tolerance of its own.
+    """
+    def __init__(self, file_path, hits_file, tolerance=0.5, dimensions=128):
+        self.file_path = file_path
+        self.hits_file = hits_file
+        self.tolerance = tolerance
+        self.dimensions = dimensions
+        self.entries = {}
+        self._mtime = None
+        self._callbacks = []
+        self._build()
+        self.reload()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _build(self):
+        """Stack the reference encodings of every person in a matrix"""
+        names = sorted(self.entries)
+        self._owners = []
+        self._tolerances = []
+        references = []
+        for name in names:
+            entry = self.entries[name]
+            for encoding in entry["encodings"]:
+                self._owners.append(name)
+                self._tolerances.append(entry["tolerance"] if entry.get("tolerance") is not None else self.tolerance)
+                references.append(encoding)
+        self._matrix = np.array(references, dtype=np.float32).reshape(-1, self.dimensions)
+        self._norms = squared_norms(self._matrix)
+        self._tolerances = np.array(self._tolerances, dtype=np.float32)
+
+    def reload(self):
+        """Load the persons again if another process changed them
+
+        It only checks the modification time, so it is cheap to call it
+        before every check.
+        """
+        try:
+            mtime = os.stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self.entries = {}
+        if mtime is not None:
+            with open(self.file_path, "r") as input_file:
+                self.entries = json.load(input_file)
+        self._mtime = mtime
+        self._build()
+
+    def save(self):
+        """Persist the persons
+
+        It MUST be called while holding the lock of the data folder, after
+        reloading them.
+        """
+        atomic_write_json(self.file_path, self.entries)
+        self._mtime = os.stat(self.file_path).st_mtime_ns
+
+    def add(self, name, encodings, tolerance=None, note=None):
+        """Put a person on the watchlist, replacing any previous entry
+
+        Args:
+            name (str): The name of the person.
+            encodings (list): The reference encodings of the person.
+            tolerance (float): The distance under which a face is a hit. The
+                default one of the watchlist if None.
+            note (str): Any information about the person.
+
+        Raises:
+            ValueError.
+        """
+        if not name:
+            raise ValueError("A name is required to put someone on the watchlist.")
+        if not len(encodings):
+            raise ValueError(f"At least a face or an encoding of '{name}' is required.")
+        self.entries[name] = {
+            "added": dt.datetime.now().isoformat(),
+            "encodings": [[float(value) for value in encoding] for encoding in encodings],
+            "note": note,
+            "tolerance": tolerance
+        }
+        self._build()
+
+    def remove(self, name):
+        """Take a person off the watchlist
+
+        Args:
+            name (str): The name of the person.
+
+        Raises:
+            KeyError.
+        """
+        del self.entries[name]
+        self._build()
+
+    def summary(self):
+        """Get the persons on the watchlist without their encodings
+
+        Returns:
+            list.
+        """
+        return [
+            {
+                "name": name,
+                "references": len(entry["encodings"]),
+                "tolerance": entry["tolerance"] if entry.get("tolerance") is not None else self.tolerance,
+                "note": entry.get("note"),
+                "added": entry.get("added")
+            }
+            for name, entry in sorted(self.entries.items())
+        ]
+
+    def subscribe(self, callback):
+        """Call a function with the hits of every check
+
+        Args:
+            callback (callable): It receives the list of hits. It is only
+                subscribed once.
+        """
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+
+    def check(self, new_encodings):
+        """Find the new faces close to a person of the watchlist
+
+        Args:
+            new_encodings (dict): The new encodings entries by face path.
+
+        Returns:
+            list. A hit for each face and person, closest first.
+        """
+        faces = [(face_path, entry) for face_path, entry in new_encodings.items() if len(entry["encodings"])]
+        if not faces or not len(self._matrix):
+            return []
+
+        queries = np.array([entry["encodings"][0] for _, entry in faces], dtype=np.float32)
+        distances = distance_block(queries, squared_norms(queries), self._matrix, self._norms)
+
+        closest = {}
+        for row, column in zip(*np.nonzero(distances <= self._tolerances[None, :])):
+            key = (row, self._owners[column])
+            if key not in closest or distances[row, column] < closest[key]:
+                closest[key] = float(distances[row, column])
+
+        hits = []
+        for (row, name), distance in closest.items():
+            face_path, entry = faces[row]
+            hits.append({
+                "name": name,
+                "distance": round(distance, 4),
+                "face_path": face_path,
+                "original_image_path": entry.get("original_image_path"),
+                "copied_original_file": entry.get("copied_original_file"),
+                "position": entry.get("position")
+            })
+        return sorted(hits, key=lambda hit: (hit["distance"], hit["face_path"], hit["name"]))
+
+    def record(self, hits):
+        """Append some hits to the hits file
+
+        It MUST be called while holding the lock of the data folder.
+
+        Args:
+            hits (list): The hits found by `check`.
+        """
+        if not hits:
+            return
+        time = dt.datetime.now().isoformat()
+        with open(self.hits_file, "a") as output_file:
+            for hit in hits:
+                hit["time"] = time
+                output_file.write(json.dumps(hit) + "\n")
+
+    def notify(self, hits):
+        """Call the subscribed functions with some hits
+
+        Exceptions raised by a callback do not stop the ingestion.
+
+        Args:
+            hits (list): The hits found by `check`.
+
+        Returns:
+            list. The exceptions raised by the callbacks.
+        """
+        errors = []
+        if hits:
+            for callback in self._callbacks:
+                try:
+                    callback(hits)
+                except Exception as exc:
+                    errors.append(exc)
+        return errors
+
+    def hits(self, after=0, limit=100):
+        """Read the hits recorded
+
+        Each hit has an 'id', its line in the hits file, so that clients can
+        poll for the new ones.
+
+        Args:
+            after (int): Only return the hits with a greater id.
+            limit (int): The maximum number of hits returned.
+
+        Returns:
+            list. The hits, oldest first.
+        """
+        hits = []
+        try:
+            with open(self.hits_file, "r") as input_file:
+                for hit_id, line in enumerate(input_file, 1):
+                    if hit_id <= after or not line.endswith("\n"):
+                        # Lines being written are skipped until complete
+                        continue
+                    hits.append(dict(json.loads(line), id=hit_id))
+                    if len(hits) >= limit:
+                        break
+        except FileNotFoundError:
+            pass
+        return hits
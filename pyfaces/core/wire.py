@@ -0,0 +1,356 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import base64
+import os
+
+import numpy as np
+
+
+# The response formats accepted by the methods returning faces or matches
+RESPONSE_FORMATS = ["json", "compact"]
+
+# Similarities keep every digit so that results print as in the JSON format
+SIMILARITY_DTYPE = "<f8"
+
+
+def check_format(response_format):
+    """Make sure that a response format is known
+
+    Args:
+        response_format (str): The format asked by the client.
+
+    Raises:
+        ValueError.
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown response format '{response_format}'. Use one of: {', '.join(RESPONSE_FORMATS)}.")
+
+
+def encode_array(values, dtype="<f4"):
+    """Pack numbers as the base64 of their little-endian binary values
+
+    Args:
+        values (iterable): The numbers or a numpy.array.
+        dtype (str): The numpy type of each value.
+
+    Returns:
+        str.
+    """
+    return base64.b64encode(np.asarray(values, dtype=dtype).tobytes()).decode("ascii")
+
+
+def decode_array(text, dtype="<f4", dimensions=None):
+    """Unpack the numbers packed by `encode_array`
+
+    Args:
+        text (str): The base64 text.
+        dtype (str): The numpy type of each value.
+        dimensions (int): If set, the values are returned as rows of this length.
+
+    Returns:
+        numpy.array.
+    """
+    values = np.frombuffer(base64.b64decode(text), dtype=dtype)
+    if dimensions:
+        values = values.reshape(-1, dimensions)
+    return values
+
+
+class PathTable:
+    """Interns the paths of a response as integer ids
+
+    The folder shared by all the paths is only sent once and each path is
+    then referred to by its position in the table.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.paths = []
+
+    def id(self, path):
+        """Get the id of a path adding it if needed
+
+        Args:
+            path (str): The path.
+
+        Returns:
+            int.
+        """
+        path_id = self.ids.get(path)
+        if path_id is None:
+            path_id = self.ids[path] = len(self.paths)
+            self.paths.append(path)
+        return path_id
+
+    def to_dict(self):
+        """Serialize the table
+
+        Returns:
+            dict. The 'prefix' shared by the paths and the 'names' after it.
+        """
+        prefix = ""
+        if self.paths:
+            try:
+                # Taken from the folders so that every path is strictly under
+                # it. The faces usually share one or two of them.
+                by_folder = {path.rpartition(os.sep)[0]: path for path in self.paths}
+                prefix = os.path.commonpath([os.path.dirname(path) for path in by_folder.values()])
+            except ValueError:
+                # Relative and absolute paths mixed
+                prefix = ""
+        start = len(prefix) + 1 if prefix and prefix != os.sep else len(prefix)
+        return {
+            "prefix": prefix,
+            "names": [path[start:] for path in self.paths]
+        }
+
+
+def expand_paths(table):
+    """Rebuild the paths of a table serialized by `PathTable.to_dict`
+
+    Args:
+        table (dict): The serialized table.
+
+    Returns:
+        list. The paths by id.
+    """
+    prefix = table["prefix"]
+    if not prefix:
+        return list(table["names"])
+    separator = "" if prefix.endswith(os.sep) else os.sep
+    return [f"{prefix}{separator}{name}" for name in table["names"]]
+
+
+def compact_comparisons(comparisons, table):
+    """Turn a list of comparisons into columns
+
+    Args:
+        comparisons (list): The {'known_face', 'similarity', …} dicts.
+        table (PathTable): The table interning the known faces.
+
+    Returns:
+        dict. The 'ids' and 'similarities' as packed arrays plus a plain
+            list for any other field, such as the 'collection'.
+    """
+    path_id = table.id
+    columns = {
+        "ids": encode_array([path_id(c["known_face"]) for c in comparisons], "<i4"),
+        "similarities": encode_array([c["similarity"] for c in comparisons], SIMILARITY_DTYPE)
+    }
+    for key in sorted({key for c in comparisons for key in c} - {"known_face", "similarity"}):
+        columns[key] = [c.get(key) for c in comparisons]
+    return columns
+
+
+def expand_comparisons(columns, paths):
+    """Rebuild the comparisons packed by `compact_comparisons`
+
+    Args:
+        columns (dict): The packed columns.
+        paths (list): The paths by id.
+
+    Returns:
+        list.
+    """
+    ids = decode_array(columns["ids"], "<i4").tolist()
+    similarities = decode_array(columns["similarities"], SIMILARITY_DTYPE).tolist()
+    extra = {key: values for key, values in columns.items() if key not in ("ids", "similarities")}
+    comparisons = []
+    for row, (face_id, similarity) in enumerate(zip(ids, similarities)):
+        comparison = {"known_face": paths[face_id], "similarity": similarity}
+        for key, values in extra.items():
+            comparison[key] = values[row]
+        comparisons.append(comparison)
+    return comparisons
+
+
+def compact_face(entry):
+    """Pack the entry of a face as returned by `FaceProcessor.get_face`
+
+    Args:
+        entry (dict): The entry of the face.
+
+    Returns:
+        dict. The same entry with its encodings as packed float32 values.
+    """
+    packed = dict(entry)
+    packed["encodings"] = encode_array(packed["encodings"])
+    packed["format"] = "compact"
+    return packed
+
+
+def expand_face(packed, dimensions=128):
+    """Rebuild the entry of a face packed by `compact_face`
+
+    Args:
+        packed (dict): The packed entry.
+        dimensions (int): The number of values of each encoding.
+
+    Returns:
+        dict.
+    """
+    entry = dict(packed)
+    del entry["format"]
+    entry["encodings"] = decode_array(entry["encodings"], dimensions=dimensions).tolist()
+    return entry
+
+
+def compact_guess(result):
+    """Pack the result of a guess
+
+    It works for `guess_face`, `guess_encoding` and the searches across
+    collections or shards.
+
+    Args:
+        result (dict): The result with its 'comparisons'.
+
+    Returns:
+        dict.
+    """
+    table = PathTable()
+    packed = dict(result)
+    packed["comparisons"] = compact_comparisons(result["comparisons"], table)
+    packed["paths"] = table.to_dict()
+    packed["format"] = "compact"
+    return packed
+
+
+def expand_guess(packed):
+    """Rebuild the result packed by `compact_guess`
+
+    Args:
+        packed (dict): The packed result.
+
+    Returns:
+        dict.
+    """
+    result = dict(packed)
+    del result["format"]
+    paths = expand_paths(result.pop("paths"))
+    result["comparisons"] = expand_comparisons(result["comparisons"], paths)
+    return result
+
+
+def compact_search(result):
+    """Pack the result of `FaceProcessor.search_image`
+
+    The known faces matched by several faces of the image share their id.
+
+    Args:
+        result (dict): The result with its 'faces'.
+
+    Returns:
+        dict.
+    """
+    table = PathTable()
+    packed = dict(result)
+    packed["faces"] = [
+        dict(face, comparisons=compact_comparisons(face["comparisons"], table))
+        for face in result["faces"]
+    ]
+    packed["paths"] = table.to_dict()
+    packed["format"] = "compact"
+    return packed
+
+
+def expand_search(packed):
+    """Rebuild the result packed by `compact_search`
+
+    Args:
+        packed (dict): The packed result.
+
+    Returns:
+        dict.
+    """
+    result = dict(packed)
+    del result["format"]
+    paths = expand_paths(result.pop("paths"))
+    result["faces"] = [
+        dict(face, comparisons=expand_comparisons(face["comparisons"], paths))
+        for face in result["faces"]
+    ]
+    return result
+
+
+def compact_matches(result):
+    """Pack the matches returned by `CollectionRegistry.compare_sets`
+
+    The pairs of every query are flattened in a sparse row layout: the
+    matches of the i-th query are those between offsets[i] and offsets[i + 1].
+
+    Args:
+        result (dict): The result with its 'matches', if any.
+
+    Returns:
+        dict.
+    """
+    packed = dict(result)
+    packed["format"] = "compact"
+    if "matches" not in result:
+        return packed
+
+    table = PathTable()
+    queries = []
+    offsets = [0]
+    ids = []
+    similarities = []
+    for query_path, comparisons in result["matches"].items():
+        queries.append(table.id(query_path))
+        for comparison in comparisons:
+            ids.append(table.id(comparison["known_face"]))
+            similarities.append(comparison["similarity"])
+        offsets.append(len(ids))
+    packed["matches"] = {
+        "queries": encode_array(queries, "<i4"),
+        "offsets": encode_array(offsets, "<i8"),
+        "ids": encode_array(ids, "<i4"),
+        "similarities": encode_array(similarities, SIMILARITY_DTYPE)
+    }
+    packed["paths"] = table.to_dict()
+    return packed
+
+
+def expand_matches(packed):
+    """Rebuild the result packed by `compact_matches`
+
+    Args:
+        packed (dict): The packed result.
+
+    Returns:
+        dict.
+    """
+    result = dict(packed)
+    del result["format"]
+    if "matches" not in result:
+        return result
+
+    paths = expand_paths(result.pop("paths"))
+    columns = result["matches"]
+    offsets = decode_array(columns["offsets"], "<i8").tolist()
+    ids = decode_array(columns["ids"], "<i4").tolist()
+    similarities = decode_array(columns["similarities"], SIMILARITY_DTYPE).tolist()
+    result["matches"] = {
+        paths[query_id]: [
+            {"known_face": paths[ids[i]], "similarity": similarities[i]}
+            for i in range(offsets[row], offsets[row + 1])
+        ]
+        for row, query_id in enumerate(decode_array(columns["queries"], "<i4").tolist())
+    }
+    return result
+
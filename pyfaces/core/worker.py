@@ -0,0 +1,328 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import base64
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+from pyfaces.core.locking import FileLock
+from pyfaces.core.rpc import RPCClient
+from pyfaces.core.rpc import RPCError
+from pyfaces.core.wire import expand_guess
+from pyfaces.core.wire import expand_matches
+from pyfaces.core.wire import expand_search
+
+
+def worker_socket_path(config):
+    """Get the path of the Unix domain socket of the background worker
+
+    Args:
+        config (ConfigManager): The configuration manager object.
+
+    Returns:
+        str.
+    """
+    return os.path.join(config.app_folder, "worker.sock")
+
+
+def _answers(client):
+    """Check if a usable server answers
+
+    Services which do not speak HTTP or JSON-RPC and servers refusing the
+    call, such as an old pyfacesd, are not usable.
+    """
+    try:
+        client.call("info")
+        return True
+    except (OSError, ValueError, http.client.HTTPException, RPCError):
+        return False
+
+
+def connect_worker(config, port=12012, spawn=True, idle_timeout=600, startup_timeout=60):
+    """Find a long-lived server with the models and the data already loaded
+
+    The background worker is looked for first, then a pyfacesd running in
+    the local host. If none answers, a background worker is spawned. The
+    worker is looked for and spawned holding `worker.lock`, so processes
+    starting at once share a single worker instead of replacing the socket
+    of each other.
+
+    Args:
+        config (ConfigManager): The configuration manager object.
+        port (int): The port of the local pyfacesd.
+        spawn (bool): If False, None is returned instead of spawning a worker.
+        idle_timeout (float): Seconds a spawned worker waits for requests before exiting.
+        startup_timeout (float): Seconds to wait for a spawned worker.
+
+    Returns:
+        RPCClient. Or None if no server was found and none could be spawned.
+    """
+    socket_path = worker_socket_path(config)
+    has_unix_sockets = hasattr(socket, "AF_UNIX")
+
+    # Servers are probed with a short timeout, but long operations such as
+    # extractions are not limited by one
+    worker = RPCClient(f"unix://{socket_path}", timeout=None)
+    worker_probe = RPCClient(worker.url, timeout=2)
+    if has_unix_sockets and os.path.exists(socket_path) and _answers(worker_probe):
+        return worker
+
+    client = RPCClient(f"http://127.0.0.1:{port}", timeout=None)
+    probe = RPCClient(client.url, timeout=0.5)
+    if _answers(probe):
+        return client
+
+    if not spawn or not has_unix_sockets:
+        return None
+
+    with FileLock(os.path.join(config.app_folder, "worker.lock")):
+        # Another process may have spawned it while waiting for the lock
+        if os.path.exists(socket_path) and _answers(worker_probe):
+            return worker
+
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "pyfaces.server",
+                "--unix-socket", socket_path,
+                "--idle-timeout", str(idle_timeout),
+                "--log-level", "WARNING"
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+
+        deadline = time.time() + startup_timeout
+        while time.time() < deadline:
+            if os.path.exists(socket_path) and _answers(worker_probe):
+                return worker
+            time.sleep(0.1)
+    return None
+
+
+class WorkerProxy:
+    """Forwards the FaceProcessor methods used by the CLI to a server
+
+    Relative paths are made absolute as the server may be running in a
+    different folder. Results with many faces are asked for in the compact
+    format, which is smaller and faster to parse, and expanded here.
+
+    Attributes:
+        client (RPCClient): The client connected to the server.
+        collection (str): The collection of faces to use. The default one if None.
+    """
+    def __init__(self, client, collection=None):
+        self.client = client
+        self.collection = collection
+
+    def compare_faces(self, face_path_1, face_path_2, force_recalculation=False):
+        """See `FaceProcessor.compare_faces`"""
+        return self.client.call(
+            "compare_faces",
+            face_path_1=os.path.abspath(face_path_1),
+            face_path_2=os.path.abspath(face_path_2),
+            force_recalculation=force_recalculation,
+            collection=self.collection
+        )
+
+    def compare_sets(self, queries, gallery, threshold=None, top_k=None, output_path=None, block_size=1024, workers=None):
+        """See `CollectionRegistry.compare_sets`
+
+        The server only writes files to its exports folder, so the output
+        file is written there under a unique name and then moved to the
+        path asked for, as the worker runs in this same host.
+        """
+        def absolute(selection):
+            selection = dict(selection)
+            for key in ("face_paths", "source_paths"):
+                if selection.get(key) is not None:
+                    selection[key] = [os.path.abspath(path) for path in selection[key]]
+            return selection
+
+        output_name = None
+        if output_path is not None:
+            extension = ".npz" if output_path.endswith(".npz") else ".ndjson"
+            output_name = f"compare-{uuid.uuid4().hex}{extension}"
+
+        result = expand_matches(self.client.call(
+            "compare_many",
+            queries=absolute(queries),
+            gallery=absolute(gallery),
+            threshold=threshold,
+            top_k=top_k,
+            output_name=output_name,
+            block_size=block_size,
+            response_format="compact"
+        ))
+        if output_path is not None:
+            shutil.move(result["output"], output_path)
+            result["output"] = output_path
+        return result
+
+    def delete_many(self, source_paths=(), face_paths=(), prefix=None):
+        """See `FaceProcessor.delete_many`"""
+        return self.client.call(
+            "delete_many",
+            source_paths=[os.path.abspath(path) for path in source_paths],
+            face_paths=[os.path.abspath(path) for path in face_paths],
+            prefix=prefix and os.path.abspath(prefix),
+            collection=self.collection
+        )
+
+    def extract_faces(self, image_path, force_recalculation=False, roi=None, min_face_size=None, max_faces=None, best_shots=None):
+        """See `FaceProcessor.extract_faces`"""
+        return self.client.call(
+            "extract_faces",
+            image_path=os.path.abspath(image_path),
+            force_recalculation=force_recalculation,
+            roi=roi,
+            min_face_size=min_face_size,
+            max_faces=max_faces,
+            best_shots=best_shots,
+            collection=self.collection
+        )
+
+    def extract_many(self, image_paths, force_recalculation=False, batch_size=16, roi=None, min_face_size=None, max_faces=None, best_shots=None, **kwargs):
+        """See `FaceProcessor.extract_many`
+
+        The paths are sent in batches and the server decides the number of
+        workers. Batches refused by an overloaded server are sent again.
+        """
+        image_paths = iter(image_paths)
+        while True:
+            batch = {os.path.abspath(path): path for _, path in zip(range(batch_size), image_paths)}
+            if not batch:
+                return
+            while True:
+                try:
+                    results = self.client.call(
+                        "extract_many",
+                        image_paths=list(batch),
+                        force_recalculation=force_recalculation,
+                        roi=roi,
+                        min_face_size=min_face_size,
+                        max_faces=max_faces,
+                        best_shots=best_shots,
+                        collection=self.collection
+                    )
+                    break
+                except RPCError as e:
+                    # The server refused the batch to keep serving searches
+                    if e.retry_after is None:
+                        raise
+                    time.sleep(e.retry_after)
+            for absolute_path, metadata in results.items():
+                if "error" in metadata:
+                    metadata = Exception(metadata["error"])
+                yield batch[absolute_path], metadata
+
+    def extract_video(self, video_path, sample_rate=1, queue_size=8, batch_size=16):
+        """See `FaceProcessor.extract_video`"""
+        return self.client.call(
+            "extract_video",
+            video_path=os.path.abspath(video_path),
+            sample_rate=sample_rate,
+            queue_size=queue_size,
+            batch_size=batch_size,
+            collection=self.collection
+        )
+
+    def keep_best_shots(self, best_shots=1, group_by="identity", tolerance=0.6):
+        """See `FaceProcessor.keep_best_shots`"""
+        return self.client.call(
+            "keep_best_shots",
+            best_shots=best_shots,
+            group_by=group_by,
+            tolerance=tolerance,
+            collection=self.collection
+        )
+
+    def watchlist_add(self, name, face_paths=(), encodings=(), tolerance=None, note=None):
+        """See `FaceProcessor.watchlist_add`"""
+        return self.client.call(
+            "watchlist_add",
+            name=name,
+            face_paths=[os.path.abspath(path) for path in face_paths],
+            encodings=[list(encoding) for encoding in encodings],
+            tolerance=tolerance,
+            note=note,
+            collection=self.collection
+        )
+
+    def watchlist_remove(self, name):
+        """See `FaceProcessor.watchlist_remove`"""
+        return self.client.call("watchlist_remove", name=name, collection=self.collection)
+
+    def watchlist_entries(self):
+        """See `FaceProcessor.watchlist_entries`"""
+        return self.client.call("watchlist", collection=self.collection)
+
+    def watchlist_hits(self, after=0, limit=100):
+        """See `FaceProcessor.watchlist_hits`"""
+        return self.client.call("watchlist_hits", after=after, limit=limit, collection=self.collection)
+
+    def search_image(self, image_path=None, image_data=None, top_k=10, roi=None, min_face_size=None, max_faces=None, best_shots=None):
+        """See `FaceProcessor.search_image`
+
+        The contents of the image are sent instead of its path so that the
+        server does not need to read the file.
+        """
+        if image_data is None:
+            with open(image_path, "rb") as image_file:
+                image_data = image_file.read()
+        return expand_search(self.client.call(
+            "search_image",
+            image_data=base64.b64encode(image_data).decode("ascii"),
+            top_k=top_k,
+            roi=roi,
+            min_face_size=min_face_size,
+            max_faces=max_faces,
+            best_shots=best_shots,
+            collection=self.collection,
+            response_format="compact"
+        ))
+
+    def guess_face(self, new_face_path, force_recalculation=False, top_k=None):
+        """See `FaceProcessor.guess_face`"""
+        return expand_guess(self.client.call(
+            "guess_face",
+            face_path=os.path.abspath(new_face_path),
+            force_recalculation=force_recalculation,
+            top_k=top_k,
+            collection=self.collection,
+            response_format="compact"
+        ))
+
+    def guess_across(self, face_path, collections, collection=None, top_k=None):
+        """See `CollectionRegistry.guess_across`"""
+        return expand_guess(self.client.call(
+            "guess_face",
+            face_path=os.path.abspath(face_path),
+            top_k=top_k,
+            collection=collection or self.collection,
+            across=list(collections),
+            response_format="compact"
+        ))
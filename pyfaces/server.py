@@ -18,19 +18,146 @@
 ################################################################################
 
 import argparse
+import base64
+import functools
 import logging
 import threading
 import time
 import os 
 from jsonrpc import JSONRPCResponseManager, dispatcher
+from jsonrpc.exceptions import JSONRPCDispatchException
 
 from werkzeug.wrappers import Request, Response
 from waitress import serve
 
 import pyfaces
 import pyfaces.misc.text as text
-from pyfaces.core.processor import FaceProcessor
+from pyfaces.aioserver import AsyncJSONRPCServer
 from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.governor import configure_governor
+from pyfaces.core.governor import get_governor
+from pyfaces.core.registry import CollectionRegistry
+from pyfaces.core.replication import PrimaryClient
+from pyfaces.core.replication import ReplicaFollower
+from pyfaces.core.rpc import RPCClient
+from pyfaces.core.rpc import compress
+from pyfaces.core.scheduler import Overloaded
+from pyfaces.core.scheduler import RequestScheduler
+from pyfaces.core.scheduler import default_limits
+from pyfaces.core.scheduler import parse_class_values
+from pyfaces.core.sharding import ShardCoordinator
+from pyfaces.core.watch import default_index_path
+from pyfaces.core.watch import FolderWatcher
+from pyfaces.core import wire
+
+
+# Options of the running daemon set in main()
+SETTINGS = {
+    "coordinator": None,
+    "replica": None,
+    "scheduler": None,
+    "shard_count": None,
+    "shard_index": None
+}
+
+# JSON-RPC error sent when a request is refused by the scheduler
+OVERLOADED_CODE = -32001
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Get the processors of the collections shared by all the requests
+
+    Returns:
+        CollectionRegistry.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CollectionRegistry(
+                shard_index=SETTINGS["shard_index"],
+                shard_count=SETTINGS["shard_count"]
+            )
+    return _registry
+
+
+def new_processor(collection=None, check_staleness=True):
+    """Get the face processor of a collection shared by all the requests of the daemon
+
+    The processors are thread-safe so the same instance is reused by every
+    waitress thread. Files changed by other processes are reloaded. Unknown
+    collections are refused: they are created with `create_collection`.
+
+    Args:
+        collection (str): The name of the collection. The default one if None.
+        check_staleness (bool): If False, a replica answers even if it is
+            too far behind its primary.
+
+    Returns:
+        FaceProcessor.
+
+    Raises:
+        ValueError.
+    """
+    proc = get_registry().get(collection)
+    replica = SETTINGS["replica"]
+    if replica:
+        if proc is not replica.processor:
+            raise ValueError(f"This replica only serves the collection '{replica.processor.collection}'.")
+        if check_staleness:
+            replica.check_fresh()
+    proc.refresh()
+    proc.watchlist.subscribe(log_watchlist_hits)
+    return proc
+
+
+def log_watchlist_hits(hits):
+    """Log the new faces matching a person of the watchlist
+
+    Args:
+        hits (list): The hits of a batch of new faces.
+    """
+    for hit in hits:
+        logging.warning(
+            f"Watchlist hit: '{hit['face_path']}' from '{hit['original_image_path']}' matches '{hit['name']}' (distance: {hit['distance']})."
+        )
+
+
+def schedule_methods(scheduler, target=None):
+    """Make the methods of the dispatcher wait for a slot of their priority class
+
+    Args:
+        scheduler (RequestScheduler): The scheduler admitting the requests.
+        target (Dispatcher): The dispatcher whose methods are wrapped. The
+            one of the daemon if None.
+    """
+    target = dispatcher if target is None else target
+
+    def scheduled(method, priority_class):
+        @functools.wraps(method)
+        def run(*args, **kwargs):
+            try:
+                with scheduler.admit(priority_class):
+                    return method(*args, **kwargs)
+            except Overloaded as e:
+                raise JSONRPCDispatchException(
+                    code=OVERLOADED_CODE,
+                    message="Server overloaded",
+                    data={
+                        "type": "Overloaded",
+                        "message": str(e),
+                        "priority_class": e.priority_class,
+                        "retry_after": e.retry_after
+                    }
+                )
+        return run
+
+    for name in list(target):
+        priority_class = scheduler.classify(name)
+        if priority_class:
+            target[name] = scheduled(target[name], priority_class)
 
 
 def kill_daemon_job():
@@ -43,25 +170,103 @@ def kill_daemon_job():
 
 
 @dispatcher.add_method
-def compare_faces(face_path_1, face_path_2):
+def compare_faces(face_path_1, face_path_2, force_recalculation=False, collection=None):
     """Compare two faces located in a given path
 
     Args:
         face_path_1 (str): The path to the image of the first face.
         face_path_1 (str): The path to the image of the second face.
+        force_recalculation (bool): If True, it recalculates the process.
+        collection (str): The collection of the faces. The default one if None.
 
     Return:
         double. The similarity value in a domain [0, 1].
     """
-    proc = FaceProcessor()
-    return proc.compare(face_path_1, face_path_2)
+    proc = new_processor(collection)
+    return proc.compare_faces(face_path_1, face_path_2, force_recalculation)
+
+
+def export_path(output_name):
+    """Resolve the name of a file asked for by a client
+
+    Clients can only name files inside the exports folder of the data
+    folder, so that they cannot overwrite any other file of the server.
+
+    Args:
+        output_name (str): A bare file name.
+
+    Returns:
+        str. The path to the file.
+
+    Raises:
+        ValueError.
+    """
+    separators = [separator for separator in (os.sep, os.altsep, "/") if separator]
+    if (
+        not output_name
+        or output_name in (".", "..")
+        or os.path.isabs(output_name)
+        or any(separator in output_name for separator in separators)
+    ):
+        raise ValueError(f"'{output_name}' is not a bare file name. Files are written to the exports folder of the server.")
+    exports_folder = ConfigManager().exports_folder
+    os.makedirs(exports_folder, exist_ok=True)
+    return os.path.join(exports_folder, output_name)
+
+
+@dispatcher.add_method
+def compare_many(queries, gallery, threshold=None, top_k=None, output_name=None, block_size=1024, response_format="json"):
+    """Compare every face of a set with every face of another one
+
+    Args:
+        queries (dict): The 'collection', 'face_paths' and 'source_paths' of the faces to look for.
+        gallery (dict): The 'collection', 'face_paths' and 'source_paths' of the faces to compare them with.
+        threshold (float): Only keep the pairs closer than this.
+        top_k (int): Only keep the closest top_k faces of each query.
+        output_name (str): Stream the matches to this NDJSON or npz file
+            of the exports folder instead of returning them.
+        block_size (int): The rows and columns of each block of distances.
+        response_format (str): Either 'json' or 'compact', with the matches as packed columns.
+    """
+    logging.debug(f"Comparing sets of faces…")
+    wire.check_format(response_format)
+    output_path = export_path(output_name) if output_name is not None else None
+    result = get_registry().compare_sets(queries, gallery, threshold, top_k, output_path, block_size)
+    return wire.compact_matches(result) if response_format == "compact" else result
 
 
 @dispatcher.add_method
 def config():
     """Return configuration"""
     logging.debug("Getting configuration…")
-    return ConfigManager().get()
+    result = ConfigManager().get()
+    result["resources"] = get_governor().allocation()
+    return result
+
+
+@dispatcher.add_method
+def create_collection(name):
+    """Create a collection so that the other methods accept it
+
+    In coordinator mode it is created in every shard.
+
+    Args:
+        name (str): The name of the collection. Up to 64 letters, digits,
+            '.', '_' or '-'.
+
+    Returns:
+        list. The names of the collections.
+
+    Raises:
+        ValueError.
+    """
+    logging.debug(f"Creating the collection '{name}'…")
+    if SETTINGS["coordinator"]:
+        return SETTINGS["coordinator"].create_collection(name)
+    if SETTINGS["replica"]:
+        raise ValueError("Collections cannot be created in a replica.")
+    get_registry().get(name, create=True)
+    return get_registry().names()
 
 
 @dispatcher.add_method
@@ -75,116 +280,426 @@ def set_config(name, value):
     Return:
         str.
     """
+    if name == "data_folder" and SETTINGS["replica"]:
+        raise ValueError("The data folder of a replica cannot be changed while it follows its primary.")
     config = ConfigManager()
-    config.set(name, value)
+    config.set_attribute(name, value)
+    if name == "data_folder":
+        # The shared processors are bound to the previous data folder
+        get_registry().clear()
     msg = f"Configuration option '{name}' changed to '{value}'."
     logging.debug(msg)
     return msg
 
 
 @dispatcher.add_method
-def extract_faces(image_path):
+def extract_faces(image_path, force_recalculation=False, roi=None, min_face_size=None, max_faces=None, best_shots=None, collection=None):
     """Extract faces from an image
 
     Args:
         image_path (str): The path to the image which will be searched for images.
+        force_recalculation (bool): If True, it recalculates the process.
+        roi (list): The (top, right, bottom, left) region where faces are looked for.
+        min_face_size (int): The minimum width and height of a face in pixels.
+        max_faces (int): The maximum number of faces, largest first.
+        best_shots (int): The maximum number of faces, best quality first.
+        collection (str): The collection to add the faces to. The default one if None.
     """
     logging.debug(f"Extracting faces from '{image_path}'…")
-    proc = FaceProcessor()
-    return proc.extract_faces(image_path)
+    if SETTINGS["coordinator"]:
+        return SETTINGS["coordinator"].extract_faces(
+            image_path,
+            force_recalculation=force_recalculation,
+            roi=roi,
+            min_face_size=min_face_size,
+            max_faces=max_faces,
+            best_shots=best_shots,
+            collection=collection
+        )
+    proc = new_processor(collection)
+    return proc.extract_faces(image_path, force_recalculation, roi, min_face_size, max_faces, best_shots)
 
 
 @dispatcher.add_method
-def delete_analysis(image_path):
+def extract_many(image_paths, force_recalculation=False, roi=None, min_face_size=None, max_faces=None, best_shots=None, collection=None):
+    """Extract faces from several images overlapping I/O and CPU work
+
+    Args:
+        image_paths (list): The paths to the images.
+        force_recalculation (bool): If True, it recalculates the process.
+        roi (list): The (top, right, bottom, left) region where faces are looked for.
+        min_face_size (int): The minimum width and height of a face in pixels.
+        max_faces (int): The maximum number of faces per image, largest first.
+        best_shots (int): The maximum number of faces per image, best quality first.
+        collection (str): The collection to add the faces to. The default one if None.
+
+    Returns:
+        dict. The metadata of each image or the error it generated.
+    """
+    logging.debug(f"Extracting faces from {len(image_paths)} images…")
+    if SETTINGS["coordinator"]:
+        return SETTINGS["coordinator"].extract_many(
+            image_paths,
+            force_recalculation=force_recalculation,
+            roi=roi,
+            min_face_size=min_face_size,
+            max_faces=max_faces,
+            best_shots=best_shots,
+            collection=collection
+        )
+    proc = new_processor(collection)
+    results = {}
+    for image_path, metadata in proc.extract_many(image_paths, force_recalculation, roi=roi, min_face_size=min_face_size, max_faces=max_faces, best_shots=best_shots):
+        if isinstance(metadata, Exception):
+            results[image_path] = {"error": str(metadata)}
+        else:
+            results[image_path] = metadata
+    return results
+
+
+@dispatcher.add_method
+def extract_video(video_path, sample_rate=1, queue_size=8, batch_size=16, collection=None):
+    """Extract faces from a video or a folder of frames
+
+    Args:
+        video_path (str): The path to the video or to the folder of frames.
+        sample_rate (int): Only one out of every `sample_rate` frames is processed.
+        queue_size (int): The maximum number of frames waiting between stages.
+        batch_size (int): The number of frames with new faces persisted at once.
+        collection (str): The collection to add the faces to. The default one if None.
+    """
+    logging.debug(f"Extracting faces from the frames of '{video_path}'…")
+    if SETTINGS["coordinator"]:
+        return SETTINGS["coordinator"].extract_video(
+            video_path,
+            sample_rate=sample_rate,
+            queue_size=queue_size,
+            batch_size=batch_size,
+            collection=collection
+        )
+    proc = new_processor(collection)
+    return proc.extract_video(video_path, sample_rate, queue_size, batch_size)
+
+
+@dispatcher.add_method
+def keep_best_shots(best_shots=1, group_by="identity", tolerance=0.6, collection=None):
+    """Keep only the best faces of each person or of each source image
+
+    Args:
+        best_shots (int): The number of faces kept per group.
+        group_by (str): Either 'identity' or 'source'.
+        tolerance (float): The maximum distance between faces of the same person.
+        collection (str): The collection to prune. The default one if None.
+    """
+    logging.debug(f"Keeping the {best_shots} best shots by {group_by}…")
+    proc = new_processor(collection)
+    return proc.keep_best_shots(best_shots, group_by, tolerance)
+
+
+@dispatcher.add_method
+def delete_analysis(image_path, collection=None):
     """The analysis to remove
 
     Args:
         image_path (str): The path to the source image to delete.
+        collection (str): The collection of the image. The default one if None.
     """
     logging.debug(f"Deleting analysis linked to '{image_path}'…")
-    proc = FaceProcessor()
-    return proc.delete_path(image_path)
+    if SETTINGS["coordinator"]:
+        return SETTINGS["coordinator"].delete_analysis(image_path, collection=collection)
+    proc = new_processor(collection)
+    return proc.delete_analysis(image_path)
 
 
 @dispatcher.add_method
-def get_face(face_path):
+def delete_many(source_paths=[], face_paths=[], prefix=None, collection=None):
+    """Delete many images and faces at once
+
+    Args:
+        source_paths (list): The copies or original paths of the images to delete.
+        face_paths (list): The faces to delete.
+        prefix (str): Delete every image whose path starts with this prefix.
+        collection (str): The collection of the images. The default one if None.
+    """
+    logging.debug(f"Deleting {len(source_paths)} images and {len(face_paths)} faces…")
+    if SETTINGS["coordinator"]:
+        return SETTINGS["coordinator"].delete_many(
+            source_paths=source_paths,
+            face_paths=face_paths,
+            prefix=prefix,
+            collection=collection
+        )
+    proc = new_processor(collection)
+    return proc.delete_many(source_paths, face_paths, prefix)
+
+
+@dispatcher.add_method
+def get_face(face_path, collection=None, response_format="json"):
     """Get the face configuration
 
     Warning! This could be used to grab other files! Watch out!
 
     Args:
         face_path (str): The path to the face which is used as a key.
+        collection (str): The collection of the face. The default one if None.
+        response_format (str): Either 'json' or 'compact', with the encodings as packed float32 values.
 
     Returns:
         str. Base64 representation of the face.
     """
     logging.debug(f"Grabbing face from '{face_path}'…")
-    proc = FaceProcessor()
-    return proc.get_face(face_path)
+    wire.check_format(response_format)
+    if SETTINGS["coordinator"]:
+        result = SETTINGS["coordinator"].get_face(face_path, collection)
+    else:
+        proc = new_processor(collection)
+        result = proc.get_face(face_path)
+    return wire.compact_face(result) if response_format == "compact" else result
 
 
 @dispatcher.add_method
-def get_image(image_path):
+def get_image(image_path, collection=None):
     """Get the base64 image
 
     Security Warning! This could be used to grab other files! Watch out!
 
     Args:
         image_path (str): The image path to the file to be grabbed.
+        collection (str): The collection of the image. The default one if None.
 
     Returns:
         str. Base64 representation of the image.
     """
-    logging.debug(f"Grabbing image from '{face_path}'…")
-    proc = FaceProcessor()
+    logging.debug(f"Grabbing image from '{image_path}'…")
+    proc = new_processor(collection)
     return proc.get_image(image_path)
 
 @dispatcher.add_method
-def get_metadata(image_path):
+def get_metadata(image_path, collection=None):
     """Get the metadata from a source image
 
     Warning! This could be used to grab other files! Watch out!
 
     Args:
         image_path (str): The path to the image which is used as a key.
+        collection (str): The collection of the image. The default one if None.
     """
     logging.debug(f"Grabbing metadata from '{image_path}'…")
-    proc = FaceProcessor()
+    proc = new_processor(collection)
     return proc.get_metadata(image_path)
 
 @dispatcher.add_method
-def guess_face(face_path):
+def guess_face(face_path, top_k=None, force_recalculation=False, collection=None, across=None, response_format="json"):
     """Compare a given face with all the known faces
+
+    In coordinator mode the search is fanned out to all the shards.
+
+    Args:
+        face_path (str): The path to the face which is used as a key.
+        top_k (int): The number of results to return. All if None.
+        force_recalculation (bool): If True, it recalculates the process.
+        collection (str): The collection of the face. The default one if None.
+        across (list): Search these collections in parallel instead of the
+            one of the face. '*' searches all of them.
+        response_format (str): Either 'json' or 'compact', with the comparisons as packed columns.
     """
-    proc = FaceProcessor()
-    return proc.guess_face(face_path)
+    wire.check_format(response_format)
+    if SETTINGS["coordinator"]:
+        if across:
+            raise ValueError("Searching across collections is not supported by coordinators.")
+        result = SETTINGS["coordinator"].guess_face(face_path, top_k, collection)
+    elif across:
+        result = get_registry().guess_across(face_path, across, collection, top_k)
+    else:
+        proc = new_processor(collection)
+        result = proc.guess_face(face_path, force_recalculation, top_k)
+    return wire.compact_guess(result) if response_format == "compact" else result
 
 
 @dispatcher.add_method
-def info():
+def search_image(image_path=None, image_data=None, top_k=10, roi=None, min_face_size=None, max_faces=None, best_shots=None, collection=None, response_format="json"):
+    """Find the closest known faces to the faces of an image without storing anything
+
+    Args:
+        image_path (str): The path to the image.
+        image_data (str): The base64 encoded contents of the image, instead of a path.
+        top_k (int): The number of matches of each face. All if None.
+        roi (list): The (top, right, bottom, left) region where faces are looked for.
+        min_face_size (int): The minimum width and height of a face in pixels.
+        max_faces (int): The maximum number of faces, largest first.
+        best_shots (int): The maximum number of faces, best quality first.
+        collection (str): The collection to search. The default one if None.
+        response_format (str): Either 'json' or 'compact', with the comparisons as packed columns.
+    """
+    logging.debug(f"Searching the faces of '{image_path or 'an uploaded image'}'…")
+    wire.check_format(response_format)
+    if image_data is not None:
+        image_data = base64.b64decode(image_data)
+    proc = new_processor(collection)
+    result = proc.search_image(image_path, image_data, top_k, roi, min_face_size, max_faces, best_shots)
+    return wire.compact_search(result) if response_format == "compact" else result
+
+
+@dispatcher.add_method
+def replication_snapshot(after=None, limit=1000, collection=None):
+    """Get a page of the gallery to bootstrap a replica
+
+    Args:
+        after (str): The last face path of the previous page. None for the first one.
+        limit (int): The number of faces of the page.
+        collection (str): The collection replicated. The default one if None.
+    """
+    logging.debug(f"Shipping a snapshot page after '{after}'…")
+    proc = new_processor(collection)
+    return proc.replication_snapshot(after, limit)
+
+
+@dispatcher.add_method
+def replication_changes(since, limit=1000, collection=None):
+    """Get the changes of the gallery made after a generation held by a replica
+
+    Args:
+        since (int): The generation held by the replica.
+        limit (int): The approximate number of changes returned.
+        collection (str): The collection replicated. The default one if None.
+    """
+    proc = new_processor(collection)
+    return proc.replication_changes(since, limit)
+
+
+@dispatcher.add_method
+def guess_encoding(encoding, top_k=None, exclude=None, collection=None, response_format="json"):
+    """Compare a raw encoding with the known faces without persisting anything
+
+    This is the method used by a coordinator to query its shards.
+
+    Args:
+        encoding (list): The 128 values of the face encoding.
+        top_k (int): The number of results to return. All if None.
+        exclude (str): A face path to leave out of the results.
+        collection (str): The collection to search. The default one if None.
+        response_format (str): Either 'json' or 'compact', with the comparisons as packed columns.
+    """
+    wire.check_format(response_format)
+    proc = new_processor(collection)
+    result = proc.guess_encoding(encoding, top_k, exclude)
+    return wire.compact_guess(result) if response_format == "compact" else result
+
+
+@dispatcher.add_method
+def watchlist_add(name, face_paths=[], encodings=[], tolerance=None, note=None, collection=None):
+    """Put a person on the watchlist checked against every new face
+
+    Args:
+        name (str): The name of the person. An existing entry is replaced.
+        face_paths (list): Registered faces of the person used as references.
+        encodings (list): Raw reference encodings of the person.
+        tolerance (float): The distance under which a new face is a hit.
+        note (str): Any information about the person.
+        collection (str): The collection whose new faces are checked. The default one if None.
+    """
+    logging.debug(f"Adding '{name}' to the watchlist…")
+    proc = new_processor(collection)
+    return proc.watchlist_add(name, face_paths, encodings, tolerance, note)
+
+@dispatcher.add_method
+def watchlist_remove(name, collection=None):
+    """Take a person off the watchlist
+
+    Args:
+        name (str): The name of the person.
+        collection (str): The collection of the watchlist. The default one if None.
+    """
+    logging.debug(f"Removing '{name}' from the watchlist…")
+    proc = new_processor(collection)
+    return proc.watchlist_remove(name)
+
+@dispatcher.add_method
+def watchlist(collection=None):
+    """Get the persons on the watchlist
+
+    Args:
+        collection (str): The collection of the watchlist. The default one if None.
+    """
+    proc = new_processor(collection)
+    return proc.watchlist_entries()
+
+@dispatcher.add_method
+def watchlist_hits(after=0, limit=100, collection=None):
+    """Get the new faces that matched a person of the watchlist
+
+    Clients poll for new hits passing the id of the last one they got.
+
+    Args:
+        after (int): Only return the hits with a greater id.
+        limit (int): The maximum number of hits returned.
+        collection (str): The collection of the watchlist. The default one if None.
+    """
+    proc = new_processor(collection)
+    return proc.watchlist_hits(after, limit)
+
+@dispatcher.add_method
+def info(collection=None):
     """Get server information
 
+    Args:
+        collection (str): The collection whose faces are counted. The default one if None.
+
     Returns:
         dict.
     """
     logging.debug(f"Grabbing information from the server…")
-    proc = FaceProcessor()
-    return {
+    result = {
         "name": f"Pyfaces {pyfaces.__version__} JSON-RPC Server",
         "methods": [
             "compare_faces",
+            "compare_many",
             "config",
+            "create_collection",
+            "delete_analysis",
+            "delete_many",
             "extract_faces",
+            "extract_many",
+            "extract_video",
             "get_face",
             "get_image",
             "get_metadata",
+            "guess_encoding",
             "guess_face",
             "info",
+            "keep_best_shots",
+            "replication_changes",
+            "replication_snapshot",
+            "search_image",
             "set_config",
-            "shutdown"
+            "shutdown",
+            "watchlist",
+            "watchlist_add",
+            "watchlist_hits",
+            "watchlist_remove"
         ],
-        "faces": len(proc.encodings)
+        "resources": get_governor().allocation()
     }
+    if SETTINGS["scheduler"]:
+        result["scheduler"] = SETTINGS["scheduler"].stats()
+    if SETTINGS["coordinator"]:
+        result["shards"] = SETTINGS["coordinator"].info(collection)
+        result["faces"] = result["shards"]["faces"]
+    else:
+        proc = new_processor(collection, check_staleness=False)
+        result["faces"] = len(proc.encodings)
+        result["generation"] = proc.gallery.generation
+        result["collections"] = get_registry().names()
+        if proc.hot_faces:
+            result["tiers"] = proc.tier_stats()
+        if SETTINGS["replica"]:
+            result["replica"] = SETTINGS["replica"].status()
+        if SETTINGS["shard_count"]:
+            result["shard"] = {
+                "index": SETTINGS["shard_index"],
+                "count": SETTINGS["shard_count"]
+            }
+    return result
 
 @dispatcher.add_method
 def shutdown():
@@ -197,13 +712,58 @@ def shutdown():
     return "Daemon shutdown order received."
 
 
+def watch_folder(folder, interval=5, collection=None):
+    """Ingest the new images of a folder for as long as the daemon runs
+
+    Errors are logged and the folder is watched again after `interval`
+    seconds, so the thread never dies silently.
+
+    Args:
+        folder (str): The folder to watch.
+        interval (float): The seconds between scans.
+        collection (str): The collection to add the faces to. The default one if None.
+    """
+    while True:
+        try:
+            proc = new_processor(collection)
+            watcher = FolderWatcher(proc, folder, default_index_path(proc.config, folder), interval=interval)
+            for report in watcher.run():
+                for image_path, message in report["errors"]:
+                    logging.warning(f"'{image_path}' generated an exception: {message}")
+                if report["images"]:
+                    logging.info(f"Ingested {report['images']} images with {report['faces']} faces from '{folder}' (lag: {report['lag']:.2f} s).")
+        except Exception:
+            logging.exception(f"Watching '{folder}' failed. Retrying in {interval} s…")
+            time.sleep(interval)
+
+
+def follow_primary(follower):
+    """Apply the changes of the primary for as long as the daemon runs
+
+    Args:
+        follower (ReplicaFollower): The follower of the primary.
+    """
+    for report in follower.run():
+        if "error" in report:
+            logging.warning(f"The primary '{follower.primary_url}' could not be reached: {report['error']}")
+            continue
+        if report["bootstrapped"] is not None:
+            logging.info(f"Bootstrapped {report['bootstrapped']} faces from '{follower.primary_url}' at generation {report['generation']}.")
+        if report["inserted"] or report["deleted"]:
+            logging.info(f"Replicated {report['inserted']} insertions and {report['deleted']} deletions up to generation {report['generation']}.")
+
+
 @Request.application
 def application(request):
     response = JSONRPCResponseManager.handle(
         request.data,
         dispatcher
     )
-    return Response(response.json, mimetype='application/json')
+    body, encoding = compress(response.json.encode("utf-8"), request.headers.get("Accept-Encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
 
 
 def get_parser():
@@ -225,8 +785,38 @@ def get_parser():
     group_server.add_argument('-h', '--host', metavar='<HOST>', required=False, default="0.0.0.0", action='store', help="the host where it will be launched. Note that '0.0.0.0' will make it accesible from outside and this can be dangerous. Default value: localhost.")
     group_server.add_argument('-p', '--port', metavar='<PORT>', required=False, default=12012, action='store', help='select the port in which the JSON RPC server will be deployed. Default value: 12012.')
     group_server.add_argument('-t', '--threads', metavar='<NUM>', required=False, default=config.get_attribute("num_threads"), action='store', help=f"select the number of threads to be used. Default value: {config.get_attribute('num_threads')}")
+    group_server.add_argument('-m', '--mode', metavar='<MODE>', required=False, default="waitress", action='store', choices=["waitress", "asyncio"], help="the server front end: 'waitress' uses a thread per request while 'asyncio' handles connections with coroutines and only uses the threads to run the methods. Default value: 'waitress'.")
+    group_server.add_argument('-u', '--unix-socket', metavar='<PATH>', required=False, default=None, action='store', help="listen on this Unix domain socket instead of a TCP port. It implies '--mode asyncio'.")
+    group_server.add_argument('--idle-timeout', metavar='<SECONDS>', required=False, default=None, type=float, action='store', help="exit after this many seconds without requests. Only in asyncio mode. Default value: never.")
     group_server.add_argument('-l', '--log-level', metavar='<LOG_LEVEL>', required=False, default="INFO", action='store', choices=["DEBUG", "INFO", "WARNING", "ERROR"], help=f"the log level for the application. Default value: 'INFO'.")
 
+    group_resources = parser.add_argument_group('Resource arguments', 'Dividing the CPUs between the threads of the server')
+    group_resources.add_argument('--cpu-budget', metavar='<NUM>', required=False, default=None, type=int, action='store', help=f"the CPUs used by the server, 0 for all the available ones. Default value: {config.get_attribute('cpu_budget')}.")
+    group_resources.add_argument('--native-threads', metavar='<NUM>', required=False, default=None, type=int, action='store', help=f"the threads NumPy's BLAS and OpenMP may use in each worker. Changing it at runtime needs threadpoolctl. Default value: {config.get_attribute('native_threads')}.")
+
+    group_scheduler = parser.add_argument_group('Scheduling arguments', 'Giving interactive searches priority over bulk ingestion')
+    group_scheduler.add_argument('--class-limits', metavar='<CLASS>=<NUM>', required=False, default=None, nargs='+', action='store', help="the requests of each priority class (interactive, bulk or maintenance) run at once. Default value: the request threads for interactive, half the CPU workers for bulk and 1 for maintenance.")
+    group_scheduler.add_argument('--queue-sizes', metavar='<CLASS>=<NUM>', required=False, default=None, nargs='+', action='store', help="the requests of each priority class that may wait for a slot before new ones are refused. Waiting requests hold a thread. Default value: the request threads for interactive, the bulk limit for bulk and 2 for maintenance.")
+    group_scheduler.add_argument('--max-running', metavar='<NUM>', required=False, default=None, type=int, action='store', help="the requests of all the classes run at once. Freed slots go to the highest class waiting. Default value: the request threads.")
+    group_scheduler.add_argument('--queue-timeout', metavar='<SECONDS>', required=False, default=30, type=float, action='store', help="refuse the requests that waited for a slot for longer than this. Default value: 30.")
+
+    group_watch = parser.add_argument_group('Watch arguments', 'Ingesting the images dropped in folders')
+    group_watch.add_argument('--watch', metavar='<FOLDER>', required=False, default=None, nargs='+', action='store', help='ingest the new or changed images of these folders in the background.')
+    group_watch.add_argument('--watch-interval', metavar='<SECONDS>', required=False, default=5, type=float, action='store', help='the seconds between scans of the watched folders. Default value: 5.')
+    group_watch.add_argument('--watch-collection', metavar='<NAME>', required=False, default=None, action='store', help="the collection fed by the watched folders. Default value: 'default'.")
+
+    group_shards = parser.add_argument_group('Sharding arguments', 'Spreading the gallery across several pyfacesd instances')
+    group_shards.add_argument('--shard-index', metavar='<NUM>', required=False, default=None, type=int, action='store', help='launch the server as the shard with this index, using its own data folder. Requires --shard-count.')
+    group_shards.add_argument('--shard-count', metavar='<NUM>', required=False, default=None, type=int, action='store', help='the total number of shards.')
+    group_shards.add_argument('--shards', metavar='<URL>', required=False, default=None, nargs='+', action='store', help='launch the server as a coordinator that fans out searches and routes writes to these shards, ordered by shard index.')
+    group_shards.add_argument('--shard-timeout', metavar='<SECONDS>', required=False, default=10, type=float, action='store', help='the seconds a coordinator waits for the shards. Default value: 10.')
+
+    group_replica = parser.add_argument_group('Replication arguments', 'Serving reads from a copy of the gallery of another pyfacesd')
+    group_replica.add_argument('--replica-of', metavar='<URL>', required=False, default=None, action='store', help='launch the server as a read-only replica of the gallery of this primary pyfacesd.')
+    group_replica.add_argument('--replica-interval', metavar='<SECONDS>', required=False, default=1, type=float, action='store', help='the seconds between polls of the change log of the primary. Default value: 1.')
+    group_replica.add_argument('--replica-collection', metavar='<NAME>', required=False, default=None, action='store', help="the collection replicated, both in the primary and in the replica. Default value: 'default'.")
+    group_replica.add_argument('--max-staleness', metavar='<SECONDS>', required=False, default=None, type=float, action='store', help='refuse reads once the replica has not been up to date for this long. Default value: never.')
+
     # About options
     group_about = parser.add_argument_group('About arguments', 'Showing additional information about this program.')
     group_about.add_argument('-h', '--help', action='help', help='shows this help and exists.')
@@ -251,18 +841,92 @@ def main(params=None):
     else:
         args = params
 
-    logging.basicConfig(format='[%(levelname)s] Pyfaces:  %(message)s', level="DEBUG")
+    logging.basicConfig(format='[%(levelname)s] Pyfaces:  %(message)s', level=args.log_level)
 
+    governor = configure_governor(args.cpu_budget, int(args.threads), args.native_threads)
+    logging.info(f"Running {governor.workers} workers with {governor.native_threads} native threads each on {governor.cpus} CPUs…")
+
+    limits, queue_sizes = default_limits(int(args.threads), governor.workers)
     try:
-        logging.info("Starting JSON-RPC server using waitress…")
-        serve(
-            application,
-            host=args.host,
-            port=args.port,
-            threads=args.threads
+        limits.update(parse_class_values(args.class_limits))
+        queue_sizes.update(parse_class_values(args.queue_sizes))
+    except ValueError as e:
+        logging.error(str(e))
+        return
+    SETTINGS["scheduler"] = RequestScheduler(
+        limits,
+        queue_sizes,
+        capacity=args.max_running or int(args.threads),
+        queue_timeout=args.queue_timeout
+    )
+    schedule_methods(SETTINGS["scheduler"])
+    logging.info("Scheduling up to " + ", ".join(f"{limits[name]} {name}" for name in limits) + " requests at once…")
+
+    if args.shards:
+        logging.info(f"Coordinating {len(args.shards)} shards…")
+        SETTINGS["coordinator"] = ShardCoordinator(args.shards, timeout=args.shard_timeout, request_threads=int(args.threads))
+    elif args.shard_count:
+        if args.shard_index is None or not 0 <= args.shard_index < args.shard_count:
+            logging.error(f"A valid --shard-index between 0 and {args.shard_count - 1} is required.")
+            return
+        logging.info(f"Serving shard {args.shard_index} of {args.shard_count}…")
+        SETTINGS["shard_index"] = args.shard_index
+        SETTINGS["shard_count"] = args.shard_count
+
+    if args.replica_of:
+        if args.shards or args.shard_count or args.watch:
+            logging.error("A replica cannot be sharded, coordinate shards or watch folders.")
+            return
+        logging.info(f"Following the primary '{args.replica_of}'…")
+        SETTINGS["replica"] = ReplicaFollower(
+            get_registry().get(args.replica_collection, create=True),
+            PrimaryClient(RPCClient(args.replica_of, timeout=60), args.replica_collection),
+            args.replica_of,
+            interval=args.replica_interval,
+            max_staleness=args.max_staleness
         )
+        threading.Thread(target=follow_primary, args=(SETTINGS["replica"],), daemon=True).start()
+
+    if args.watch:
+        if args.shards or args.shard_count:
+            logging.error("Folders cannot be watched by shards or coordinators.")
+            return
+        get_registry().get(args.watch_collection, create=True)
+        for folder in args.watch:
+            logging.info(f"Watching '{folder}'…")
+            threading.Thread(
+                target=watch_folder,
+                args=(folder, args.watch_interval, args.watch_collection),
+                daemon=True
+            ).start()
+
+    try:
+        if args.unix_socket:
+            # A socket left behind by a dead worker would make the bind fail
+            if os.path.exists(args.unix_socket):
+                os.remove(args.unix_socket)
+            logging.info("Starting JSON-RPC server using asyncio…")
+            logging.info(f"Serving on unix://{args.unix_socket}")
+            AsyncJSONRPCServer(dispatcher, threads=args.threads, idle_timeout=args.idle_timeout).serve_forever(
+                path=args.unix_socket
+            )
+        elif args.mode == "asyncio":
+            logging.info("Starting JSON-RPC server using asyncio…")
+            logging.info(f"Serving on http://{args.host}:{args.port}")
+            AsyncJSONRPCServer(dispatcher, threads=args.threads, idle_timeout=args.idle_timeout).serve_forever(
+                host=args.host,
+                port=args.port
+            )
+        else:
+            logging.info("Starting JSON-RPC server using waitress…")
+            serve(
+                application,
+                host=args.host,
+                port=args.port,
+                threads=args.threads
+            )
     except KeyboardInterrupt:
-        loggin.info("Manually stopped by the user.")
+        logging.info("Manually stopped by the user.")
     except OSError as e:
         logging.error(f"Something happened: '{e}'.")
     finally:
@@ -41,5 +41,10 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={
+        'governor': ['threadpoolctl'],
+        'video': ['opencv-python'],
+        'watch': ['inotify_simple'],
+    },
 )
 
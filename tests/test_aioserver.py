@@ -0,0 +1,139 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from jsonrpc import Dispatcher
+
+from pyfaces.aioserver import AsyncJSONRPCServer
+from pyfaces.core.rpc import RPCClient
+from pyfaces.core.rpc import decompress
+
+
+def request(method, request_id, **params):
+    """Build a raw HTTP request with a JSON-RPC call"""
+    body = json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}).encode()
+    return b"POST / HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+
+async def read_response(reader):
+    """Read a raw HTTP response and return its JSON body"""
+    headers = {}
+    await reader.readline()
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    return json.loads(await reader.readexactly(int(headers["content-length"])))
+
+
+class TestAsyncServer(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher()
+        self.dispatcher.add_method(lambda seconds: time.sleep(seconds) or seconds, name="sleep")
+        self.server = AsyncJSONRPCServer(self.dispatcher, threads=4)
+
+    def test_pipelining(self):
+        """Test that pipelined requests run concurrently and answer in order"""
+        async def run():
+            server = await self.server.start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+            start_time = time.perf_counter()
+            writer.write(b"".join(request("sleep", i, seconds=seconds) for i, seconds in enumerate([0.3, 0.2, 0.1])))
+            responses = [await read_response(reader) for _ in range(3)]
+            elapsed = time.perf_counter() - start_time
+
+            # The connection is still alive
+            writer.write(request("sleep", 3, seconds=0))
+            responses.append(await read_response(reader))
+
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return responses, elapsed
+
+        responses, elapsed = asyncio.run(run())
+        self.assertEqual([response["id"] for response in responses], [0, 1, 2, 3])
+        self.assertLess(elapsed, 0.55)
+
+    def test_slow_request(self):
+        """Test that a client sending the headers or the body too slowly is answered with 408"""
+        server = AsyncJSONRPCServer(self.dispatcher, threads=2, keep_alive_timeout=0.3)
+
+        async def run(partial):
+            listener = await server.start("127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(partial)
+            status = await asyncio.wait_for(reader.readline(), 5)
+            # The connection is closed afterwards
+            await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+            return status
+
+        for partial in [b"POST / HTTP/1.1\r\nHost: localhost\r\n", request("sleep", 0, seconds=0)[:-5]]:
+            status = asyncio.run(run(partial))
+            self.assertTrue(status.startswith(b"HTTP/1.1 408"), status)
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix domain sockets are not available")
+    def test_idle_timeout(self):
+        """Test that a worker on a Unix socket stops by itself when idle"""
+        server = AsyncJSONRPCServer(self.dispatcher, threads=2, idle_timeout=0.5)
+        path = os.path.join(tempfile.mkdtemp(), "worker.sock")
+        thread = threading.Thread(target=server.serve_forever, kwargs={"path": path})
+        thread.start()
+        while not os.path.exists(path):
+            time.sleep(0.01)
+
+        # A long request does not count as idle time
+        self.assertEqual(RPCClient(f"unix://{path}").call("sleep", seconds=0.8), 0.8)
+        self.assertTrue(thread.is_alive())
+
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(path))
+
+    def test_compression(self):
+        """Test that large responses are compressed only when the client accepts it"""
+        self.dispatcher.add_method(lambda size: "x" * size, name="text")
+        body = json.dumps({"jsonrpc": "2.0", "id": 0, "method": "text", "params": {"size": 10000}}).encode()
+
+        status, headers, plain = self.server.dispatch(body)
+        self.assertNotIn("Content-Encoding", headers)
+
+        status, headers, compressed = self.server.dispatch(body, accept_encoding="deflate;q=0.5, gzip")
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertLess(len(compressed), len(plain) / 10)
+        self.assertEqual(decompress(compressed, "gzip"), plain)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import argparse
+import os
+import tempfile
+import unittest
+
+from pyfaces.core.bulk import BulkImport
+from pyfaces.cli import manifest_part
+from pyfaces.core.bulk import manifest_slices
+
+
+class RecordingProcessor:
+    """Stands for a FaceProcessor recording the images extracted"""
+    def __init__(self, fail_after=None):
+        self.extracted = []
+        self.fail_after = fail_after
+
+    def extract_many(self, image_paths, batch_size=16, **kwargs):
+        if self.fail_after is not None and len(self.extracted) >= self.fail_after:
+            raise KeyboardInterrupt
+        for image_path in image_paths:
+            self.extracted.append(os.path.basename(image_path))
+            yield image_path, {"faces": [image_path]}
+
+
+class TestBulkImport(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.folder, "manifest.txt")
+        with open(self.manifest, "w") as output_file:
+            output_file.write("# Images\n")
+            output_file.write("\n".join(f"{i}.jpg" for i in range(10)))
+
+    def test_resume(self):
+        """Test that an interrupted import goes on from its checkpoint"""
+        crashing = RecordingProcessor(fail_after=5)
+        with self.assertRaises(KeyboardInterrupt):
+            for _ in BulkImport(crashing, self.manifest, chunk_size=3).run():
+                pass
+        self.assertEqual(len(crashing.extracted), 5)
+
+        resumed = RecordingProcessor()
+        reports = list(BulkImport(resumed, self.manifest, chunk_size=3).run())
+        checkpoint = BulkImport(resumed, self.manifest, chunk_size=3).load_checkpoint()
+
+        self.assertEqual(resumed.extracted, [f"{i}.jpg" for i in range(5, 10)])
+        self.assertEqual([report["first_index"] for report in reports], [6, 9])
+        self.assertEqual((checkpoint["images"], checkpoint["faces"], checkpoint["next_index"]), (10, 10, 11))
+
+    def test_slices(self):
+        """Test that slices cover the manifest once"""
+        extracted = []
+        for start, stop in manifest_slices(self.manifest, 3):
+            processor = RecordingProcessor()
+            list(BulkImport(processor, self.manifest, chunk_size=2, start=start, stop=stop).run())
+            extracted.extend(processor.extracted)
+        self.assertEqual(extracted, [f"{i}.jpg" for i in range(10)])
+
+    def test_parts(self):
+        """Test that only parts I/N with 1 <= I <= N are accepted"""
+        self.assertEqual(manifest_part("2/4"), (2, 4))
+        self.assertEqual(manifest_part("1/1"), (1, 1))
+        for value in ["0/4", "5/4", "-1/4", "1/0", "2", "a/b", "1/2/3"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                manifest_part(value)
+
+    def test_changed_manifest(self):
+        """Test that a checkpoint is not applied to a different manifest"""
+        list(BulkImport(RecordingProcessor(), self.manifest).run())
+        with open(self.manifest, "a") as output_file:
+            output_file.write("\n10.jpg")
+        with self.assertRaises(ValueError):
+            BulkImport(RecordingProcessor(), self.manifest).load_checkpoint()
+
+if __name__ == '__main__':
+    unittest.main()
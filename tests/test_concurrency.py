@@ -0,0 +1,76 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import concurrent.futures
+import json
+import unittest
+
+from pyfaces.core.processor import FaceProcessor
+
+
+class TestConcurrency(unittest.TestCase):
+    def setUp(self):
+        """A single processor shared by every thread like in pyfacesd"""
+        self.proc = FaceProcessor()
+        self.images = ["./res/hoodie.jpeg", "./res/two_people.jpg", "./res/twitter.png"]
+        for image_path in self.images:
+            self.proc.extract_faces(image_path)
+
+    def test_stress(self):
+        """Hammer extractions, guesses and deletions concurrently"""
+        def extract(i):
+            return self.proc.extract_faces(self.images[i % len(self.images)], force_recalculation=True)
+
+        def guess(i):
+            faces = sorted(self.proc.encodings)
+            if not faces:
+                # Every image has been deleted in the meantime
+                return None
+            try:
+                return self.proc.guess_face(faces[i % len(faces)])
+            except ValueError:
+                # The face has been deleted in the meantime
+                return None
+
+        def delete(i):
+            metadata = self.proc.extract_faces(self.images[i % len(self.images)])
+            try:
+                return self.proc.delete_analysis(metadata["copied_path"])
+            except FileNotFoundError:
+                # Already deleted by another thread
+                return None
+
+        jobs = [extract, guess, guess, delete]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(jobs[i % len(jobs)], i) for i in range(48)]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+        # Every file is still valid JSON and consistent with the memory
+        for image_path in self.images:
+            self.proc.extract_faces(image_path)
+        for file_path, attribute in [
+            (self.proc.config.encodings_file, self.proc.encodings),
+            (self.proc.config.metadata_file, self.proc.metadata),
+        ]:
+            with open(file_path) as input_file:
+                self.assertEqual(json.load(input_file).keys(), attribute.keys())
+
+if __name__ == '__main__':
+    unittest.main()
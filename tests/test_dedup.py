@@ -0,0 +1,61 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import io
+import random
+import unittest
+
+from PIL import Image
+
+from pyfaces.core.dedup import BKTree
+from pyfaces.core.dedup import dhash
+from pyfaces.core.dedup import hamming
+
+
+class TestDedup(unittest.TestCase):
+    def test_dhash(self):
+        """Test that recompressed and shifted copies keep a close hash"""
+        image = Image.open("./res/hoodie.jpeg").convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=40)
+        output.seek(0)
+        recompressed = Image.open(output)
+        shifted = image.crop((1, 1, image.width, image.height))
+
+        self.assertLessEqual(hamming(dhash(image), dhash(recompressed)), 6)
+        self.assertLessEqual(hamming(dhash(image), dhash(shifted)), 6)
+        self.assertGreater(hamming(dhash(image), dhash(Image.open("./res/two_people.jpg"))), 6)
+
+    def test_bk_tree(self):
+        """Test that the tree finds the same hashes as a linear scan"""
+        rng = random.Random(0)
+        hashes = [rng.getrandbits(64) for _ in range(2000)]
+        tree = BKTree()
+        for i, value in enumerate(hashes):
+            tree.add(value, i)
+
+        query = hashes[42] ^ 0b1011
+        self.assertEqual(
+            sorted(i for _, i in tree.search(query, 8)),
+            [i for i, value in enumerate(hashes) if hamming(value, query) <= 8]
+        )
+        self.assertEqual(tree.search(query, 8)[0], (3, 42))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import unittest
+
+from pyfaces.core.gallery import GalleryVersion
+
+
+class TestGalleryVersion(unittest.TestCase):
+    def test_changes_since(self):
+        """Test the faces changed between two generations"""
+        gallery = GalleryVersion()
+        first = gallery.bump(inserted=["a", "b"])
+        gallery.bump(inserted=["c"])
+        gallery.bump(deleted=["a"])
+
+        self.assertEqual(gallery.changes_since(first), ({"c"}, {"a"}))
+        self.assertEqual(gallery.changes_since(gallery.generation), (set(), set()))
+
+    def test_replay(self):
+        """Test that a replayed log keeps the generations of the original"""
+        primary = GalleryVersion()
+        first = primary.bump(inserted=["a", "b"])
+        primary.bump(deleted=["a"])
+
+        replica = GalleryVersion({"generation": first, "start": first})
+        replica.replay(primary.log_since(first), primary.generation)
+        self.assertEqual(replica.generation, primary.generation)
+        self.assertEqual(replica.changes_since(first), (set(), {"a"}))
+        self.assertIsNone(replica.log_since(first - 1))
+
+    def test_truncated_log(self):
+        """Test that generations out of the log are reported as unknown"""
+        gallery = GalleryVersion(max_changes=2)
+        first = gallery.bump(inserted=["a", "b"])
+        second = gallery.bump(inserted=["c", "d"])
+
+        self.assertIsNone(gallery.changes_since(first - 1))
+        self.assertEqual(gallery.changes_since(first), ({"c", "d"}, set()))
+
+        # The state survives a round trip through the gallery file
+        restored = GalleryVersion(gallery.to_dict(), max_changes=2)
+        self.assertEqual(restored.changes_since(second), (set(), set()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from pyfaces.core.governor import NATIVE_THREAD_VARIABLES
+from pyfaces.core.governor import ResourceGovernor
+from pyfaces.core.governor import limit_native_threads
+
+
+class TestResourceGovernor(unittest.TestCase):
+    def test_allocation(self):
+        """Test how the CPU budget is divided between the workers"""
+        governor = ResourceGovernor(cpus=64, request_threads=128, native_threads=4)
+        allocation = governor.allocation()
+
+        self.assertEqual((allocation["cpus"], allocation["workers"], allocation["native_threads"]), (64, 16, 4))
+        self.assertEqual(allocation["request_threads"], 128)
+        self.assertEqual(ResourceGovernor(cpus=2, native_threads=8).workers, 1)
+
+    def test_workers(self):
+        """Test that no more sections than workers run at once"""
+        governor = ResourceGovernor(cpus=2, native_threads=1)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def section():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+        threads = [threading.Thread(target=governor.run, args=(section,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(governor.allocation()["busy_workers"], 0)
+        governor.shutdown()
+
+    def test_nested_sections(self):
+        """Test that sections submitted from a worker run in it instead of waiting"""
+        governor = ResourceGovernor(cpus=1, native_threads=1)
+
+        def outer():
+            return [governor.run(threading.current_thread) for _ in range(3)], threading.current_thread()
+
+        inner, worker = governor.submit(outer).result(timeout=5)
+        self.assertEqual(inner, [worker] * 3)
+        self.assertNotEqual(worker, threading.current_thread())
+        governor.shutdown()
+
+    def test_native_limits_keep_user_values(self):
+        """Test that the limits set by the user in the environment are kept"""
+        saved = {name: os.environ.get(name) for name in NATIVE_THREAD_VARIABLES}
+        try:
+            os.environ["OMP_NUM_THREADS"] = "3"
+            limit_native_threads(1)
+            self.assertEqual(os.environ["OMP_NUM_THREADS"], "3")
+            self.assertEqual(os.environ["OPENBLAS_NUM_THREADS"], saved["OPENBLAS_NUM_THREADS"] or "1")
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def test_cli_loads_numpy_lazily(self):
+        """Test that the CLI can limit the native threads before NumPy is loaded"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get("PYTHONPATH", "")]))
+        loaded = subprocess.run(
+            [sys.executable, "-c", "import sys, pyfaces.cli; print('numpy' in sys.modules)"],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        self.assertEqual(loaded, "False")
+
+if __name__ == '__main__':
+    unittest.main()
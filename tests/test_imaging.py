@@ -0,0 +1,75 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import io
+import os
+import unittest
+
+import face_recognition
+import numpy as np
+from PIL import Image
+
+from pyfaces.core.imaging import hash_pixels
+from pyfaces.core.imaging import load_image
+from pyfaces.core.imaging import scale_locations
+
+IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "res", "two_people.jpg")
+
+
+class TestImaging(unittest.TestCase):
+    def test_hash_pixels(self):
+        """Test that the hashes of images and crops did not change"""
+        image_array = face_recognition.load_image_file(IMAGE_PATH)
+        crop = image_array[10:200, 30:300]
+
+        self.assertEqual(hash_pixels(image_array), hashlib.md5(Image.fromarray(image_array).tobytes()).hexdigest())
+        self.assertEqual(hash_pixels(crop), hashlib.md5(Image.fromarray(crop).tobytes()).hexdigest())
+        self.assertEqual(len(hash_pixels(crop, "blake2b")), 32)
+        self.assertNotEqual(hash_pixels(crop, "blake2b"), hash_pixels(crop))
+        with self.assertRaises(ValueError):
+            hash_pixels(crop, "sha0")
+
+    def test_load_image(self):
+        """Test that large images are reduced to look for faces"""
+        image_array, detection_array, scale = load_image(IMAGE_PATH)
+        self.assertTrue(np.array_equal(image_array, face_recognition.load_image_file(IMAGE_PATH)))
+        self.assertIs(detection_array, image_array)
+        self.assertEqual(scale, 1.0)
+
+        # JPEG files are decoded in draft mode, never below the size asked
+        with open(IMAGE_PATH, "rb") as image_file:
+            image_array, detection_array, scale = load_image(io.BytesIO(image_file.read()), 400)
+        self.assertEqual(image_array.shape, (1440, 1920, 3))
+        self.assertEqual(detection_array.shape, (360, 480, 3))
+        self.assertEqual(scale, 4.0)
+
+        # Other formats are reduced from the full image
+        png = io.BytesIO()
+        Image.fromarray(image_array).save(png, format="PNG")
+        png.seek(0)
+        self.assertEqual(load_image(png, 600)[1].shape, (480, 640, 3))
+
+    def test_scale_locations(self):
+        """Test that boxes are mapped to the full image and clipped"""
+        self.assertEqual(scale_locations([(1, 30, 20, 2)], 1, (40, 40)), [(1, 30, 20, 2)])
+        self.assertEqual(scale_locations([(1, 30, 20, 2)], 2.0, (40, 50, 3)), [(2, 50, 40, 4)])
+
+if __name__ == '__main__':
+    unittest.main()
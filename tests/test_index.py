@@ -0,0 +1,74 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import unittest
+
+import numpy as np
+
+from pyfaces.core.index import EncodingIndex
+
+
+class TestEncodingIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.encodings = {f"face-{i:03d}": rng.rand(128) for i in range(100)}
+        self.index = EncodingIndex(max_tombstones=0.5)
+        for face_path, encoding in self.encodings.items():
+            self.index.add(face_path, encoding)
+
+    def brute_force(self, query, faces):
+        return sorted(faces, key=lambda face_path: (np.linalg.norm(self.encodings[face_path] - query), face_path))
+
+    def test_tombstones(self):
+        """Test that removed faces are skipped before and after compacting"""
+        query = np.random.RandomState(1).rand(128)
+        removed = [f"face-{i:03d}" for i in range(0, 100, 4)]
+        self.index.remove(removed)
+        alive = [face_path for face_path in self.encodings if face_path not in removed]
+
+        self.assertEqual(self.index.tombstones, len(removed))
+        self.assertEqual([face for face, _ in self.index.search(query)], self.brute_force(query, alive))
+
+        self.index.compact()
+        self.assertEqual(self.index.tombstones, 0)
+        self.assertEqual([face for face, _ in self.index.search(query, top_k=5)], self.brute_force(query, alive)[:5])
+
+    def test_replace_and_exclude(self):
+        """Test that replaced encodings are used and excluded faces skipped"""
+        self.index.add("face-007", np.zeros(128))
+        results = self.index.search(np.zeros(128), top_k=2, exclude="face-001")
+
+        self.assertEqual(results[0], ("face-007", 0.0))
+        self.assertNotIn("face-001", [face for face, _ in self.index.search(np.zeros(128), exclude="face-001")])
+        self.assertEqual(len(self.index), 100)
+    def test_snapshot(self):
+        """Test that a snapshot does not see the changes made after it"""
+        query = np.random.RandomState(1).rand(128)
+        snapshot = self.index.snapshot()
+        expected = snapshot.search(query)
+
+        self.index.add("face-000", query)
+        self.index.add("face-new", query)
+        self.index.remove([f"face-{i:03d}" for i in range(1, 100, 2)])
+
+        self.assertEqual(snapshot.search(query), expected)
+        self.assertEqual([face for face, _ in self.index.search(query, top_k=2)], ["face-000", "face-new"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from pyfaces.core.locking import FileLock
+from pyfaces.core.locking import ReadWriteLock
+from pyfaces.core.locking import atomic_write_json
+
+
+def increment_counter(lock_path, counter_path, times):
+    """Increment a counter stored in a JSON file using read-modify-write"""
+    lock = FileLock(lock_path)
+    for _ in range(times):
+        with lock:
+            with open(counter_path) as input_file:
+                data = json.load(input_file)
+            data["counter"] += 1
+            atomic_write_json(counter_path, data)
+
+
+class TestLocking(unittest.TestCase):
+    def test_concurrent_readers(self):
+        """Test that several readers can hold the lock at once"""
+        lock = ReadWriteLock()
+        barrier = threading.Barrier(4, timeout=5)
+
+        def reader():
+            with lock.read():
+                # It would time out if readers were exclusive
+                barrier.wait()
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(barrier.broken)
+
+    def test_exclusive_writers(self):
+        """Test that writers never overlap with readers or writers"""
+        lock = ReadWriteLock()
+        state = {"readers": 0, "writers": 0, "errors": 0}
+        state_lock = threading.Lock()
+
+        def worker(writer):
+            for _ in range(200):
+                with (lock.write() if writer else lock.read()):
+                    with state_lock:
+                        state["writers" if writer else "readers"] += 1
+                        if state["writers"] > 1 or (state["writers"] and state["readers"]):
+                            state["errors"] += 1
+                    time.sleep(0)
+                    with state_lock:
+                        state["writers" if writer else "readers"] -= 1
+
+        threads = [threading.Thread(target=worker, args=(i % 2 == 0,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(state["errors"], 0)
+
+    def test_file_lock_between_processes(self):
+        """Test that no write is lost when several processes share a file"""
+        with tempfile.TemporaryDirectory() as folder:
+            lock_path = os.path.join(folder, ".lock")
+            counter_path = os.path.join(folder, "counter.json")
+            atomic_write_json(counter_path, {"counter": 0})
+
+            processes = [
+                multiprocessing.Process(target=increment_counter, args=(lock_path, counter_path, 50))
+                for _ in range(4)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+            with open(counter_path) as input_file:
+                self.assertEqual(json.load(input_file)["counter"], 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pyfaces.core.matrix import compare_matrices
+from pyfaces.core.matrix import write_ndjson
+from pyfaces.core.matrix import write_npz
+
+
+class TestCompareMatrices(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.gallery = rng.rand(500, 128).astype(np.float32) * 0.1
+        self.queries = self.gallery[:70]
+        self.excluded = np.arange(70)
+        self.distances = np.linalg.norm(self.queries[:, None, :].astype(np.float64) - self.gallery[None, :, :], axis=2)
+        self.distances[np.arange(70), self.excluded] = np.inf
+
+    def test_top_k(self):
+        """Test that the blocked top-k matches a brute force search"""
+        results = list(compare_matrices(self.queries, self.gallery, top_k=5, excluded=self.excluded, block_size=64, workers=3))
+
+        self.assertEqual([row for row, _, _ in results], list(range(70)))
+        for row, columns, distances in results:
+            self.assertEqual(list(columns), list(np.argsort(self.distances[row], kind="stable")[:5]))
+            np.testing.assert_allclose(distances, self.distances[row][columns], atol=1e-4)
+
+    def test_threshold(self):
+        """Test that only the pairs under the threshold are kept"""
+        threshold = np.percentile(self.distances[np.isfinite(self.distances)], 1)
+        results = list(compare_matrices(self.queries, self.gallery, threshold=threshold, excluded=self.excluded, block_size=100))
+
+        for row, columns, distances in results:
+            self.assertEqual(set(columns), set(np.flatnonzero(self.distances[row] <= threshold)))
+            self.assertEqual(list(distances), sorted(distances))
+        with self.assertRaises(ValueError):
+            next(compare_matrices(self.queries, self.gallery))
+
+    def test_writers(self):
+        """Test that matches are written as NDJSON lines and as a sparse npz"""
+        paths = [f"face-{i}" for i in range(500)]
+        output_file = io.StringIO()
+        pairs = write_ndjson(compare_matrices(self.queries, self.gallery, top_k=2, excluded=self.excluded), paths, paths, output_file)
+        lines = [json.loads(line) for line in output_file.getvalue().splitlines()]
+
+        self.assertEqual(pairs, 140)
+        self.assertEqual(len(lines), 70)
+        self.assertEqual(lines[0]["face_path"], "face-0")
+        self.assertNotIn("face-0", [match["known_face"] for match in lines[0]["comparisons"]])
+
+        output_path = os.path.join(tempfile.mkdtemp(), "matches.npz")
+        self.assertEqual(write_npz(compare_matrices(self.queries, self.gallery, top_k=2, excluded=self.excluded), paths, paths, output_path), 140)
+        with np.load(output_path) as data:
+            self.assertEqual(data["rows"][:2].tolist(), [0, 0])
+            self.assertEqual(data["gallery_paths"][data["columns"][0]], lines[0]["comparisons"][0]["known_face"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,8 +17,14 @@
 #
 ################################################################################
 
+import json
 import os
+import tempfile
 import unittest
+from unittest import mock
+
+import face_recognition
+from PIL import Image
 
 from pyfaces.core.processor import FaceProcessor
 
@@ -61,5 +67,185 @@ class TestFaceProcessor(unittest.TestCase):
             "101ed2b1a1e882f2f2512eee9937c1ad.bmp"
         )
 
+    def test_face_filters(self):
+        """Test that filtered faces are skipped and counted"""
+        result = self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True, max_faces=1)
+
+        self.assertEqual(len(result["faces"]), 1)
+        self.assertEqual(result["skipped_faces"], {"low_quality": 0, "over_limit": 2, "too_small": 0})
+
+    def test_face_best_shots(self):
+        """Test that only the faces of best quality are kept"""
+        result = self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True, best_shots=1)
+        scores = [self.proc.encodings[face_path]["quality"]["score"] for face_path in result["faces"]]
+
+        self.assertEqual(len(scores), 1)
+        self.assertEqual(result["skipped_faces"]["low_quality"], 2)
+        self.assertGreater(scores[0], 0)
+
+    def test_face_roi(self):
+        """Test that faces are found inside a region of interest"""
+        result = self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True, roi=[0, 1000, 500, 100])
+        positions = [self.proc.encodings[face_path]["position"] for face_path in result["faces"]]
+
+        self.assertEqual(positions, [{"top": 315, "bottom": 445, "left": 862, "right": 992}])
+        self.assertEqual(result["skipped_faces"], {"low_quality": 0, "over_limit": 0, "too_small": 0})
+
+        # Without filters the faces keep the order of the detector
+        image_array = face_recognition.load_image_file("./res/two_people.jpg")
+        result = self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True)
+        self.assertEqual(
+            [self.proc.encodings[face_path]["position"]["top"] for face_path in result["faces"]],
+            [max(top - 20, 0) for top, _, _, _ in face_recognition.face_locations(image_array)]
+        )
+
+    def test_detection_size(self):
+        """Test that faces looked for in a scaled down image are cut from the full one"""
+        image_array = face_recognition.load_image_file("./res/two_people.jpg")
+        expected = self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True)["faces"]
+        positions = [self.proc.encodings[face_path]["position"] for face_path in expected]
+
+        # Only set in memory, so the configuration file of the user is not touched
+        get_attribute = self.proc.config.get_attribute
+        patcher = mock.patch.object(
+            self.proc.config,
+            "get_attribute",
+            side_effect=lambda name: "1280" if name == "detection_size" else get_attribute(name)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        result = self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True)
+
+        # Crops are named after their pixels, so the same names mean the same crops
+        self.assertEqual(result["faces"], expected)
+        self.assertEqual([self.proc.encodings[face_path]["position"] for face_path in result["faces"]], positions)
+        for face_path, position in zip(result["faces"], positions):
+            with Image.open(face_path) as crop:
+                self.assertEqual(crop.size, (position["right"] - position["left"], position["bottom"] - position["top"]))
+                self.assertEqual(
+                    crop.tobytes(),
+                    Image.fromarray(image_array[position["top"]:position["bottom"], position["left"]:position["right"]]).tobytes()
+                )
+
+        # Regions are given in the coordinates of the full image
+        result = self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True, roi=[0, 1000, 500, 100])
+        self.assertEqual(result["faces"], [face_path for face_path, position in zip(expected, positions) if position["top"] < 500])
+
+        # And checked against it, as given
+        with self.assertRaisesRegex(ValueError, r"\[1500, 2500, 1600, 2000\] is outside the image \(1920x1440\)"):
+            self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True, roi=[1500, 2500, 1600, 2000])
+
+    def test_near_duplicate_linking(self):
+        """Test that a recompressed copy is linked to the known face"""
+        known = self.proc.extract_faces("./res/hoodie.jpeg")["faces"]
+        copy_path = os.path.join(tempfile.mkdtemp(), "hoodie.jpg")
+        Image.open("./res/hoodie.jpeg").convert("RGB").save(copy_path, quality=60)
+        result = self.proc.extract_faces(copy_path, force_recalculation=True)
+
+        self.assertEqual(result["faces"], known)
+        self.assertIn(
+            copy_path,
+            [sighting["original_image_path"] for sighting in self.proc.encodings[known[0]]["sightings"]]
+        )
+
+    def test_search_image(self):
+        """Test that searching an image finds the known face and writes nothing"""
+        known = self.proc.extract_faces("./res/hoodie.jpeg")["faces"]
+        data_folder = self.proc.config.get_attribute("data_folder")
+        before = {
+            os.path.join(folder, name): os.stat(os.path.join(folder, name)).st_mtime_ns
+            for folder, _, names in os.walk(data_folder) for name in names
+        }
+        with open("./res/hoodie.jpeg", "rb") as image_file:
+            result = self.proc.search_image(image_data=image_file.read(), top_k=1)
+        after = {
+            os.path.join(folder, name): os.stat(os.path.join(folder, name)).st_mtime_ns
+            for folder, _, names in os.walk(data_folder) for name in names
+        }
+
+        self.assertEqual(len(result["faces"]), 1)
+        self.assertEqual(result["faces"][0]["comparisons"][0]["known_face"], known[0])
+        self.assertLess(result["faces"][0]["comparisons"][0]["similarity"], 0.1)
+        self.assertEqual(before, after)
+
+    def test_bulk_deletion(self):
+        """Test that deleted images leave no faces, comparisons nor guesses behind"""
+        images = [self.proc.extract_faces(image_path) for image_path in ["./res/hoodie.jpeg", "./res/two_people.jpg"]]
+        kept_face = images[0]["faces"][0]
+        self.proc.guess_face(kept_face)
+
+        result = self.proc.delete_many(source_paths=["./res/two_people.jpg"])
+
+        self.assertEqual(sorted(result["faces"]), sorted(images[1]["faces"]))
+        self.assertNotIn(images[1]["copied_path"], self.proc.metadata)
+        self.assertFalse(set(result["faces"]) & set(self.proc.encodings))
+        self.assertFalse(set(result["faces"]) & set(self.proc.comparisons.get(kept_face, {})))
+        self.assertEqual(
+            [comparison["known_face"] for comparison in self.proc.guess_face(kept_face)["comparisons"]],
+            [comparison["known_face"] for comparison in self.proc.guess_encoding(self.proc.encodings[kept_face]["encodings"][0], exclude=kept_face)["comparisons"]]
+        )
+
+    def test_store_updated_in_place(self):
+        """Test that writes change the loaded FaceStore instead of building a new one"""
+        self.proc.extract_faces("./res/hoodie.jpeg")
+        store = self.proc.encodings
+        self.proc.extract_faces("./res/two_people.jpg", force_recalculation=True)
+        self.proc.delete_many(source_paths=["./res/hoodie.jpeg"])
+
+        self.assertIs(self.proc.encodings, store)
+        with open(self.proc.config.encodings_file) as input_file:
+            encodings = json.load(input_file)
+        self.assertEqual(set(self.proc.encodings), set(encodings))
+        for face_path, value in encodings.items():
+            self.assertEqual(self.proc.encodings[face_path]["position"], value["position"])
+
+    def test_face_many_extraction(self):
+        """Test that the pipeline finds the same faces as single extractions"""
+        images = ["./res/hoodie.jpeg", "./res/two_people.jpg"]
+        results = dict(self.proc.extract_many(images, batch_size=1))
+
+        for image_path in images:
+            self.assertEqual(
+                sorted(results[image_path]["faces"]),
+                sorted(self.proc.extract_faces(image_path)["faces"])
+            )
+
+    def test_guess_cache_refresh(self):
+        """Test that cached guesses are refreshed with the faces added later"""
+        face_path = self.proc.extract_faces("./res/hoodie.jpeg")["faces"][0]
+        self.proc.guess_face(face_path)
+        self.proc.extract_faces("./res/two_people.jpg")
+
+        self.assertEqual(
+            self.proc.guess_face(face_path),
+            self.proc.guess_face(face_path, force_recalculation=True)
+        )
+
+    def test_guess_cache_log(self):
+        """Test that guesses are appended to the cache with their best results only"""
+        faces = self.proc.extract_faces("./res/two_people.jpg")["faces"]
+        self.proc.guess_cache_size = 1
+        self.proc.guess_face(faces[0])
+
+        self.assertEqual(len(self.proc.guess_cache[faces[0]]["comparisons"]), 1)
+        with open(self.proc.config.guess_log_file) as input_file:
+            self.assertIn(faces[0], json.loads(input_file.readlines()[-1]))
+        self.assertEqual(FaceProcessor().guess_cache[faces[0]], self.proc.guess_cache[faces[0]])
+        self.assertEqual(
+            self.proc.guess_face(faces[0], top_k=1),
+            self.proc.guess_face(faces[0], top_k=1, force_recalculation=True)
+        )
+
+    def test_guess_cache_default(self):
+        """Test that guesses without top_k are served from the cache while the gallery fits in it"""
+        faces = self.proc.extract_faces("./res/two_people.jpg")["faces"]
+        self.proc.guess_cache_size = len(self.proc.encodings)
+        expected = self.proc.guess_face(faces[0])
+
+        self.assertIsNone(self.proc.guess_cache[faces[0]]["top_k"])
+        with mock.patch.object(self.proc, "_score", wraps=self.proc._score) as score:
+            self.assertEqual(self.proc.guess_face(faces[0]), expected)
+        self.assertEqual([face for call in score.call_args_list for face in call.args[1]], [])
+
 if __name__ == '__main__':
     unittest.main()
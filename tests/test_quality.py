@@ -0,0 +1,57 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import unittest
+
+import numpy as np
+
+from pyfaces.core.quality import group_identities
+from pyfaces.core.quality import laplacian_variance
+from pyfaces.core.quality import pose_score
+
+
+class TestQuality(unittest.TestCase):
+    def test_sharpness(self):
+        """Test that blurring an image lowers its sharpness"""
+        image = np.random.RandomState(0).randint(0, 255, (64, 64)).astype(np.float32)
+        blurred = (image[:-1, :-1] + image[1:, :-1] + image[:-1, 1:] + image[1:, 1:]) / 4
+
+        self.assertGreater(laplacian_variance(image), laplacian_variance(blurred))
+        self.assertEqual(laplacian_variance(np.full((64, 64, 3), 200)), 0)
+
+    def test_pose(self):
+        """Test that frontal faces score higher than turned ones"""
+        frontal = {"left_eye": [(30, 40)], "right_eye": [(70, 40)], "nose_tip": [(50, 60)]}
+        turned = {"left_eye": [(30, 40)], "right_eye": [(70, 40)], "nose_tip": [(62, 60)]}
+
+        self.assertEqual(pose_score(frontal), 1)
+        self.assertLess(pose_score(turned), pose_score(frontal))
+        self.assertEqual(pose_score({}), 0.5)
+
+    def test_group_identities(self):
+        """Test that faces of the same person are grouped best first"""
+        faces = [
+            ("a-blurry", [0.0, 0.1], 0.2),
+            ("b", [5.0, 5.0], 0.9),
+            ("a-sharp", [0.0, 0.0], 0.8),
+        ]
+        self.assertEqual(group_identities(faces, tolerance=0.6), [["b"], ["a-sharp", "a-blurry"]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import unittest
+
+import numpy as np
+
+from pyfaces.core.regions import clip_region
+from pyfaces.core.regions import crop_region
+from pyfaces.core.regions import select_faces
+from pyfaces.core.regions import shift_locations
+
+
+class TestRegions(unittest.TestCase):
+    def test_crop_region(self):
+        """Test that regions are clipped and located in the image"""
+        image = np.zeros((100, 200, 3), dtype=np.uint8)
+        region, offset = crop_region(image, (10, 250, 60, 50))
+
+        self.assertEqual(region.shape, (50, 150, 3))
+        self.assertTrue(region.flags.c_contiguous)
+        self.assertEqual(offset, (10, 50))
+        self.assertEqual(shift_locations([(0, 20, 10, 5)], offset), [(10, 70, 20, 55)])
+        with self.assertRaises(ValueError):
+            crop_region(image, (150, 10, 200, 0))
+
+    def test_clip_region(self):
+        """Test that regions are clipped to the image without cutting it"""
+        self.assertEqual(clip_region((-5, 250, 60.7, 50), (100, 200, 3)), (0, 200, 60, 50))
+        with self.assertRaisesRegex(ValueError, r"\[150, 10, 200, 0\] is outside the image \(200x100\)"):
+            clip_region((150, 10, 200, 0), (100, 200, 3))
+
+    def test_select_faces(self):
+        """Test that small faces are dropped and the largest ones kept"""
+        locations = [(0, 10, 10, 0), (0, 50, 50, 0), (0, 100, 100, 0), (0, 40, 30, 0)]
+        kept, skipped = select_faces(locations, min_face_size=20, max_faces=2)
+
+        self.assertEqual(kept, [(0, 100, 100, 0), (0, 50, 50, 0)])
+        self.assertEqual(skipped, {"over_limit": 1, "too_small": 1})
+        # Without a limit the faces keep the order they were found in
+        self.assertEqual(select_faces(locations)[0], locations)
+
+if __name__ == '__main__':
+    unittest.main()
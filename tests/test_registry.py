@@ -0,0 +1,113 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import json
+import os
+import shutil
+import unittest
+
+from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.registry import CollectionRegistry
+
+
+class TestCollectionRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = CollectionRegistry()
+        self.names = ["test-registry-a", "test-registry-b"]
+        self.faces = {}
+        for offset, name in enumerate(self.names):
+            config = ConfigManager(name)
+            encodings = {}
+            for i in range(3):
+                face_path = os.path.join(config.faces_folder, f"{name}-{i}.bmp")
+                encodings[face_path] = {
+                    "copied_md5": f"{i:032x}",
+                    "copied_original_file": os.path.join(config.sources_folder, f"{i}.jpg"),
+                    "face_path": face_path,
+                    "original_image_path": f"/photos/{i}.jpg",
+                    "encodings": [[offset + i / 10] * 128]
+                }
+            with open(config.encodings_file, "w") as output_file:
+                json.dump(encodings, output_file)
+            self.faces[name] = sorted(encodings)
+
+    def tearDown(self):
+        for name in self.names:
+            shutil.rmtree(ConfigManager().collection_folder(name), ignore_errors=True)
+
+    def test_collections_are_independent(self):
+        """Test that each collection only searches its own faces"""
+        self.assertEqual(ConfigManager().list_collections()[0], "default")
+        self.assertTrue(set(self.names) <= set(self.registry.names()))
+
+        proc = self.registry.get(self.names[0])
+        result = proc.guess_encoding([0] * 128)
+        self.assertEqual([c["known_face"] for c in result["comparisons"]], self.faces[self.names[0]])
+        self.assertIsNot(proc, self.registry.get(self.names[1]))
+        self.assertIs(proc, self.registry.get(self.names[0]))
+
+    def test_guess_across(self):
+        """Test that several collections are searched at once and merged"""
+        face_path = self.faces[self.names[0]][2]
+        result = self.registry.guess_across(face_path, self.names, self.names[0], top_k=3)
+
+        self.assertEqual(result["collections"], {self.names[0]: 2, self.names[1]: 3})
+        self.assertEqual(
+            [(c["collection"], c["known_face"]) for c in result["comparisons"]],
+            [(self.names[0], self.faces[self.names[0]][1]), (self.names[0], self.faces[self.names[0]][0]), (self.names[1], self.faces[self.names[1]][0])]
+        )
+        with self.assertRaises(ValueError):
+            self.registry.guess_across(face_path, ["test-registry-missing"], self.names[0])
+
+    def test_compare_sets(self):
+        """Test that a whole collection is compared with another one"""
+        result = self.registry.compare_sets(
+            {"collection": self.names[0]},
+            {"collection": self.names[1], "face_paths": self.faces[self.names[1]][:2]},
+            top_k=1
+        )
+
+        self.assertEqual((result["queries"], result["faces"], result["pairs"]), (3, 2, 3))
+        self.assertEqual(
+            [matches[0]["known_face"] for matches in result["matches"].values()],
+            [self.faces[self.names[1]][0]] * 3
+        )
+
+    def test_unknown_collections(self):
+        """Test that collections are only created when asked for"""
+        name = "test-registry-new"
+        self.names.append(name)
+        with self.assertRaises(ValueError):
+            self.registry.get(name)
+        self.assertNotIn(name, self.registry.names())
+
+        self.registry.get(name, create=True)
+        self.assertIn(name, self.registry.names())
+        self.assertIs(self.registry.get(name), self.registry.get(name, create=True))
+
+    def test_invalid_names(self):
+        """Test that collection names cannot escape the data folder"""
+        for name in ["../outside", "a/b", ".hidden", ""]:
+            if name:
+                with self.assertRaises(ValueError):
+                    ConfigManager(name)
+        self.assertEqual(ConfigManager("").collection, "default")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import shutil
+import time
+import unittest
+
+from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.processor import FaceProcessor
+from pyfaces.core.replication import ReplicaFollower
+
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        self.names = ["test-replication-primary", "test-replication-replica"]
+        self.primary = FaceProcessor(collection=self.names[0])
+        self.replica = FaceProcessor(collection=self.names[1])
+        self.follower = ReplicaFollower(self.replica, self.primary, "local", interval=0, page_size=2)
+        self.insert(range(5))
+
+    def tearDown(self):
+        for name in self.names:
+            shutil.rmtree(ConfigManager().collection_folder(name), ignore_errors=True)
+
+    def insert(self, indexes):
+        config = self.primary.config
+        encodings = {}
+        metadata = {}
+        for i in indexes:
+            source = os.path.join(config.sources_folder, f"{i}.jpg")
+            face_path = os.path.join(config.faces_folder, f"{i:032x}.bmp")
+            encodings[face_path] = {
+                "copied_md5": f"{i:032x}",
+                "copied_original_file": source,
+                "face_path": face_path,
+                "original_image_path": f"/photos/{i}.jpg",
+                "encodings": [[i / 8] * 128]
+            }
+            metadata[source] = {"copied_path": source, "faces": [face_path], "original_path": f"/photos/{i}.jpg"}
+        self.primary._commit(encodings, metadata)
+
+    def assertReplicated(self):
+        self.assertEqual(sorted(self.replica.encodings), sorted(self.primary.encodings))
+        self.assertEqual(self.replica.metadata, self.primary.metadata)
+        self.assertEqual(self.replica.gallery.generation, self.primary.gallery.generation)
+        for face_path in self.primary.encodings:
+            self.assertEqual(self.replica.get_face(face_path), self.primary.get_face(face_path))
+
+    def test_bootstrap_and_tail(self):
+        """Test that a replica follows the insertions and deletions of its primary"""
+        report = self.follower.poll()
+        self.assertEqual(report["bootstrapped"], 5)
+        self.assertReplicated()
+
+        face_path = sorted(self.primary.encodings)[0]
+        guess = self.replica.guess_face(face_path, top_k=2)
+
+        self.insert(range(5, 8))
+        self.primary.delete_many(source_paths=["/photos/1.jpg", "/photos/6.jpg"])
+        report = self.follower.poll()
+        self.assertEqual((report["bootstrapped"], report["inserted"], report["deleted"]), (None, 3, 2))
+        self.assertReplicated()
+
+        # Guesses cached by the replica are refreshed with the changes replicated
+        self.assertEqual(self.replica.guess_face(face_path, top_k=2), self.primary.guess_face(face_path, top_k=2))
+        self.assertNotEqual(self.replica.guess_face(face_path, top_k=2), guess)
+        self.assertEqual(
+            self.replica.guess_encoding([0.5] * 128, top_k=3),
+            self.primary.guess_encoding([0.5] * 128, top_k=3)
+        )
+
+    def test_read_only_and_staleness(self):
+        """Test that replicas refuse writes and reads once too stale"""
+        with self.assertRaises(ValueError):
+            self.follower.check_fresh()
+        self.follower.poll()
+        self.follower.check_fresh()
+
+        with self.assertRaises(ValueError):
+            self.replica.delete_many(source_paths=["/photos/1.jpg"])
+        # The files of the primary are not replicated
+        with self.assertRaises(ValueError):
+            self.replica.get_image(self.replica.encodings[sorted(self.replica.encodings)[0]]["face_path"])
+
+        self.follower.max_staleness = 5
+        self.follower.synced_at = time.time() - 10
+        with self.assertRaises(ValueError):
+            self.follower.check_fresh()
+        self.assertGreater(self.follower.status()["staleness"], 5)
+
+    def test_reset(self):
+        """Test that a replica takes a new snapshot when the log is too short"""
+        self.follower.poll()
+        self.primary.delete_many(source_paths=["/photos/0.jpg"])
+        self.follower.generation = -1
+        report = self.follower.poll()
+
+        self.assertEqual(report["bootstrapped"], 4)
+        self.assertReplicated()
+
+if __name__ == '__main__':
+    unittest.main()
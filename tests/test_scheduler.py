@@ -0,0 +1,141 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import threading
+import time
+import unittest
+
+from pyfaces.core.scheduler import Overloaded
+from pyfaces.core.scheduler import RequestScheduler
+from pyfaces.core.scheduler import default_limits
+from pyfaces.core.scheduler import parse_class_values
+
+
+def start(scheduler, priority_class, release, order=None):
+    """Run a request that holds its slot until release is set"""
+    def request():
+        try:
+            with scheduler.admit(priority_class):
+                if order is not None:
+                    order.append(priority_class)
+                release.wait()
+        except Overloaded:
+            pass
+    thread = threading.Thread(target=request)
+    thread.start()
+    return thread
+
+
+def wait_for(condition, timeout=5):
+    """Wait until a condition on the scheduler holds"""
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def test_bounded_queue(self):
+        """Test that a saturated class refuses new requests while others still run"""
+        scheduler = RequestScheduler(
+            {"interactive": 2, "bulk": 1, "maintenance": 1},
+            {"interactive": 2, "bulk": 1, "maintenance": 0},
+            queue_timeout=5
+        )
+        release = threading.Event()
+        threads = [start(scheduler, "bulk", release) for _ in range(2)]
+        wait_for(lambda: scheduler.stats()["classes"]["bulk"]["waiting"] == 1)
+
+        with self.assertRaises(Overloaded) as context:
+            with scheduler.admit("bulk"):
+                pass
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+
+        # Searches are not stuck behind the ingestion
+        with scheduler.admit("interactive"):
+            pass
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        stats = scheduler.stats()["classes"]
+        self.assertEqual((stats["bulk"]["admitted"], stats["bulk"]["rejected"]), (2, 1))
+        self.assertIsNotNone(stats["interactive"]["latency_p99"])
+
+    def test_priority(self):
+        """Test that a freed slot goes to the highest class waiting"""
+        scheduler = RequestScheduler(
+            {"interactive": 1, "bulk": 1, "maintenance": 1},
+            {"interactive": 1, "bulk": 1, "maintenance": 1},
+            capacity=1
+        )
+        first, rest = threading.Event(), threading.Event()
+        order = []
+        threads = [start(scheduler, "maintenance", first)]
+        wait_for(lambda: scheduler.stats()["running"] == 1)
+        threads.append(start(scheduler, "bulk", rest, order))
+        wait_for(lambda: scheduler.stats()["classes"]["bulk"]["waiting"] == 1)
+        threads.append(start(scheduler, "interactive", rest, order))
+        wait_for(lambda: scheduler.stats()["classes"]["interactive"]["waiting"] == 1)
+
+        first.set()
+        wait_for(lambda: order)
+        rest.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["interactive", "bulk"])
+
+    def test_queue_timeout(self):
+        """Test that requests waiting for too long are refused"""
+        scheduler = RequestScheduler(
+            {"interactive": 1, "bulk": 1, "maintenance": 1},
+            {"interactive": 1, "bulk": 1, "maintenance": 1},
+            queue_timeout=0.1
+        )
+        release = threading.Event()
+        thread = start(scheduler, "bulk", release)
+        wait_for(lambda: scheduler.stats()["running"] == 1)
+        with self.assertRaises(Overloaded):
+            with scheduler.admit("bulk"):
+                pass
+        release.set()
+        thread.join()
+        self.assertEqual(scheduler.stats()["classes"]["bulk"]["expired"], 1)
+
+    def test_replication_polls(self):
+        """Test that several replicas polling at once are not refused with the default limits"""
+        scheduler = RequestScheduler(*default_limits(4, 2), queue_timeout=5)
+        methods = ["replication_changes", "replication_changes", "replication_snapshot", "replication_snapshot"]
+        release = threading.Event()
+        threads = [start(scheduler, scheduler.classify(method), release) for method in methods]
+        wait_for(lambda: scheduler.stats()["running"] == len(methods))
+        release.set()
+        for thread in threads:
+            thread.join()
+        stats = scheduler.stats()["classes"]
+        self.assertEqual(sum(state["rejected"] for state in stats.values()), 0)
+        self.assertEqual(sum(state["admitted"] for state in stats.values()), len(methods))
+
+    def test_parse_class_values(self):
+        """Test the limits given in the command line"""
+        self.assertEqual(parse_class_values(["bulk=2", "maintenance=0"]), {"bulk": 2, "maintenance": 0})
+        with self.assertRaises(ValueError):
+            parse_class_values(["batch=2"])
+
+if __name__ == '__main__':
+    unittest.main()
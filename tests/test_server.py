@@ -0,0 +1,53 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import unittest
+from unittest import mock
+
+from pyfaces import server
+from pyfaces.core.configuration import ConfigManager
+from pyfaces.server import export_path
+
+
+class StopWatching(BaseException):
+    """Ends the endless loop of the watching thread"""
+
+
+class TestServer(unittest.TestCase):
+    def test_export_path(self):
+        """Test that clients can only name files of the exports folder"""
+        exports_folder = ConfigManager().exports_folder
+        self.assertEqual(export_path("matches.npz"), os.path.join(exports_folder, "matches.npz"))
+        for output_name in ["", ".", "..", "/etc/passwd", "../matches.ndjson", "sub/matches.ndjson"]:
+            with self.assertRaises(ValueError):
+                export_path(output_name)
+
+    def test_watch_folder_survives_errors(self):
+        """Test that the watching thread logs errors and keeps polling"""
+        with mock.patch.object(server, "new_processor", side_effect=[OSError("Disk full"), StopWatching()]), \
+                mock.patch.object(server.time, "sleep") as sleep, \
+                self.assertLogs(level="ERROR") as logs:
+            with self.assertRaises(StopWatching):
+                server.watch_folder("/photos", interval=3)
+        sleep.assert_called_once_with(3)
+        self.assertIn("Disk full", "\n".join(logs.output))
+
+if __name__ == '__main__':
+    unittest.main()
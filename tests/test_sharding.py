@@ -0,0 +1,199 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.locking import atomic_write_json
+from pyfaces.core.processor import FaceProcessor
+from pyfaces.core.sharding import face_md5_from_path
+from pyfaces.core.sharding import iter_json_items
+from pyfaces.core.sharding import merge_results
+from pyfaces.core.sharding import shard_for
+from pyfaces.core.sharding import shard_for_path
+from pyfaces.core.sharding import ShardCoordinator
+
+
+class LocalShard:
+    """Stands for the client of a shard calling its processor directly"""
+    def __init__(self, proc):
+        self.proc = proc
+        self.url = proc.config.encodings_file
+
+    def call(self, method, collection=None, **params):
+        return getattr(self.proc, method)(**params)
+
+
+class TestSharding(unittest.TestCase):
+    def test_shard_assignment(self):
+        """Test that every face is owned by exactly one shard"""
+        face_md5 = "101ed2b1a1e882f2f2512eee9937c1ad"
+        self.assertEqual(
+            shard_for(face_md5, 4),
+            int(face_md5, 16) % 4
+        )
+        self.assertEqual(
+            face_md5_from_path(f"/tmp/data/faces/{face_md5}.bmp"),
+            face_md5
+        )
+
+    def test_merge_results(self):
+        """Test the merge of the partial top-k of several shards"""
+        partial_results = [
+            [{"known_face": "a", "similarity": 0.2}, {"known_face": "b", "similarity": 0.5}],
+            [{"known_face": "c", "similarity": 0.1}, {"known_face": "d", "similarity": 0.7}],
+        ]
+        self.assertEqual(
+            [r["known_face"] for r in merge_results(partial_results, top_k=3)],
+            ["c", "a", "b"]
+        )
+    def test_shard_for_path(self):
+        """Test that new files are assigned to a shard by their path"""
+        self.assertEqual(
+            shard_for_path("/photos/a.jpg", 3),
+            shard_for(hashlib.md5(b"/photos/a.jpg").hexdigest(), 3)
+        )
+
+    def test_searches_during_writes(self):
+        """Test that searches are answered in time while long writes and other searches run"""
+        class SlowShard:
+            def __init__(self, url):
+                self.url = url
+
+            def call(self, method, **params):
+                time.sleep(1 if method == "extract_many" else 0.1)
+                return {"faces": 1} if method == "info" else {}
+
+        coordinator = ShardCoordinator(["http://127.0.0.1:1", "http://127.0.0.1:2"], timeout=0.5, request_threads=4)
+        coordinator.shards = [SlowShard(f"shard-{index}") for index in range(2)]
+        coordinator.writers = [SlowShard(f"writer-{index}") for index in range(2)]
+        paths = [f"/photos/{index}.jpg" for index in range(16)]
+        writer = threading.Thread(target=coordinator.extract_many, args=(paths,))
+        writer.start()
+
+        results = []
+        searches = [threading.Thread(target=lambda: results.append(coordinator.info())) for _ in range(4)]
+        for thread in searches:
+            thread.start()
+        for thread in searches:
+            thread.join()
+        writer.join()
+        self.assertEqual([(result["answered"], result["failed"]) for result in results], [(2, {})] * 4)
+
+    def test_iter_json_items(self):
+        """Test that a JSON object is parsed one item at a time"""
+        data = {
+            "a": {"encodings": [[0.125, -1e-05, 3]], "name": "x \"}{\" y"},
+            "b": 12345,
+            "c": [],
+            "d": None
+        }
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, "data.json")
+            for text in (json.dumps(data), json.dumps(data, indent=4)):
+                with open(file_path, "w") as output_file:
+                    output_file.write(text)
+                for chunk_size in (1, 3, 1 << 20):
+                    self.assertEqual(dict(iter_json_items(file_path, chunk_size)), data)
+
+            with open(file_path, "w") as output_file:
+                output_file.write(" { } ")
+            self.assertEqual(list(iter_json_items(file_path)), [])
+
+            with open(file_path, "w") as output_file:
+                output_file.write('{"a": 1')
+            with self.assertRaises(ValueError):
+                list(iter_json_items(file_path))
+
+
+class TestShardFolders(unittest.TestCase):
+    def setUp(self):
+        self.name = "test-sharding"
+        config = ConfigManager(self.name)
+        self.photos = tempfile.mkdtemp()
+        self.encodings = {}
+        self.metadata = {}
+        for i in range(8):
+            face_path = os.path.join(config.faces_folder, f"{i:032x}.bmp")
+            source = os.path.join(config.sources_folder, f"{i // 2}.jpg")
+            original = os.path.join(self.photos, f"{i // 2}.jpg")
+            pathlib.Path(original).touch()
+            self.encodings[face_path] = {
+                "copied_md5": f"{i:032x}",
+                "copied_original_file": source,
+                "face_path": face_path,
+                "original_image_path": original,
+                "encodings": [[i / 8] * 128]
+            }
+            self.metadata.setdefault(source, {"copied_path": source, "faces": []})["faces"].append(face_path)
+        atomic_write_json(config.encodings_file, self.encodings)
+        atomic_write_json(config.metadata_file, self.metadata)
+
+    def tearDown(self):
+        shutil.rmtree(ConfigManager().collection_folder(self.name), ignore_errors=True)
+        shutil.rmtree(self.photos, ignore_errors=True)
+
+    def test_split(self):
+        """Test that each shard copies the faces it owns to its own folder"""
+        shards = [FaceProcessor(index, 2, self.name) for index in range(2)]
+        self.assertNotEqual(shards[0].config.encodings_file, shards[1].config.encodings_file)
+        for index, proc in enumerate(shards):
+            owned = [
+                face_path for face_path, value in self.encodings.items()
+                if shard_for_path(value["original_image_path"], 2) == index
+            ]
+            self.assertEqual(sorted(proc.encodings), sorted(owned))
+            for image_metadata in proc.metadata.values():
+                self.assertTrue(image_metadata["faces"])
+                self.assertTrue(set(image_metadata["faces"]) <= set(owned))
+
+        # Shards are writable and the split is not done again
+        shards[0].delete_many(face_paths=list(shards[0].encodings)[:1])
+        self.assertEqual(len(FaceProcessor(0, 2, self.name).encodings), len(shards[0].encodings))
+
+    def test_delete_after_split(self):
+        """Test that deleting an image through the coordinator leaves no faces of it in any shard"""
+        shards = [FaceProcessor(index, 2, self.name) for index in range(2)]
+        coordinator = ShardCoordinator(["http://127.0.0.1:1", "http://127.0.0.1:2"])
+        coordinator.shards = coordinator.writers = [LocalShard(proc) for proc in shards]
+        image_path = os.path.join(self.photos, "0.jpg")
+        # A face of the image held by the shard it is not assigned to
+        other = shards[1 - shard_for_path(image_path, 2)]
+        with other._writing():
+            other.encodings = other._load(other.config.encodings_file)
+            face_path = next(face_path for face_path in self.encodings if self.encodings[face_path]["original_image_path"] == image_path)
+            other.encodings[face_path] = self.encodings[face_path]
+            other._dump(other.config.encodings_file, other.encodings)
+            other._bump_gallery(inserted=[face_path])
+
+        self.assertTrue(coordinator.delete_analysis(image_path))
+        self.assertFalse(os.path.exists(image_path))
+        for proc in shards:
+            self.assertFalse([face_path for face_path in proc.encodings if proc.encodings[face_path]["original_image_path"] == image_path])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import unittest
+
+import face_recognition
+import numpy as np
+
+from pyfaces.core.store import FaceStore
+
+
+def entry(i, **extras):
+    """Build an encodings entry like the ones saved by the processor"""
+    face_path = os.path.join("data", "faces", f"{i:04d}.bmp")
+    value = {
+        "copied_md5": f"{i:032x}",
+        "copied_original_file": os.path.join("data", "sources", f"{i // 2:04d}.jpg"),
+        "face_path": face_path,
+        "original_image_path": f"/photos/über {i}.jpg",
+        "position": {"top": i, "bottom": i + 10, "left": i + 20, "right": i + 30},
+        "encodings": [[(i + j) / 1024 for j in range(128)]],
+    }
+    value.update(extras)
+    return face_path, value
+
+
+class TestFaceStore(unittest.TestCase):
+    def setUp(self):
+        self.entries = dict(entry(i) for i in range(50))
+        self.entries.update([
+            entry(50, quality={"pose": 0.9328, "sharpness": 0.9457, "size": 0.3187, "score": 0.6923}, dhash="00ff00ff00ff00ff"),
+            entry(51, sightings=[{"copied_original_file": "other.jpg", "original_image_path": "/other.jpg", "position": {}}], collection="default"),
+            entry(52, encodings=[]),
+        ])
+        self.store = FaceStore(self.entries)
+
+    def test_round_trip(self):
+        """Test that every entry is rebuilt as it was loaded"""
+        self.assertEqual(list(self.store), list(self.entries))
+        for face_path, value in self.entries.items():
+            self.assertEqual(self.store[face_path].to_dict(), value)
+
+    def test_lookup(self):
+        """Test that faces are found by path and missing fields raise KeyError"""
+        face_path, _ = entry(7)
+        record = self.store[face_path]
+        self.assertIn(face_path, self.store)
+        self.assertNotIn(os.path.join("data", "faces", "0007.jpg"), self.store)
+        self.assertNotIn(None, self.store)
+        self.assertIsNone(self.store.get("missing"))
+
+        self.assertEqual(record["encodings"].shape, (1, 128))
+        self.assertEqual(record["encodings"].dtype, np.float32)
+        self.assertNotIn("quality", record)
+        self.assertIsNone(record.get("sightings"))
+        with self.assertRaises(KeyError):
+            record["dhash"]
+        self.assertEqual(len(self.store[entry(52)[0]]["encodings"]), 0)
+
+    def test_compact(self):
+        """Test that the store is smaller than the vectors as Python floats"""
+        self.assertLess(self.store.nbytes / len(self.store), 128 * 8)
+
+    def test_update(self):
+        """Test that faces are changed, added and deleted without rebuilding the arrays"""
+        changed = dict(self.entries[entry(3)[0]], quality={"pose": 0.5, "sharpness": 0.5, "size": 0.5, "score": 0.5})
+        added = dict([entry(60)])
+        self.assertTrue(self.store.update({changed["face_path"]: changed, **added}, deleted=[entry(4)[0], entry(99)[0]]))
+
+        expected = dict(self.entries)
+        expected[changed["face_path"]] = changed
+        expected.update(added)
+        del expected[entry(4)[0]]
+        self.assertEqual(len(self.store), len(expected))
+        self.assertEqual(set(self.store), set(expected))
+        self.assertNotIn(entry(4)[0], self.store)
+        with self.assertRaises(KeyError):
+            self.store[entry(4)[0]]
+        for face_path, value in expected.items():
+            self.assertEqual(self.store[face_path].to_dict(), value)
+
+        # A face deleted and extracted again
+        self.assertTrue(self.store.update(dict([entry(4)])))
+        self.assertEqual(self.store[entry(4)[0]].to_dict(), self.entries[entry(4)[0]])
+        self.assertEqual(len(self.store), len(expected) + 1)
+
+    def test_precision(self):
+        """Test that real encodings rounded to float32 keep their distances and ranking"""
+        encodings = [
+            np.asarray(encoding)
+            for image_path in ["./res/two_people.jpg", "./res/hoodie.jpeg"]
+            for encoding in face_recognition.face_encodings(face_recognition.load_image_file(image_path))
+        ]
+        entries = dict(entry(i, encodings=[encoding.tolist()]) for i, encoding in enumerate(encodings))
+        store = FaceStore(entries)
+
+        for face_path, value in entries.items():
+            query = np.asarray(value["encodings"][0])
+            expected = face_recognition.face_distance(encodings, query)
+            rounded = face_recognition.face_distance([store[other]["encodings"][0] for other in entries], query.astype(np.float32))
+            np.testing.assert_allclose(rounded, expected, atol=1e-6)
+            self.assertEqual(list(np.argsort(rounded)), list(np.argsort(expected)))
+
+    def test_update_limit(self):
+        """Test that too many changes are refused and leave the store as it was"""
+        store = FaceStore(self.entries, max_changes=0)
+        self.assertFalse(store.update(dict(entry(i) for i in range(100, 1200))))
+        self.assertEqual(list(store), list(self.entries))
+
+if __name__ == '__main__':
+    unittest.main()
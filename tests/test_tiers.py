@@ -0,0 +1,81 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from pyfaces.core.index import EncodingIndex
+from pyfaces.core.store import FaceStore
+from pyfaces.core.tiers import TieredIndex
+
+
+class TestTieredIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.encodings = {f"face-{i:03d}": rng.rand(128) for i in range(100)}
+        self.folder = tempfile.mkdtemp()
+        self.index = TieredIndex(self.folder, capacity=20, threshold=0.5, max_segments=2)
+        self.flat = EncodingIndex()
+        for face_path, encoding in self.encodings.items():
+            self.index.add(face_path, encoding)
+            self.flat.add(face_path, encoding)
+
+    def test_capacity(self):
+        """Test that the oldest faces are demoted and every face is still found"""
+        stats = self.index.stats()
+        self.assertLessEqual(stats["hot_faces"], 25)
+        self.assertEqual(stats["hot_faces"] + stats["cold_faces"], 100)
+        self.assertLessEqual(stats["segments"], 2)
+        self.assertIn("face-099", self.index.hot)
+        self.assertNotIn("face-000", self.index.hot)
+
+        query = np.random.RandomState(1).rand(128)
+        self.assertEqual(self.index.search(query), self.flat.search(query))
+        self.assertEqual(self.index.search(query, top_k=5, exclude="face-007"), self.flat.search(query, top_k=5, exclude="face-007"))
+
+    def test_cold_scan_and_promotion(self):
+        """Test that confident hot matches skip the cold tier and cold matches are promoted"""
+        self.index.search(self.encodings["face-099"], top_k=1)
+        self.assertEqual(self.index.counters["cold_scans"], 0)
+
+        self.assertEqual(self.index.search(self.encodings["face-000"], top_k=1)[0][0], "face-000")
+        self.assertEqual(self.index.counters["cold_scans"], 1)
+        self.assertIn("face-000", self.index.hot)
+        self.assertEqual(len(self.index), 100)
+
+        self.index.remove(["face-000", "face-001"])
+        self.assertEqual(len(self.index), 98)
+        self.assertNotIn("face-001", [face for face, _ in self.index.search(self.encodings["face-001"])])
+
+
+class TestMappedStore(unittest.TestCase):
+    def test_mapped_vectors(self):
+        """Test that a store with memory-mapped encodings reads the same values"""
+        entries = {
+            f"/faces/{i}.bmp": {"face_path": f"/faces/{i}.bmp", "encodings": [[float(i)] * 128]}
+            for i in range(3)
+        }
+        store = FaceStore(entries, vectors_folder=tempfile.mkdtemp())
+        self.assertIsInstance(store._vectors, np.memmap)
+        self.assertEqual(store["/faces/2.bmp"].to_dict()["encodings"], [[2.0] * 128])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pyfaces.core.configuration import ConfigManager
+from pyfaces.core.processor import FaceProcessor
+from pyfaces.core.video import IoUTracker
+from pyfaces.core.video import iou
+
+
+class TestTracker(unittest.TestCase):
+    def test_iou(self):
+        """Test the overlap between boxes"""
+        self.assertEqual(iou((0, 10, 10, 0), (0, 10, 10, 0)), 1.0)
+        self.assertEqual(iou((0, 10, 10, 0), (20, 30, 30, 20)), 0.0)
+
+    def test_faces_encoded_once_per_track(self):
+        """Test that a face moving slowly keeps its track"""
+        tracker = IoUTracker()
+        first = tracker.update([(0, 100, 100, 0), (0, 300, 100, 200)], 0)
+        second = tracker.update([(5, 105, 105, 5)], 1)
+        third = tracker.update([(10, 110, 110, 10), (0, 300, 100, 200)], 2)
+
+        self.assertEqual([is_new for (_, _, is_new) in first], [True, True])
+        self.assertEqual(second, [(first[0][0], (5, 105, 105, 5), False)])
+        self.assertEqual([is_new for (_, _, is_new) in third], [False, False])
+
+    def test_tracks_expire(self):
+        """Test that faces leaving the scene are forgotten"""
+        tracker = IoUTracker(max_age=1)
+        tracker.update([(0, 100, 100, 0)], 0)
+        tracker.update([], 1)
+        tracker.update([], 2)
+        self.assertTrue(tracker.update([(0, 100, 100, 0)], 3)[0][2])
+
+class TestVideoExtraction(unittest.TestCase):
+    def setUp(self):
+        self.name = "test-video"
+        self.proc = FaceProcessor(collection=self.name)
+        self.frames_folder = tempfile.mkdtemp()
+        for index, file_name in enumerate(["two_people.jpg", "hoodie.jpeg"]):
+            shutil.copy(
+                os.path.join("res", file_name),
+                os.path.join(self.frames_folder, f"{index}{os.path.splitext(file_name)[1]}")
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.frames_folder, ignore_errors=True)
+        shutil.rmtree(ConfigManager().collection_folder(self.name), ignore_errors=True)
+
+    def test_batched_commits(self):
+        """Test that the faces of a video are persisted while it is processed"""
+        with mock.patch.object(self.proc, "_commit", wraps=self.proc._commit) as commit:
+            summary = self.proc.extract_video(self.frames_folder, batch_size=1)
+        self.assertEqual(summary["frames"], 2)
+        self.assertEqual(commit.call_count, 2)
+        self.assertEqual(sorted(self.proc.encodings), sorted(summary["faces"]))
+
+if __name__ == '__main__':
+    unittest.main()
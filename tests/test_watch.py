@@ -0,0 +1,120 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import tempfile
+import time
+import unittest
+
+from pyfaces.core.watch import FolderWatcher
+
+
+class RecordingProcessor:
+    """Stands for a FaceProcessor recording the images extracted"""
+    def __init__(self):
+        self.extracted = []
+
+    def extract_many(self, image_paths, batch_size=16, **kwargs):
+        for image_path in image_paths:
+            self.extracted.append(os.path.basename(image_path))
+            yield image_path, {"faces": [image_path]}
+
+
+class TestFolderWatcher(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.index_path = os.path.join(tempfile.mkdtemp(), "index.json")
+        self.processor = RecordingProcessor()
+        os.makedirs(os.path.join(self.folder, "camera"))
+        for name in ["a.jpg", "b.png", "notes.txt", os.path.join("camera", "c.jpg")]:
+            self.write(name, age=60)
+
+    def write(self, name, age=0, data=b"image"):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as output_file:
+            output_file.write(data)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def watcher(self, **kwargs):
+        return FolderWatcher(self.processor, self.folder, self.index_path, settle=5, **kwargs)
+
+    def test_incremental(self):
+        """Test that only new or changed images are ingested"""
+        watcher = self.watcher()
+        report = watcher.poll()
+        self.assertEqual((report["images"], report["pending"], report["listed_folders"]), (0, 3, 2))
+
+        # Images are ingested once a second scan finds them unchanged
+        report = watcher.poll()
+        self.assertEqual(sorted(self.processor.extracted), ["a.jpg", "b.png", "c.jpg"])
+        self.assertEqual((report["images"], report["listed_folders"]), (3, 0))
+
+        # Nothing changed, so no folder is listed again
+        report = watcher.poll()
+        self.assertEqual((report["images"], report["listed_folders"]), (0, 0))
+
+        # Changes inside a folder are only found by the full scans
+        self.write("a.jpg", age=30, data=b"changed")
+        self.write(os.path.join("camera", "d.jpg"), age=30)
+        self.assertEqual(watcher.poll()["pending"], 1)
+        self.assertEqual(watcher.poll(full=True)["images"], 1)
+        self.assertEqual(watcher.poll()["images"], 1)
+        self.assertEqual(self.processor.extracted[-2:], ["d.jpg", "a.jpg"])
+
+        # The index survives restarts
+        self.assertEqual(self.watcher().poll(full=True)["images"], 0)
+
+    def test_settle(self):
+        """Test that files still being written wait until they settle"""
+        watcher = self.watcher()
+        watcher.poll()
+        watcher.poll()
+        path = self.write("partial.jpg")
+
+        report = watcher.poll()
+        self.assertEqual((report["images"], report["pending"]), (0, 1))
+        self.assertNotIn("partial.jpg", self.processor.extracted)
+
+        # The folder does not change when the file is completed
+        mtime = time.time() - 10
+        os.utime(path, (mtime, mtime))
+        self.assertEqual(watcher.poll()["pending"], 1)
+        report = watcher.poll()
+        self.assertEqual((report["images"], report["pending"]), (1, 0))
+        self.assertEqual(self.processor.extracted[-1], "partial.jpg")
+
+        # Files growing with an old modification time wait too
+        path = self.write("copied.jpg", age=60)
+        mtime_ns = os.stat(path).st_mtime_ns
+        watcher.poll()
+        self.write("copied.jpg", data=b"image and more")
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+        self.assertEqual(watcher.poll()["images"], 0)
+        self.assertEqual(watcher.poll()["images"], 1)
+        self.assertEqual(self.processor.extracted[-1], "copied.jpg")
+
+    def test_run(self):
+        """Test that a limited number of cycles can be run"""
+        reports = list(self.watcher(interval=0.01).run(cycles=3))
+        self.assertEqual([report["images"] for report in reports], [0, 3, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pyfaces.core.watchlist import Watchlist
+
+
+def face(encoding, source="/tmp/source.jpg"):
+    """Build the encodings entry of a new face"""
+    return {"encodings": [list(encoding)], "original_image_path": source, "position": [0, 10, 10, 0]}
+
+
+class TestWatchlist(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.folder.name, "watchlist.json")
+        self.hits_file = os.path.join(self.folder.name, "watchlist_hits.ndjson")
+        rng = np.random.RandomState(0)
+        self.alice, self.bob, self.stranger = rng.normal(0, 0.056, (3, 128))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_check(self):
+        """Test that only the faces close enough to a person are hits"""
+        watchlist = Watchlist(self.file_path, self.hits_file, tolerance=0.5)
+        watchlist.add("alice", [self.alice, self.alice + 0.01])
+        watchlist.add("bob", [self.bob], tolerance=0.05)
+
+        hits = watchlist.check({
+            "a.bmp": face(self.alice + 0.005),
+            "b.bmp": face(self.bob + 0.01),
+            "c.bmp": face(self.stranger)
+        })
+        # One hit per face and person even with two close references, and
+        # none for bob as his own tolerance is stricter
+        self.assertEqual([(hit["face_path"], hit["name"]) for hit in hits], [("a.bmp", "alice")])
+        self.assertEqual(hits[0]["original_image_path"], "/tmp/source.jpg")
+        self.assertLess(hits[0]["distance"], 0.1)
+        self.assertEqual(Watchlist(self.file_path, self.hits_file).check({"a.bmp": face(self.alice)}), [])
+
+    def test_persistence(self):
+        """Test that the persons and the hits are shared through the files"""
+        watchlist = Watchlist(self.file_path, self.hits_file)
+        other = Watchlist(self.file_path, self.hits_file)
+        watchlist.add("alice", [self.alice], note="seen at the gate")
+        watchlist.save()
+
+        other.reload()
+        self.assertEqual([entry["name"] for entry in other.summary()], ["alice"])
+        self.assertEqual(other.summary()[0]["note"], "seen at the gate")
+
+        watchlist.record(watchlist.check({"a.bmp": face(self.alice)}))
+        watchlist.record(watchlist.check({"b.bmp": face(self.alice)}))
+        hits = other.hits()
+        self.assertEqual([hit["id"] for hit in hits], [1, 2])
+        self.assertIn("time", hits[0])
+        self.assertEqual([hit["face_path"] for hit in other.hits(after=1)], ["b.bmp"])
+        self.assertEqual(other.hits(after=2), [])
+
+        watchlist.remove("alice")
+        watchlist.save()
+        other.reload()
+        self.assertEqual(len(other), 0)
+
+    def test_notify(self):
+        """Test that failing callbacks do not stop the others"""
+        received = []
+
+        def failing(hits):
+            raise RuntimeError("unreachable endpoint")
+
+        watchlist = Watchlist(self.file_path, self.hits_file)
+        watchlist.subscribe(failing)
+        watchlist.subscribe(received.extend)
+        watchlist.subscribe(received.extend)
+        watchlist.add("alice", [self.alice])
+
+        errors = watchlist.notify(watchlist.check({"a.bmp": face(self.alice)}))
+        self.assertEqual(len(errors), 1)
+        self.assertEqual([hit["name"] for hit in received], ["alice"])
+        self.assertEqual(watchlist.notify([]), [])
+
+if __name__ == '__main__':
+    unittest.main()
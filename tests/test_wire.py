@@ -0,0 +1,82 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import unittest
+
+from pyfaces.core.wire import compact_guess
+from pyfaces.core.wire import compact_matches
+from pyfaces.core.wire import compact_search
+from pyfaces.core.wire import expand_matches
+from pyfaces.core.wire import expand_search
+from pyfaces.core.worker import WorkerProxy
+
+
+class TestWire(unittest.TestCase):
+    def test_search_round_trip(self):
+        """Test that a compact search result expands to the original one"""
+        result = {
+            "image": "/photos/party.jpg",
+            "faces": [
+                {"location": [1, 2, 3, 4], "comparisons": [
+                    {"known_face": "/data/faces/a.bmp", "similarity": 0.25, "collection": "staff"},
+                    {"known_face": "/data/faces/b.bmp", "similarity": 0.5, "collection": None},
+                ]},
+                {"location": [5, 6, 7, 8], "comparisons": [
+                    {"known_face": "/data/faces/b.bmp", "similarity": 0.75, "collection": None},
+                ]},
+            ]
+        }
+        packed = compact_search(result)
+        self.assertEqual(packed["paths"], {"prefix": "/data/faces", "names": ["a.bmp", "b.bmp"]})
+        self.assertEqual(expand_search(packed), result)
+
+    def test_matches_round_trip(self):
+        """Test that the sparse rows of the matches keep queries without pairs"""
+        result = {
+            "queries": 3,
+            "matches": {
+                "/q/1.bmp": [{"known_face": "/g/a.bmp", "similarity": 0.125}],
+                "/q/2.bmp": [],
+                "/q/3.bmp": [
+                    {"known_face": "/g/b.bmp", "similarity": 0.5},
+                    {"known_face": "/g/a.bmp", "similarity": 0.625},
+                ],
+            }
+        }
+        self.assertEqual(expand_matches(compact_matches(result)), result)
+        self.assertEqual(expand_matches(compact_matches({"output": "/tmp/out.npz"})), {"output": "/tmp/out.npz"})
+
+    def test_worker_output(self):
+        """Test that the worker returns the same similarities as a local processor"""
+        local = {
+            "counter": 2,
+            "comparisons": [
+                {"known_face": "/data/faces/a.bmp", "similarity": 0.4321},
+                {"known_face": "/data/faces/b.bmp", "similarity": 0.5678912345678912},
+            ]
+        }
+
+        class Client:
+            def call(self, method, **params):
+                return compact_guess(local)
+
+        self.assertEqual(repr(WorkerProxy(Client()).guess_face("/data/faces/c.bmp")), repr(local))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+################################################################################
+#
+#    Copyright 2020-2022 @ Félix Brezo (@febrezo)
+#
+#    This program is part of Pyfaces. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import concurrent.futures
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from jsonrpc import Dispatcher
+
+from pyfaces.aioserver import AsyncJSONRPCServer
+from pyfaces.core.worker import connect_worker
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix domain sockets are not available")
+class TestConnectWorker(unittest.TestCase):
+    def setUp(self):
+        self.config = mock.Mock(app_folder=tempfile.mkdtemp())
+        self.spawned = []
+        # A port nobody listens on, so no pyfacesd is found
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+
+    def spawn(self, command, **kwargs):
+        """Serve the socket of a spawned worker from a thread, a while later"""
+        path = command[command.index("--unix-socket") + 1]
+        self.spawned.append(path)
+        dispatcher = Dispatcher()
+        dispatcher.add_method(lambda: {}, name="info")
+        server = AsyncJSONRPCServer(dispatcher, threads=2, idle_timeout=1)
+
+        def serve():
+            time.sleep(0.3)
+            if os.path.exists(path):
+                os.remove(path)
+            server.serve_forever(path=path)
+
+        threading.Thread(target=serve, daemon=True).start()
+
+    def test_single_spawn(self):
+        """Test that processes connecting at once share a single spawned worker"""
+        with mock.patch("pyfaces.core.worker.subprocess.Popen", self.spawn):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                clients = list(executor.map(lambda _: connect_worker(self.config, port=self.port, startup_timeout=5), range(4)))
+
+        self.assertEqual(len(self.spawned), 1)
+        self.assertTrue(all(clients))
+        self.assertEqual(clients[0].call("info"), {})
+
+    def test_unusable_servers(self):
+        """Test that services which are not a usable pyfacesd are skipped"""
+        def garbage(listener, answer):
+            connection, _ = listener.accept()
+            with connection:
+                connection.recv(65536)
+                connection.sendall(answer)
+
+        answers = [
+            b"SSH-2.0-OpenSSH_9.0\r\n",
+            b"HTTP/1.1 200 OK\r\nContent-Length: 9\r\n\r\nnot json!",
+        ]
+        refused = b'{"jsonrpc": "2.0", "id": 1, "error": {"code": -32601, "message": "Method not found"}}'
+        answers.append(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(refused), refused))
+        for answer in answers:
+            with socket.socket() as listener:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                listener.bind(("127.0.0.1", self.port))
+                listener.listen()
+                thread = threading.Thread(target=garbage, args=(listener, answer))
+                thread.start()
+                self.assertIsNone(connect_worker(self.config, port=self.port, spawn=False), answer)
+                thread.join()
+
+    def test_stale_socket(self):
+        """Test that a socket left behind by a dead worker is replaced"""
+        path = os.path.join(self.config.app_folder, "worker.sock")
+        with socket.socket(socket.AF_UNIX) as stale:
+            stale.bind(path)
+
+        with mock.patch("pyfaces.core.worker.subprocess.Popen", self.spawn):
+            client = connect_worker(self.config, port=self.port, startup_timeout=5)
+
+        self.assertEqual(self.spawned, [path])
+        self.assertEqual(client.call("info"), {})
+
+if __name__ == '__main__':
+    unittest.main()